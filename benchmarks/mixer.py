@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import time
+from collections.abc import Sequence
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from testing.utils import PCMSource
+from threepseat.ext.sounds.mixer import FRAME_SIZE
+from threepseat.ext.sounds.mixer import PCMMixer
+
+VOICES = (1, 2, 4, 8)
+FRAMES_PER_SECOND = 50
+"""Frames a mixer must produce each second to play in real time."""
+
+logger = logging.getLogger(__name__)
+
+
+class Result(NamedTuple):
+    """Mixing throughput of one core."""
+
+    voices: int
+    gain: float
+    frames: int
+    frames_per_second: float
+    """Frames mixed per second of CPU time."""
+
+    @property
+    def realtime_mixers(self) -> float:
+        """Mixers one core could keep playing in real time."""
+        return self.frames_per_second / FRAMES_PER_SECOND
+
+
+def run(
+    voices: int,
+    *,
+    gain: float = 1.0,
+    frames: int = 5000,
+    seed: int = 0,
+) -> Result:
+    """Time mixing random PCM frames from voices sources.
+
+    Sources are read from memory, so only the mixer's cost is measured and
+    not decoding. The time is CPU time of this process, so the result is
+    the throughput of one core regardless of other load.
+
+    Args:
+        voices (int): number of sources played at once.
+        gain (float): gain of every source. At 1.0, a single voice is
+            passed through without mixing.
+        frames (int): number of 20 ms frames to mix.
+        seed (int): seed for the PCM samples.
+
+    Returns:
+        the result.
+    """
+    rng = random.Random(seed)
+    mixer = PCMMixer(max_voices=voices)
+    for _ in range(voices):
+        mixer.add(PCMSource([rng.randbytes(FRAME_SIZE)] * frames), gain)
+
+    start = time.process_time_ns()
+    for _ in range(frames):
+        mixer.read()
+    elapsed = (time.process_time_ns() - start) / 1e9
+    mixer.cleanup()
+
+    return Result(
+        voices=voices,
+        gain=gain,
+        frames=frames,
+        frames_per_second=frames / elapsed if elapsed > 0 else float('inf'),
+    )
+
+
+def report(results: Sequence[Result]) -> str:
+    """Format results as a table."""
+    lines = [f'{"voices":>6} {"gain":>5} {"frames/s":>12} {"mixers":>8}']
+    lines.extend(
+        f'{result.voices:>6} {result.gain:>5.2f} '
+        f'{result.frames_per_second:>12.0f} {result.realtime_mixers:>8.0f}'
+        for result in results
+    )
+    return '\n'.join(lines)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the mixer benchmarks."""
+    parser = argparse.ArgumentParser(
+        description='PCMMixer throughput benchmarks',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        prog='python -m benchmarks.mixer',
+    )
+    parser.add_argument(
+        '--voices',
+        nargs='+',
+        type=int,
+        default=VOICES,
+        help='sources played at once',
+    )
+    parser.add_argument(
+        '--gains',
+        nargs='+',
+        type=float,
+        default=(1.0, 0.5),
+        help='gain of every source',
+    )
+    parser.add_argument(
+        '--frames',
+        type=int,
+        default=5000,
+        help='20 ms frames to mix per benchmark',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='seed for the PCM samples',
+    )
+    parser.add_argument(
+        '--output',
+        metavar='PATH',
+        help='write the results as JSON to this file',
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    results = []
+    for voices in args.voices:
+        for gain in args.gains:
+            logger.info('benchmarking %s voice(s) at gain %s', voices, gain)
+            results.append(
+                run(voices, gain=gain, frames=args.frames, seed=args.seed),
+            )
+
+    if args.output is not None:
+        with Path(args.output).open('w') as f:
+            json.dump(
+                {
+                    'metadata': {
+                        'timestamp': time.strftime(
+                            '%Y-%m-%dT%H:%M:%SZ',
+                            time.gmtime(),
+                        ),
+                        'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'platform': platform.platform(),
+                        'frames': args.frames,
+                        'seed': args.seed,
+                    },
+                    'results': [result._asdict() for result in results],
+                },
+                f,
+                indent=2,
+            )
+    sys.stdout.write(f'{report(results)}\n')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,712 @@
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import logging
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+from typing import NamedTuple
+
+from testing import data
+from threepseat.ext.rules.data import GuildConfigTable
+from threepseat.ext.rules.data import UserOffensesTable
+from threepseat.ext.sounds.data import SoundsTable
+from threepseat.table import CACHE_MAXSIZE
+from threepseat.table import DICT_DATABASE
+from threepseat.table import SQLTableInterface
+from threepseat.table import fields_to_search_str
+
+SIZES = (1_000, 100_000, 1_000_000)
+ENGINES = ('sqlite', 'dict')
+# Sounds and offenses are spread over one guild per this many rows.
+ROWS_PER_GUILD = 100
+
+logger = logging.getLogger(__name__)
+
+
+class Dataset(NamedTuple):
+    """A table to benchmark and how to fill it."""
+
+    name: str
+    table: Callable[[str, str], SQLTableInterface[Any]]
+    """Opens the table given the database path and a data directory."""
+    rows: Callable[[int, int], Iterator[NamedTuple]]
+    """Generates the rows given the count and seed."""
+    partition: tuple[str, ...]
+    """Fields all() filters by."""
+    mutable: str
+    """Field changed by the update benchmarks."""
+
+
+class Result(NamedTuple):
+    """Latency of one operation in microseconds."""
+
+    dataset: str
+    rows: int
+    engine: str
+    operation: str
+    cache: str
+    """'cold' if the table's caches were empty, otherwise 'hot'."""
+    calls: int
+    mean_us: float
+    p50_us: float
+    p99_us: float
+    max_us: float
+
+    @property
+    def key(self) -> tuple[str, int, str, str, str]:
+        """Identifies the same benchmark across runs."""
+        return (
+            self.dataset,
+            self.rows,
+            self.engine,
+            self.operation,
+            self.cache,
+        )
+
+
+class Overhead(NamedTuple):
+    """Per-call latency of a read before and after the table's changes."""
+
+    dataset: str
+    rows: int
+    operation: str
+    cache: str
+    """'cold' if the caches were empty, otherwise 'hot'."""
+    baseline_us: float
+    """Mean latency of the original read path (see BaselineReads)."""
+    table_us: float
+    """Mean latency of SQLTableInterface."""
+
+    @property
+    def speedup(self) -> float:
+        """How many times faster the table is than the baseline."""
+        return self.baseline_us / self.table_us
+
+
+class BaselineReads:
+    """The read path of SQLTableInterface before its per-call work was cut.
+
+    Every call validates its kwargs with isinstance() against the field's
+    type, builds its SQL, and decodes rows with RowType(*row), and reads
+    are cached with functools.lru_cache rather than the table's caches.
+    """
+
+    def __init__(
+        self,
+        table: SQLTableInterface[Any],
+        row_type: type[NamedTuple],
+        db_path: str,
+    ) -> None:
+        """Init BaselineReads.
+
+        Args:
+            table (SQLTableInterface): table whose file and fields to read.
+            row_type (type[NamedTuple]): type of the table's rows.
+            db_path (str): path to the table's database file.
+        """
+        self.table = table
+        self.row_type = row_type
+        self.db = sqlite3.connect(db_path)
+        self.get = functools.lru_cache(maxsize=CACHE_MAXSIZE)(self._get)
+        self.all = functools.lru_cache(maxsize=CACHE_MAXSIZE)(self._all)
+
+    def _validate(self, kwargs: dict[str, Any]) -> None:
+        fields = self.table.fields
+        for field, value in kwargs.items():
+            if field not in fields:
+                msg = f'Field {field} is not a member of the table.'
+                raise ValueError(msg)
+            if not isinstance(value, fields[field].python_type):
+                msg = f'Type of {field} is {type(value)}.'
+                raise ValueError(msg)  # noqa: TRY004
+
+    def _all(self, **kwargs: Any) -> tuple[Any, ...]:  # noqa: ANN401
+        self._validate(kwargs)
+        where = (
+            f'WHERE {fields_to_search_str(kwargs.keys())}'
+            if len(kwargs) > 0
+            else ''
+        )
+        with self.db as db:
+            rows = db.execute(
+                f'SELECT * FROM {self.table.name} {where}',  # noqa: S608
+                kwargs,
+            ).fetchall()
+        return tuple(self.row_type(*row) for row in rows)
+
+    def _get(self, **kwargs: Any) -> Any:  # noqa: ANN401
+        rows = self._all(**kwargs)
+        return rows[0] if len(rows) > 0 else None
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.db.close()
+
+
+DATASETS = {
+    'guild_configs': Dataset(
+        'guild_configs',
+        lambda db_path, _: GuildConfigTable(db_path),
+        lambda count, seed: data.guild_configs(count, seed=seed),
+        (),
+        'last_event',
+    ),
+    'sounds': Dataset(
+        'sounds',
+        SoundsTable,
+        lambda count, seed: data.sounds(
+            count,
+            guilds=max(count // ROWS_PER_GUILD, 1),
+            seed=seed,
+        ),
+        ('guild_id',),
+        'description',
+    ),
+    'user_offenses': Dataset(
+        'user_offenses',
+        lambda db_path, _: UserOffensesTable(db_path),
+        lambda count, seed: data.user_offenses(
+            count,
+            guilds=max(count // ROWS_PER_GUILD, 1),
+            seed=seed,
+        ),
+        ('guild_id',),
+        'total_offenses',
+    ),
+}
+
+
+def _db_path(dataset: Dataset, size: int, engine: str, directory: str) -> str:
+    if engine == 'dict':
+        return DICT_DATABASE
+    return str(Path(directory) / f'{dataset.name}-{size}.db')
+
+
+def _load(  # noqa: PLR0913
+    dataset: Dataset,
+    size: int,
+    engine: str,
+    directory: str,
+    *,
+    sample: set[int],
+    seed: int,
+) -> tuple[SQLTableInterface[Any], dict[int, Any]]:
+    """Open the table filled with size rows.
+
+    Returns:
+        the table and the rows with the indices in sample.
+    """
+    db_path = _db_path(dataset, size, engine, directory)
+    sampled: dict[int, Any] = {}
+
+    def _rows() -> Iterator[NamedTuple]:
+        for i, row in enumerate(dataset.rows(size, seed)):
+            if i in sample:
+                sampled[i] = row
+            yield row
+
+    table = dataset.table(db_path, directory)
+    if engine == 'dict':
+        table.update_many(_rows())
+        return table, sampled
+
+    # Insert directly rather than with update_many() so tables with
+    # write-behind are not flushed every WriteBehind.max_rows rows, then
+    # reopen the table so its caches and mirror start from the file.
+    with table.connect() as db:
+        db.executemany(
+            f'INSERT INTO {table.name} '  # noqa: S608
+            f'VALUES ({", ".join("?" * len(table.field_names))})',
+            _rows(),
+        )
+    table.close()
+    return dataset.table(db_path, directory), sampled
+
+
+def _measure(
+    func: Callable[[Any], object],
+    args: Sequence[Any],
+    before: Callable[[], object] | None = None,
+) -> list[float]:
+    """Time func(arg) for each arg in microseconds."""
+    times = []
+    for arg in args:
+        if before is not None:
+            before()
+        start = time.perf_counter_ns()
+        func(arg)
+        times.append((time.perf_counter_ns() - start) / 1000)
+    return times
+
+
+def _mean(
+    func: Callable[[Any], object],
+    args: Sequence[Any],
+    before: Callable[[], object] | None = None,
+) -> float:
+    """Mean time of func(arg) over args in microseconds.
+
+    Without before(), the calls are timed together so the timer's own
+    overhead does not swamp calls that take under a microsecond.
+    """
+    if before is not None:
+        return statistics.fmean(_measure(func, args, before))
+    start = time.perf_counter_ns()
+    for arg in args:
+        func(arg)
+    return (time.perf_counter_ns() - start) / 1000 / len(args)
+
+
+def _call(read: Callable[..., object], kwargs: dict[str, Any]) -> object:
+    return read(**kwargs)
+
+
+def _bump(value: Any) -> Any:  # noqa: ANN401
+    return f'{value}!' if isinstance(value, str) else value + 1
+
+
+def run(
+    dataset: Dataset,
+    size: int,
+    engine: str,
+    *,
+    calls: int = 1000,
+    seed: int = 0,
+) -> list[Result]:
+    """Benchmark get(), all(), update(), and remove() on a dataset.
+
+    Each operation is timed with cold caches, cleared before every call,
+    and with hot caches, filled with the keys being read. For update()
+    and remove(), hot caches also include the cost of invalidating the
+    entries a write affects. Only the table's caches are cleared, SQLite's
+    page cache stays warm.
+
+    remove() is the one from SQLTableInterface, subclasses may disallow it
+    or have side effects (e.g., deleting a sound's file).
+
+    Args:
+        dataset (Dataset): dataset to benchmark.
+        size (int): number of rows in the table.
+        engine (str): 'sqlite' or 'dict' (see DICT_DATABASE).
+        calls (int): maximum calls per operation. Each call uses a
+            different row, so fewer are made if there are too few rows.
+        seed (int): seed for the rows and the rows chosen.
+
+    Returns:
+        list of the results.
+    """
+    rng = random.Random(seed)
+    count = max(min(calls, size // 3), 1)
+    indices = rng.sample(range(size), 3 * count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        table, sampled = _load(
+            dataset,
+            size,
+            engine,
+            directory,
+            sample=set(indices),
+            seed=seed,
+        )
+        rows = [sampled[i] for i in indices[:count]]
+        removed_cold = [sampled[i] for i in indices[count : 2 * count]]
+        removed_hot = [sampled[i] for i in indices[2 * count :]]
+
+        def _key(row: Any) -> dict[str, Any]:  # noqa: ANN401
+            return {k: getattr(row, k) for k in table.primary_keys}
+
+        keys = [_key(row) for row in rows]
+        partitions = list(
+            {
+                tuple((f, getattr(row, f)) for f in dataset.partition): None
+                for row in rows
+            },
+        )
+        hot_keys = keys[:CACHE_MAXSIZE]
+        hot_partitions = partitions[:CACHE_MAXSIZE]
+
+        def _clear() -> None:
+            table.get.cache_clear()
+            table.all.cache_clear()
+
+        def _warm() -> None:
+            for key in hot_keys:
+                table.get(**key)
+            for partition in hot_partitions:
+                table.all(**dict(partition))
+
+        def _update(row: Any) -> None:  # noqa: ANN401
+            table.update(
+                row._replace(
+                    **{dataset.mutable: _bump(getattr(row, dataset.mutable))},
+                ),
+            )
+
+        def _remove(row: Any) -> None:  # noqa: ANN401
+            SQLTableInterface.remove(table, **_key(row))
+
+        def _get(key: dict[str, Any]) -> None:
+            table.get(**key)
+
+        def _all(partition: tuple[tuple[str, Any], ...]) -> None:
+            table.all(**dict(partition))
+
+        timings: list[tuple[str, str, list[float]]] = []
+        timings.append(('get', 'cold', _measure(_get, keys, _clear)))
+        _warm()
+        timings.append(
+            (
+                'get',
+                'hot',
+                _measure(
+                    _get,
+                    [hot_keys[i % len(hot_keys)] for i in range(count)],
+                ),
+            ),
+        )
+        timings.append(('all', 'cold', _measure(_all, partitions, _clear)))
+        _warm()
+        timings.append(
+            (
+                'all',
+                'hot',
+                _measure(
+                    _all,
+                    [
+                        hot_partitions[i % len(hot_partitions)]
+                        for i in range(count)
+                    ],
+                ),
+            ),
+        )
+        _clear()
+        timings.append(('update', 'cold', _measure(_update, rows)))
+        _warm()
+        timings.append(('update', 'hot', _measure(_update, rows)))
+        _clear()
+        timings.append(('remove', 'cold', _measure(_remove, removed_cold)))
+        _warm()
+        timings.append(('remove', 'hot', _measure(_remove, removed_hot)))
+        table.close()
+
+    return [
+        Result(
+            dataset=dataset.name,
+            rows=size,
+            engine=engine,
+            operation=operation,
+            cache=cache,
+            calls=len(times),
+            mean_us=statistics.fmean(times),
+            p50_us=statistics.median(times),
+            p99_us=sorted(times)[int(0.99 * (len(times) - 1))],
+            max_us=max(times),
+        )
+        for operation, cache, times in timings
+    ]
+
+
+def overhead(
+    dataset: Dataset,
+    size: int,
+    *,
+    calls: int = 1000,
+    repeat: int = 5,
+    seed: int = 0,
+) -> list[Overhead]:
+    """Compare the per-call latency of get() and all() with the baseline.
+
+    Both read the same SQLite file. Uncached ('cold') calls clear the cache
+    before each call, and cached ('hot') calls read keys that were all
+    cached first. Each latency is the best mean of repeat rounds, with the
+    baseline and table rounds interleaved to spread out noise.
+
+    Args:
+        dataset (Dataset): dataset to benchmark.
+        size (int): number of rows in the table.
+        calls (int): maximum calls per operation per round.
+        repeat (int): rounds per operation.
+        seed (int): seed for the rows and the rows chosen.
+
+    Returns:
+        list of the results.
+    """
+    rng = random.Random(seed)
+    count = max(min(calls, size), 1)
+    indices = rng.sample(range(size), count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        table, sampled = _load(
+            dataset,
+            size,
+            'sqlite',
+            directory,
+            sample=set(indices),
+            seed=seed,
+        )
+        rows = [sampled[i] for i in indices]
+        baseline = BaselineReads(
+            table,
+            type(rows[0]),
+            _db_path(dataset, size, 'sqlite', directory),
+        )
+        keys = [
+            {k: getattr(row, k) for k in table.primary_keys} for row in rows
+        ]
+        partitions = list(
+            {
+                tuple((f, getattr(row, f)) for f in dataset.partition): None
+                for row in rows
+            },
+        )
+        calls_by_operation: dict[str, list[dict[str, Any]]] = {
+            'get': keys[:CACHE_MAXSIZE],
+            'all': [dict(p) for p in partitions[:CACHE_MAXSIZE]],
+        }
+
+        results = []
+        for operation, kwargs in calls_by_operation.items():
+            for cache in ('cold', 'hot'):
+                best = {'baseline': float('inf'), 'table': float('inf')}
+                for _ in range(repeat):
+                    for name, reads in (
+                        ('baseline', baseline),
+                        ('table', table),
+                    ):
+                        read = getattr(reads, operation)
+                        if cache == 'hot':
+                            for kw in kwargs:
+                                read(**kw)
+                        best[name] = min(
+                            best[name],
+                            _mean(
+                                functools.partial(_call, read),
+                                kwargs,
+                                read.cache_clear if cache == 'cold' else None,
+                            ),
+                        )
+                results.append(
+                    Overhead(
+                        dataset=dataset.name,
+                        rows=size,
+                        operation=operation,
+                        cache=cache,
+                        baseline_us=best['baseline'],
+                        table_us=best['table'],
+                    ),
+                )
+        baseline.close()
+        table.close()
+    return results
+
+
+def report_overhead(results: Sequence[Overhead]) -> str:
+    """Format overhead results as a table."""
+    lines = [
+        (
+            f'{"dataset":<14} {"rows":>9} {"operation":<9} {"cache":<5} '
+            f'{"baseline_us":>11} {"table_us":>9} {"speedup":>8}'
+        ),
+    ]
+    lines.extend(
+        f'{result.dataset:<14} {result.rows:>9} {result.operation:<9} '
+        f'{result.cache:<5} {result.baseline_us:>11.2f} '
+        f'{result.table_us:>9.2f} {result.speedup:>7.1f}x'
+        for result in results
+    )
+    return '\n'.join(lines)
+
+
+def metadata(*, calls: int, seed: int) -> dict[str, Any]:
+    """Describe the environment so results can be compared across runs."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],  # noqa: S607 (git from PATH)
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'calls': calls,
+        'seed': seed,
+    }
+
+
+def report(
+    results: Sequence[Result],
+    baseline: Sequence[Result] = (),
+) -> str:
+    """Format results as a table, with the change from a baseline if given.
+
+    The change is of the mean latency, so negative is faster.
+    """
+    previous = {result.key: result for result in baseline}
+    header = (
+        f'{"dataset":<14} {"rows":>9} {"engine":<6} {"operation":<9} '
+        f'{"cache":<5} {"mean_us":>10} {"p99_us":>10} {"change":>8}'
+    )
+    lines = [header]
+    for result in results:
+        change = ''
+        if result.key in previous:
+            base = previous[result.key].mean_us
+            change = f'{(result.mean_us - base) / base:+.1%}'
+        lines.append(
+            f'{result.dataset:<14} {result.rows:>9} {result.engine:<6} '
+            f'{result.operation:<9} {result.cache:<5} '
+            f'{result.mean_us:>10.1f} {result.p99_us:>10.1f} {change:>8}',
+        )
+    return '\n'.join(lines)
+
+
+def load(filepath: str) -> list[Result]:
+    """Load the results written by a previous run."""
+    with Path(filepath).open() as f:
+        return [Result(**result) for result in json.load(f)['results']]
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the table benchmarks."""
+    parser = argparse.ArgumentParser(
+        description='SQLTableInterface benchmarks',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        prog='python -m benchmarks.tables',
+    )
+    parser.add_argument(
+        '--datasets',
+        nargs='+',
+        choices=sorted(DATASETS),
+        default=sorted(DATASETS),
+        help='datasets to benchmark',
+    )
+    parser.add_argument(
+        '--sizes',
+        nargs='+',
+        type=int,
+        default=SIZES[:2],
+        help=f'rows per dataset (e.g., {" ".join(map(str, SIZES))})',
+    )
+    parser.add_argument(
+        '--engines',
+        nargs='+',
+        choices=ENGINES,
+        default=ENGINES,
+        help='storage engines to benchmark',
+    )
+    parser.add_argument(
+        '--calls',
+        type=int,
+        default=1000,
+        help='maximum calls per operation',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='seed for the generated datasets',
+    )
+    parser.add_argument(
+        '--overhead',
+        action='store_true',
+        help=(
+            'compare the per-call latency of get() and all() with the '
+            'original read path instead (SQLite only)'
+        ),
+    )
+    parser.add_argument(
+        '--output',
+        metavar='PATH',
+        help='write the results as JSON to this file',
+    )
+    parser.add_argument(
+        '--compare',
+        metavar='PATH',
+        help='show the change from the results in this file',
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.overhead:
+        return _main_overhead(args)
+
+    results = []
+    for name in args.datasets:
+        for size in args.sizes:
+            for engine in args.engines:
+                logger.info(
+                    'benchmarking %s (%s rows, %s)', name, size, engine
+                )
+                results.extend(
+                    run(
+                        DATASETS[name],
+                        size,
+                        engine,
+                        calls=args.calls,
+                        seed=args.seed,
+                    ),
+                )
+
+    if args.output is not None:
+        with Path(args.output).open('w') as f:
+            json.dump(
+                {
+                    'metadata': metadata(calls=args.calls, seed=args.seed),
+                    'results': [result._asdict() for result in results],
+                },
+                f,
+                indent=2,
+            )
+    baseline = load(args.compare) if args.compare is not None else []
+    sys.stdout.write(f'{report(results, baseline)}\n')
+    return 0
+
+
+def _main_overhead(args: argparse.Namespace) -> int:
+    results = []
+    for name in args.datasets:
+        for size in args.sizes:
+            logger.info('benchmarking overhead of %s (%s rows)', name, size)
+            results.extend(
+                overhead(
+                    DATASETS[name],
+                    size,
+                    calls=args.calls,
+                    seed=args.seed,
+                ),
+            )
+    if args.output is not None:
+        with Path(args.output).open('w') as f:
+            json.dump(
+                {
+                    'metadata': metadata(calls=args.calls, seed=args.seed),
+                    'overhead': [result._asdict() for result in results],
+                },
+                f,
+                indent=2,
+            )
+    sys.stdout.write(f'{report_overhead(results)}\n')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -18,9 +18,22 @@ TEMPLATE_CONFIG = """\
     "redirect_uri": <str>,
     "sounds_path": <str>,
     "sqlite_database": <str>,
+    "sqlite_cache_kib": 2000,
+    "sqlite_mmap_mib": 0,
+    "sqlite_synchronous": "FULL",
+    "sqlite_coherence_ms": 1000,
+    "sqlite_slow_query_ms": null,
+    "backup_path": null,
+    "backup_interval_hours": 24,
+    "backup_keep": 7,
+    "backup_compress": true,
+    "backup_vacuum": false,
     "sounds_port": 5001,
     "sounds_certfile": null,
     "sounds_keyfile": null,
+    "voice_idle_seconds": 60,
+    "voice_queue_size": 8,
+    "sounds_mix_voices": null,
     "playing_title": "3pseat Simulator 2022"
 }
 """
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import random
+from collections.abc import Iterator
+
 from threepseat.ext.reminders.data import Reminder
 from threepseat.ext.rules.data import GuildConfig
+from threepseat.ext.rules.data import UserOffenses
+from threepseat.ext.sounds.data import Sound
 
 GUILD_CONFIG = GuildConfig(
     guild_id=1234,
@@ -24,3 +29,68 @@ REMINDER = Reminder(
     text='test message',
     delay_minutes=1,
 )
+
+# Synthetic ids start here so they look like (and sort like) Discord ids.
+FIRST_ID = 100_000_000_000_000_000
+
+
+def guild_configs(count: int, *, seed: int = 0) -> Iterator[GuildConfig]:
+    """Generate guild configs with unique guild ids.
+
+    The rows are the same for the same count and seed, so datasets are
+    reproducible across runs.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        yield GUILD_CONFIG._replace(
+            guild_id=FIRST_ID + i,
+            enabled=rng.randint(0, 1),
+            event_expectancy=round(rng.uniform(0.1, 2), 2),
+            last_event=float(rng.randint(0, 2_000_000_000)),
+            max_offenses=rng.randint(1, 5),
+        )
+
+
+def sounds(count: int, *, guilds: int = 1, seed: int = 0) -> Iterator[Sound]:
+    """Generate sounds spread evenly over guilds.
+
+    Row i is in guild `FIRST_ID + i % guilds`, so the primary keys are
+    unique and a guild's sounds can be found without the rows. See
+    guild_configs() for reproducibility.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        name = f'sound{i // guilds}'
+        guild_id = FIRST_ID + i % guilds
+        yield Sound(
+            uuid=f'{rng.getrandbits(128):032x}',
+            name=name,
+            description=f'{name} description',
+            link='',
+            author_id=FIRST_ID + rng.randrange(1000),
+            guild_id=guild_id,
+            created_time=float(rng.randint(0, 2_000_000_000)),
+            filename=f'{name}-{guild_id}.mp3',
+        )
+
+
+def user_offenses(
+    count: int,
+    *,
+    guilds: int = 1,
+    seed: int = 0,
+) -> Iterator[UserOffenses]:
+    """Generate user offenses spread evenly over guilds.
+
+    See sounds() for how rows are assigned to guilds.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        total = rng.randint(0, 100)
+        yield UserOffenses(
+            guild_id=FIRST_ID + i % guilds,
+            user_id=FIRST_ID + i // guilds,
+            current_offenses=rng.randint(0, min(total, 3)),
+            total_offenses=total,
+            last_offense=float(rng.randint(0, 2_000_000_000)),
+        )
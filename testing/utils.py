@@ -3,15 +3,18 @@ from __future__ import annotations
 import asyncio
 import json
 import pathlib
+import struct
 import time
 import uuid
 from collections.abc import Awaitable
 from collections.abc import Callable
 from collections.abc import Generator
+from collections.abc import Sequence
 from typing import Any
 from typing import cast
 from unittest import mock
 
+import discord
 import pytest
 from discord import app_commands
 
@@ -66,3 +69,37 @@ def mock_download() -> Generator[None, None, None]:
         mock.MagicMock(side_effect=_download),
     ):
         yield
+
+
+def write_opus(filepath: str, packets: list[bytes]) -> None:
+    """Write packets to an Ogg/Opus file with one packet per page.
+
+    Only the structure discord.oggparse reads is written, so the file has
+    placeholder headers and checksums and cannot be decoded.
+    """
+    headers = [b'OpusHead' + bytes(11), b'OpusTags' + bytes(8)]
+    with pathlib.Path(filepath).open('wb') as f:
+        for index, packet in enumerate(headers + packets):
+            lacing = [255] * (len(packet) // 255) + [len(packet) % 255]
+            f.write(b'OggS')
+            f.write(struct.pack('<BBQIIIB', 0, 0, 0, 1, index, 0, len(lacing)))
+            f.write(bytes(lacing))
+            f.write(packet)
+
+
+class PCMSource(discord.AudioSource):
+    """PCM audio source that plays frames from memory."""
+
+    def __init__(self, frames: Sequence[bytes]) -> None:
+        self.frames = frames
+        self.index = 0
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        if self.index >= len(self.frames):
+            return b''
+        self.index += 1
+        return self.frames[self.index - 1]
+
+    def cleanup(self) -> None:
+        self.cleaned_up = True
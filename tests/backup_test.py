@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import pathlib
+import sqlite3
+from typing import NamedTuple
+from unittest import mock
+
+import pytest
+
+from testing.utils import wait_for
+from threepseat import connections
+from threepseat.backup import _Progress
+from threepseat.backup import backup
+from threepseat.backup import rotate
+from threepseat.backup import snapshot
+from threepseat.backup import snapshot_loop
+from threepseat.table import SQLTableInterface
+
+
+class ExampleRow(NamedTuple):
+    guild_id: int
+    value: str
+
+
+def _table(filepath: str) -> SQLTableInterface[ExampleRow]:
+    return SQLTableInterface(
+        ExampleRow,
+        'example',
+        filepath,
+        primary_keys=('guild_id',),
+    )
+
+
+def _count(filepath: str) -> int:
+    db = sqlite3.connect(filepath)
+    count: int = db.execute('SELECT COUNT(*) FROM example').fetchone()[0]
+    db.close()
+    return count
+
+
+def test_backup_live_database(tmp_path: pathlib.Path) -> None:
+    source = str(tmp_path / 'bot.db')
+    target = str(tmp_path / 'copy.db')
+    table = _table(source)
+    # The commits are still in the -wal file while the table is open, which
+    # copying the database file alone would miss.
+    table.update_many(ExampleRow(i, 'x' * 100) for i in range(1000))
+
+    backup(source, target, pages=1, sleep_ms=0)
+    assert _count(target) == 1000
+    db = sqlite3.connect(target)
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    db.close()
+    table.close()
+
+
+def test_backup_restarts_limited(
+    tmp_path: pathlib.Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    source = str(tmp_path / 'bot.db')
+    table = _table(source)
+    table.update_many(ExampleRow(i, 'x' * 100) for i in range(1000))
+
+    class _WriteEachStep(_Progress):
+        # A write by another connection between steps restarts the copy.
+        def __call__(self, status: int, remaining: int, total: int) -> None:
+            table.update(ExampleRow(0, str(remaining)))
+            super().__call__(status, remaining, total)
+
+    caplog.set_level(logging.WARNING)
+    with mock.patch('threepseat.backup._Progress', _WriteEachStep):
+        backup(source, str(tmp_path / 'copy.db'), pages=1, restarts=2)
+    assert 'restarted 2 times' in caplog.text
+    assert _count(str(tmp_path / 'copy.db')) == 1000
+    table.close()
+
+
+def test_backup_vacuum(tmp_path: pathlib.Path) -> None:
+    source = str(tmp_path / 'bot.db')
+    table = _table(source)
+    table.update_many(ExampleRow(i, 'x' * 100) for i in range(1000))
+    table.remove_many({'guild_id': i} for i in range(900))
+
+    backup(source, str(tmp_path / 'copy.db'))
+    backup(source, str(tmp_path / 'vacuum.db'), vacuum=True)
+    assert _count(str(tmp_path / 'vacuum.db')) == 100
+    # Free pages left by the removed rows are not copied.
+    assert (tmp_path / 'vacuum.db').stat().st_size < (
+        tmp_path / 'copy.db'
+    ).stat().st_size
+    table.close()
+
+
+def test_backup_validation(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(ValueError, match='in-memory'):
+        backup(connections.MEMORY_DATABASE, str(tmp_path / 'copy.db'))
+    target = tmp_path / 'copy.db'
+    target.touch()
+    with pytest.raises(ValueError, match='already exists'):
+        backup(str(tmp_path / 'bot.db'), str(target))
+
+
+def test_snapshot(tmp_path: pathlib.Path) -> None:
+    source = str(tmp_path / 'bot.db')
+    backups = tmp_path / 'backups'
+    table = _table(source)
+    table.update(ExampleRow(0, 'value'))
+
+    path = snapshot(source, str(backups))
+    assert path.parent == backups
+    assert path.name.startswith('bot-')
+    assert path.suffix == '.sqlite3'
+    assert _count(str(path)) == 1
+
+    compressed = snapshot(source, str(backups), compress=True)
+    assert compressed.name.endswith('.sqlite3.gz')
+    decompressed = tmp_path / 'decompressed.db'
+    with gzip.open(compressed, 'rb') as f:
+        decompressed.write_bytes(f.read())
+    assert _count(str(decompressed)) == 1
+
+    assert sorted(backups.iterdir()) == [path, compressed]
+    table.close()
+
+
+def test_snapshot_rotates(tmp_path: pathlib.Path) -> None:
+    source = str(tmp_path / 'bot.db')
+    backups = tmp_path / 'backups'
+    _table(source).close()
+
+    paths = [snapshot(source, str(backups), keep=2) for _ in range(3)]
+    assert sorted(backups.iterdir()) == paths[1:]
+
+    # Other files in the directory are left alone.
+    other = backups / 'bot-notes.txt'
+    other.touch()
+    assert rotate(str(backups), 'bot', 1) == [paths[1]]
+    assert sorted(backups.iterdir()) == sorted([other, paths[2]])
+
+
+def test_snapshot_failure_removes_partial(tmp_path: pathlib.Path) -> None:
+    source = str(tmp_path / 'bot.db')
+    backups = tmp_path / 'backups'
+    _table(source).close()
+
+    with (
+        mock.patch('threepseat.backup.gzip.open', side_effect=OSError),
+        pytest.raises(OSError),  # noqa: PT011
+    ):
+        snapshot(source, str(backups), compress=True)
+    assert list(backups.iterdir()) == []
+
+    # Partial snapshots of other calls are left alone.
+    other = backups / 'bot-20240101T000000000Z.sqlite3.partial'
+    other.touch()
+    with (
+        mock.patch('threepseat.backup.gzip.open', side_effect=OSError),
+        pytest.raises(OSError),  # noqa: PT011
+    ):
+        snapshot(source, str(backups), compress=True)
+    assert list(backups.iterdir()) == [other]
+
+
+async def test_snapshot_loop(
+    tmp_path: pathlib.Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    source = str(tmp_path / 'bot.db')
+    backups = tmp_path / 'backups'
+    _table(source).close()
+
+    task = snapshot_loop(source, str(backups), hours=1, compress=True)
+    task.start()
+    await wait_for(lambda: len(list(backups.glob('*.gz'))) == 1)
+    task.cancel()
+
+    # Failures are logged rather than stopping the loop.
+    caplog.set_level(logging.ERROR)
+    task = snapshot_loop(
+        str(tmp_path / 'missing' / 'bot.db'), str(backups), hours=1
+    )
+    task.start()
+    await wait_for(lambda: 'failed to snapshot' in caplog.text)
+    await asyncio.sleep(0)
+    assert task.is_running()
+    task.cancel()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import json
+import pathlib
+from unittest import mock
+
+import pytest
+
+from benchmarks.mixer import Result
+from benchmarks.mixer import main
+from benchmarks.mixer import report
+from benchmarks.mixer import run
+
+
+@pytest.mark.parametrize(('voices', 'gain'), [(1, 1.0), (3, 0.5)])
+def test_run(voices: int, gain: float) -> None:
+    result = run(voices, gain=gain, frames=20)
+    assert result.voices == voices
+    assert result.gain == gain
+    assert result.frames == 20
+    assert result.frames_per_second > 0
+    assert result.realtime_mixers == result.frames_per_second / 50
+
+
+def test_run_too_fast_to_time() -> None:
+    with mock.patch(
+        'benchmarks.mixer.time.process_time_ns',
+        return_value=0,
+    ):
+        assert run(1, frames=1).frames_per_second == float('inf')
+
+
+def test_report() -> None:
+    output = report([Result(4, 0.5, 100, 5000.0)])
+    assert output.splitlines()[1].split() == ['4', '0.50', '5000', '100']
+
+
+def test_main(
+    tmp_path: pathlib.Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    output = str(tmp_path / 'results.json')
+    assert (
+        main(
+            [
+                '--voices',
+                '1',
+                '2',
+                '--gains',
+                '1',
+                '--frames',
+                '10',
+                '--output',
+                output,
+            ],
+        )
+        == 0
+    )
+    with pathlib.Path(output).open() as f:
+        written = json.load(f)
+    assert written['metadata']['frames'] == 10
+    assert [r['voices'] for r in written['results']] == [1, 2]
+    assert 'frames/s' in capsys.readouterr().out
+
+    main(['--voices', '1', '--gains', '1', '--frames', '10'])
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import json
+import pathlib
+import subprocess
+from unittest import mock
+
+import pytest
+
+from benchmarks.tables import DATASETS
+from benchmarks.tables import BaselineReads
+from benchmarks.tables import Overhead
+from benchmarks.tables import Result
+from benchmarks.tables import load
+from benchmarks.tables import main
+from benchmarks.tables import metadata
+from benchmarks.tables import overhead
+from benchmarks.tables import report
+from benchmarks.tables import report_overhead
+from benchmarks.tables import run
+from testing import data
+
+
+def test_datasets_are_reproducible() -> None:
+    assert list(data.sounds(50, guilds=5, seed=1)) == list(
+        data.sounds(50, guilds=5, seed=1),
+    )
+    assert list(data.sounds(50, seed=1)) != list(data.sounds(50, seed=2))
+
+    sounds = list(data.sounds(50, guilds=5))
+    assert len({(s.name, s.guild_id) for s in sounds}) == 50
+    assert len({s.guild_id for s in sounds}) == 5
+    offenses = list(data.user_offenses(50, guilds=5))
+    assert len({(o.guild_id, o.user_id) for o in offenses}) == 50
+    configs = list(data.guild_configs(50))
+    assert len({c.guild_id for c in configs}) == 50
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'dict'])
+def test_run(engine: str) -> None:
+    results = run(DATASETS['sounds'], 30, engine, calls=5)
+    assert {(r.operation, r.cache) for r in results} == {
+        (operation, cache)
+        for operation in ('get', 'all', 'update', 'remove')
+        for cache in ('cold', 'hot')
+    }
+    for result in results:
+        assert result.engine == engine
+        assert result.calls > 0
+        assert 0 < result.p50_us <= result.max_us
+
+
+def test_main(
+    tmp_path: pathlib.Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    output = str(tmp_path / 'results.json')
+    assert (
+        main(
+            [
+                '--datasets',
+                'guild_configs',
+                'user_offenses',
+                '--sizes',
+                '12',
+                '--engines',
+                'dict',
+                '--calls',
+                '2',
+                '--output',
+                output,
+            ],
+        )
+        == 0
+    )
+    with pathlib.Path(output).open() as f:
+        written = json.load(f)
+    assert written['metadata']['calls'] == 2
+    results = load(output)
+    assert len(results) == 16
+    assert 'change' in capsys.readouterr().out
+
+    # Compared to itself, the change is only shown for matching results.
+    main(['--datasets', 'guild_configs', '--sizes', '12', '--compare', output])
+    lines = capsys.readouterr().out.splitlines()
+    assert sum(line.endswith('%') for line in lines) == 8
+
+
+def test_report() -> None:
+    result = Result('sounds', 10, 'dict', 'get', 'hot', 1, 2.0, 2.0, 2.0, 2.0)
+    baseline = result._replace(mean_us=4.0)
+    assert report([result], [baseline]).splitlines()[1].endswith('-50.0%')
+    assert not report([result]).splitlines()[1].endswith('%')
+
+
+def test_metadata_without_git() -> None:
+    with mock.patch(
+        'subprocess.run',
+        side_effect=subprocess.CalledProcessError(128, 'git'),
+    ):
+        assert metadata(calls=1, seed=0)['commit'] is None
+
+
+def test_overhead() -> None:
+    results = overhead(DATASETS['sounds'], 30, calls=5, repeat=2)
+    assert {(r.operation, r.cache) for r in results} == {
+        (operation, cache)
+        for operation in ('get', 'all')
+        for cache in ('cold', 'hot')
+    }
+    for result in results:
+        assert result.baseline_us > 0
+        assert result.table_us > 0
+
+
+def test_baseline_reads_match_table(tmp_path: pathlib.Path) -> None:
+    db_path = str(tmp_path / 'configs.db')
+    table = DATASETS['guild_configs'].table(db_path, str(tmp_path))
+    rows = list(data.guild_configs(10))
+    table.update_many(rows)
+    baseline = BaselineReads(table, type(rows[0]), db_path)
+
+    key = {k: getattr(rows[0], k) for k in table.primary_keys}
+    assert baseline.get(**key) == table.get(**key)
+    assert set(baseline.all()) == set(table.all())
+    assert baseline.get(guild_id=-1) is None
+    with pytest.raises(ValueError, match='not a member'):
+        baseline.get(missing=0)
+    with pytest.raises(ValueError, match='Type of guild_id'):
+        baseline.get(guild_id='0')
+    baseline.close()
+    table.close()
+
+
+def test_report_overhead() -> None:
+    result = Overhead('sounds', 10, 'get', 'hot', 2.0, 0.5)
+    assert result.speedup == 4.0
+    assert report_overhead([result]).splitlines()[1].endswith('4.0x')
+
+
+def test_main_overhead(
+    tmp_path: pathlib.Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    output = str(tmp_path / 'overhead.json')
+    args = ['--overhead', '--datasets', 'guild_configs', '--sizes', '12']
+    assert main([*args, '--calls', '2', '--output', output]) == 0
+    with pathlib.Path(output).open() as f:
+        assert len(json.load(f)['overhead']) == 4
+    assert 'speedup' in capsys.readouterr().out
+
+    main([*args, '--calls', '2'])
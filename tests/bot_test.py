@@ -156,13 +156,13 @@ async def test_bot_shutdown_closes_extensions(tmp_file: str) -> None:
         await bot.close()
 
     assert mock_close.called
-    assert birthdays.table._db is None
-    assert custom.table._db is None
-    assert reminders.table._db is None
-    assert rules.database.config_table._db is None
-    assert rules.database.offenses_table._db is None
-    assert sounds.table._db is None
-    assert sounds.join_table._db is None
+    assert not birthdays.table._backend.connected
+    assert not custom.table._backend.connected
+    assert not reminders.table._backend.connected
+    assert not rules.database.config_table._backend.connected
+    assert not rules.database.offenses_table._backend.connected
+    assert not sounds.table._backend.connected
+    assert not sounds.join_table._backend.connected
 
 
 async def test_bot_shutdown_without_extensions() -> None:
@@ -197,4 +197,4 @@ async def test_bot_shutdown_isolates_failures(
 
     # A failing extension is logged but does not stop the others.
     assert any('post_shutdown failed' in r.message for r in caplog.records)
-    assert good.table._db is None
+    assert not good.table._backend.connected
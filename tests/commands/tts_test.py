@@ -9,6 +9,7 @@ from testing.mock import MockInteraction
 from testing.mock import MockMember
 from testing.utils import extract
 from threepseat.commands.tts import tts
+from threepseat.voice import VoiceBusyError
 
 
 async def test_tts_command() -> None:
@@ -86,3 +87,26 @@ async def test_tts_command_exception() -> None:
         await tts_(interaction, 'test message')
 
     assert_followed(interaction, 'Failed to play TTS')
+
+
+async def test_tts_command_busy() -> None:
+    tts_ = extract(tts)
+
+    guild = MockGuild('guild', 5678)
+    interaction = MockInteraction(
+        tts,
+        user=MockMember('user', 1234, guild),
+        guild=guild,
+    )
+
+    with (
+        mock.patch('threepseat.commands.tts.voice_channel'),
+        mock.patch(
+            'threepseat.commands.tts.play_sound',
+            side_effect=VoiceBusyError('Too many sounds.'),
+        ),
+        mock.patch('threepseat.tts.gTTS'),
+    ):
+        await tts_(interaction, 'test message')
+
+    assert_followed(interaction, 'Try again later')
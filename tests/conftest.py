@@ -1,5 +1,47 @@
 from __future__ import annotations
 
+import pathlib
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+
 from testing.utils import config
 from testing.utils import mock_download
 from testing.utils import tmp_file
+from threepseat.table import DICT_DATABASE
+from threepseat.table import SQLTableInterface
+from threepseat.table import WriteBehind
+
+
+@pytest.fixture
+def make_table(
+    tmp_path: pathlib.Path,
+) -> Callable[..., SQLTableInterface[Any]]:
+    """Fixture that makes tables keyed on (guild_id, user_id) by engine.
+
+    The engine is 'sqlite' to write directly to the database file,
+    'write-behind' to buffer writes until the table is flushed or closed,
+    'mirror' to also keep the rows in memory, or 'dict' to keep the rows
+    only in memory. Tests parametrize the engines they support.
+    """
+
+    def _make(
+        engine: str,
+        row_type: type[Any],
+        name: str,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> SQLTableInterface[Any]:
+        return SQLTableInterface(
+            row_type,
+            name,
+            DICT_DATABASE if engine == 'dict' else str(tmp_path / 'tables.db'),
+            primary_keys=('guild_id', 'user_id'),
+            write_behind=WriteBehind(interval_ms=60_000, max_rows=10_000)
+            if engine == 'write-behind'
+            else None,
+            mirror=engine == 'mirror',
+            **kwargs,
+        )
+
+    return _make
@@ -0,0 +1,450 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from typing import NamedTuple
+
+import pytest
+
+from testing.utils import wait_for
+from threepseat import connections
+from threepseat.connections import ConnectionPool
+from threepseat.connections import PoolSettings
+from threepseat.table import SQLTableInterface
+
+
+class ExampleRow(NamedTuple):
+    guild_id: int
+    value: str
+
+
+def test_pool_invalid_settings(tmp_file: str) -> None:
+    with pytest.raises(ValueError, match='Synchronous mode'):
+        ConnectionPool(tmp_file, PoolSettings(synchronous='SOMETIMES'))
+    with pytest.raises(ValueError, match='At least one reader'):
+        ConnectionPool(tmp_file, PoolSettings(readers=0))
+
+
+def test_pool_pragmas(tmp_file: str) -> None:
+    settings = PoolSettings(
+        cache_size_kib=4096,
+        mmap_size_mib=1,
+        synchronous='NORMAL',
+    )
+    pool = ConnectionPool(tmp_file, settings)
+
+    with pool.writer() as db:
+        assert db.execute('PRAGMA cache_size').fetchone()[0] == -4096
+        assert db.execute('PRAGMA mmap_size').fetchone()[0] == 1 << 20
+        # 1 is NORMAL
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 1
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA query_only').fetchone()[0] == 0
+
+    with pool.reader() as db:
+        assert db.execute('PRAGMA cache_size').fetchone()[0] == -4096
+        assert db.execute('PRAGMA query_only').fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            db.execute('CREATE TABLE t (x INTEGER)')
+
+    pool.close()
+
+
+def test_pool_read_during_write(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file)
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+        db.execute('INSERT INTO t VALUES (1)')
+
+    with pool.writer() as db:
+        db.execute('INSERT INTO t VALUES (2)')
+
+        # A reader on another thread sees the last commit without waiting
+        # for the open write transaction.
+        results: list[int] = []
+
+        def _read() -> None:
+            with pool.reader() as reader:
+                results.append(
+                    reader.execute('SELECT COUNT(*) FROM t').fetchone()[0],
+                )
+
+        thread = threading.Thread(target=_read)
+        thread.start()
+        thread.join(timeout=5)
+        assert results == [1]
+
+    with pool.reader() as db:
+        assert db.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 2
+
+    pool.close()
+
+
+def test_pool_reuses_readers(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(readers=2))
+
+    with pool.reader() as first, pool.reader() as second:
+        assert first is not second
+    with pool.reader() as third:
+        assert third in (first, second)
+    assert len(pool._readers) == 2
+
+    pool.close()
+    assert pool._readers == []
+    assert pool._writer is None
+
+
+def test_pool_writer_rollback(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file)
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+
+    def _insert_then_fail() -> None:
+        with pool.writer() as db:
+            db.execute('INSERT INTO t VALUES (1)')
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _insert_then_fail()
+
+    with pool.reader() as db:
+        assert db.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+    pool.close()
+
+
+def test_memory_pool_reads_from_writer() -> None:
+    pool = ConnectionPool(connections.MEMORY_DATABASE)
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+    with pool.reader() as db:
+        assert db is pool._writer
+        assert db.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    assert pool._readers == []
+    pool.close()
+
+
+async def test_pool_run(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file)
+    name = await pool.run(lambda: threading.current_thread().name)
+    assert name.startswith('threepseat-sqlite')
+    pool.close()
+    assert pool._executor is None
+
+
+def test_acquire_shares_pool(tmp_file: str) -> None:
+    first = connections.acquire(tmp_file)
+    second = connections.acquire(tmp_file)
+    assert first is second
+
+    with first.writer():
+        pass
+    connections.release(first)
+    assert first._writer is not None
+
+    connections.release(second)
+    assert first._writer is None
+
+    # Released pools are not reused and releasing twice is a no-op.
+    third = connections.acquire(tmp_file)
+    assert third is not first
+    connections.release(first)
+    connections.release(third)
+
+
+def test_acquire_memory_is_private() -> None:
+    first = connections.acquire(connections.MEMORY_DATABASE)
+    second = connections.acquire(connections.MEMORY_DATABASE)
+    assert first is not second
+    with first.writer():
+        pass
+    connections.release(first)
+    assert first._writer is None
+    connections.release(second)
+
+
+def test_configure(tmp_file: str) -> None:
+    settings = PoolSettings(cache_size_kib=1234)
+    connections.configure(tmp_file, settings)
+    pool = connections.acquire(tmp_file)
+    assert pool.settings == settings
+    connections.release(pool)
+
+
+def test_tables_share_connections(tmp_file: str) -> None:
+    first = SQLTableInterface(ExampleRow, 'first', tmp_file)
+    second = SQLTableInterface(ExampleRow, 'second', tmp_file)
+    assert first.pool is second.pool
+
+    row = ExampleRow(1, 'value')
+    first.update(row)
+    second.update(row)
+    assert first.all() == second.all() == (row,)
+
+    pool = first.pool
+    first.close()
+    assert pool._writer is not None
+    second.close()
+    assert pool._writer is None
+
+
+def test_pool_reader_waits_for_idle_reader(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(readers=1))
+    borrowed: list[sqlite3.Connection] = []
+
+    def _borrow() -> None:
+        with pool.reader() as db:
+            borrowed.append(db)
+
+    with pool.reader() as first:
+        thread = threading.Thread(target=_borrow)
+        thread.start()
+        thread.join(timeout=0.05)
+        # Still waiting because the only reader is in use.
+        assert thread.is_alive()
+    thread.join(timeout=5)
+    assert borrowed == [first]
+    pool.close()
+
+
+def test_pool_close_while_reader_borrowed(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file)
+    with pool.reader() as first:
+        pool.close()
+    # The closed reader is not handed out again.
+    with pool.reader() as second:
+        assert second is not first
+    pool.close()
+
+
+async def test_pool_close_wakes_waiting_readers(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(readers=1))
+    borrowed: list[sqlite3.Connection] = []
+
+    def _read() -> None:
+        with pool.reader() as db:
+            borrowed.append(db)
+
+    with pool.reader() as first:
+        waiters = [threading.Thread(target=_read) for _ in range(2)]
+        for thread in waiters:
+            thread.start()
+        await wait_for(lambda: pool._waiting == len(waiters))
+        pool.close()
+        # The waiters get new readers rather than waiting for the closed one.
+        for thread in waiters:
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+    assert len(borrowed) == len(waiters)
+    assert first not in borrowed
+    pool.close()
+
+
+def _external_write(filepath: str) -> None:
+    db = sqlite3.connect(filepath)
+    with db:
+        db.execute('INSERT INTO t VALUES (1)')
+    db.close()
+
+
+def test_pool_check_external_writes(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(coherence_interval_ms=0))
+    calls: list[None] = []
+
+    def _listener() -> None:
+        calls.append(None)
+
+    pool.subscribe(_listener)
+
+    # Nothing to check until the writer is opened.
+    assert not pool.check_external_writes()
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+
+    # Writes by this pool are not external.
+    assert not pool.check_external_writes()
+    _external_write(tmp_file)
+    assert pool.check_external_writes()
+    assert not pool.check_external_writes()
+    assert len(calls) == 1
+
+    pool.unsubscribe(_listener)
+    pool.unsubscribe(_listener)
+    _external_write(tmp_file)
+    assert pool.check_external_writes()
+    assert len(calls) == 1
+    pool.close()
+
+
+def test_pool_check_external_writes_throttled(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(coherence_interval_ms=60_000))
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+    assert not pool.check_external_writes()
+    _external_write(tmp_file)
+    # Within the interval of the last check.
+    assert not pool.check_external_writes()
+    pool._next_check = 0
+    assert pool.check_external_writes()
+    pool.close()
+
+
+def test_pool_check_external_writes_skipped(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(coherence_interval_ms=None))
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+    _external_write(tmp_file)
+    assert not pool.check_external_writes()
+    pool.close()
+
+    pool = ConnectionPool(tmp_file, PoolSettings(coherence_interval_ms=0))
+    with pool.writer():
+        _external_write(tmp_file)
+
+        # Skipped while another thread holds the writer.
+        results: list[bool] = []
+        thread = threading.Thread(
+            target=lambda: results.append(pool.check_external_writes()),
+        )
+        thread.start()
+        thread.join(timeout=5)
+        assert results == [False]
+    assert pool.check_external_writes()
+    pool.close()
+
+    pool = ConnectionPool(connections.MEMORY_DATABASE)
+    with pool.writer():
+        pass
+    assert not pool.check_external_writes()
+    pool.close()
+
+
+def test_pool_schedule_check(
+    tmp_file: str,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    pool = ConnectionPool(tmp_file, PoolSettings(coherence_interval_ms=0))
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+    release = threading.Event()
+    threads: list[str] = []
+
+    def _reload() -> None:
+        # Like a mirror reload waiting for the writer lock.
+        threads.append(threading.current_thread().name)
+        release.wait(timeout=5)
+
+    pool.subscribe(_reload)
+    _external_write(tmp_file)
+    # Returns without waiting for the check or the listener.
+    pool.schedule_check()
+    # Only one check is scheduled at a time.
+    pool.schedule_check()
+    release.set()
+    pool.close()
+    assert len(threads) == 1
+    assert threads[0].startswith('threepseat-sqlite')
+
+    def _fail() -> None:
+        raise RuntimeError
+
+    pool.unsubscribe(_reload)
+    pool.subscribe(_fail)
+    with pool.writer():
+        pass
+    _external_write(tmp_file)
+    pool.schedule_check()
+    pool.close()
+    assert 'failed to check' in caplog.text
+
+
+def test_pool_schedule_check_skipped(tmp_file: str) -> None:
+    for pool in (
+        ConnectionPool(tmp_file, PoolSettings(coherence_interval_ms=None)),
+        ConnectionPool(connections.MEMORY_DATABASE),
+    ):
+        pool.schedule_check()
+        # The database thread was not started.
+        assert pool._executor is None
+        pool.close()
+
+
+def test_pool_transaction(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file)
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+    statements: list[str] = []
+    with pool.writer() as db:
+        db.set_trace_callback(statements.append)
+
+    events: list[str] = []
+    with pool.transaction() as db:
+        assert pool.in_transaction()
+        db.execute('INSERT INTO t VALUES (1)')
+        with pool.writer() as inner:
+            assert inner is db
+            inner.execute('INSERT INTO t VALUES (2)')
+        # Nested transactions join the outer one.
+        with pool.transaction() as inner:
+            inner.execute('INSERT INTO t VALUES (3)')
+        pool.defer(on_commit=lambda: events.append('commit'))
+        pool.defer(on_rollback=lambda: events.append('rollback'))
+        assert events == []
+
+        # Readers see the state before the transaction.
+        with pool.reader() as reader:
+            assert reader.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+        # Only the thread in the transaction joins it.
+        results: list[bool] = []
+        thread = threading.Thread(
+            target=lambda: results.append(pool.in_transaction()),
+        )
+        thread.start()
+        thread.join(timeout=5)
+        assert results == [False]
+
+    assert not pool.in_transaction()
+    assert statements.count('COMMIT') == 1
+    assert events == ['commit']
+    with pool.reader() as db:
+        assert db.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 3
+
+    # Outside of a transaction, on_commit is called immediately.
+    pool.defer(on_commit=lambda: events.append('now'))
+    pool.defer(on_rollback=lambda: events.append('never'))
+    assert events == ['commit', 'now']
+    pool.close()
+
+
+def test_pool_transaction_rollback(tmp_file: str) -> None:
+    pool = ConnectionPool(tmp_file)
+    with pool.writer() as db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+
+    events: list[str] = []
+
+    def _insert_then_fail() -> None:
+        with pool.transaction():
+            with pool.writer() as db:
+                db.execute('INSERT INTO t VALUES (1)')
+            pool.defer(
+                on_commit=lambda: events.append('commit'),
+                on_rollback=lambda: events.append('rollback'),
+            )
+            with pool.writer() as db:
+                db.execute('INSERT INTO t VALUES (2)')
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _insert_then_fail()
+    assert events == ['rollback']
+    assert not pool.in_transaction()
+    with pool.reader() as db:
+        assert db.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+    # Callbacks of the failed transaction are not kept.
+    with pool.transaction():
+        pass
+    assert events == ['rollback']
+    pool.close()
@@ -36,6 +36,9 @@ async def test_birthday_task(birthdays: BirthdayCommands) -> None:
     with mock.patch('discord.Client'):
         client = discord.Client()  # type: ignore[call-arg]
         client.guilds = [MockGuild('guild', 42)]  # type: ignore[misc]
+    birthday = BIRTHDAY._replace(guild_id=42)
+    birthdays.table.update(birthday)
+    birthdays.table.update(BIRTHDAY._replace(guild_id=43))
 
     # asyncio.sleep is patched so the task does not wait until midnight.
     # wait_for cannot be used here for the same reason: it would never yield.
@@ -51,6 +54,7 @@ async def test_birthday_task(birthdays: BirthdayCommands) -> None:
         task.cancel()
 
         assert mock_send.await_count >= 1
+        mock_send.assert_awaited_with(client.guilds[0], [birthday])
 
 
 async def test_post_init_shutdown(birthdays: BirthdayCommands) -> None:
@@ -62,7 +66,7 @@ async def test_post_init_shutdown(birthdays: BirthdayCommands) -> None:
 
     await birthdays.post_shutdown()
     assert birthdays._birthday_task is None
-    assert birthdays.table._db is None
+    assert not birthdays.table._backend.connected
 
 
 async def test_send_birthday_messages(birthdays: BirthdayCommands) -> None:
@@ -98,6 +102,30 @@ async def test_send_birthday_messages(birthdays: BirthdayCommands) -> None:
         assert mock_send.await_count == 1
 
 
+async def test_send_birthday_messages_prefetched(
+    birthdays: BirthdayCommands,
+) -> None:
+    guild = MockGuild('guild', BIRTHDAY.guild_id)
+    channel = MockChannel('channel', 42)
+    # Not in the table, so the message can only come from the argument.
+    birthday = BIRTHDAY._replace(
+        birth_month=datetime.datetime.now(tz=datetime.UTC).month,
+        birth_day=datetime.datetime.now(tz=datetime.UTC).day,
+    )
+    member = MockMember('user', birthday.user_id, guild)
+
+    with (
+        mock.patch.object(channel, 'send', mock.AsyncMock()) as mock_send,
+        mock.patch.object(guild, 'get_member', return_value=member),
+        mock.patch(
+            'threepseat.ext.birthdays.commands.primary_channel',
+            return_value=channel,
+        ),
+    ):
+        await birthdays.send_birthday_messages(guild, [birthday])
+        assert mock_send.await_count == 1
+
+
 async def test_send_birthday_messages_no_channel_found(
     birthdays: BirthdayCommands,
 ) -> None:
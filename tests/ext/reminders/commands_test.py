@@ -30,6 +30,9 @@ def reminders(tmp_file: str) -> ReminderCommands:
 async def test_start_repeating_reminders(reminders: ReminderCommands) -> None:
     reminders.table.update(REMINDER._replace(name='a'))
     reminders.table.update(REMINDER._replace(name='b'))
+    # Reminders in guilds the bot is no longer in are not started.
+    reminders.table.update(REMINDER._replace(guild_id=7, name='c'))
+    assert len(reminders.table.all(REMINDER.guild_id)) == 2
 
     with mock.patch('discord.Client'):
         client = discord.Client()  # type: ignore[call-arg]
@@ -44,7 +47,7 @@ async def test_start_repeating_reminders(reminders: ReminderCommands) -> None:
     tasks = [value.task for value in reminders._tasks.values()]
     await reminders.post_shutdown()
     assert len(reminders._tasks) == 0
-    assert reminders.table._db is None
+    assert not reminders.table._backend.connected
     for task in tasks:
         with pytest.raises(asyncio.CancelledError):
             await task._task  # type: ignore[misc]
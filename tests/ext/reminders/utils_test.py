@@ -3,6 +3,8 @@ from __future__ import annotations
 import logging
 from unittest import mock
 
+import pytest
+
 from testing.data import REMINDER as SHARED_REMINDER
 from testing.mock import MockChannel
 from testing.mock import MockClient
@@ -15,6 +17,7 @@ from threepseat.ext.reminders.data import ReminderType
 from threepseat.ext.reminders.utils import reminder_task
 from threepseat.ext.reminders.utils import send_text_reminder
 from threepseat.ext.reminders.utils import send_voice_reminder
+from threepseat.voice import VoiceBusyError
 
 # Run in roughly 10 ms rather than a minute.
 REMINDER = SHARED_REMINDER._replace(delay_minutes=0.0001)  # type: ignore[arg-type]
@@ -146,3 +149,23 @@ async def test_send_voice_reminder() -> None:
     ):
         await send_voice_reminder(client, channel, message)
         assert mock_play.await_count == 1
+
+
+async def test_send_voice_reminder_busy(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    client = MockClient(MockUser('user', 1234))
+    channel = MockVoiceChannel()
+    channel._members = [MockMember('user', 42, MockGuild('guild', 1234))]
+
+    with (
+        mock.patch('threepseat.tts.gTTS'),
+        mock.patch(
+            'threepseat.ext.reminders.utils.play_sound',
+            side_effect=VoiceBusyError(),
+        ),
+    ):
+        # Should not raise so repeating reminders keep running.
+        await send_voice_reminder(client, channel, 'test message')
+
+    assert any('skipped voice reminder' in r.message for r in caplog.records)
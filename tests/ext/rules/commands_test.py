@@ -111,8 +111,8 @@ async def test_on_message(commands: RulesCommands) -> None:
         # skip because guild missing config
         with mock.patch.object(
             commands.database,
-            'get_config',
-            return_value=None,
+            'aget_config',
+            mock.AsyncMock(return_value=None),
         ):
             await commands.on_message(message)
         assert mock_handler.await_count == 0
@@ -531,7 +531,7 @@ async def test_resume_events(commands: RulesCommands) -> None:
 
     await commands.post_shutdown()
     assert commands._event_starter_task is None
-    assert commands.database.config_table._db is None
+    assert not commands.database.config_table._backend.connected
 
     # Retest with guild not found
     with (
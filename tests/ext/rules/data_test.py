@@ -141,3 +141,17 @@ def test_add_remove_below_one(tmp_file: str) -> None:
 
     with pytest.raises(ValueError, match='greater than zero'):
         rules.remove_offense(1, 1, -1)
+
+
+def test_offenses_flushed_on_close(tmp_file: str) -> None:
+    rules = RulesDatabase(db_path=tmp_file)
+    rules.update_config(GUILD_CONFIG)
+    rules.add_offense(GUILD_CONFIG.guild_id, 42)
+    rules.add_offense(GUILD_CONFIG.guild_id, 42)
+    rules.close()
+
+    rules = RulesDatabase(db_path=tmp_file)
+    user = rules.get_user(GUILD_CONFIG.guild_id, 42)
+    assert user is not None
+    assert user.current_offenses == 2
+    rules.close()
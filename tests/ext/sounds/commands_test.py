@@ -22,6 +22,7 @@ from threepseat.ext.sounds.data import MAX_SOUND_LENGTH_SECONDS
 from threepseat.ext.sounds.data import MAX_VIDEO_FILE_SIZE_BYTES
 from threepseat.ext.sounds.data import MemberSound
 from threepseat.ext.sounds.data import Sound
+from threepseat.voice import VoiceBusyError
 
 
 @pytest.fixture
@@ -306,7 +307,7 @@ async def test_play_command(sound_fixtures: tuple[Bot, SoundCommands]) -> None:
     )
     with (
         mock.patch(
-            'threepseat.ext.sounds.commands.play_sound',
+            'threepseat.ext.sounds.data.play_sound',
             mock.AsyncMock(),
         ),
         mock.patch(
@@ -315,8 +316,15 @@ async def test_play_command(sound_fixtures: tuple[Bot, SoundCommands]) -> None:
         ),
     ):
         await play_(sounds, interaction, name='mysound')
+        assert_followed(interaction, 'Played!')
 
-    assert_followed(interaction, 'Played!')
+        # Back-pressure from a busy voice session.
+        with mock.patch(
+            'threepseat.ext.sounds.data.play_sound',
+            mock.AsyncMock(side_effect=VoiceBusyError('Busy.')),
+        ):
+            await play_(sounds, interaction, name='mysound')
+        assert_followed(interaction, 'Try again later')
 
 
 async def test_play_command_missing(
@@ -406,7 +414,7 @@ async def test_play_command_error(
     )
     with (
         mock.patch(
-            'threepseat.ext.sounds.commands.play_sound',
+            'threepseat.ext.sounds.data.play_sound',
             side_effect=Exception(),
         ),
         mock.patch(
@@ -497,9 +505,12 @@ async def test_upload_command_success(
         client=mockbot,
     )
 
-    with mock.patch(
-        'threepseat.ext.sounds.data.mp3_duration_seconds',
-        return_value=15.0,
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.data.mp3_duration_seconds',
+            return_value=15.0,
+        ),
+        mock.patch('threepseat.ext.sounds.data.encode_opus') as mock_encode,
     ):
         await upload_(
             sounds,
@@ -510,6 +521,7 @@ async def test_upload_command_success(
         )
 
     assert_followed(interaction, 'Uploaded and added')
+    mock_encode.assert_awaited_once()
 
 
 async def test_upload_command_invalid_extension(
@@ -710,6 +722,7 @@ async def test_upload_command_video_success(
             'threepseat.ext.sounds.data.extract_audio',
             side_effect=fake_extract,
         ),
+        mock.patch('threepseat.ext.sounds.data.encode_opus'),
     ):
         await upload_(
             sounds,
@@ -846,12 +859,14 @@ async def test_post_init(
 
     with mock.patch.object(mockbot, 'add_listener'):
         await sounds.post_init(mockbot)
-    assert sounds._vc_leaver_task is not None
+    assert sounds._idle is not None
+    assert sounds._backfill_task is not None
 
     await sounds.post_shutdown()
-    assert sounds._vc_leaver_task is None
-    assert sounds.table._db is None
-    assert sounds.join_table._db is None
+    assert sounds._idle is None
+    assert sounds._backfill_task is None
+    assert not sounds.table._backend.connected
+    assert not sounds.join_table._backend.connected
 
 
 async def test_voice_state_update(
@@ -868,7 +883,7 @@ async def test_voice_state_update(
     before.channel = None
     after.channel = None
 
-    with mock.patch('threepseat.ext.sounds.commands.play_sound') as mock_play:
+    with mock.patch('threepseat.ext.sounds.data.play_sound') as mock_play:
         # skip: before and after are the same
         await sounds.on_voice_state_update(member, before, after)
         assert mock_play.await_count == 0
@@ -904,9 +919,17 @@ async def test_voice_state_update(
         await sounds.on_voice_state_update(member, before, after)
         assert mock_play.await_count == 1
 
-    caplog.set_level(logging.ERROR)
+    caplog.set_level(logging.DEBUG)
+    with mock.patch(
+        'threepseat.ext.sounds.data.play_sound',
+        side_effect=VoiceBusyError(),
+    ):
+        # Entrance sounds are skipped in busy guilds.
+        await sounds.on_voice_state_update(member, before, after)
+    assert any('skipped entrance' in r.message for r in caplog.records)
+
     with mock.patch(
-        'threepseat.ext.sounds.commands.play_sound',
+        'threepseat.ext.sounds.data.play_sound',
         side_effect=Exception(),
     ):
         # exception should be captured and logged
@@ -1,20 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import pathlib
+import subprocess
 import time
 from unittest import mock
 
 import pytest
 
+from testing.utils import write_opus
 from threepseat.ext.sounds.data import MAX_SOUND_NAME_CHARS
 from threepseat.ext.sounds.data import MemberSound
 from threepseat.ext.sounds.data import MemberSoundTable
 from threepseat.ext.sounds.data import Sound
 from threepseat.ext.sounds.data import SoundsTable
+from threepseat.ext.sounds.data import backfill_opus
 from threepseat.ext.sounds.data import download
+from threepseat.ext.sounds.data import encode_opus
 from threepseat.ext.sounds.data import extract_audio
 from threepseat.ext.sounds.data import mp3_duration_seconds
 from threepseat.ext.sounds.data import supported_video_extensions_str
+from threepseat.utils import opus_path
 
 TEST_SOUND = Sound.new(
     name='mysound',
@@ -48,6 +54,14 @@ def test_filepath(tmp_path: pathlib.Path) -> None:
     assert pathlib.Path(data_path).is_dir()
 
 
+def test_list_sounds_uses_index(sounds: SoundsTable) -> None:
+    with sounds.connect() as db:
+        plan = db.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM sounds WHERE guild_id = 0',
+        ).fetchall()
+    assert 'sounds_guild_id_idx' in plan[0][-1]
+
+
 def test_add_get_sound(sounds: SoundsTable) -> None:
     sounds.add(TEST_SOUND)
 
@@ -171,16 +185,143 @@ def test_remove_sound(sounds: SoundsTable) -> None:
     found1 = sounds.get(name=TEST_SOUND.name, guild_id=TEST_SOUND.guild_id)
     assert found1 is not None
     assert pathlib.Path(sounds.filepath(found1.filename)).exists()
+    opus = pathlib.Path(opus_path(sounds.filepath(found1.filename)))
+    opus.touch()
 
     sounds.remove(name=TEST_SOUND.name, guild_id=TEST_SOUND.guild_id)
     found2 = sounds.get(name=TEST_SOUND.name, guild_id=TEST_SOUND.guild_id)
     assert found2 is None
     assert not pathlib.Path(sounds.filepath(found1.filename)).exists()
+    assert not opus.exists()
 
     # Should not error if sound does not exist
     sounds.remove(name='notasound', guild_id=123456789)
 
 
+async def test_sound_play(sounds: SoundsTable, tmp_path: pathlib.Path) -> None:
+    channel = mock.MagicMock()
+    with mock.patch(
+        'threepseat.ext.sounds.data.play_sound',
+        mock.AsyncMock(),
+    ) as mock_play:
+        await sounds.play(TEST_SOUND, channel, policy='enqueue')
+    filepath = sounds.filepath(TEST_SOUND.filename)
+    mock_play.assert_awaited_once_with(filepath, channel, policy='enqueue')
+
+    # Other gains are applied to the decoded sound.
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.data.play_sound',
+            mock.AsyncMock(),
+        ) as mock_play,
+        mock.patch('discord.FFmpegPCMAudio') as mock_audio,
+        mock.patch('discord.PCMVolumeTransformer') as mock_volume,
+    ):
+        await sounds.play(TEST_SOUND, channel, gain=0.5)
+    mock_audio.assert_called_once_with(filepath)
+    mock_volume.assert_called_once_with(mock_audio.return_value, volume=0.5)
+    mock_play.assert_awaited_once_with(
+        mock_volume.return_value,
+        channel,
+        policy='interrupt',
+    )
+    with pytest.raises(ValueError, match='must not be negative'):
+        await sounds.play(TEST_SOUND, channel, gain=-1)
+
+    mixed = SoundsTable(
+        str(tmp_path / 'mixed.db'),
+        str(tmp_path / 'data'),
+        mix_voices=2,
+    )
+    assert mixed.mixers is not None
+    assert mixed.mixers.max_voices == 2
+    with mock.patch.object(
+        mixed.mixers,
+        'play',
+        mock.AsyncMock(),
+    ) as mock_mix:
+        await mixed.play(TEST_SOUND, channel, gain=0.5)
+    mock_mix.assert_awaited_once_with(
+        filepath,
+        channel,
+        gain=0.5,
+        policy='interrupt',
+    )
+    mixed.close()
+
+
+async def test_sound_audio_source(sounds: SoundsTable) -> None:
+    sounds.add(TEST_SOUND)
+    filepath = sounds.filepath(TEST_SOUND.filename)
+
+    # Without an Opus file the MP3 is played.
+    assert await sounds.audio_source(TEST_SOUND) == filepath
+
+    write_opus(opus_path(filepath), [b'packet'])
+    source = await sounds.audio_source(TEST_SOUND)
+    assert not isinstance(source, str)
+    assert source.read() == b'packet'
+    assert sounds.packets.cache_info().currsize == 1
+
+    # Removing the sound drops its cached packets.
+    sounds.remove(TEST_SOUND.name, TEST_SOUND.guild_id)
+    info = sounds.packets.cache_info()
+    assert info.currsize == 0
+    assert info.invalidations == 1
+
+
+def test_remove_sound_clears_entrances(
+    sounds: SoundsTable,
+    tmp_path: pathlib.Path,
+) -> None:
+    member_sounds = MemberSoundTable(str(tmp_path / 'sounds.db'))
+    sounds.add(TEST_SOUND)
+    guild_id = TEST_SOUND.guild_id
+    member_sounds.update_many(
+        [
+            MemberSound(1, guild_id, TEST_SOUND.name, 0),
+            MemberSound(2, guild_id, 'other', 0),
+            MemberSound(3, guild_id + 1, TEST_SOUND.name, 0),
+        ],
+    )
+
+    statements: list[str] = []
+    with sounds.connect() as db:
+        db.set_trace_callback(statements.append)
+    sounds.remove(TEST_SOUND.name, guild_id, member_sounds=member_sounds)
+
+    # The sound and the entrance sounds using it are removed in one commit.
+    assert statements.count('COMMIT') == 1
+    assert sounds.get(name=TEST_SOUND.name, guild_id=guild_id) is None
+    assert [m.member_id for m in member_sounds.all(guild_id)] == [2]
+    assert len(member_sounds.all(guild_id + 1)) == 1
+    member_sounds.close()
+
+
+def test_remove_sound_in_memory(tmp_path: pathlib.Path) -> None:
+    sounds = SoundsTable(':memory:', data_path=str(tmp_path / 'data'))
+    member_sounds = MemberSoundTable(':memory:')
+    pathlib.Path(sounds.filepath(TEST_SOUND.filename)).touch()
+    sounds.add(TEST_SOUND)
+    guild_id = TEST_SOUND.guild_id
+    member_sounds.update(MemberSound(1, guild_id, TEST_SOUND.name, 0))
+
+    sounds.remove(TEST_SOUND.name, guild_id, member_sounds=member_sounds)
+    assert sounds.get(name=TEST_SOUND.name, guild_id=guild_id) is None
+    assert member_sounds.all(guild_id) == ()
+    sounds.close()
+    member_sounds.close()
+
+
+def _ffmpeg_output(
+    cmd: tuple[str, ...],
+    returncode: int,
+) -> subprocess.CompletedProcess[bytes]:
+    # ffmpeg writes the output file even if it fails part way.
+    pathlib.Path(cmd[-1]).touch()
+    return subprocess.CompletedProcess(cmd, returncode, b'', b'error')
+
+
 def test_youtube_download(tmp_path: pathlib.Path) -> None:
     filepath = str(tmp_path / 'test_video.mp3')
     link = 'https://www.youtube.com/watch?v=jhFDyDgMVUI'
@@ -191,8 +332,39 @@ def test_youtube_download(tmp_path: pathlib.Path) -> None:
             return_value={'duration': 0.1},
         ),
         mock.patch('threepseat.ext.sounds.data.YoutubeDL.download'),
+        mock.patch(
+            'threepseat.ext.sounds.data.subprocess.run',
+            side_effect=lambda cmd, **_: _ffmpeg_output(cmd, 0),
+        ) as mock_run,
+    ):
+        download(link, filepath)
+
+    # The downloaded MP3 is encoded to Opus next to it.
+    cmd = mock_run.call_args.args[0]
+    assert cmd[cmd.index('-i') + 1] == filepath
+    assert cmd[-1] != opus_path(filepath)
+    assert [p.name for p in tmp_path.iterdir()] == ['test_video.ogg']
+
+
+def test_youtube_download_encode_error(tmp_path: pathlib.Path) -> None:
+    filepath = str(tmp_path / 'test_video.mp3')
+    link = 'https://www.youtube.com/watch?v=jhFDyDgMVUI'
+
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.data.YoutubeDL.extract_info',
+            return_value={'duration': 0.1},
+        ),
+        mock.patch('threepseat.ext.sounds.data.YoutubeDL.download'),
+        mock.patch(
+            'threepseat.ext.sounds.data.subprocess.run',
+            side_effect=lambda cmd, **_: _ffmpeg_output(cmd, 1),
+        ),
+        pytest.raises(ValueError, match='Could not encode'),
     ):
         download(link, filepath)
+    # The partial output is removed.
+    assert list(tmp_path.iterdir()) == []
 
 
 def test_youtube_download_errors(tmp_path: pathlib.Path) -> None:
@@ -358,6 +530,129 @@ async def test_extract_audio_error(tmp_path: pathlib.Path) -> None:
         await extract_audio(source, mp3_path)
 
 
+def _mock_ffmpeg(proc: mock.MagicMock) -> mock.AsyncMock:
+    async def _exec(*cmd: str, **_: object) -> mock.MagicMock:
+        pathlib.Path(cmd[-1]).write_bytes(b'partial')
+        return proc
+
+    return mock.AsyncMock(side_effect=_exec)
+
+
+async def test_encode_opus(tmp_path: pathlib.Path) -> None:
+    mp3_path = str(tmp_path / 'sound.mp3')
+    # An existing Opus file is replaced rather than written in place.
+    opus = tmp_path / 'sound.ogg'
+    opus.write_bytes(b'old')
+    proc = _mock_ffprobe_process(returncode=0, stdout=b'')
+
+    with mock.patch(
+        'threepseat.ext.sounds.data.asyncio.create_subprocess_exec',
+        _mock_ffmpeg(proc),
+    ) as mock_exec:
+        assert await encode_opus(mp3_path) == str(opus)
+
+    cmd = mock_exec.call_args.args
+    assert 'libopus' in cmd
+    assert cmd[-1] != str(opus)
+    assert pathlib.Path(cmd[-1]).parent == tmp_path
+    proc.communicate.assert_awaited_once()
+    assert [p.name for p in tmp_path.iterdir()] == ['sound.ogg']
+    assert opus.read_bytes() == b'partial'
+
+
+async def test_encode_opus_error(tmp_path: pathlib.Path) -> None:
+    mp3_path = str(tmp_path / 'sound.mp3')
+    proc = _mock_ffprobe_process(returncode=1, stdout=b'', stderr=b'error')
+
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.data.asyncio.create_subprocess_exec',
+            _mock_ffmpeg(proc),
+        ),
+        pytest.raises(ValueError, match='Could not encode'),
+    ):
+        await encode_opus(mp3_path)
+    # The partial output is removed and never replaces the Opus file.
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('exited', [False, True])
+async def test_encode_opus_cancelled(
+    tmp_path: pathlib.Path,
+    exited: bool,
+) -> None:
+    mp3_path = str(tmp_path / 'sound.mp3')
+    proc = _mock_ffprobe_process(returncode=0, stdout=b'')
+    proc.communicate.side_effect = asyncio.CancelledError
+    if exited:
+        proc.kill.side_effect = ProcessLookupError
+
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.data.asyncio.create_subprocess_exec',
+            _mock_ffmpeg(proc),
+        ),
+        pytest.raises(asyncio.CancelledError),
+    ):
+        await encode_opus(mp3_path)
+    proc.kill.assert_called_once()
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_backfill_opus(
+    sounds: SoundsTable,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    def _add(name: str, *, mp3: bool = True, opus: bool = False) -> str:
+        sound = Sound.new(name, '', None, 1234, 5678)
+        filepath = sounds.filepath(sound.filename)
+        pathlib.Path(filepath).touch()
+        sounds.add(sound)
+        if not mp3:
+            pathlib.Path(filepath).unlink()
+        if opus:
+            pathlib.Path(opus_path(filepath)).touch()
+        return filepath
+
+    missing = _add('missing')
+    encoded = _add('encoded', opus=True)
+    failing = _add('failing')
+    deleted = _add('deleted', mp3=False)
+
+    async def _encode(mp3_path: str) -> str:
+        if mp3_path == failing:
+            raise ValueError
+        pathlib.Path(opus_path(mp3_path)).touch()
+        return opus_path(mp3_path)
+
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.data.encode_opus',
+            side_effect=_encode,
+        ) as mock_encode,
+        mock.patch.object(
+            sounds.packets,
+            'invalidate',
+            wraps=sounds.packets.invalidate,
+        ) as mock_invalidate,
+    ):
+        assert await backfill_opus(sounds) == 1
+        # Stale packets of the encoded sound are not played.
+        mock_invalidate.assert_called_once_with(opus_path(missing))
+        assert sorted(c.args[0] for c in mock_encode.call_args_list) == sorted(
+            [missing, failing],
+        )
+        assert pathlib.Path(opus_path(missing)).is_file()
+        assert encoded not in (c.args[0] for c in mock_encode.call_args_list)
+        assert any(deleted in r.message for r in caplog.records)
+        assert any(failing in r.message for r in caplog.records)
+
+        # Only the failed sound is retried.
+        mock_encode.reset_mock()
+        assert await backfill_opus(sounds) == 0
+        mock_encode.assert_awaited_once_with(failing)
+
+
 def test_supported_video_extensions_str() -> None:
     result = supported_video_extensions_str()
     assert 'mp4' in result
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from testing.utils import PCMSource
+from threepseat.ext.sounds.mixer import FRAME_SIZE
+from threepseat.ext.sounds.mixer import PCMMixer
+from threepseat.ext.sounds.mixer import SoundMixers
+from threepseat.ext.sounds.packets import OpusPackets
+from threepseat.voice import VoiceBusyError
+
+
+def _frame(value: int, samples: int = FRAME_SIZE // 2) -> bytes:
+    return np.full(samples, value, dtype=np.int16).tobytes()
+
+
+def _samples(frame: bytes) -> list[int]:
+    return sorted(set(np.frombuffer(frame, dtype=np.int16).tolist()))
+
+
+def test_mixer_passthrough() -> None:
+    mixer = PCMMixer(name='name')
+    assert repr(mixer) == "PCMMixer('name')"
+    assert not mixer.is_opus()
+
+    source = PCMSource([_frame(5), _frame(7, samples=10)])
+    assert mixer.add(source)
+    assert mixer.voices == 1
+    # A single voice at full gain is passed through.
+    assert mixer.read() == _frame(5)
+    # A short last frame is padded with silence.
+    assert mixer.read() == _frame(7, samples=10).ljust(FRAME_SIZE, b'\x00')
+
+    assert mixer.read() == b''
+    assert mixer.closed
+    assert mixer.voices == 0
+    assert source.cleaned_up
+    assert not mixer.add(PCMSource([_frame(1)]))
+
+
+def test_mixer_sums_and_clips() -> None:
+    mixer = PCMMixer()
+    mixer.add(PCMSource([_frame(100), _frame(30000), _frame(-30000)]))
+    mixer.add(PCMSource([_frame(-40), _frame(30000), _frame(-30000)]))
+    mixer.add(PCMSource([_frame(10, samples=11)]), gain=0.5)
+
+    frame = np.frombuffer(mixer.read(), dtype=np.int16)
+    assert len(frame) == FRAME_SIZE // 2
+    # Only the third voice's short frame is in the first samples.
+    assert frame[:11].tolist() == [65] * 11
+    assert _samples(frame[11:].tobytes()) == [60]
+
+    # Loud overlaps clip rather than wrap around.
+    assert _samples(mixer.read()) == [32767]
+    assert _samples(mixer.read()) == [-32768]
+    assert mixer.read() == b''
+
+
+def test_mixer_gain() -> None:
+    mixer = PCMMixer()
+    mixer.add(PCMSource([_frame(1000)]), gain=0.25)
+    assert _samples(mixer.read()) == [250]
+    mixer.cleanup()
+
+
+def test_mixer_add_validation() -> None:
+    mixer = PCMMixer(max_voices=1)
+    with pytest.raises(ValueError, match='PCM'):
+        mixer.add(OpusPackets([]))
+    with pytest.raises(ValueError, match='negative'):
+        mixer.add(PCMSource([]), gain=-1)
+
+    mixer.add(PCMSource([_frame(1)]))
+    with pytest.raises(VoiceBusyError):
+        mixer.add(PCMSource([_frame(1)]))
+
+    with pytest.raises(ValueError, match='at least one voice'):
+        PCMMixer(max_voices=0)
+
+
+def test_mixer_voice_added_as_last_ends() -> None:
+    mixer = PCMMixer()
+    added = PCMSource([_frame(3)])
+
+    class _Ending(PCMSource):
+        def read(self) -> bytes:
+            mixer.add(added)
+            return b''
+
+    mixer.add(_Ending([]))
+    # The new voice starts on the next frame rather than ending the mixer.
+    assert mixer.read() == bytes(FRAME_SIZE)
+    assert not mixer.closed
+    assert mixer.read() == _frame(3)
+    assert mixer.read() == b''
+
+
+def test_mixer_cleanup() -> None:
+    mixer = PCMMixer()
+    playing = PCMSource([_frame(1)] * 3)
+
+    class _Stopped(PCMSource):
+        def read(self) -> bytes:
+            # The voice client stops the mixer while it is reading.
+            mixer.cleanup()
+            return b''
+
+    stopped = _Stopped([])
+    mixer.add(playing)
+    mixer.add(stopped)
+    assert mixer.read() == _frame(1)
+    assert mixer.closed
+    assert mixer.read() == b''
+    assert playing.cleaned_up
+    assert stopped.cleaned_up
+
+
+def _channel(guild_id: int = 1, name: str = 'channel') -> Any:
+    channel = mock.MagicMock()
+    channel.guild.id = guild_id
+    channel.name = name
+    return channel
+
+
+@pytest.fixture
+def pcm_audio() -> Any:
+    with mock.patch(
+        'threepseat.ext.sounds.mixer.discord.FFmpegPCMAudio',
+        side_effect=lambda _: PCMSource([_frame(1)] * 10),
+    ) as mocked:
+        yield mocked
+
+
+def _submit(
+    futures: list[asyncio.Future[bool]] | None = None,
+) -> mock.MagicMock:
+    # Each sound's future stays pending until the test sets it.
+    def _future(*_: object, **__: object) -> asyncio.Future[bool]:
+        future = asyncio.get_running_loop().create_future()
+        if futures is not None:
+            futures.append(future)
+        return future
+
+    return mock.MagicMock(side_effect=_future)
+
+
+async def test_sound_mixers_play(pcm_audio: Any) -> None:
+    mixers = SoundMixers(max_voices=2)
+    channel = _channel()
+    assert mixers.mixer(1) is None
+
+    with mock.patch(
+        'threepseat.ext.sounds.mixer.submit_sound',
+        _submit(),
+    ) as mock_play:
+        await mixers.play('a.mp3', channel, policy='enqueue')
+        mixer = mixers.mixer(1)
+        assert mixer is not None
+        mock_play.assert_called_once_with(mixer, channel, policy='enqueue')
+
+        # The second sound is mixed into the playing mixer.
+        await mixers.play('b.mp3', channel, gain=0.5)
+        assert mock_play.call_count == 1
+        assert mixer.voices == 2
+        assert _samples(mixer.read()) == [2]
+
+        # The mixer is full.
+        with pytest.raises(VoiceBusyError):
+            await mixers.play('c.mp3', channel)
+        assert pcm_audio.call_count == 3
+
+        # Sounds in another channel get a new mixer.
+        other = _channel(name='other')
+        await mixers.play('d.mp3', other)
+        assert mock_play.call_count == 2
+        assert mixers.mixer(1) is not mixer
+
+        # As do sounds played after the mixer ends.
+        mixer = mixers.mixer(1)
+        assert mixer is not None
+        mixer.cleanup()
+        assert mixers.mixer(1) is None
+        await mixers.play('e.mp3', other)
+        assert mock_play.call_count == 3
+
+
+@pytest.mark.usefixtures('pcm_audio')
+async def test_sound_mixers_busy() -> None:
+    mixers = SoundMixers()
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.mixer.submit_sound',
+            side_effect=VoiceBusyError('busy'),
+        ),
+        pytest.raises(VoiceBusyError),
+    ):
+        await mixers.play('a.mp3', _channel(), policy='drop')
+    assert mixers.mixer(1) is None
+
+    with pytest.raises(ValueError, match='at least one voice'):
+        SoundMixers(max_voices=0)
+
+
+@pytest.mark.parametrize('outcome', ['error', 'skipped', 'cancelled'])
+async def test_sound_mixers_cleanup_when_not_played(
+    outcome: str,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    mixers = SoundMixers()
+    channel = _channel()
+    source = PCMSource([_frame(1)] * 10)
+    futures: list[asyncio.Future[bool]] = []
+
+    with (
+        mock.patch(
+            'threepseat.ext.sounds.mixer.discord.FFmpegPCMAudio',
+            return_value=source,
+        ),
+        mock.patch(
+            'threepseat.ext.sounds.mixer.submit_sound',
+            _submit(futures),
+        ),
+    ):
+        await mixers.play('a.mp3', channel)
+    mixer = mixers.mixer(1)
+    assert mixer is not None
+
+    if outcome == 'error':
+        # E.g., the session could not connect to the channel.
+        futures[0].set_exception(TimeoutError('connect'))
+    elif outcome == 'skipped':
+        futures[0].set_result(False)
+    else:
+        futures[0].cancel()
+    await asyncio.sleep(0)
+
+    assert mixer.closed
+    assert source.cleaned_up
+    assert mixers.mixer(1) is None
+    assert mixers._mixers == {}
+    assert any('error playing' in r.message for r in caplog.records) == (
+        outcome == 'error'
+    )
+
+
+async def test_sound_mixers_keep_newer_mixer(pcm_audio: Any) -> None:
+    mixers = SoundMixers()
+    futures: list[asyncio.Future[bool]] = []
+
+    with mock.patch(
+        'threepseat.ext.sounds.mixer.submit_sound',
+        _submit(futures),
+    ):
+        await mixers.play('a.mp3', _channel())
+        # A sound in another channel interrupts the first mixer.
+        await mixers.play('b.mp3', _channel(name='other'))
+    newer = mixers.mixer(1)
+    assert newer is not None
+
+    futures[0].set_result(False)
+    await asyncio.sleep(0)
+    assert mixers.mixer(1) is newer
+    assert pcm_audio.call_count == 2
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import pathlib
+from unittest import mock
+
+import pytest
+from discord.oggparse import OggError
+
+from testing.utils import write_opus
+from threepseat.ext.sounds.packets import OpusPacketCache
+from threepseat.ext.sounds.packets import OpusPackets
+from threepseat.ext.sounds.packets import PacketCacheInfo
+from threepseat.ext.sounds.packets import packets_size
+from threepseat.ext.sounds.packets import read_packets
+
+PACKETS = [b'a' * 100, b'b' * 300, b'c']
+
+
+@pytest.fixture
+def opus_file(tmp_path: pathlib.Path) -> str:
+    filepath = str(tmp_path / 'sound.ogg')
+    write_opus(filepath, PACKETS)
+    return filepath
+
+
+def test_read_packets(opus_file: str, tmp_path: pathlib.Path) -> None:
+    # The header packets are skipped.
+    assert read_packets(opus_file) == tuple(PACKETS)
+
+    with pytest.raises(FileNotFoundError):
+        read_packets(str(tmp_path / 'missing.ogg'))
+
+    not_opus = tmp_path / 'not_opus.ogg'
+    not_opus.write_bytes(b'ID3')
+    with pytest.raises(OggError):
+        read_packets(str(not_opus))
+
+    # An Ogg stream of another codec.
+    write_opus(str(not_opus), [])
+    not_opus.write_bytes(
+        not_opus.read_bytes().replace(b'OpusHead', b'Vorbis!!')
+    )
+    with pytest.raises(OggError, match='not an Ogg/Opus file'):
+        read_packets(str(not_opus))
+
+
+def test_opus_packets() -> None:
+    source = OpusPackets(PACKETS, 'name')
+    assert source.is_opus()
+    assert repr(source) == "OpusPackets('name')"
+    assert [source.read() for _ in range(4)] == [*PACKETS, b'']
+    assert source.read() == b''
+
+
+def test_packet_cache_info_hit_rate() -> None:
+    assert PacketCacheInfo(0, 0, 0, 0, 0, 0, 0).hit_rate == 0
+    assert PacketCacheInfo(3, 1, 0, 0, 0, 0, 0).hit_rate == 0.75
+
+
+def test_packet_cache(opus_file: str) -> None:
+    cache = OpusPacketCache()
+    assert cache.get(opus_file) == tuple(PACKETS)
+    with mock.patch(
+        'threepseat.ext.sounds.packets.read_packets',
+    ) as mock_read:
+        assert cache.get(opus_file) == tuple(PACKETS)
+        mock_read.assert_not_called()
+
+    info = cache.cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+    assert info.currsize == 1
+    assert info.currbytes == packets_size(tuple(PACKETS))
+
+    assert cache.invalidate(opus_file)
+    assert not cache.invalidate(opus_file)
+    info = cache.cache_info()
+    assert info.invalidations == 1
+    assert info.currsize == info.currbytes == 0
+
+    cache.get(opus_file)
+    cache.clear()
+    assert cache.cache_info().currbytes == 0
+
+
+def test_packet_cache_evicts_by_size(tmp_path: pathlib.Path) -> None:
+    filepaths = [str(tmp_path / f'{i}.ogg') for i in range(3)]
+    for filepath in filepaths:
+        write_opus(filepath, PACKETS)
+    size = packets_size(tuple(PACKETS))
+
+    cache = OpusPacketCache(2 * size)
+    cache.get(filepaths[0])
+    cache.get(filepaths[1])
+    # Touch the first file so the second is the least recently used.
+    cache.get(filepaths[0])
+    cache.get(filepaths[2])
+
+    info = cache.cache_info()
+    assert info.evictions == 1
+    assert info.currsize == 2
+    assert info.currbytes == 2 * size
+    assert filepaths[1] not in cache._entries
+
+    # Files larger than the cache are never cached.
+    cache = OpusPacketCache(size - 1)
+    cache.get(filepaths[0])
+    assert cache.cache_info().currsize == 0
+
+    with pytest.raises(ValueError, match='must not be negative'):
+        OpusPacketCache(-1)
+
+
+def test_packet_cache_concurrent_miss(opus_file: str) -> None:
+    cache = OpusPacketCache()
+    packets, generation = cache._lookup(opus_file)
+    assert packets is None
+    cache._put(opus_file, tuple(PACKETS), generation)
+    # A second miss for the same file replaces the first.
+    cache._put(opus_file, tuple(PACKETS), generation)
+    info = cache.cache_info()
+    assert info.currsize == 1
+    assert info.currbytes == packets_size(tuple(PACKETS))
+
+
+def test_packet_cache_invalidated_during_miss(opus_file: str) -> None:
+    cache = OpusPacketCache()
+
+    def _read(filepath: str) -> tuple[bytes, ...]:
+        # The file is removed while it is being read.
+        cache.invalidate(filepath)
+        return tuple(PACKETS)
+
+    with mock.patch(
+        'threepseat.ext.sounds.packets.read_packets',
+        side_effect=_read,
+    ):
+        assert cache.get(opus_file) == tuple(PACKETS)
+    assert cache.cache_info().currsize == 0
+
+
+async def test_packet_cache_asource(
+    opus_file: str,
+    tmp_path: pathlib.Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    cache = OpusPacketCache()
+    source = await cache.asource(opus_file)
+    assert source is not None
+    assert source.packets == tuple(PACKETS)
+
+    with mock.patch(
+        'threepseat.ext.sounds.packets.asyncio.to_thread'
+    ) as mock_thread:
+        source = await cache.asource(opus_file)
+        mock_thread.assert_not_called()
+    assert source is not None
+    assert source.packets == tuple(PACKETS)
+
+    assert await cache.asource(str(tmp_path / 'missing.ogg')) is None
+
+    not_opus = tmp_path / 'not_opus.ogg'
+    not_opus.write_bytes(b'ID3')
+    assert await cache.asource(str(not_opus)) is None
+    assert any('failed to read' in r.message for r in caplog.records)
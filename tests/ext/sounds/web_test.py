@@ -28,6 +28,8 @@ from threepseat.ext.sounds.web import create_app
 from threepseat.ext.sounds.web import get_member
 from threepseat.ext.sounds.web import get_mutual_guilds
 from threepseat.ext.sounds.web import request_too_large
+from threepseat.utils import opus_path
+from threepseat.voice import VoiceBusyError
 
 
 def _upload_file(
@@ -168,7 +170,11 @@ async def test_sound_grid(quart_app) -> None:
     user.id = 999
 
     with (
-        mock.patch.object(sounds, 'all', return_value=sound_list),
+        mock.patch.object(
+            sounds,
+            'aall',
+            mock.AsyncMock(return_value=sound_list),
+        ),
         mock.patch.object(bot, 'get_guild', return_value=guild),
         mock.patch.object(
             discord,
@@ -215,7 +221,11 @@ async def test_sound_grid_marks_entrance_sound(quart_app) -> None:
     user.id = 555
 
     with (
-        mock.patch.object(sounds, 'all', return_value=[sound]),
+        mock.patch.object(
+            sounds,
+            'aall',
+            mock.AsyncMock(return_value=[sound]),
+        ),
         mock.patch.object(bot, 'get_guild', return_value=guild),
         mock.patch.object(
             discord,
@@ -257,11 +267,11 @@ async def test_sound_play(quart_app) -> None:
     sounds = quart_app.app.config['sounds']
 
     with (
-        mock.patch.object(sounds, 'get'),
+        mock.patch.object(sounds, 'aget', mock.AsyncMock()),
         mock.patch.object(sounds, 'filepath'),
         mock.patch('threepseat.ext.sounds.web.get_member'),
         mock.patch('threepseat.ext.sounds.web.voice_channel'),
-        mock.patch('threepseat.ext.sounds.web.play_sound') as mocked,
+        mock.patch('threepseat.ext.sounds.data.play_sound') as mocked,
     ):
         response = await client.post('/sounds/1234/mysound/play')
         assert mocked.await_count == 1
@@ -281,7 +291,7 @@ async def test_sound_play_no_member(quart_app) -> None:
             mock.AsyncMock(return_value=object()),
         ),
         mock.patch('threepseat.ext.sounds.web.get_member', return_value=None),
-        mock.patch('threepseat.ext.sounds.web.play_sound') as mocked,
+        mock.patch('threepseat.ext.sounds.data.play_sound') as mocked,
     ):
         response = await client.post('/sounds/1234/mysound/play')
         assert mocked.await_count == 0
@@ -296,14 +306,14 @@ async def test_sound_play_no_sound(quart_app) -> None:
     discord = quart_app.app.config['DISCORD_OAUTH2_SESSION']
 
     with (
-        mock.patch.object(sounds, 'get', return_value=None),
+        mock.patch.object(sounds, 'aget', mock.AsyncMock(return_value=None)),
         mock.patch.object(
             discord,
             'fetch_user',
             mock.AsyncMock(return_value=object()),
         ),
         mock.patch('threepseat.ext.sounds.web.get_member'),
-        mock.patch('threepseat.ext.sounds.web.play_sound') as mocked,
+        mock.patch('threepseat.ext.sounds.data.play_sound') as mocked,
     ):
         response = await client.post('/sounds/1234/mysound/play')
         assert mocked.await_count == 0
@@ -318,7 +328,7 @@ async def test_sound_play_no_channel(quart_app) -> None:
     discord = quart_app.app.config['DISCORD_OAUTH2_SESSION']
 
     with (
-        mock.patch.object(sounds, 'get'),
+        mock.patch.object(sounds, 'aget', mock.AsyncMock()),
         mock.patch.object(sounds, 'filepath'),
         mock.patch.object(
             discord,
@@ -330,7 +340,7 @@ async def test_sound_play_no_channel(quart_app) -> None:
             'threepseat.ext.sounds.web.voice_channel',
             return_value=None,
         ),
-        mock.patch('threepseat.ext.sounds.web.play_sound') as mocked,
+        mock.patch('threepseat.ext.sounds.data.play_sound') as mocked,
     ):
         response = await client.post('/sounds/1234/mysound/play')
         assert mocked.await_count == 0
@@ -345,7 +355,7 @@ async def test_sound_play_error(quart_app) -> None:
     discord = quart_app.app.config['DISCORD_OAUTH2_SESSION']
 
     with (
-        mock.patch.object(sounds, 'get'),
+        mock.patch.object(sounds, 'aget', mock.AsyncMock()),
         mock.patch.object(sounds, 'filepath'),
         mock.patch.object(
             discord,
@@ -355,7 +365,7 @@ async def test_sound_play_error(quart_app) -> None:
         mock.patch('threepseat.ext.sounds.web.get_member'),
         mock.patch('threepseat.ext.sounds.web.voice_channel'),
         mock.patch(
-            'threepseat.ext.sounds.web.play_sound',
+            'threepseat.ext.sounds.data.play_sound',
             mock.AsyncMock(side_effect=Exception()),
         ) as mocked,
     ):
@@ -366,6 +376,33 @@ async def test_sound_play_error(quart_app) -> None:
     assert response.status_code == HTTPStatus.BAD_REQUEST
 
 
+async def test_sound_play_busy(quart_app) -> None:
+    client = quart_app.test_client()
+
+    sounds = quart_app.app.config['sounds']
+    discord = quart_app.app.config['DISCORD_OAUTH2_SESSION']
+
+    with (
+        mock.patch.object(sounds, 'aget', mock.AsyncMock()),
+        mock.patch.object(sounds, 'audio_source', mock.AsyncMock()),
+        mock.patch.object(
+            discord,
+            'fetch_user',
+            mock.AsyncMock(return_value=object()),
+        ),
+        mock.patch('threepseat.ext.sounds.web.get_member'),
+        mock.patch('threepseat.ext.sounds.web.voice_channel'),
+        mock.patch(
+            'threepseat.ext.sounds.data.play_sound',
+            mock.AsyncMock(side_effect=VoiceBusyError('Busy.')),
+        ) as mocked,
+    ):
+        response = await client.post('/sounds/1234/mysound/play')
+        assert mocked.await_count == 1
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+
+
 async def test_set_entrance_new(quart_app) -> None:
     client = quart_app.test_client()
 
@@ -373,7 +410,11 @@ async def test_set_entrance_new(quart_app) -> None:
     member_sounds = quart_app.app.config['member_sounds']
 
     with (
-        mock.patch.object(sounds, 'get', return_value=object()),
+        mock.patch.object(
+            sounds,
+            'aget',
+            mock.AsyncMock(return_value=object()),
+        ),
         authed_member(quart_app),
     ):
         response = await client.post('/sounds/5678/mysound/entrance')
@@ -403,7 +444,11 @@ async def test_set_entrance_toggle_clear(quart_app) -> None:
     )
 
     with (
-        mock.patch.object(sounds, 'get', return_value=object()),
+        mock.patch.object(
+            sounds,
+            'aget',
+            mock.AsyncMock(return_value=object()),
+        ),
         authed_member(quart_app),
     ):
         response = await client.post('/sounds/5678/mysound/entrance')
@@ -441,7 +486,7 @@ async def test_set_entrance_no_sound(quart_app) -> None:
     sounds = quart_app.app.config['sounds']
 
     with (
-        mock.patch.object(sounds, 'get', return_value=None),
+        mock.patch.object(sounds, 'aget', mock.AsyncMock(return_value=None)),
         authed_member(quart_app),
     ):
         response = await client.post('/sounds/5678/mysound/entrance')
@@ -478,7 +523,7 @@ async def test_sound_file_missing(quart_app) -> None:
 
     sounds = quart_app.app.config['sounds']
 
-    with mock.patch.object(sounds, 'get', return_value=None):
+    with mock.patch.object(sounds, 'aget', mock.AsyncMock(return_value=None)):
         response = await client.get('/sounds/5678/nope/file')
 
     assert response.status_code == HTTPStatus.NOT_FOUND
@@ -545,6 +590,7 @@ async def test_sound_add_success(quart_app) -> None:
             'threepseat.ext.sounds.data.mp3_duration_seconds',
             mock.AsyncMock(return_value=1.0),
         ),
+        mock.patch('threepseat.ext.sounds.data.encode_opus') as mock_encode,
     ):
         response = await client.post(
             '/sounds/5678/add',
@@ -553,6 +599,7 @@ async def test_sound_add_success(quart_app) -> None:
         )
 
     assert response.status_code == HTTPStatus.OK
+    mock_encode.assert_awaited_once()
     # The sound was actually persisted to the table.
     assert sounds.get('mysound', guild_id=5678) is not None
 
@@ -577,6 +624,7 @@ async def test_sound_add_video_success(quart_app) -> None:
             'threepseat.ext.sounds.data.extract_audio',
             side_effect=fake_extract,
         ) as mock_extract,
+        mock.patch('threepseat.ext.sounds.data.encode_opus'),
     ):
         response = await client.post(
             '/sounds/5678/add',
@@ -826,12 +874,24 @@ async def test_sound_add_duplicate_name(quart_app) -> None:
     pathlib.Path(sounds.filepath(existing.filename)).touch()
     sounds.add(existing)
 
+    encoded: list[pathlib.Path] = []
+
+    async def fake_encode(mp3_path: str) -> str:
+        path = pathlib.Path(opus_path(mp3_path))
+        path.touch()
+        encoded.append(path)
+        return str(path)
+
     with (
         authed_member(quart_app),
         mock.patch(
             'threepseat.ext.sounds.data.mp3_duration_seconds',
             mock.AsyncMock(return_value=1.0),
         ),
+        mock.patch(
+            'threepseat.ext.sounds.data.encode_opus',
+            side_effect=fake_encode,
+        ),
     ):
         response = await client.post(
             '/sounds/5678/add',
@@ -841,6 +901,10 @@ async def test_sound_add_duplicate_name(quart_app) -> None:
 
     assert response.status_code == HTTPStatus.BAD_REQUEST
     assert b'already exists' in await response.get_data()
+    # Both files of the rejected upload are cleaned up.
+    assert len(encoded) == 1
+    assert not encoded[0].exists()
+    assert not encoded[0].with_suffix('.mp3').exists()
 
 
 async def test_sound_add_save_error(quart_app) -> None:
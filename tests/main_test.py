@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import json
 import logging
 import pathlib
 import shutil
@@ -13,6 +14,7 @@ import pytest
 from hypercorn.logging import Logger as HypercornLogger
 
 import threepseat
+from testing.config import EXAMPLE_CONFIG
 from testing.config import TEMPLATE_CONFIG
 from threepseat.logging import configure_logging
 from threepseat.main import amain
@@ -240,3 +242,63 @@ async def test_amain_surfaces_first_of_many_errors(
 
     assert any('bot exited' in record.message for record in caplog.records)
     assert any('webapp exited' in record.message for record in caplog.records)
+
+
+def test_main_migrate(config: str, caplog: pytest.LogCaptureFixture) -> None:
+    caplog.set_level(logging.INFO)
+    assert main(['--migrate', config, '--dry-run']) == 0
+    assert 'would migrate sounds to version 1' in caplog.text
+    assert 'found' in caplog.text
+    assert main(['--migrate', config]) == 0
+    assert 'migrated sounds to version 1' in caplog.text
+
+
+def test_main_dry_run_requires_migrate(config: str) -> None:
+    with pytest.raises(SystemExit) as e:
+        main(['--config', config, '--dry-run'])
+    assert e.value.code != 0
+
+
+def _backup_config(tmp_path: pathlib.Path, **options: Any) -> str:
+    filepath = tmp_path / 'backup-config.json'
+    with filepath.open('w') as f:
+        json.dump(
+            {
+                **EXAMPLE_CONFIG,
+                'sqlite_database': str(tmp_path / 'bot.db'),
+                **options,
+            },
+            f,
+        )
+    return str(filepath)
+
+
+def test_main_backup(tmp_path: pathlib.Path) -> None:
+    backups = tmp_path / 'backups'
+    config = _backup_config(tmp_path, backup_path=str(backups))
+    assert main(['--backup', config]) == 0
+    (snapshot,) = backups.iterdir()
+    assert snapshot.name.startswith('bot-')
+    assert snapshot.name.endswith('.sqlite3.gz')
+
+
+def test_main_backup_requires_path(
+    tmp_path: pathlib.Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    caplog.set_level(logging.ERROR)
+    assert main(['--backup', _backup_config(tmp_path)]) == 1
+    assert 'backup_path is not set' in caplog.text
+
+
+async def test_amain_snapshots(tmp_path: pathlib.Path) -> None:
+    config = _backup_config(tmp_path, backup_path=str(tmp_path / 'backups'))
+    with (
+        mock.patch('threepseat.main.Bot.start', mock.AsyncMock()),
+        mock.patch('threepseat.main.serve', mock.AsyncMock()),
+        mock.patch('threepseat.main.backup.snapshot_loop') as snapshot_loop,
+    ):
+        await amain(threepseat.config.load(config), asyncio.Event())
+
+    snapshot_loop.return_value.start.assert_called_once()
+    snapshot_loop.return_value.cancel.assert_called_once()
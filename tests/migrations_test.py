@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import NamedTuple
+from unittest import mock
+
+import pytest
+
+# Imports the extensions, which register their migrations.
+import threepseat.main  # noqa: F401
+from threepseat import migrations
+from threepseat.migrations import Migration
+from threepseat.table import SQLTableInterface
+from threepseat.table import index_name
+
+
+class ExampleRow(NamedTuple):
+    guild_id: int
+    name: str
+    value: int
+
+
+def _add_column(db: sqlite3.Connection) -> None:
+    if migrations.table_exists(db, 'example'):
+        db.execute('ALTER TABLE example ADD COLUMN extra INTEGER')
+
+
+def _rebuild(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'example')
+
+
+def _fail(db: sqlite3.Connection) -> None:
+    db.execute('CREATE TABLE partial (x INTEGER)')
+    raise RuntimeError
+
+
+def _columns(filepath: str, table: str) -> list[str]:
+    db = sqlite3.connect(filepath)
+    columns = [c[1] for c in db.execute(f'PRAGMA table_info({table})')]
+    db.close()
+    return columns
+
+
+def _versions(filepath: str) -> dict[str, int]:
+    db = sqlite3.connect(filepath)
+    versions = migrations.versions(db)
+    db.close()
+    return versions
+
+
+def test_register() -> None:
+    with mock.patch.dict(migrations._registry, clear=True):
+
+        @migrations.register('b', 1, 'first', tables=('t',))
+        def _b1(db: sqlite3.Connection) -> None: ...
+
+        @migrations.register('a', 2, 'second')
+        def _a2(db: sqlite3.Connection) -> None: ...
+
+        @migrations.register('a', 1, 'first')
+        def _a1(db: sqlite3.Connection) -> None: ...
+
+        assert [(m.component, m.version) for m in migrations.registered()] == [
+            ('a', 1),
+            ('a', 2),
+            ('b', 1),
+        ]
+        assert migrations.registered()[2] == Migration(
+            'b',
+            1,
+            'first',
+            _b1,
+            ('t',),
+        )
+
+        with pytest.raises(ValueError, match='already registered'):
+            migrations.register('a', 1, 'again')(_a1)
+        with pytest.raises(ValueError, match='start at 1'):
+            migrations.register('a', 0, 'zero')(_a1)
+
+
+def test_extensions_register_migrations() -> None:
+    components = {m.component for m in migrations.registered()}
+    assert {'birthdays', 'rules', 'sounds'} <= components
+
+
+def test_migrate(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'example',
+        tmp_file,
+        primary_keys=('guild_id', 'name'),
+    )
+    table.update_many(ExampleRow(0, str(i), i) for i in range(3))
+    table.close()
+
+    steps = [
+        Migration('example', 2, 'rebuild', _rebuild, ('example',)),
+        Migration('example', 1, 'add column', _add_column, ('example',)),
+    ]
+
+    planned = migrations.migrate(tmp_file, dry_run=True, migrations=steps)
+    assert [(s.migration.version, s.rows) for s in planned] == [(1, 3), (2, 3)]
+    # Nothing was applied.
+    assert _versions(tmp_file) == {}
+    assert 'extra' not in _columns(tmp_file, 'example')
+
+    applied = migrations.migrate(tmp_file, migrations=steps)
+    assert applied == planned
+    assert _versions(tmp_file) == {'example': 2}
+    assert 'extra' in _columns(tmp_file, 'example')
+
+    # Already applied migrations are skipped.
+    assert migrations.migrate(tmp_file, migrations=steps) == ()
+
+    db = sqlite3.connect(tmp_file)
+    sql = db.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'example'",
+    ).fetchone()[0]
+    assert sql.endswith('WITHOUT ROWID')
+    assert db.execute('SELECT COUNT(*) FROM example').fetchone()[0] == 3
+    db.close()
+
+
+def test_migrate_new_database(tmp_file: str) -> None:
+    steps = [Migration('example', 1, 'add column', _add_column, ('example',))]
+    assert (
+        migrations.migrate(tmp_file, dry_run=True, migrations=steps)[0].rows
+        == 0
+    )
+    migrations.migrate(tmp_file, migrations=steps)
+    assert _versions(tmp_file) == {'example': 1}
+    assert 'extra' not in _columns(tmp_file, 'example')
+
+
+def test_migrate_failure_rolls_back(tmp_file: str) -> None:
+    steps = [
+        Migration('example', 1, 'add column', _add_column),
+        Migration('example', 2, 'fail', _fail),
+        Migration('other', 1, 'add column', _add_column),
+    ]
+    with pytest.raises(RuntimeError):
+        migrations.migrate(tmp_file, migrations=steps)
+
+    # The first migration was committed but the failed one was not.
+    assert _versions(tmp_file) == {'example': 1}
+    db = sqlite3.connect(tmp_file)
+    assert not migrations.table_exists(db, 'partial')
+    db.close()
+
+
+def test_rebuild_without_rowid_skips(tmp_file: str) -> None:
+    db = sqlite3.connect(tmp_file)
+    with db:
+        db.execute('CREATE TABLE legacy (x INTEGER, y TEXT)')
+        db.execute('CREATE TABLE keyed (x INTEGER PRIMARY KEY) WITHOUT ROWID')
+    assert not migrations.rebuild_without_rowid(db, 'missing')
+    assert not migrations.rebuild_without_rowid(db, 'legacy')
+    assert not migrations.rebuild_without_rowid(db, 'keyed')
+    db.close()
+
+
+def test_rebuilt_table_reopens(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'example',
+        tmp_file,
+        primary_keys=('guild_id', 'name'),
+        indexes=(('value',),),
+    )
+    row = ExampleRow(0, 'a', 1)
+    table.update(row)
+    table.close()
+
+    migrations.migrate(
+        tmp_file,
+        migrations=[Migration('example', 1, 'rebuild', _rebuild)],
+    )
+
+    table = SQLTableInterface(
+        ExampleRow,
+        'example',
+        tmp_file,
+        primary_keys=('guild_id', 'name'),
+        indexes=(('value',),),
+        without_rowid=True,
+    )
+    assert table.get(guild_id=0, name='a') == row
+    with table.connect() as db:
+        indexes = db.execute('PRAGMA index_list(example)').fetchall()
+    # The index dropped by the rebuild is recreated.
+    assert any(
+        index[1] == index_name('example', ('value',)) for index in indexes
+    )
+    table.close()
@@ -1,20 +1,44 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import logging
 import pathlib
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
 from collections.abc import Iterable
 from collections.abc import Sequence
+from typing import Any
 from typing import NamedTuple
+from unittest import mock
 
 import pytest
 
+from testing.utils import wait_for
+from threepseat import connections
 from threepseat.table import CACHE_MAXSIZE
+from threepseat.table import DICT_DATABASE
+from threepseat.table import LATENCY_BUCKETS_MS
+from threepseat.table import MAX_VARIABLES
+from threepseat.table import CacheInfo
+from threepseat.table import ChangeEvent
 from threepseat.table import Field
+from threepseat.table import OperationStats
+from threepseat.table import SQLiteBackend
 from threepseat.table import SQLTableInterface
+from threepseat.table import TableCache
+from threepseat.table import WriteBehind
 from threepseat.table import field_names
 from threepseat.table import field_types
+from threepseat.table import fields_to_excluded_str
 from threepseat.table import fields_to_insert_str
 from threepseat.table import fields_to_search_str
 from threepseat.table import fields_to_update_str
+from threepseat.table import index_name
+from threepseat.table import row_matches
+from threepseat.table import transaction
 
 
 class ExampleRow(NamedTuple):
@@ -37,6 +61,11 @@ def table(
     )
 
 
+def _sqlite(table: SQLTableInterface[Any]) -> SQLiteBackend[Any]:
+    assert isinstance(table._backend, SQLiteBackend)
+    return table._backend
+
+
 def test_table_init(tmp_file: str) -> None:
     table = SQLTableInterface(ExampleRow, 'mytable', tmp_file)
 
@@ -65,6 +94,59 @@ def test_table_init_primary_keys_valid() -> None:
         )
 
 
+def test_table_init_indexes(tmp_file: str) -> None:
+    indexes = (('guild_id',), ('timestamp', 'admin'))
+    table = SQLTableInterface(ExampleRow, 'mytable', tmp_file, indexes=indexes)
+    assert table.indexes == indexes
+    # Creating the indexes is idempotent.
+    table = SQLTableInterface(ExampleRow, 'mytable', tmp_file, indexes=indexes)
+
+    with table.connect() as db:
+        rows = db.execute(
+            'SELECT name FROM sqlite_master '
+            'WHERE type="index" AND tbl_name="mytable"',
+        ).fetchall()
+        plan = db.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM mytable WHERE guild_id = 0',
+        ).fetchall()
+    assert {row[0] for row in rows} == {
+        'mytable_guild_id_idx',
+        'mytable_timestamp_admin_idx',
+    }
+    assert 'mytable_guild_id_idx' in plan[0][-1]
+
+    with pytest.raises(ValueError, match='is not a field'):
+        SQLTableInterface(
+            ExampleRow,
+            'mytable',
+            ':memory:',
+            indexes=(('guild_id', 'missing_field'),),
+        )
+
+
+def test_indexes_survive_legacy_migration(tmp_file: str) -> None:
+    with contextlib.closing(sqlite3.connect(tmp_file)) as db, db:
+        db.execute('CREATE TABLE mytable (guild_id INTEGER, name TEXT)')
+
+    class _Row(NamedTuple):
+        guild_id: int
+        name: str
+
+    table = SQLTableInterface(
+        _Row,
+        'mytable',
+        tmp_file,
+        primary_keys=('name',),
+        indexes=(('guild_id',),),
+    )
+    with table.connect() as db:
+        count = db.execute(
+            'SELECT COUNT(*) FROM sqlite_master '
+            'WHERE type="index" AND name="mytable_guild_id_idx"',
+        ).fetchone()[0]
+    assert count == 1
+
+
 def test_makes_parent_dirs(tmp_path: pathlib.Path) -> None:
     db_parent_path = tmp_path / 'dir1' / 'dir2'
     db_path = str(db_parent_path / 'test.db')
@@ -78,6 +160,8 @@ def test_validate_kwargs() -> None:
     table.validate_kwargs({})
     table.validate_kwargs({'guild_id': 1})
     table.validate_kwargs({'guild_id': 1, 'filepath': None})
+    # Subclasses of a field's type fall back to isinstance().
+    table.validate_kwargs({'guild_id': True})
 
     with pytest.raises(ValueError, match='not a member'):
         table.validate_kwargs(
@@ -102,11 +186,9 @@ def test_get_with_no_params(table: SQLTableInterface[ExampleRow]) -> None:
 def test_get_multiple_values(table: SQLTableInterface[ExampleRow]) -> None:
     row = ExampleRow(0, 0, 0.0, None, True)
     table.update(row)
+    table.update(row._replace(guild_id=1))
 
-    # Manually add second row with same values
-    with table.connect() as db:
-        db.execute(f'INSERT INTO {table.name} VALUES (0, 0, 0.0, NULL, 0)')  # noqa: S608
-
+    # user_id alone is not a primary key, so it matches both rows.
     with pytest.raises(ValueError, match='Found multiple matching rows'):
         table.get(user_id=0)
 
@@ -125,16 +207,126 @@ def test_update(table: SQLTableInterface[ExampleRow]) -> None:
     assert result.timestamp == 2.0
 
 
-def test_update_multiple_rows(table: SQLTableInterface[ExampleRow]) -> None:
-    row = ExampleRow(0, 0, 0.0, None, True)
+def test_update_is_single_statement(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    statements: list[str] = []
+    with table.connect() as db:
+        db.set_trace_callback(statements.append)
 
-    table.update(row)
-    # Manually add second row with same values
+    table.update(ExampleRow(0, 0, 0.0, None, True))
+    table.update(ExampleRow(0, 0, 1.0, None, True))
+
+    writes = [s for s in statements if s.startswith('INSERT')]
+    assert len(writes) == 2
+    assert all('ON CONFLICT' in s for s in writes)
+    assert not any(s.startswith(('UPDATE', 'SELECT')) for s in statements)
+
+
+def test_primary_keys_declared(table: SQLTableInterface[ExampleRow]) -> None:
     with table.connect() as db:
-        db.execute(f'INSERT INTO {table.name} VALUES (0, 0, 0.0, NULL, 1)')  # noqa: S608
+        info = db.execute(f'PRAGMA table_info({table.name})').fetchall()
+    assert {column[1] for column in info if column[5]} == {
+        'guild_id',
+        'user_id',
+    }
+
+    table.update(ExampleRow(0, 0, 0.0, None, True))
+    with table.connect() as db, pytest.raises(sqlite3.IntegrityError):
+        db.execute(f'INSERT INTO {table.name} VALUES (0, 0, 0.0, NULL, 0)')  # noqa: S608
+
+
+def test_migrate_legacy_table(
+    tmp_file: str,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    # Legacy tables were created without a primary key and could contain
+    # duplicate rows for the same keys.
+    with contextlib.closing(sqlite3.connect(tmp_file)) as db, db:
+        db.execute(
+            'CREATE TABLE mytable (guild_id INTEGER NOT NULL, user_id INTEGER '
+            'NOT NULL, timestamp REAL NOT NULL, filepath TEXT, admin BOOLEAN '
+            'NOT NULL)',
+        )
+        db.executemany(
+            'INSERT INTO mytable VALUES (?, ?, ?, ?, ?)',
+            [(0, 0, 0.0, None, 1), (0, 1, 0.0, 'a', 0), (0, 0, 1.0, None, 1)],
+        )
+
+    caplog.set_level(logging.INFO)
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+
+    # The most recently inserted duplicate is kept.
+    assert table.all() == (
+        ExampleRow(0, 1, 0.0, 'a', False),
+        ExampleRow(0, 0, 1.0, None, True),
+    )
+    assert 'dropped 1 row(s)' in caplog.text
+    table.update(ExampleRow(0, 0, 2.0, None, True))
+    assert len(table.all()) == 2
+    table.close()
+
+    # Reopening an already migrated table does not rebuild it again.
+    caplog.clear()
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    assert 'migrated' not in caplog.text
+    assert len(table.all()) == 2
 
-    with pytest.raises(ValueError, match='Updated more than one row!'):
-        table.update(row._replace(admin=False))
+
+def test_migrate_legacy_table_without_duplicates(
+    tmp_file: str,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    with contextlib.closing(sqlite3.connect(tmp_file)) as db, db:
+        db.execute('CREATE TABLE mytable (guild_id INTEGER, name TEXT)')
+        db.execute("INSERT INTO mytable VALUES (0, 'a')")
+
+    class _Row(NamedTuple):
+        guild_id: int
+        name: str
+
+    table = SQLTableInterface(
+        _Row,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'name'),
+    )
+    assert table.all() == (_Row(0, 'a'),)
+    assert 'dropped' not in caplog.text
+
+
+def test_update_without_primary_keys_inserts() -> None:
+    table = SQLTableInterface(ExampleRow, 'mytable', ':memory:')
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    table.update(row)
+    assert table.all() == (row, row)
+
+
+def test_update_only_primary_keys() -> None:
+    class _KeysOnly(NamedTuple):
+        guild_id: int
+        name: str
+
+    table = SQLTableInterface(
+        _KeysOnly,
+        'mytable',
+        ':memory:',
+        primary_keys=('guild_id', 'name'),
+    )
+    table.update(_KeysOnly(0, 'a'))
+    table.update(_KeysOnly(0, 'a'))
+    assert table.all() == (_KeysOnly(0, 'a'),)
 
 
 def test_all(table: SQLTableInterface[ExampleRow]) -> None:
@@ -165,12 +357,6 @@ def test_remove(table: SQLTableInterface[ExampleRow]) -> None:
     assert table.get(guild_id=row.guild_id, user_id=row.user_id) is None
 
     assert len(table.all()) == 0
-    table.update(row)
-    # Manually add second row
-    with table.connect() as db:
-        db.execute(f'INSERT INTO {table.name} VALUES (0, 0, 0.0, NULL, 0)')  # noqa: S608
-
-    assert table.remove(guild_id=row.guild_id, user_id=row.user_id) == 2
 
 
 def test_remove_without_primary_keys(
@@ -230,38 +416,464 @@ def test_all_returns_immutable_result(
     assert isinstance(table.all(guild_id=0), tuple)
 
 
-def test_update_resets_cache(table: SQLTableInterface[ExampleRow]) -> None:
+def test_update_invalidates_matching_entries(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
     row = ExampleRow(0, 0, 0.0, None, True)
-
     table.update(row)
-    assert table.get.cache_info().misses == 0
+    table.update(row._replace(guild_id=1))
 
     table.get(guild_id=0, user_id=0)
-    assert table.get.cache_info().misses == 1
-
+    table.get(guild_id=1, user_id=0)
     table.all(guild_id=0)
-    assert table.all.cache_info().misses == 1
+    table.all(guild_id=1)
 
     table.update(row._replace(timestamp=1.0))
-    assert table.get.cache_info().misses == 0
-    assert table.all.cache_info().misses == 0
+
+    # Only the entries containing the written row are evicted; guild 1's
+    # entries are unaffected and stay cached.
+    assert table.get.cache_info().invalidations == 1
+    assert table.all.cache_info().invalidations == 1
+    assert table.get(guild_id=1, user_id=0) is not None
+    assert table.all(guild_id=1)
+    assert table.get.cache_info().hits == 1
+    assert table.all.cache_info().hits == 1
+
+    result = table.get(guild_id=0, user_id=0)
+    assert result is not None
+    assert result.timestamp == 1.0
+    assert table.all(guild_id=0) == (result,)
 
 
-def test_remove_resets_cache(table: SQLTableInterface[ExampleRow]) -> None:
+def test_update_invalidates_entries_the_row_now_matches(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
     row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+
+    # Cached results that do not contain the row yet, including a miss.
+    assert table.all(guild_id=0, user_id=1) == ()
+    assert table.get(guild_id=0, user_id=1) is None
+
+    table.update(row._replace(user_id=1))
 
+    assert table.get(guild_id=0, user_id=1) == row._replace(user_id=1)
+    assert table.all(guild_id=0, user_id=1) == (row._replace(user_id=1),)
+
+
+def test_update_invalidates_old_and_new_partitions() -> None:
+    # The row moves between partitions of a non-key field, so both the
+    # result it left and the result it joined are stale.
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        ':memory:',
+        primary_keys=('user_id',),
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
     table.update(row)
-    assert table.get.cache_info().misses == 0
+    assert table.all(guild_id=0) == (row,)
+    assert table.all(guild_id=1) == ()
+
+    table.update(row._replace(guild_id=1))
+
+    assert table.all(guild_id=0) == ()
+    assert table.all(guild_id=1) == (row._replace(guild_id=1),)
+
+
+def test_remove_invalidates_matching_entries(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    table.update(row._replace(guild_id=1))
 
     table.get(guild_id=0, user_id=0)
-    assert table.get.cache_info().misses == 1
+    table.all(guild_id=0)
+    table.all(guild_id=1)
+
+    table.remove(guild_id=0, user_id=0)
+
+    assert table.get.cache_info().currsize == 0
+    assert table.all.cache_info().currsize == 1
+    assert table.get(guild_id=0, user_id=0) is None
+    assert table.all(guild_id=0) == ()
 
+
+def test_remove_missing_row_keeps_cache(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    table.update(ExampleRow(0, 0, 0.0, None, True))
     table.all(guild_id=0)
+
+    assert table.remove(guild_id=0, user_id=1) == 0
+    assert table.all.cache_info().currsize == 1
+    assert table.all.cache_info().invalidations == 0
+
+
+class _ExampleTable(SQLTableInterface[ExampleRow]):
+    def __init__(self) -> None:
+        super().__init__(
+            ExampleRow,
+            'mytable',
+            ':memory:',
+            primary_keys=('guild_id', 'user_id'),
+        )
+
+    def _get(self, guild_id: int, user_id: int) -> ExampleRow | None:
+        return super()._get(guild_id=guild_id, user_id=user_id)
+
+
+def test_cache_key_ignores_argument_style() -> None:
+    table = _ExampleTable()
+    table.update(ExampleRow(0, 0, 0.0, None, True))
+
+    table.get(0, 0)
+    table.get(0, user_id=0)
+    table.get(user_id=0, guild_id=0)
+    assert table.get.cache_info().misses == 1
+    assert table.get.cache_info().hits == 2
+
+    # Invalidation matches the named arguments against the row's fields.
+    table.update(ExampleRow(0, 0, 1.0, None, True))
+    assert table.get.cache_info().currsize == 0
+
+
+def test_cache_key_ignores_unused_positional_arguments(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    # The base class read methods only use keyword arguments.
+    assert table.get.key(1, guild_id=0) == (('guild_id', 0),)
+
+
+def test_cache_hits_do_not_bind_arguments() -> None:
+    def _read(a: int, b: int = 0, *_: Any, **kwargs: Any) -> int:
+        return a + b + int(sum(kwargs.values()))
+
+    cache: TableCache[int] = TableCache(_read, lambda _: ())
+    assert cache(1, 2, c=3) == 6
+    with mock.patch.object(cache, 'key', wraps=cache.key) as key:
+        # Positional, keyword, and unused extra positional arguments.
+        assert cache(1, 2, c=3) == 6
+        assert cache(1, b=2, c=3) == 6
+        assert cache(c=3, b=2, a=1) == 6
+        assert cache(1, 2, 9, c=3) == 6
+        key.assert_not_called()
+    assert cache.cache_info().hits == 4
+
+    def _strict(a: int) -> int:
+        return a
+
+    strict: TableCache[int] = TableCache(_strict, lambda _: ())
+    strict(1)
+    # Invalid calls miss and are rejected when the call is bound.
+    with pytest.raises(TypeError):
+        strict(1, a=1)
+    with pytest.raises(TypeError):
+        strict(1, 2)
+    assert strict.cache_info().hits == 0
+
+
+def test_cache_check_interval() -> None:
+    check = mock.MagicMock()
+    cache: TableCache[int] = TableCache(
+        lambda x: x,
+        lambda _: (),
+        check=check,
+        check_interval=60,
+    )
+    cache(x=1)
+    cache(x=1)
+    cache.lookup(x=1)
+    check.assert_called_once()
+
+    with mock.patch(
+        'threepseat.table.time.monotonic',
+        return_value=time.monotonic() + 61,
+    ):
+        cache(x=1)
+    assert check.call_count == 2
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache: TableCache[int] = TableCache(lambda x: x, lambda _: (), maxsize=2)
+
+    cache(x=1)
+    cache(x=2)
+    cache(x=1)
+    cache(x=3)
+
+    info = cache.cache_info()
+    assert info.currsize == 2
+    assert info.evictions == 1
+    # 2 was the least recently used, so 1 is still cached.
+    cache(x=1)
+    assert cache.cache_info().hits == 2
+
+
+def test_cache_invalidate_row_uses_indexes() -> None:
+    rows = [ExampleRow(0, user_id, 0.0, None, True) for user_id in range(3)]
+    rows.append(ExampleRow(1, 0, 0.0, None, True))
+    scanned: list[tuple[ExampleRow, ...]] = []
+
+    def _all(**filters: Any) -> tuple[ExampleRow, ...]:
+        return tuple(row for row in rows if row_matches(row, filters.items()))
+
+    def _rows(value: tuple[ExampleRow, ...]) -> tuple[ExampleRow, ...]:
+        scanned.append(value)
+        return value
+
+    cache = TableCache(_all, _rows, primary_keys=('guild_id', 'user_id'))
+    cache(guild_id=0)
+    cache(guild_id=1)
+    cache(guild_id=0, user_id=1)
+    # A None filter and a filter that is not a field match any row.
+    cache(guild_id=None)
+    cache(guild_id=0, option='x')
+    scanned.clear()
+
+    # Entries matching the new version of the row.
+    row = ExampleRow(1, 0, 1.0, None, True)
+    assert cache.invalidate_row({'guild_id': 1, 'user_id': 0}, row) == 2
+    # Entries containing the old version of a removed row.
+    assert cache.invalidate_row({'guild_id': 0, 'user_id': 2}) == 2
+    # Only the evicted entries' rows were read to unindex them; the rows of
+    # the entry still cached were not checked.
+    assert len(scanned) == 4
+    assert (rows[1],) not in scanned
+    assert cache.cache_info().currsize == 1
+
+    # Without every primary key value, the rows of every entry are checked.
+    scanned.clear()
+    assert cache.invalidate_row({'guild_id': 0, 'user_id': None}) == 1
+    assert scanned[0] == (rows[1],)
+
+    unkeyed = TableCache(_all, _rows)
+    unkeyed(guild_id=1)
+    assert unkeyed.invalidate_row({}) == 1
+    assert unkeyed.cache_info().invalidations == 1
+
+
+def test_cache_skips_results_invalidated_during_miss() -> None:
+    def _func(x: int) -> int:
+        # A concurrent write lands while this miss is querying the table.
+        cache.invalidate(lambda *_: True)
+        return x
+
+    cache: TableCache[int] = TableCache(_func, lambda _: ())
+
+    assert cache(1) == 1
+    assert cache.cache_info().currsize == 0
+
+
+async def test_cache_coalesces_concurrent_misses() -> None:
+    started = threading.Event()
+    release = threading.Event()
+    calls: list[int] = []
+
+    def _func(x: int) -> int:
+        calls.append(x)
+        started.set()
+        release.wait(5)
+        if x < 0:
+            raise ValueError
+        return x
+
+    cache: TableCache[int] = TableCache(_func, lambda _: ())
+    results: list[int] = []
+    errors: list[Exception] = []
+
+    def _call(x: int) -> None:
+        try:
+            results.append(cache(x=x))
+        except ValueError as e:
+            errors.append(e)
+
+    for x in (1, -1):
+        started.clear()
+        release.clear()
+        threads = [threading.Thread(target=_call, args=(x,)) for _ in range(4)]
+        threads[0].start()
+        assert started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        await wait_for(lambda: cache.cache_info().coalesced in (3, 6))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+    # One query per distinct call and the waiters share its result.
+    assert calls == [1, -1]
+    assert results == [1, 1, 1, 1]
+    assert len(errors) == 4
+    assert len({id(e) for e in errors}) == 1
+    info = cache.cache_info()
+    assert (info.misses, info.coalesced, info.currsize) == (2, 6, 1)
+    assert cache._flights == {}
+
+
+async def test_cache_does_not_coalesce_across_invalidation() -> None:
+    release = threading.Event()
+    calls: list[int] = []
+
+    def _func(x: int) -> int:
+        calls.append(x)
+        if len(calls) == 1:
+            release.wait(5)
+        return x
+
+    cache: TableCache[int] = TableCache(_func, lambda _: ())
+    thread = threading.Thread(target=cache, args=(1,))
+    thread.start()
+    await wait_for(lambda: len(calls) == 1)
+
+    # The miss in flight may be stale, so a new miss queries again.
+    cache.invalidate(lambda *_: True)
+    assert cache(1) == 1
+    release.set()
+    thread.join(5)
+    assert calls == [1, 1]
+    assert cache.cache_info().coalesced == 0
+    # The newer miss is cached, the stale one is not.
+    assert cache.cache_info().currsize == 1
+
+
+async def test_cache_acall_coalesces() -> None:
+    calls: list[int] = []
+    release = asyncio.Event()
+
+    def _func(x: int) -> int:
+        calls.append(x)
+        return x
+
+    async def _run(func: Callable[..., int], *args: Any) -> int:
+        await release.wait()
+        return func(*args)
+
+    cache: TableCache[int] = TableCache(_func, lambda _: ())
+    first = asyncio.ensure_future(cache.acall(_run, 1))
+    second = asyncio.ensure_future(cache.acall(_run, 1))
+    await asyncio.sleep(0)
+    # Cancelling the caller that started the miss does not cancel it.
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == 1
+    assert first.cancelled()
+    assert calls == [1]
+
+    # Hits do not call run.
+    assert await cache.acall(_run, 1) == 1
+    info = cache.cache_info()
+    assert (info.hits, info.misses, info.coalesced) == (1, 1, 1)
+
+
+async def test_cache_acall_errors() -> None:
+    def _func(_: int) -> int:
+        raise ValueError
+
+    async def _run(func: Callable[..., int], *args: Any) -> int:
+        await asyncio.sleep(0)
+        return func(*args)
+
+    async def _cancelled(*_: Any) -> int:
+        raise asyncio.CancelledError
+
+    cache: TableCache[int] = TableCache(_func, lambda _: ())
+    results = await asyncio.gather(
+        cache.acall(_run, 1),
+        cache.acall(_run, 1),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(asyncio.CancelledError):
+        await cache.acall(_cancelled, 1)
+    assert cache.cache_info().currsize == 0
+
+
+async def test_cache_sync_call_does_not_join_async_miss() -> None:
+    release = asyncio.Event()
+
+    async def _run(func: Callable[..., int], *args: Any) -> int:
+        await release.wait()
+        return func(*args)
+
+    cache: TableCache[int] = TableCache(lambda x: x, lambda _: ())
+    pending = asyncio.ensure_future(cache.acall(_run, 1))
+    await asyncio.sleep(0)
+    # The async miss can only settle on the loop this call is blocking, so
+    # the sync call computes its own value rather than waiting for it.
+    assert cache(1) == 1
+    release.set()
+    assert await pending == 1
+    info = cache.cache_info()
+    assert (info.misses, info.coalesced) == (2, 0)
+
+
+async def test_sync_get_during_pending_aget(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    pending = asyncio.ensure_future(table.aget(guild_id=0, user_id=0))
+    await asyncio.sleep(0)
+    # Called on the loop while the aget() miss is in flight.
+    assert table.get(guild_id=0, user_id=0) == row
+    assert await pending == row
+    assert table.get.cache_info().coalesced == 0
+
+
+async def test_async_reads_share_one_query(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    statements: list[str] = []
+    with table.pool.reader() as db:
+        db.set_trace_callback(statements.append)
+
+    results = await asyncio.gather(*(table.aall(guild_id=0) for _ in range(8)))
+    assert results == [(row,)] * 8
     assert table.all.cache_info().misses == 1
+    assert len(statements) == 1
+    table.close()
 
-    table.remove(guild_id=0, user_id=0)
-    assert table.get.cache_info().misses == 0
-    assert table.all.cache_info().misses == 0
+
+def test_cache_clear_resets_counters() -> None:
+    cache: TableCache[int] = TableCache(lambda x: x, lambda _: ())
+    cache(1)
+    cache(1)
+    cache.cache_clear()
+    assert cache.cache_info() == CacheInfo(0, 0, 0, 0, CACHE_MAXSIZE, 0, 0)
+
+
+def test_index_name() -> None:
+    assert index_name('sounds', ('guild_id',)) == 'sounds_guild_id_idx'
+    assert index_name('t', ('a', 'b')) == 't_a_b_idx'
+
+
+@pytest.mark.parametrize(
+    ('filters', 'expected'),
+    [
+        ((), True),
+        ((('guild_id', 0),), True),
+        ((('guild_id', 1),), False),
+        ((('guild_id', 0), ('user_id', 1)), False),
+        # None and unknown names are treated as "no filter".
+        ((('guild_id', None),), True),
+        ((('not_a_field', 1),), True),
+    ],
+)
+def test_row_matches(
+    filters: tuple[tuple[str, object], ...],
+    expected: bool,
+) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+    assert row_matches(row, filters) is expected
 
 
 @pytest.mark.parametrize(
@@ -280,6 +892,18 @@ def test_fields_to_update_str(fields: Iterable[str], result: str) -> None:
     assert fields_to_update_str(fields) == result
 
 
+@pytest.mark.parametrize(
+    ('fields', 'result'),
+    [
+        ([], ''),
+        (['name'], 'name = excluded.name'),
+        (['name', 'date'], 'name = excluded.name, date = excluded.date'),
+    ],
+)
+def test_fields_to_excluded_str(fields: Iterable[str], result: str) -> None:
+    assert fields_to_excluded_str(fields) == result
+
+
 @pytest.mark.parametrize(
     ('fields', 'result'),
     [
@@ -382,6 +1006,1463 @@ def test_close_reopens_on_demand(table: SQLTableInterface[ExampleRow]) -> None:
     assert table.get(guild_id=0, user_id=0) == row
 
 
+async def test_async_operations(table: SQLTableInterface[ExampleRow]) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+
+    await table.aupdate(row)
+    assert await table.aget(guild_id=0, user_id=0) == row
+    assert await table.aall(guild_id=0) == (row,)
+    assert await table.aremove(guild_id=0, user_id=0) == 1
+    assert await table.aget(guild_id=0, user_id=0) is None
+    assert await table.aall(guild_id=0) == ()
+
+
+async def test_async_queries_run_on_database_thread(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    threads: list[str] = []
+
+    def _trace(statement: str) -> None:
+        # The coherence check before a cache hit is a cheap pragma run on
+        # the caller's thread, so it is not counted.
+        if statement != 'PRAGMA data_version':
+            threads.append(threading.current_thread().name)
+
+    with table.connect() as db:
+        db.set_trace_callback(_trace)
+
+    await table.aupdate(ExampleRow(0, 0, 0.0, None, True))
+    await table.aget(guild_id=0, user_id=0)
+    await table.aall(guild_id=0)
+    assert len(threads) > 0
+    assert all(name.startswith('threepseat-sqlite') for name in threads)
+
+    # Cache hits are answered on the event loop without a query.
+    threads.clear()
+    await table.aget(guild_id=0, user_id=0)
+    await table.aall(guild_id=0)
+    assert threads == []
+    assert table.get.cache_info().hits == 1
+    assert table.all.cache_info().hits == 1
+
+
+async def test_close_stops_database_thread(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+    await table.aupdate(row)
+    pool = _sqlite(table).pool
+    assert pool._executor is not None
+    table.close()
+    assert not table._backend.connected
+    assert pool._executor is None
+
+    # Both the connection and the thread are restarted on demand.
+    assert await table.aremove(guild_id=0, user_id=0) == 1
+
+
+def test_cache_lookup() -> None:
+    cache: TableCache[int] = TableCache(lambda x: x, lambda _: ())
+    with pytest.raises(KeyError):
+        cache.lookup(1)
+    cache(1)
+    assert cache.lookup(x=1) == 1
+    assert cache.cache_info().hits == 1
+    assert cache.cache_info().misses == 1
+
+
 def test_close_is_idempotent(table: SQLTableInterface[ExampleRow]) -> None:
     table.close()
     table.close()
+
+
+def _stored_rows(filepath: str) -> list[tuple[object, ...]]:
+    db = sqlite3.connect(filepath)
+    try:
+        return db.execute('SELECT * FROM mytable').fetchall()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def buffered_table(
+    tmp_file: str,
+) -> SQLTableInterface[ExampleRow]:
+    # A long interval so only the tests that want a timed flush get one.
+    return SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        write_behind=WriteBehind(interval_ms=60_000, max_rows=3),
+    )
+
+
+def test_write_behind_requires_primary_keys(tmp_file: str) -> None:
+    with pytest.raises(ValueError, match='requires primary keys'):
+        SQLTableInterface(
+            ExampleRow,
+            'mytable',
+            tmp_file,
+            write_behind=WriteBehind(),
+        )
+
+
+def test_write_behind_buffers_writes(
+    tmp_file: str,
+    buffered_table: SQLTableInterface[ExampleRow],
+) -> None:
+    row1 = ExampleRow(0, 0, 0.0, None, True)
+    row2 = ExampleRow(0, 1, 0.0, None, True)
+    buffered_table.update(row1)
+    buffered_table.update(row2)
+
+    # Visible to reads but not yet written to the file.
+    assert buffered_table.get(guild_id=0, user_id=0) == row1
+    assert buffered_table.all(guild_id=0) == (row1, row2)
+    assert buffered_table.all(guild_id=1) == ()
+    assert _stored_rows(tmp_file) == []
+
+    assert buffered_table.flush() == 2
+    assert len(_stored_rows(tmp_file)) == 2
+    assert buffered_table.flush() == 0
+
+    # Rows read from the file are overridden by buffered writes.
+    new_row1 = row1._replace(timestamp=1.0)
+    buffered_table.update(new_row1)
+    assert buffered_table.remove(guild_id=0, user_id=1) == 1
+    assert buffered_table.remove(guild_id=0, user_id=1) == 0
+    assert buffered_table.get(guild_id=0, user_id=0) == new_row1
+    assert buffered_table.get(guild_id=0, user_id=1) is None
+    assert buffered_table.all() == (new_row1,)
+    assert len(_stored_rows(tmp_file)) == 2
+
+    buffered_table.close()
+    assert _stored_rows(tmp_file) == [tuple(new_row1)]
+
+
+def test_write_behind_flushes_when_full(
+    tmp_file: str,
+    buffered_table: SQLTableInterface[ExampleRow],
+) -> None:
+    for user_id in range(3):
+        buffered_table.update(ExampleRow(0, user_id, 0.0, None, True))
+    assert len(_stored_rows(tmp_file)) == 3
+    assert buffered_table._dirty == {}
+    buffered_table.close()
+
+
+def test_write_behind_flush_is_one_transaction(
+    buffered_table: SQLTableInterface[ExampleRow],
+) -> None:
+    statements: list[str] = []
+    with buffered_table.connect() as db:
+        db.set_trace_callback(statements.append)
+
+    buffered_table.update(ExampleRow(0, 0, 0.0, None, True))
+    buffered_table.update(ExampleRow(0, 1, 0.0, None, True))
+    assert statements == []
+    buffered_table.flush()
+    assert sum(s == 'COMMIT' for s in statements) == 1
+    buffered_table.close()
+
+
+def test_write_behind_keeps_rows_written_during_flush(
+    buffered_table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+    new_row = row._replace(timestamp=1.0)
+    buffered_table.update(row)
+
+    def _write_during_flush(_: str) -> None:
+        if buffered_table._dirty.get((0, 0)) is row:
+            buffered_table._dirty[(0, 0)] = new_row
+
+    with buffered_table.connect() as db:
+        db.set_trace_callback(_write_during_flush)
+    assert buffered_table.flush() == 1
+    assert buffered_table._dirty == {(0, 0): new_row}
+    assert buffered_table.get(guild_id=0, user_id=0) == new_row
+    buffered_table.close()
+
+
+async def test_write_behind_flushes_on_timer(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        write_behind=WriteBehind(interval_ms=10),
+    )
+    table.update(ExampleRow(0, 0, 0.0, None, True))
+    await wait_for(lambda: len(_stored_rows(tmp_file)) == 1)
+    await wait_for(lambda: table._flush_timer is None)
+
+    # The next write schedules another flush.
+    table.update(ExampleRow(0, 1, 0.0, None, True))
+    await wait_for(lambda: len(_stored_rows(tmp_file)) == 2)
+    table.close()
+
+
+async def test_write_behind_timer_flush_error(
+    tmp_file: str,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        write_behind=WriteBehind(interval_ms=10),
+    )
+    with mock.patch.object(table, 'flush', side_effect=sqlite3.Error):
+        table.update(ExampleRow(0, 0, 0.0, None, True))
+        await wait_for(lambda: 'failed to flush' in caplog.text)
+
+    # The row is still buffered and is written on close.
+    assert len(table._dirty) == 1
+    table.close()
+    assert len(_stored_rows(tmp_file)) == 1
+
+
+def test_write_behind_close_cancels_timer(
+    buffered_table: SQLTableInterface[ExampleRow],
+) -> None:
+    buffered_table.update(ExampleRow(0, 0, 0.0, None, True))
+    timer = buffered_table._flush_timer
+    assert timer is not None
+    buffered_table.close()
+    assert buffered_table._flush_timer is None
+    assert not timer.is_alive() or timer.finished.is_set()
+
+
+class CounterRow(NamedTuple):
+    guild_id: int
+    user_id: int
+    hits: int
+    score: float
+
+
+@pytest.mark.parametrize(
+    'engine', ['sqlite', 'write-behind', 'mirror', 'dict']
+)
+def test_increment(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    counter_table = make_table(engine, CounterRow, 'counters')
+    default = CounterRow(1, 2, 1, 0.5)
+
+    # No row and no default so nothing happens.
+    assert counter_table.increment(guild_id=1, user_id=2, hits=1) is None
+    assert counter_table.get(guild_id=1, user_id=2) is None
+
+    # Default is inserted as is.
+    row = counter_table.increment(
+        guild_id=1,
+        user_id=2,
+        hits=1,
+        default=default,
+    )
+    assert row == default
+    assert counter_table.get(guild_id=1, user_id=2) == default
+
+    row = counter_table.increment(
+        user_id=2,
+        guild_id=1,
+        hits=2,
+        score=1.5,
+        default=default,
+    )
+    assert row == CounterRow(1, 2, 3, 2.0)
+    # Cached read was invalidated.
+    assert counter_table.get(guild_id=1, user_id=2) == row
+
+    row = counter_table.increment(guild_id=1, user_id=2, hits=-5, minimum=0)
+    assert row == CounterRow(1, 2, 0, 2.0)
+    row = counter_table.increment(guild_id=1, user_id=2, hits=-5)
+    assert row == CounterRow(1, 2, -5, 2.0)
+
+    counter_table.close()
+    assert counter_table.get(guild_id=1, user_id=2) == row
+
+
+@pytest.mark.parametrize(
+    'engine', ['sqlite', 'write-behind', 'mirror', 'dict']
+)
+def test_increment_validation(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    counter_table = make_table(engine, CounterRow, 'counters')
+    with pytest.raises(ValueError, match='must include the primary keys'):
+        counter_table.increment(guild_id=1, hits=1)
+    with pytest.raises(ValueError, match='At least one field'):
+        counter_table.increment(guild_id=1, user_id=2)
+    with pytest.raises(ValueError, match='do not match'):
+        counter_table.increment(
+            guild_id=1,
+            user_id=2,
+            hits=1,
+            default=CounterRow(1, 3, 1, 0),
+        )
+    with pytest.raises(ValueError, match='Type of hits'):
+        counter_table.increment(guild_id=1, user_id=2, hits=1.0)
+
+
+def test_increment_is_one_statement(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        CounterRow,
+        'counters',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    statements: list[str] = []
+    with table.connect() as db:
+        db.set_trace_callback(statements.append)
+
+    table.increment(
+        guild_id=1, user_id=2, hits=1, default=CounterRow(1, 2, 1, 0)
+    )
+    table.increment(guild_id=1, user_id=2, hits=1)
+    queries = [s for s in statements if s not in ('BEGIN ', 'COMMIT')]
+    assert len(queries) == 2
+    assert all('RETURNING' in query for query in queries)
+
+
+def test_increment_concurrent(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        CounterRow,
+        'counters',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    default = CounterRow(1, 2, 1, 0)
+
+    def _increment() -> None:
+        for _ in range(50):
+            table.increment(guild_id=1, user_id=2, hits=1, default=default)
+
+    threads = [threading.Thread(target=_increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    row = table.get(guild_id=1, user_id=2)
+    assert row is not None
+    assert row.hits == 200
+
+
+@pytest.mark.parametrize(
+    'engine', ['sqlite', 'write-behind', 'mirror', 'dict']
+)
+def test_assign(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    counter_table = make_table(engine, CounterRow, 'counters')
+    # Missing rows are not inserted.
+    assert counter_table.assign(guild_id=1, user_id=2, hits=0) is None
+    assert counter_table.get(guild_id=1, user_id=2) is None
+
+    counter_table.update(CounterRow(1, 2, 5, 0.5))
+    row = counter_table.assign(guild_id=1, user_id=2, hits=0)
+    assert row == CounterRow(1, 2, 0, 0.5)
+    # Cached read was invalidated.
+    assert counter_table.get(guild_id=1, user_id=2) == row
+
+    with pytest.raises(ValueError, match='must include the primary keys'):
+        counter_table.assign(guild_id=1, hits=1)
+    with pytest.raises(ValueError, match='At least one field'):
+        counter_table.assign(guild_id=1, user_id=2)
+    with pytest.raises(ValueError, match='Type of hits'):
+        counter_table.assign(guild_id=1, user_id=2, hits=1.0)
+
+    counter_table.close()
+    assert counter_table.get(guild_id=1, user_id=2) == row
+
+
+def test_assign_is_one_statement(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        CounterRow,
+        'counters',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    table.update(CounterRow(1, 2, 5, 0.5))
+    statements: list[str] = []
+    with table.connect() as db:
+        db.set_trace_callback(statements.append)
+
+    table.assign(guild_id=1, user_id=2, hits=0, score=1.0)
+    queries = [s for s in statements if s not in ('BEGIN ', 'COMMIT')]
+    assert len(queries) == 1
+    assert queries[0].startswith('UPDATE')
+
+
+def test_write_behind_writes_wait_for_increment(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        CounterRow,
+        'counters',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        write_behind=WriteBehind(),
+    )
+    table.update(CounterRow(1, 2, 0, 0))
+
+    # Hold the lock as increment() does between its read and its write,
+    # so an update() made meanwhile must not be buffered until it is done.
+    with table._write_behind_lock:
+        thread = threading.Thread(
+            target=table.update,
+            args=(CounterRow(1, 2, 0, 1.0),),
+        )
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()
+        assert table.get(guild_id=1, user_id=2) == CounterRow(1, 2, 0, 0)
+    thread.join()
+    assert table.get(guild_id=1, user_id=2) == CounterRow(1, 2, 0, 1.0)
+    table.close()
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'write-behind', 'dict'])
+def test_bulk_operations(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    bulk_table = make_table(engine, ExampleRow, 'mytable')
+    rows = [
+        ExampleRow(guild_id, user_id, 0.0, None, True)
+        for guild_id in range(3)
+        for user_id in range(2)
+    ]
+    bulk_table.update_many(rows)
+    assert bulk_table.all() == tuple(rows)
+
+    assert bulk_table.get_many(
+        [
+            {'guild_id': 1, 'user_id': 1},
+            {'user_id': 0, 'guild_id': 0},
+            {'guild_id': 5, 'user_id': 0},
+        ],
+    ) == (rows[3], rows[0], None)
+    assert bulk_table.get_many([]) == ()
+    assert set(bulk_table.all_in(guild_id=[0, 2, 7])) == {
+        *rows[0:2],
+        *rows[4:6],
+    }
+    assert bulk_table.all_in(guild_id=[]) == ()
+
+    assert (
+        bulk_table.remove_many(
+            [
+                {'guild_id': 0, 'user_id': 0},
+                {'guild_id': 0, 'user_id': 1},
+                {'guild_id': 5, 'user_id': 0},
+            ],
+        )
+        == 2
+    )
+    assert bulk_table.all(guild_id=0) == ()
+    assert bulk_table.all_in(guild_id=[0, 1]) == tuple(rows[2:4])
+    assert bulk_table.get_many([{'guild_id': 0, 'user_id': 0}]) == (None,)
+
+    bulk_table.close()
+    assert set(bulk_table.all()) == set(rows[2:])
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'write-behind', 'dict'])
+def test_bulk_operations_chunked(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    bulk_table = make_table(engine, ExampleRow, 'mytable')
+    count = MAX_VARIABLES + 10
+    rows = [ExampleRow(i, i, 0.0, None, True) for i in range(count)]
+    bulk_table.update_many(rows)
+    keys = [{'guild_id': i, 'user_id': i} for i in range(count)]
+    assert bulk_table.get_many(keys) == tuple(rows)
+    assert len(bulk_table.all_in(guild_id=range(count))) == count
+    bulk_table.close()
+
+
+def test_bulk_operations_are_batched(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    statements: list[str] = []
+    with table.connect() as db:
+        db.set_trace_callback(statements.append)
+
+    table.update_many(ExampleRow(0, i, 0.0, None, True) for i in range(5))
+    assert sum(s == 'COMMIT' for s in statements) == 1
+    statements.clear()
+    assert table.remove_many({'guild_id': 0, 'user_id': i} for i in range(5))
+    assert sum(s == 'COMMIT' for s in statements) == 1
+
+
+def test_bulk_operations_validation(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    with pytest.raises(ValueError, match='Get parameters'):
+        table.get_many([{'guild_id': 0}])
+    with pytest.raises(ValueError, match='Remove parameters'):
+        table.remove_many([{'guild_id': 0}])
+    with pytest.raises(ValueError, match='Exactly one field'):
+        table.all_in(guild_id=[0], user_id=[0])
+    with pytest.raises(ValueError, match='Type of guild_id'):
+        table.all_in(guild_id=['0'])
+
+    no_keys = SQLTableInterface(ExampleRow, 'nokeys', tmp_file)
+    with pytest.raises(ValueError, match='requires primary keys'):
+        no_keys.get_many([])
+
+
+def test_iter_all(table: SQLTableInterface[ExampleRow]) -> None:
+    rows = [
+        ExampleRow(guild_id, user_id, float(user_id), None, True)
+        for guild_id in range(2)
+        for user_id in range(5)
+    ]
+    table.update_many(reversed(rows))
+
+    assert list(table.iter_all()) == rows
+    assert list(table.iter_all(batch_size=3)) == rows
+    assert list(table.iter_all(batch_size=5)) == rows
+    assert list(table.iter_all(batch_size=2, guild_id=1)) == rows[5:]
+    assert list(table.iter_all(guild_id=3)) == []
+    assert list(table.iter_all(batch_size=2, limit=3, offset=4)) == rows[4:7]
+    assert list(table.iter_all(limit=0)) == []
+
+    by_time = sorted(rows, key=lambda r: (r.timestamp, r.guild_id))
+    assert (
+        list(table.iter_all(batch_size=3, order_by=('timestamp', 'guild_id')))
+        == by_time
+    )
+    assert (
+        list(
+            table.iter_all(
+                batch_size=3,
+                order_by=('timestamp', 'guild_id'),
+                offset=1,
+                limit=4,
+            ),
+        )
+        == by_time[1:5]
+    )
+
+    # Results are not cached.
+    assert table.all.cache_info().currsize == 0
+
+
+def test_iter_all_no_primary_keys(tmp_file: str) -> None:
+    table = SQLTableInterface(ExampleRow, 'mytable', tmp_file)
+    rows = [ExampleRow(0, i, 0.0, None, True) for i in range(5)]
+    table.update_many(rows)
+    assert list(table.iter_all(batch_size=2)) == rows
+
+
+def test_iter_all_between_batches(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    rows = [ExampleRow(0, i, 0.0, None, True) for i in range(4)]
+    table.update_many(rows)
+
+    iterator = table.iter_all(batch_size=2)
+    assert next(iterator) == rows[0]
+    # The reader connection is not held while the caller has the row.
+    pool = table.pool
+    assert pool._idle.qsize() == len(pool._readers)
+    # Keyset pagination picks up rows written during iteration.
+    table.update(ExampleRow(0, 10, 0.0, None, True))
+    table.remove(guild_id=0, user_id=2)
+    assert [row.user_id for row in iterator] == [1, 3, 10]
+
+
+def test_iter_all_flushes_write_behind(
+    buffered_table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(0, 0, 0.0, None, True)
+    buffered_table.update(row)
+    assert list(buffered_table.iter_all()) == [row]
+    assert buffered_table._dirty == {}
+    buffered_table.close()
+
+
+def test_iter_all_validation(table: SQLTableInterface[ExampleRow]) -> None:
+    with pytest.raises(ValueError, match='Batch size'):
+        next(table.iter_all(batch_size=0))
+    with pytest.raises(ValueError, match='Field fake'):
+        next(table.iter_all(order_by=('fake',)))
+    with pytest.raises(ValueError, match='Field fake'):
+        next(table.iter_all(fake=0))
+
+
+def test_reads_reuse_precompiled_statements(
+    table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(1, 2, 0.0, None, True)
+    table.update(row)
+    backend = _sqlite(table)
+    compiled = dict(backend._statements)
+    statements: list[str] = []
+    with table.pool.reader() as db:
+        db.set_trace_callback(statements.append)
+
+    with mock.patch(
+        'threepseat.table.fields_to_search_str',
+        wraps=fields_to_search_str,
+    ) as build:
+        assert table.get(guild_id=1, user_id=2) == row
+        assert table.get(guild_id=3, user_id=4) is None
+        # The primary key select was compiled when the table was opened.
+        build.assert_not_called()
+    assert backend._statements == compiled
+    assert len(statements) == 2
+
+    # Cached reads do not query at all.
+    assert table.get(guild_id=1, user_id=2) == row
+    assert len(statements) == 2
+
+
+def test_statement_cache(table: SQLTableInterface[ExampleRow]) -> None:
+    backend = _sqlite(table)
+    sql = backend.statement('select', ('guild_id',))
+    assert sql == 'SELECT * FROM mytable WHERE guild_id = :guild_id'
+    assert backend.statement('select', ('guild_id',)) is sql
+    with pytest.raises(ValueError, match='Unknown operation'):
+        backend.statement('drop')
+
+
+async def test_cache_sees_external_writes(tmp_file: str) -> None:
+    connections.configure(
+        tmp_file,
+        connections.PoolSettings(coherence_interval_ms=0),
+    )
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    assert table.get(guild_id=0, user_id=0) == row
+    assert table.all() == (row,)
+
+    # Another process (e.g., an admin script) updates the row.
+    other = sqlite3.connect(tmp_file)
+    with other:
+        other.execute('UPDATE mytable SET timestamp = 1.0')
+    other.close()
+
+    # The write is checked for on the database thread, so the read that
+    # starts the check may still be served from the cache.
+    new_row = row._replace(timestamp=1.0)
+    assert table.get(guild_id=0, user_id=0) in (row, new_row)
+    await wait_for(lambda: table.all.cache_info().invalidations == 1)
+    with pytest.raises(KeyError):
+        table.get.lookup(guild_id=0, user_id=0)
+    assert table.get(guild_id=0, user_id=0) == new_row
+    assert table.all.cache_info().invalidations == 1
+    assert table.all() == (new_row,)
+
+    # Closed tables do not check, or reopen the pool.
+    table.close()
+    table._check_external_writes()
+    assert not table._backend.connected
+
+
+@pytest.fixture
+def mirror_table(tmp_file: str) -> SQLTableInterface[ExampleRow]:
+    return SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        indexes=(('filepath',),),
+        mirror=True,
+    )
+
+
+def test_mirror_validation(tmp_file: str) -> None:
+    with pytest.raises(ValueError, match='Mirror requires primary keys'):
+        SQLTableInterface(ExampleRow, 'mytable', tmp_file, mirror=True)
+    with pytest.raises(ValueError, match='cannot be combined'):
+        SQLTableInterface(
+            ExampleRow,
+            'mytable',
+            tmp_file,
+            primary_keys=('guild_id',),
+            write_behind=WriteBehind(),
+            mirror=True,
+        )
+
+
+def test_mirror_loads_existing_rows(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    table.close()
+
+    mirrored = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        mirror=True,
+    )
+    assert mirrored.get(guild_id=0, user_id=0) == row
+    mirrored.close()
+
+
+def test_mirror_reads_without_queries(
+    mirror_table: SQLTableInterface[ExampleRow],
+) -> None:
+    rows = [
+        ExampleRow(0, 0, 0.0, 'a', True),
+        ExampleRow(0, 1, 0.0, 'b', False),
+        ExampleRow(1, 0, 0.0, 'a', False),
+        ExampleRow(1, 1, 0.0, None, False),
+    ]
+    mirror_table.update_many(rows)
+
+    statements: list[str] = []
+    with mirror_table.pool.reader() as db:
+        db.set_trace_callback(statements.append)
+    with mirror_table.connect() as db:
+        db.set_trace_callback(statements.append)
+    statements.clear()
+
+    assert mirror_table.get(guild_id=0, user_id=1) == rows[1]
+    assert mirror_table.get(guild_id=2, user_id=0) is None
+    assert set(mirror_table.all()) == set(rows)
+    assert set(mirror_table.all(guild_id=1)) == set(rows[2:])
+    assert set(mirror_table.all(filepath='a')) == {rows[0], rows[2]}
+    assert mirror_table.all(filepath='a', guild_id=1) == (rows[2],)
+    assert mirror_table.all(filepath='c') == ()
+    # Like SQL, None never matches.
+    assert mirror_table.all(filepath=None) == ()
+    assert mirror_table.get_many(
+        [{'guild_id': 1, 'user_id': 1}, {'guild_id': 2, 'user_id': 2}],
+    ) == (rows[3], None)
+    assert set(mirror_table.all_in(guild_id=[0, 0])) == set(rows[:2])
+    assert list(mirror_table.iter_all(guild_id=1, batch_size=1)) == rows[2:]
+    # Only the (throttled) check for external writes touches the database.
+    assert set(statements) <= {'PRAGMA data_version'}
+    mirror_table.close()
+
+
+def test_mirror_writes(mirror_table: SQLTableInterface[ExampleRow]) -> None:
+    row = ExampleRow(0, 0, 0.0, 'a', True)
+    mirror_table.update(row)
+    assert mirror_table.all(filepath='a') == (row,)
+
+    # Moving a row to another index group removes it from the old one.
+    moved = row._replace(filepath='b')
+    mirror_table.update(moved)
+    assert mirror_table.all(filepath='a') == ()
+    mirror = _sqlite(mirror_table).mirror
+    assert mirror is not None
+    assert 'a' not in mirror.index['filepath']
+    assert mirror_table.all(filepath='b') == (moved,)
+
+    assert mirror_table.remove(guild_id=0, user_id=0) == 1
+    assert mirror_table.all() == ()
+    assert mirror_table.remove(guild_id=0, user_id=0) == 0
+
+    mirror_table.update_many([moved, moved._replace(user_id=1)])
+    assert len(mirror_table.all(filepath='b')) == 2
+    assert mirror_table.remove_many(
+        [{'guild_id': 0, 'user_id': 0}, {'guild_id': 0, 'user_id': 1}],
+    )
+    assert mirror_table.all() == ()
+    mirror_table.close()
+
+
+def test_mirror_reloaded_after_failed_write(
+    mirror_table: SQLTableInterface[ExampleRow],
+) -> None:
+    row = ExampleRow(0, 0, 0.0, 'a', True)
+    mirror_table.update(row)
+
+    with (
+        mock.patch.object(
+            _sqlite(mirror_table).pool,
+            'writer',
+            side_effect=sqlite3.OperationalError('disk I/O error'),
+        ),
+        pytest.raises(sqlite3.OperationalError),
+    ):
+        mirror_table.update(row._replace(timestamp=1.0))
+    assert mirror_table.all() == (row,)
+
+    def _update_then_fail() -> None:
+        with _sqlite(mirror_table).write() as writer:
+            writer.upsert([row._replace(timestamp=2.0)])
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _update_then_fail()
+    assert mirror_table.all() == (row,)
+    mirror_table.close()
+
+
+def test_mirror_reload_does_not_deadlock_with_write() -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        connections.MEMORY_DATABASE,
+        primary_keys=('guild_id', 'user_id'),
+        mirror=True,
+    )
+    backend = _sqlite(table)
+    row = ExampleRow(0, 0, 0.0, None, True)
+    writing = threading.Event()
+    loading = threading.Event()
+
+    def _write() -> None:
+        with backend.write() as writer:
+            writing.set()
+            loading.wait()
+            # Give the reload time to block on the writer lock.
+            threading.Event().wait(0.05)
+            writer.upsert([row])
+
+    def _load() -> None:
+        loading.set()
+        backend.load_mirror()
+
+    threads = [
+        threading.Thread(target=_write, daemon=True),
+        threading.Thread(target=_load, daemon=True),
+    ]
+    threads[0].start()
+    writing.wait()
+    threads[1].start()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert table.all() == (row,)
+    table.close()
+
+
+async def test_mirror_sees_external_writes(tmp_file: str) -> None:
+    connections.configure(
+        tmp_file,
+        connections.PoolSettings(coherence_interval_ms=0),
+    )
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        mirror=True,
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+
+    other = sqlite3.connect(tmp_file)
+    with other:
+        other.execute('UPDATE mytable SET timestamp = 1.0')
+    other.close()
+
+    await wait_for(lambda: table.all() == (row._replace(timestamp=1.0),))
+    table.close()
+
+
+def test_without_rowid(tmp_file: str) -> None:
+    with pytest.raises(ValueError, match='Without rowid requires'):
+        SQLTableInterface(ExampleRow, 'mytable', tmp_file, without_rowid=True)
+
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        without_rowid=True,
+    )
+    rows = [ExampleRow(0, i, 0.0, None, True) for i in (2, 0, 1)]
+    table.update_many(rows)
+    with table.connect() as db:
+        sql = db.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'mytable'",
+        ).fetchone()[0]
+    assert sql.endswith('WITHOUT ROWID')
+    # Rows are returned in primary key order.
+    assert table.all() == tuple(sorted(rows))
+    table.close()
+
+
+def test_stats(table: SQLTableInterface[ExampleRow]) -> None:
+    rows = [ExampleRow(0, i, 0.0, None, True) for i in range(3)]
+    table.update_many(rows)
+    assert table.all(guild_id=0) == tuple(rows)
+    assert table.all(guild_id=0) == tuple(rows)
+    assert table.get(guild_id=0, user_id=0) == rows[0]
+    assert table.get(guild_id=1, user_id=0) is None
+    assert table.remove(guild_id=0, user_id=0) == 1
+    assert len(list(table.iter_all(batch_size=1))) == 2
+    with pytest.raises(ValueError, match='Get parameters'):
+        table.get_many([{'guild_id': 0}])
+
+    stats = table.stats()
+    assert stats.name == 'mytable'
+    operations = stats.operations
+    assert operations['update_many'].calls == 1
+    # The second all() was a cache hit so only queried once.
+    assert operations['all'].calls == 1
+    assert operations['all'].rows == 3
+    assert stats.all.hits == 1
+    assert operations['get'].calls == 2
+    assert operations['get'].rows == 1
+    assert operations['remove'].rows == 1
+    # One call per batch, including the last empty batch.
+    assert operations['iter_all'].calls == 3
+    assert operations['iter_all'].rows == 2
+    assert operations['get_many'].errors == 1
+
+    for operation in operations.values():
+        assert len(operation.histogram) == len(LATENCY_BUCKETS_MS) + 1
+        assert sum(operation.histogram) == operation.calls
+        assert 0 < operation.max_ms <= operation.total_ms
+        assert operation.mean_ms <= operation.max_ms
+    assert OperationStats(0, 0, 0, 0.0, 0.0, ()).mean_ms == 0
+
+
+def test_stats_write_behind_internal_reads(tmp_file: str) -> None:
+    table = SQLTableInterface(
+        CounterRow,
+        'counters',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        write_behind=WriteBehind(interval_ms=60_000),
+    )
+    # Subscribers make writes read the rows they replace.
+    table.subscribe(lambda _: None)
+    table.update(CounterRow(0, 0, 0, 0.0))
+    table.increment(guild_id=0, user_id=0, hits=1)
+    table.assign(guild_id=0, user_id=0, hits=0)
+    table.remove(guild_id=0, user_id=0)
+    table.update_many([CounterRow(0, 1, 0, 0.0)])
+    table.remove_many([{'guild_id': 0, 'user_id': 1}])
+
+    # The reads the writes made are not counted as calls.
+    assert set(table.stats().operations) == {
+        'update',
+        'increment',
+        'assign',
+        'remove',
+        'update_many',
+        'remove_many',
+    }
+    table.close()
+
+
+def test_slow_query_log(
+    tmp_file: str,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    connections.configure(
+        tmp_file,
+        connections.PoolSettings(slow_query_ms=0),
+    )
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    caplog.set_level(logging.WARNING)
+    table.all(guild_id=0)
+    assert 'slow all on table mytable' in caplog.text
+    table.close()
+
+
+def test_transaction(tmp_file: str) -> None:
+    first = SQLTableInterface(
+        ExampleRow,
+        'first',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    second = SQLTableInterface(
+        ExampleRow,
+        'second',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+        mirror=True,
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+    assert first.all() == ()
+
+    with transaction(first, second):
+        first.update(row)
+        second.update(row)
+        # The cached read is not invalidated until the commit.
+        assert first.all() == ()
+        assert first.all.cache_info().invalidations == 0
+    assert first.all() == second.all() == (row,)
+
+    def _update_then_fail() -> None:
+        with transaction(first, second):
+            first.update(row._replace(timestamp=1.0))
+            second.update(row._replace(timestamp=1.0))
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _update_then_fail()
+    # The mirror of second is reloaded and neither write is kept.
+    assert first.all() == second.all() == (row,)
+    first.close()
+    second.close()
+
+
+def test_transaction_requires_one_file(
+    tmp_path: pathlib.Path,
+) -> None:
+    first = SQLTableInterface(ExampleRow, 'first', str(tmp_path / 'a.db'))
+    second = SQLTableInterface(ExampleRow, 'second', str(tmp_path / 'b.db'))
+    with pytest.raises(ValueError, match='share one database file'):
+        transaction(first, second).__enter__()
+    first.close()
+    second.close()
+
+
+def test_transaction_in_memory(tmp_file: str) -> None:
+    first, second = (
+        SQLTableInterface(
+            ExampleRow,
+            name,
+            connections.MEMORY_DATABASE,
+            primary_keys=('guild_id', 'user_id'),
+        )
+        for name in ('first', 'second')
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+
+    with transaction(first, second):
+        first.update(row)
+        second.update(row)
+    assert first.all() == second.all() == (row,)
+
+    def _update_then_fail() -> None:
+        with transaction(first, second):
+            first.remove(guild_id=0, user_id=0)
+            second.update(row._replace(timestamp=1.0))
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _update_then_fail()
+    # Each table has its own database but both roll back.
+    assert first.all() == second.all() == (row,)
+
+    # A file can still not share a transaction with a memory table.
+    third = SQLTableInterface(ExampleRow, 'third', tmp_file)
+    with pytest.raises(ValueError, match='share one database file'):
+        transaction(first, third).__enter__()
+    first.close()
+    second.close()
+    third.close()
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'dict'])
+def test_engines_match(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    engine_table = make_table(
+        engine, ExampleRow, 'mytable', indexes=(('user_id',),)
+    )
+    rows = [
+        ExampleRow(guild_id, user_id, 0.0, None, user_id % 2 == 0)
+        for guild_id in range(2)
+        for user_id in range(3)
+    ]
+    for row in rows:
+        engine_table.update(row)
+    assert engine_table.all() == tuple(rows)
+    assert engine_table.all(user_id=1) == (rows[1], rows[4])
+    assert engine_table.all(guild_id=1, admin=True) == (rows[3], rows[5])
+    # "field = NULL" never matches.
+    assert engine_table.all(filepath=None) == ()
+
+    # Updates replace the row in place.
+    updated = rows[0]._replace(filepath='a.mp3')
+    engine_table.update(updated)
+    assert engine_table.get(guild_id=0, user_id=0) == updated
+    assert engine_table.all()[0] == updated
+    assert engine_table.all(filepath='a.mp3') == (updated,)
+
+    with pytest.raises(ValueError, match='multiple matching rows'):
+        engine_table.get(user_id=0)
+
+    assert engine_table.remove(guild_id=0, user_id=0) == 1
+    assert engine_table.remove(guild_id=0, user_id=0) == 0
+    assert engine_table.get(guild_id=0, user_id=0) is None
+    assert engine_table.all(user_id=0) == (rows[3],)
+    engine_table.close()
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'dict'])
+async def test_engines_match_async(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    engine_table = make_table(
+        engine, ExampleRow, 'mytable', indexes=(('user_id',),)
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+    await engine_table.aupdate(row)
+    assert await engine_table.aall() == (row,)
+    assert await engine_table.aget(guild_id=0, user_id=0) == row
+    assert await engine_table.aremove(guild_id=0, user_id=0) == 1
+    engine_table.close()
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'mirror', 'dict'])
+def test_engines_match_iter_all(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    engine_table = make_table(
+        engine, ExampleRow, 'mytable', indexes=(('user_id',),)
+    )
+    rows = [
+        ExampleRow(0, user_id, 0.0, None if user_id % 2 else 'a', True)
+        for user_id in range(5)
+    ]
+    engine_table.update_many(reversed(rows))
+
+    assert list(engine_table.iter_all(batch_size=2)) == rows
+    assert list(engine_table.iter_all(limit=2, offset=1)) == rows[1:3]
+    # NULL sorts first.
+    assert list(engine_table.iter_all(order_by=('filepath', 'user_id'))) == [
+        rows[1],
+        rows[3],
+        rows[0],
+        rows[2],
+        rows[4],
+    ]
+    assert engine_table.stats().operations['iter_all'].calls == 5
+    engine_table.close()
+
+
+def test_dict_engine(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(ValueError, match='dict engine requires primary keys'):
+        SQLTableInterface(ExampleRow, 'mytable', DICT_DATABASE)
+
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        DICT_DATABASE,
+        primary_keys=('guild_id', 'user_id'),
+        write_behind=WriteBehind(),
+    )
+    assert table.engine == 'dict'
+    assert table._write_behind is None
+    table.update(ExampleRow(0, 0, 0.0, None, True))
+    assert table.flush() == 0
+    with pytest.raises(ValueError, match='no database connections'):
+        table.connect().__enter__()
+    # Nothing is written to disk.
+    assert not pathlib.Path(DICT_DATABASE).exists()
+
+    sqlite = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        str(tmp_path / 'db.sqlite'),
+        primary_keys=('guild_id', 'user_id'),
+    )
+    assert sqlite.engine == 'sqlite'
+    with pytest.raises(ValueError, match='share one database file'):
+        transaction(table, sqlite).__enter__()
+    table.close()
+    sqlite.close()
+
+
+def test_dict_engine_transaction() -> None:
+    first = SQLTableInterface(
+        ExampleRow,
+        'first',
+        DICT_DATABASE,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    second = SQLTableInterface(
+        ExampleRow,
+        'second',
+        DICT_DATABASE,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    row = ExampleRow(0, 0, 0.0, None, True)
+
+    with transaction(first, second):
+        first.update(row)
+        second.update(row)
+    assert first.all() == second.all() == (row,)
+
+    def _update_then_fail() -> None:
+        with transaction(first, second, first):
+            first.update(row._replace(timestamp=1.0))
+            second.remove(guild_id=0, user_id=0)
+            # Cached inside the transaction.
+            assert second.all() == ()
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _update_then_fail()
+    # Neither write is kept.
+    assert first.all() == second.all() == (row,)
+
+    # Nested transactions join the outer one.
+    with transaction(first):
+        with transaction(first, second):
+            second.remove(guild_id=0, user_id=0)
+        assert second.all() == ()
+    assert second.all() == ()
+
+    with pytest.raises(ValueError, match='share one database file'):
+        transaction().__enter__()
+
+    # Outside of a transaction, there is nothing to roll back.
+    rollback = mock.MagicMock()
+    first._backend.defer(on_rollback=rollback)
+    rollback.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    'engine', ['sqlite', 'write-behind', 'mirror', 'dict']
+)
+def test_change_events(
+    make_table: Callable[..., SQLTableInterface[Any]],
+    engine: str,
+) -> None:
+    events_table = make_table(engine, CounterRow, 'counters')
+    events: list[ChangeEvent[CounterRow]] = []
+    events_table.subscribe(events.append)
+    first = CounterRow(0, 0, 0, 0.0)
+    second = CounterRow(0, 1, 0, 0.0)
+
+    events_table.update(first)
+    # Writing the same row again is not a change.
+    events_table.update(first)
+    events_table.update(first._replace(score=1.0))
+    assert events == [
+        ChangeEvent('insert', None, first),
+        ChangeEvent('update', first, first._replace(score=1.0)),
+    ]
+    first = first._replace(score=1.0)
+
+    events.clear()
+    events_table.increment(guild_id=0, user_id=0, hits=1)
+    events_table.increment(guild_id=0, user_id=1, hits=1)
+    events_table.increment(guild_id=0, user_id=1, hits=1, default=second)
+    assert events == [
+        ChangeEvent('update', first, first._replace(hits=1)),
+        ChangeEvent('insert', None, second),
+    ]
+    first = first._replace(hits=1)
+
+    events.clear()
+    # Rows written twice in a batch are paired with the earlier write.
+    events_table.update_many([second._replace(hits=1), second])
+    assert events == [
+        ChangeEvent('update', second, second._replace(hits=1)),
+        ChangeEvent('update', second._replace(hits=1), second),
+    ]
+
+    events.clear()
+    assert events_table.remove(guild_id=0, user_id=0) == 1
+    assert events_table.remove(guild_id=0, user_id=0) == 0
+    events_table.update(first)
+    key = {'guild_id': 0, 'user_id': 0}
+    assert events_table.remove_many([key, key, {'guild_id': 0, 'user_id': 1}])
+    assert events == [
+        ChangeEvent('delete', first, None),
+        ChangeEvent('insert', None, first),
+        ChangeEvent('delete', first, None),
+        ChangeEvent('delete', second, None),
+    ]
+
+    events.clear()
+    events_table.unsubscribe(events.append)
+    events_table.unsubscribe(events.append)
+    events_table.update(first)
+    assert events == []
+    events_table.close()
+
+
+def test_change_events_without_primary_keys(tmp_file: str) -> None:
+    table = SQLTableInterface(ExampleRow, 'mytable', tmp_file)
+    events: list[ChangeEvent[ExampleRow]] = []
+    table.subscribe(events.append)
+    row = ExampleRow(0, 0, 0.0, None, True)
+    table.update(row)
+    table.update(row)
+    # Without primary keys, remove() removes every row.
+    assert table.remove() == 2
+    assert (
+        events
+        == [ChangeEvent('insert', None, row)] * 2
+        + [
+            ChangeEvent('delete', row, None),
+        ]
+        * 2
+    )
+    table.close()
+
+
+def test_change_events_in_transaction(tmp_file: str) -> None:
+    first = SQLTableInterface(
+        ExampleRow,
+        'first',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    second = SQLTableInterface(
+        ExampleRow,
+        'second',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    events: list[ChangeEvent[ExampleRow]] = []
+    first.subscribe(events.append)
+    second.subscribe(events.append)
+    row = ExampleRow(0, 0, 0.0, None, True)
+
+    with transaction(first, second):
+        first.update(row)
+        second.update(row)
+        # Sent once the transaction commits.
+        assert events == []
+    assert events == [ChangeEvent('insert', None, row)] * 2
+
+    def _remove_then_fail() -> None:
+        with transaction(first, second):
+            first.remove(guild_id=0, user_id=0)
+            raise RuntimeError
+
+    events.clear()
+    with pytest.raises(RuntimeError):
+        _remove_then_fail()
+    assert events == []
+    first.close()
+    second.close()
+
+
+def test_change_events_in_dict_transaction() -> None:
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        DICT_DATABASE,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    events: list[ChangeEvent[ExampleRow]] = []
+    table.subscribe(events.append)
+    row = ExampleRow(0, 0, 0.0, None, True)
+
+    with transaction(table):
+        table.update(row)
+        assert events == []
+    assert events == [ChangeEvent('insert', None, row)]
+
+    def _remove_then_fail() -> None:
+        with transaction(table):
+            table.remove(guild_id=0, user_id=0)
+            raise RuntimeError
+
+    events.clear()
+    with pytest.raises(RuntimeError):
+        _remove_then_fail()
+    assert events == []
+    # Outside a transaction, events are sent immediately.
+    table.remove(guild_id=0, user_id=0)
+    assert events == [ChangeEvent('delete', row, None)]
+
+
+async def test_change_events_reset_on_external_write(
+    tmp_file: str,
+) -> None:
+    connections.configure(
+        tmp_file,
+        connections.PoolSettings(coherence_interval_ms=0),
+    )
+    table = SQLTableInterface(
+        ExampleRow,
+        'mytable',
+        tmp_file,
+        primary_keys=('guild_id', 'user_id'),
+    )
+    table.update(ExampleRow(0, 0, 0.0, None, True))
+    table.all()
+    events: list[ChangeEvent[ExampleRow]] = []
+    table.subscribe(events.append)
+
+    other = sqlite3.connect(tmp_file)
+    with other:
+        other.execute('UPDATE mytable SET timestamp = 1.0')
+    other.close()
+    table.all()
+    await wait_for(lambda: events == [ChangeEvent('reset', None, None)])
+    table.close()
+
+
+def test_change_subscriber_errors_are_logged(
+    table: SQLTableInterface[ExampleRow],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    events: list[ChangeEvent[ExampleRow]] = []
+
+    def _fail(_: ChangeEvent[ExampleRow]) -> None:
+        raise RuntimeError
+
+    table.subscribe(_fail)
+    table.subscribe(events.append)
+    with caplog.at_level(logging.ERROR):
+        table.update(ExampleRow(0, 0, 0.0, None, True))
+    assert 'change subscriber of mytable failed' in caplog.text
+    # Other subscribers still get the event.
+    assert len(events) == 1
+    table.close()
+
+
+async def test_change_events_queue(
+    table: SQLTableInterface[ExampleRow],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    queue = table.subscribe_queue(maxsize=1)
+    row = ExampleRow(0, 0, 0.0, None, True)
+    # Written on the database thread and received on the event loop.
+    await table.aupdate(row)
+    assert await asyncio.wait_for(queue.get(), 5) == ChangeEvent(
+        'insert',
+        None,
+        row,
+    )
+
+    with caplog.at_level(logging.WARNING):
+        await table.aremove(guild_id=0, user_id=0)
+        await table.aupdate(row)
+        await asyncio.sleep(0)
+    assert 'dropped insert change to mytable' in caplog.text
+    assert queue.get_nowait().kind == 'delete'
+
+    table.unsubscribe(queue)
+    await table.aremove(guild_id=0, user_id=0)
+    await asyncio.sleep(0)
+    assert queue.empty()
+    table.close()
@@ -1,21 +1,14 @@
 from __future__ import annotations
 
-import asyncio
 from unittest import mock
 
-import discord
 import pytest
 
 from testing.mock import MockChannel
-from testing.mock import MockClient
 from testing.mock import MockGuild
 from testing.mock import MockMember
-from testing.mock import MockUser
 from testing.mock import MockVoiceChannel
-from threepseat.bot import Bot
 from threepseat.utils import alphanumeric
-from threepseat.utils import leave_on_empty
-from threepseat.utils import play_sound
 from threepseat.utils import primary_channel
 from threepseat.utils import readable_sequence
 from threepseat.utils import readable_timedelta
@@ -142,82 +135,3 @@ def test_voice_channel() -> None:
 
     member._voice = Voice2()  # type: ignore[assignment]
     assert voice_channel(member) is None
-
-
-@mock.patch('discord.FFmpegOpusAudio')
-async def test_play_sound(mock_audio) -> None:
-    sound = 'filepath'
-    channel = MockVoiceChannel()
-
-    client = MockClient(MockUser('name', 1234))
-    voice_client = discord.VoiceProtocol(client=client, channel=channel)
-    voice_client.move_to = mock.AsyncMock()  # type: ignore[attr-defined]
-    voice_client.play = mock.AsyncMock()  # type: ignore[attr-defined]
-
-    # Note: first True to see if there is a current sound to be stopped,
-    # then True to allow wait to happen, then False to exit wait loop
-    voice_client.is_playing = mock.MagicMock(  # type: ignore[attr-defined]
-        side_effect=[True, True, False],
-    )
-    voice_client.stop = mock.MagicMock()  # type: ignore[attr-defined]
-
-    with (
-        mock.patch.object(channel, 'guild', mock.PropertyMock()),
-        mock.patch.object(
-            channel.guild,
-            'voice_client',
-            new_callable=mock.PropertyMock(return_value=voice_client),
-        ),
-    ):
-        await play_sound(sound, channel, wait=True)
-
-    voice_client.is_playing = mock.MagicMock(  # type: ignore[attr-defined]
-        return_value=False,
-    )
-
-    with (
-        mock.patch.object(
-            channel,
-            'connect',
-            mock.AsyncMock(return_value=voice_client),
-        ),
-        mock.patch.object(channel, 'guild', mock.PropertyMock()),
-        mock.patch.object(
-            channel.guild,
-            'voice_client',
-            new_callable=mock.PropertyMock(return_value=None),
-        ),
-    ):
-        await play_sound(sound, channel)
-
-    # Guards against the mock silently targeting the wrong audio class, which
-    # would spawn a real ffmpeg process for each call.
-    assert mock_audio.call_count == 2
-
-
-async def test_leave_on_empty() -> None:
-    class MockVoiceClient(discord.VoiceClient):
-        def __init__(self) -> None:
-            self.channel = MockVoiceChannel()
-
-    class MockVoiceProtocol(discord.VoiceProtocol):
-        def __init__(self) -> None:
-            pass
-
-    mock1 = MockVoiceClient()
-    mock2 = MockVoiceProtocol()
-    with (
-        mock.patch(
-            'threepseat.bot.Bot.voice_clients',
-            new_callable=mock.PropertyMock(return_value=[mock1, mock2]),
-        ),
-        mock.patch.object(mock1, 'disconnect', mock.AsyncMock()) as disconnect,
-    ):
-        bot = Bot()
-        task = leave_on_empty(bot, 0.01)
-        task.start()
-        await asyncio.sleep(0.03)
-        assert task.is_running()
-        assert task.current_loop > 0
-        task.stop()
-        assert disconnect.await_count > 0
@@ -0,0 +1,478 @@
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import threading
+from typing import Any
+from unittest import mock
+
+import discord
+import pytest
+
+from testing.utils import wait_for
+from threepseat import voice
+from threepseat.voice import IdleVoiceDisconnector
+from threepseat.voice import VoiceBusyError
+from threepseat.voice import VoiceSession
+from threepseat.voice import VoiceSessionManager
+from threepseat.voice import play_sound
+from threepseat.voice import submit_sound
+
+
+class _VoiceClient:
+    """Voice client that plays until finish() is called."""
+
+    def __init__(self, channel: Any) -> None:
+        self.channel = channel
+        self.move_to = mock.AsyncMock(side_effect=self._move_to)
+        self.played: list[Any] = []
+        self._after: Any = None
+
+    async def _move_to(self, channel: Any) -> None:
+        self.channel = channel
+
+    def is_playing(self) -> bool:
+        return self._after is not None
+
+    def play(self, source: Any, *, after: Any) -> None:
+        self.played.append(source)
+        self._after = after
+
+    def stop(self) -> None:
+        self.finish()
+
+    def finish(self, error: Exception | None = None) -> None:
+        after, self._after = self._after, None
+        if after is not None:
+            # discord.py calls after from the audio player thread.
+            thread = threading.Thread(target=after, args=(error,))
+            thread.start()
+            thread.join()
+
+
+def _channel(guild: Any, name: str = 'channel') -> Any:
+    channel = mock.MagicMock()
+    channel.name = name
+    channel.guild = guild
+    return channel
+
+
+@pytest.fixture
+def guild() -> Any:
+    guild = mock.MagicMock()
+    guild.id = 1234
+    guild.voice_client = None
+    return guild
+
+
+@pytest.fixture
+def voice_client(guild: Any) -> _VoiceClient:
+    client = _VoiceClient(_channel(guild))
+    guild.voice_client = client
+    return client
+
+
+@pytest.fixture
+def sessions() -> VoiceSessionManager:
+    return VoiceSessionManager(maxsize=2)
+
+
+async def _finish_next(voice_client: _VoiceClient, count: int) -> None:
+    await wait_for(lambda: len(voice_client.played) == count)
+    await wait_for(voice_client.is_playing)
+    voice_client.finish()
+
+
+@mock.patch('discord.FFmpegOpusAudio')
+async def test_play_connects(
+    mock_audio: mock.MagicMock,
+    guild: Any,
+    sessions: VoiceSessionManager,
+) -> None:
+    channel = _channel(guild)
+    voice_client = _VoiceClient(channel)
+    channel.connect = mock.AsyncMock(return_value=voice_client)
+
+    task = asyncio.create_task(sessions.play('sound.mp3', channel, wait=True))
+    await _finish_next(voice_client, 1)
+    assert await task
+
+    channel.connect.assert_awaited_once()
+    mock_audio.assert_called_once_with('sound.mp3')
+    assert not sessions.session(guild.id).busy
+
+
+@mock.patch('discord.FFmpegOpusAudio')
+async def test_play_prefers_opus(
+    mock_audio: mock.MagicMock,
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+    tmp_path: pathlib.Path,
+) -> None:
+    sound = tmp_path / 'sound.mp3'
+    opus = sound.with_suffix('.ogg')
+    opus.touch()
+    # Audio played without the session is stopped.
+    external = mock.MagicMock()
+    voice_client._after = external
+
+    task = asyncio.create_task(
+        sessions.play(str(sound), voice_client.channel, wait=True),
+    )
+    await _finish_next(voice_client, 1)
+    await task
+    # The Opus copy is streamed without transcoding.
+    mock_audio.assert_called_once_with(str(opus), codec='copy')
+    external.assert_called_once_with(None)
+
+    # Audio sources are played as-is.
+    source = mock.MagicMock(spec=discord.AudioSource)
+    task = asyncio.create_task(
+        sessions.play(source, voice_client.channel, wait=True),
+    )
+    await _finish_next(voice_client, 2)
+    await task
+    assert voice_client.played[-1] is source
+    assert mock_audio.call_count == 1
+
+
+async def test_play_enqueue(
+    guild: Any,
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+) -> None:
+    first_channel = voice_client.channel
+    second_channel = _channel(guild, 'second')
+    sources = [mock.MagicMock(spec=discord.AudioSource) for _ in range(3)]
+
+    first = asyncio.create_task(
+        sessions.play(sources[0], first_channel, wait=True),
+    )
+    await wait_for(lambda: len(voice_client.played) == 1)
+    second = asyncio.create_task(
+        sessions.play(
+            sources[1],
+            first_channel,
+            policy='enqueue',
+            wait=True,
+        ),
+    )
+    await asyncio.sleep(0)
+    assert await sessions.play(sources[2], second_channel, policy='enqueue')
+    session = sessions.session(guild.id)
+    assert session.queued == 2
+
+    # Sounds are played in order, each once the last has finished.
+    voice_client.finish()
+    assert await first
+    await _finish_next(voice_client, 2)
+    assert await second
+    await _finish_next(voice_client, 3)
+    await wait_for(lambda: not session.busy)
+    assert voice_client.played == sources
+
+    # The voice client only moves when the channel changes.
+    voice_client.move_to.assert_awaited_once_with(second_channel)
+
+
+async def test_play_interrupt(
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+) -> None:
+    channel = voice_client.channel
+    sources = [mock.MagicMock(spec=discord.AudioSource) for _ in range(3)]
+    current = asyncio.create_task(
+        sessions.play(sources[0], channel, wait=True),
+    )
+    await wait_for(lambda: len(voice_client.played) == 1)
+    queued = asyncio.create_task(
+        sessions.play(sources[1], channel, policy='enqueue', wait=True),
+    )
+    await asyncio.sleep(0)
+
+    latest = asyncio.create_task(
+        sessions.play(sources[2], channel, policy='interrupt', wait=True),
+    )
+    # The current sound is stopped and the queued sound is skipped.
+    assert not await current
+    assert not await queued
+    await _finish_next(voice_client, 2)
+    assert await latest
+    assert voice_client.played == [sources[0], sources[2]]
+    # Only the skipped source is cleaned up by the session. The voice client
+    # cleans up the sources it played.
+    sources[0].cleanup.assert_not_called()
+    sources[1].cleanup.assert_called_once()
+
+
+async def test_play_interrupt_while_connecting(
+    guild: Any,
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+) -> None:
+    channel = voice_client.channel
+    session = sessions.session(guild.id)
+    # The session has a voice client from an earlier sound.
+    task = asyncio.create_task(sessions.play('first', channel, wait=True))
+    with mock.patch('discord.FFmpegOpusAudio'):
+        await _finish_next(voice_client, 1)
+        await task
+
+    connected = asyncio.Event()
+
+    async def _connect(_: Any) -> _VoiceClient:
+        await connected.wait()
+        return voice_client
+
+    source = mock.MagicMock(spec=discord.AudioSource)
+    with mock.patch.object(session, '_connect', side_effect=_connect):
+        slow = asyncio.create_task(sessions.play(source, channel, wait=True))
+        await wait_for(lambda: session._current is not None)
+        latest = asyncio.create_task(sessions.play(source, channel, wait=True))
+        await asyncio.sleep(0)
+        connected.set()
+        assert not await slow
+    source.cleanup.assert_called_once()
+    await _finish_next(voice_client, 2)
+    assert await latest
+
+
+async def test_play_busy(
+    guild: Any,
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+) -> None:
+    channel = voice_client.channel
+    source = mock.MagicMock(spec=discord.AudioSource)
+    await sessions.play(source, channel, policy='drop')
+    await wait_for(lambda: len(voice_client.played) == 1)
+
+    with pytest.raises(VoiceBusyError, match='already playing'):
+        await sessions.play(source, channel, policy='drop')
+    with pytest.raises(VoiceBusyError, match='already playing'):
+        await sessions.play('sound.mp3', channel, policy='drop')
+
+    # Back-pressure once the queue is full.
+    await sessions.play(source, channel, policy='enqueue')
+    await sessions.play(source, channel, policy='enqueue')
+    with pytest.raises(VoiceBusyError, match='Too many sounds'):
+        await sessions.play(source, channel, policy='enqueue')
+    # Rejected sources are cleaned up.
+    assert source.cleanup.call_count == 2
+
+    session = sessions.session(guild.id)
+    for count in range(1, 3):
+        await _finish_next(voice_client, count)
+    await _finish_next(voice_client, 3)
+    await wait_for(lambda: not session.busy)
+
+
+async def test_play_skips_cancelled(
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+) -> None:
+    channel = voice_client.channel
+    sources = [mock.MagicMock(spec=discord.AudioSource) for _ in range(3)]
+    await sessions.play(sources[0], channel)
+    await wait_for(lambda: len(voice_client.played) == 1)
+    cancelled = asyncio.create_task(
+        sessions.play(sources[1], channel, policy='enqueue', wait=True),
+    )
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    playing = asyncio.create_task(
+        sessions.play(sources[2], channel, policy='enqueue', wait=True),
+    )
+    await asyncio.sleep(0)
+
+    voice_client.finish()
+    await wait_for(lambda: len(voice_client.played) == 2)
+    # Callers may also stop waiting while their sound plays.
+    playing.cancel()
+    voice_client.finish()
+    assert voice_client.played == [sources[0], sources[2]]
+    sources[1].cleanup.assert_called_once()
+
+    # Interrupts skip queued sounds whose caller stopped waiting.
+    await sessions.play(sources[0], channel)
+    await wait_for(lambda: len(voice_client.played) == 3)
+    cancelled = asyncio.create_task(
+        sessions.play(sources[1], channel, policy='enqueue', wait=True),
+    )
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    await sessions.play(sources[2], channel)
+    await _finish_next(voice_client, 4)
+    assert voice_client.played[-1] is sources[2]
+
+
+async def test_play_errors(
+    guild: Any,
+    voice_client: _VoiceClient,
+    sessions: VoiceSessionManager,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    channel = voice_client.channel
+    source = mock.MagicMock(spec=discord.AudioSource)
+
+    # Errors reported by the audio player.
+    task = asyncio.create_task(sessions.play(source, channel, wait=True))
+    await wait_for(lambda: len(voice_client.played) == 1)
+    voice_client.finish(RuntimeError('player failed'))
+    with pytest.raises(RuntimeError, match='player failed'):
+        await task
+
+    # Errors connecting to the channel.
+    guild.voice_client = None
+    channel.connect = mock.AsyncMock(side_effect=TimeoutError)
+    with pytest.raises(TimeoutError):
+        await sessions.play(source, channel, wait=True)
+    source.cleanup.assert_called_once()
+
+    # Errors starting to play.
+    guild.voice_client = voice_client
+    with (
+        mock.patch.object(voice_client, 'play', side_effect=RuntimeError),
+        pytest.raises(RuntimeError),
+    ):
+        await sessions.play(source, channel, wait=True)
+    assert source.cleanup.call_count == 2
+    guild.voice_client = None
+
+    # Errors are logged when the caller does not wait.
+    await sessions.play(source, channel)
+    session = sessions.session(guild.id)
+    await wait_for(lambda: not session.busy)
+    await asyncio.sleep(0)
+    assert any('error playing sound' in r.message for r in caplog.records)
+
+
+def test_session_validation() -> None:
+    with pytest.raises(ValueError, match='at least one'):
+        VoiceSession(1234, maxsize=0)
+
+
+def test_configure() -> None:
+    with mock.patch.object(voice, 'sessions', VoiceSessionManager()):
+        voice.configure(queue_size=3)
+        assert voice.sessions.session(1234).maxsize == 3
+        with pytest.raises(ValueError, match='at least one'):
+            voice.configure(queue_size=0)
+
+
+async def test_play_sound_uses_shared_sessions(
+    voice_client: _VoiceClient,
+) -> None:
+    source = mock.MagicMock(spec=discord.AudioSource)
+    with mock.patch.object(
+        voice.sessions,
+        'play',
+        mock.AsyncMock(return_value=True),
+    ) as mock_play:
+        assert await play_sound(source, voice_client.channel, wait=True)
+    mock_play.assert_awaited_once_with(
+        source,
+        voice_client.channel,
+        policy='interrupt',
+        wait=True,
+    )
+
+
+async def test_submit_sound_returns_future(
+    voice_client: _VoiceClient,
+) -> None:
+    source = mock.MagicMock(spec=discord.AudioSource)
+    with mock.patch.object(voice, 'sessions', VoiceSessionManager()):
+        done = submit_sound(source, voice_client.channel, policy='enqueue')
+        await _finish_next(voice_client, 1)
+        assert await done
+    assert voice_client.played == [source]
+
+
+class _IdleVoiceClient(discord.VoiceClient):
+    def __init__(self, channel: Any) -> None:
+        self.channel = channel
+        self.disconnect = mock.AsyncMock()  # type: ignore[method-assign]
+
+
+def _idle_guild(members: int) -> Any:
+    guild = mock.MagicMock()
+    guild.id = 1234
+    channel = mock.MagicMock()
+    channel.guild = guild
+    channel.members = [object() for _ in range(members)]
+    guild.voice_client = _IdleVoiceClient(channel)
+    return guild
+
+
+async def test_idle_disconnect() -> None:
+    guild = _idle_guild(members=1)
+    idle = IdleVoiceDisconnector(mock.MagicMock(), grace_seconds=0.01)
+
+    idle.check(guild)
+    assert idle.idle == {guild.id}
+    # Checking again keeps the original deadline.
+    timer = idle._timers[guild.id]
+    idle.check(guild)
+    assert idle._timers[guild.id] is timer
+
+    await wait_for(lambda: guild.voice_client.disconnect.await_count == 1)
+    assert idle.idle == frozenset()
+
+
+async def test_idle_disconnect_cancelled() -> None:
+    guild = _idle_guild(members=1)
+    idle = IdleVoiceDisconnector(mock.MagicMock(), grace_seconds=0.01)
+    idle.check(guild)
+
+    # A member joins before the grace period ends.
+    guild.voice_client.channel.members.append(object())
+    member = mock.MagicMock()
+    member.guild = guild
+    await idle.on_voice_state_update(
+        member, mock.MagicMock(), mock.MagicMock()
+    )
+    assert idle.idle == frozenset()
+    await asyncio.sleep(0.02)
+    guild.voice_client.disconnect.assert_not_awaited()
+
+    # Not connected or not alone.
+    idle.check(guild)
+    guild.voice_client = None
+    idle.check(guild)
+    assert idle.idle == frozenset()
+
+
+async def test_idle_disconnect_rechecks() -> None:
+    guild = _idle_guild(members=1)
+    idle = IdleVoiceDisconnector(mock.MagicMock(), grace_seconds=0.01)
+    idle.check(guild)
+    # A member joins without a voice state update being seen.
+    guild.voice_client.channel.members.append(object())
+    await wait_for(lambda: idle.idle == frozenset())
+    await asyncio.sleep(0)
+    guild.voice_client.disconnect.assert_not_awaited()
+
+
+async def test_idle_start_stop() -> None:
+    alone = _idle_guild(members=1)
+    busy = _idle_guild(members=2)
+    busy.id = 5678
+    client = mock.MagicMock()
+    client.voice_clients = [
+        alone.voice_client,
+        busy.voice_client,
+        mock.MagicMock(spec=discord.VoiceProtocol),
+    ]
+
+    idle = IdleVoiceDisconnector(client, grace_seconds=60)
+    idle.start()
+    assert idle.idle == {alone.id}
+    timer = idle._timers[alone.id]
+    idle.stop()
+    assert idle.idle == frozenset()
+    assert timer.cancelled()
+
+    with pytest.raises(ValueError, match='must not be negative'):
+        IdleVoiceDisconnector(client, grace_seconds=-1)
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+from discord.ext import tasks
+
+from threepseat.connections import MEMORY_DATABASE
+from threepseat.utils import LoopType
+
+BACKUP_PAGES = 256
+BACKUP_RESTARTS = 3
+BACKUP_SLEEP_MS = 10
+SNAPSHOT_SUFFIXES = ('.sqlite3', '.sqlite3.gz')
+
+logger = logging.getLogger(__name__)
+
+
+class _TooManyRestartsError(Exception):
+    pass
+
+
+class _Progress:
+    """Progress callback of a backup which limits how often it restarts."""
+
+    def __init__(self, restarts: int) -> None:
+        self.restarts = restarts
+        self.restarted = 0
+        self.remaining: int | None = None
+
+    def __call__(self, _status: int, remaining: int, _total: int) -> None:
+        # Each step copies more pages unless the copy was restarted.
+        if self.remaining is not None and remaining >= self.remaining:
+            self.restarted += 1
+            if self.restarted > self.restarts:
+                raise _TooManyRestartsError
+        self.remaining = remaining
+
+
+def backup(  # noqa: PLR0913
+    source: str,
+    target: str,
+    *,
+    pages: int = BACKUP_PAGES,
+    sleep_ms: int = BACKUP_SLEEP_MS,
+    restarts: int = BACKUP_RESTARTS,
+    vacuum: bool = False,
+) -> None:
+    """Write a consistent copy of a live database to a new file.
+
+    Copying the database file while it is in use can produce a corrupt copy,
+    especially in WAL mode where recent commits are still in the -wal file.
+    Instead, this copies the database with the SQLite online backup API,
+    `pages` pages at a time with a short sleep in between, so the lock on
+    the source is only held for one short step at a time and the bot keeps
+    serving while the copy is made. If another connection writes to the
+    source between steps, SQLite restarts the copy. After `restarts`
+    restarts, the copy is instead finished in one step, which holds the lock
+    on the source for the whole copy but cannot be restarted, so a busy
+    database still gets backed up.
+
+    With `vacuum`, the copy is written with `VACUUM INTO` instead. This
+    reads the source in one transaction, which does not block writers in WAL
+    mode, and the copy is compacted: free pages left behind by deleted sounds
+    and offenses are dropped and the rows are defragmented. The compacted
+    copy can also replace the live file while the bot is stopped.
+
+    The copy uses a rollback journal rather than WAL, so it is one
+    self-contained file.
+
+    Args:
+        source (str): filepath of the database to copy.
+        target (str): filepath to write the copy to. Must not exist.
+        pages (int): pages to copy per step.
+        sleep_ms (int): milliseconds to sleep between steps.
+        restarts (int): restarts of the copy to allow before finishing it in
+            one step.
+        vacuum (bool): write a compacted copy with `VACUUM INTO`.
+
+    Raises:
+        ValueError:
+            if `source` is an in-memory database or `target` exists.
+    """
+    if source == MEMORY_DATABASE:
+        msg = 'Cannot back up an in-memory database.'
+        raise ValueError(msg)
+    if Path(target).exists():
+        msg = f'Backup target {target} already exists.'
+        raise ValueError(msg)
+
+    src = sqlite3.connect(source)
+    try:
+        if vacuum:
+            src.execute('VACUUM INTO ?', (target,))
+        else:
+            dst = sqlite3.connect(target)
+            try:
+                _backup_in_steps(src, dst, pages, sleep_ms, restarts)
+            finally:
+                dst.close()
+    finally:
+        src.close()
+
+    dst = sqlite3.connect(target)
+    try:
+        dst.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        dst.close()
+
+
+def _backup_in_steps(
+    src: sqlite3.Connection,
+    dst: sqlite3.Connection,
+    pages: int,
+    sleep_ms: int,
+    restarts: int,
+) -> None:
+    try:
+        src.backup(
+            dst,
+            pages=pages,
+            progress=_Progress(restarts),
+            sleep=sleep_ms / 1000,
+        )
+    except _TooManyRestartsError:
+        logger.warning(
+            'backup restarted %s times, finishing it in one step', restarts
+        )
+        src.backup(dst)
+
+
+def rotate(directory: str, stem: str, keep: int) -> list[Path]:
+    """Remove all but the newest `keep` snapshots of a database.
+
+    Args:
+        directory (str): directory containing the snapshots.
+        stem (str): stem of the database filename.
+        keep (int): number of snapshots to keep.
+
+    Returns:
+        list of the removed snapshots.
+    """
+    # Snapshot names end in a UTC timestamp so sort from oldest to newest.
+    snapshots = sorted(
+        path
+        for path in Path(directory).glob(f'{stem}-*')
+        if path.name.endswith(SNAPSHOT_SUFFIXES)
+    )
+    removed = snapshots[: max(len(snapshots) - keep, 0)]
+    for path in removed:
+        path.unlink()
+        logger.debug('removed old snapshot %s', path)
+    return removed
+
+
+def snapshot(
+    filepath: str,
+    directory: str,
+    *,
+    keep: int = 7,
+    compress: bool = False,
+    vacuum: bool = False,
+) -> Path:
+    """Write a timestamped snapshot of a database and rotate old ones.
+
+    The snapshot is written to a temporary file and renamed once complete,
+    so a crash part way through never leaves a partial snapshot that looks
+    complete. See backup() for how the copy is made.
+
+    Args:
+        filepath (str): filepath of the database to snapshot.
+        directory (str): directory to write snapshots to.
+        keep (int): number of snapshots to keep, including this one.
+        compress (bool): gzip the snapshot.
+        vacuum (bool): compact the snapshot, see backup().
+
+    Returns:
+        path of the snapshot.
+    """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    stem = Path(filepath).stem
+    now = time.time()
+    timestamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))
+    milliseconds = int(now * 1000) % 1000
+    name = f'{stem}-{timestamp}{milliseconds:03}Z.sqlite3'
+    partial = Path(directory) / f'{name}.partial'
+    compressed = Path(directory) / f'{name}.gz.partial'
+
+    start = time.perf_counter()
+    try:
+        backup(filepath, str(partial), vacuum=vacuum)
+        if compress:
+            with partial.open('rb') as f, gzip.open(compressed, 'wb') as g:
+                shutil.copyfileobj(f, g)
+            partial.unlink()
+            path = compressed.rename(Path(directory) / f'{name}.gz')
+        else:
+            path = partial.rename(Path(directory) / name)
+    finally:
+        # Only remove this call's files: partial snapshots of the same
+        # database may belong to another process still writing them.
+        partial.unlink(missing_ok=True)
+        compressed.unlink(missing_ok=True)
+
+    logger.info(
+        'wrote snapshot of %s to %s in %.2fs',
+        filepath,
+        path,
+        time.perf_counter() - start,
+    )
+    rotate(directory, stem, keep)
+    return path
+
+
+def snapshot_loop(  # noqa: PLR0913
+    filepath: str,
+    directory: str,
+    *,
+    hours: float,
+    keep: int = 7,
+    compress: bool = False,
+    vacuum: bool = False,
+) -> LoopType:
+    """Returns a task that when started will periodically snapshot a database.
+
+    Snapshots are written on a worker thread so the event loop keeps
+    running. A failed snapshot is logged and retried at the next interval.
+
+    Usage:
+        >>> snapshots = snapshot_loop('bot.db', 'backups', hours=24)
+        >>> snapshots.start()
+
+    Args:
+        filepath (str): filepath of the database to snapshot.
+        directory (str): directory to write snapshots to.
+        hours (float): time in hours between snapshots.
+        keep (int): number of snapshots to keep.
+        compress (bool): gzip the snapshots.
+        vacuum (bool): compact the snapshots, see backup().
+
+    Returns:
+        discord.ext.tasks.Loop
+    """
+
+    @tasks.loop(hours=hours)
+    async def _snapshot() -> None:
+        # An exception would stop the loop, so log it and try again at the
+        # next interval instead.
+        try:
+            await asyncio.to_thread(
+                snapshot,
+                filepath,
+                directory,
+                keep=keep,
+                compress=compress,
+                vacuum=vacuum,
+            )
+        except Exception:
+            logger.exception('failed to snapshot %s', filepath)
+
+    return _snapshot
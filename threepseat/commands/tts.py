@@ -8,8 +8,9 @@ from discord import app_commands
 from threepseat.commands.commands import log_interaction
 from threepseat.tts import Accent
 from threepseat.tts import tts_as_mp3
-from threepseat.utils import play_sound
 from threepseat.utils import voice_channel
+from threepseat.voice import VoiceBusyError
+from threepseat.voice import play_sound
 
 MAX_TTS_CHARACTERS = 200
 
@@ -52,7 +53,9 @@ async def tts(
 
     try:
         async with tts_as_mp3(text, accent=accent, slow=slow) as fp:
-            await play_sound(fp, channel, wait=True)
+            await play_sound(fp, channel, policy='enqueue', wait=True)
+    except VoiceBusyError as e:
+        await interaction.followup.send(f'{e} Try again later.')
     except Exception:
         await interaction.followup.send('Failed to play TTS.')
         logger.exception('caught exception playing TTS')
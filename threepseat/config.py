@@ -17,9 +17,22 @@ class Config:
     redirect_uri: str
     sounds_path: str
     sqlite_database: str
+    sqlite_cache_kib: int = 2000
+    sqlite_mmap_mib: int = 0
+    sqlite_synchronous: str = 'FULL'
+    sqlite_coherence_ms: int | None = 1000
+    sqlite_slow_query_ms: int | None = None
+    backup_path: str | None = None
+    backup_interval_hours: int = 24
+    backup_keep: int = 7
+    backup_compress: bool = True
+    backup_vacuum: bool = False
     sounds_port: int = 5001
     sounds_certfile: str | None = None
     sounds_keyfile: str | None = None
+    voice_idle_seconds: int = 60
+    voice_queue_size: int = 8
+    sounds_mix_voices: int | None = None
     playing_title: str = '3pseat Simulator 2022'
 
     def __post_init__(self) -> None:
@@ -0,0 +1,471 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from typing import NamedTuple
+from typing import TypeVar
+
+T = TypeVar('T')
+
+MEMORY_DATABASE = ':memory:'
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSettings(NamedTuple):
+    """Tunable settings for the connections to a SQLite database file."""
+
+    readers: int = 4
+    """Maximum number of read-only connections."""
+    cache_size_kib: int = 2000
+    """Page cache size of each connection in KiB (the SQLite default)."""
+    mmap_size_mib: int = 0
+    """Bytes of the file to memory map per connection in MiB (0 disables)."""
+    synchronous: str = 'FULL'
+    """When SQLite fsyncs (one of SYNCHRONOUS_MODES). NORMAL is safe from
+    corruption in WAL mode but a power loss may roll back the most recent
+    commits."""
+    coherence_interval_ms: int | None = 1000
+    """Minimum time between checks for writes by other processes (see
+    ConnectionPool.check_external_writes()). None disables the checks."""
+    slow_query_ms: float | None = None
+    """Table operations on the file slower than this are logged as warnings
+    (see SQLTableInterface.stats()). None disables the log."""
+
+
+class ConnectionPool:
+    """Connections to one SQLite database file.
+
+    Writes are serialized through a single writer connection while reads are
+    spread across a small pool of read-only connections. In WAL mode, readers
+    see the last committed state and do not block, or get blocked by, the
+    writer. The pool also owns the database thread that the awaitable table
+    operations run on.
+
+    A ':memory:' database only exists for the connection that opened it, so
+    its pool has no readers and the writer serves reads too.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        settings: PoolSettings | None = None,
+    ) -> None:
+        """Init ConnectionPool.
+
+        Args:
+            filepath (str): filepath to the sqlite3 database to use.
+            settings (PoolSettings | None): connection settings. Defaults to
+                PoolSettings().
+
+        Raises:
+            ValueError:
+                if the settings are invalid.
+        """
+        self.filepath = filepath
+        self.settings = PoolSettings() if settings is None else settings
+        if self.settings.synchronous not in SYNCHRONOUS_MODES:
+            msg = (
+                f'Synchronous mode {self.settings.synchronous} is not one of '
+                f'{", ".join(SYNCHRONOUS_MODES)}.'
+            )
+            raise ValueError(msg)
+        if self.settings.readers < 1:
+            msg = 'At least one reader connection is required.'
+            raise ValueError(msg)
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.RLock()
+        # State of the open transaction(), only used by the thread that
+        # holds the writer lock.
+        self._transaction_depth = 0
+        self._transaction_thread: int | None = None
+        self._on_commit: list[Callable[[], None]] = []
+        self._on_rollback: list[Callable[[], None]] = []
+        # Borrowing a reader is on the path of every uncached read, so idle
+        # readers are kept in a SimpleQueue (implemented in C) rather than a
+        # list guarded by a threading.Semaphore (implemented in Python).
+        # None is put to wake the threads waiting for a reader when close()
+        # replaces the queue, see _borrow().
+        self._idle: queue.SimpleQueue[sqlite3.Connection | None] = (
+            queue.SimpleQueue()
+        )
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        # Threads waiting on _idle for a reader, guarded by _readers_lock.
+        self._waiting = 0
+        self._executor: ThreadPoolExecutor | None = None
+        self._data_version: int | None = None
+        self._next_check = 0.0
+        self._check_scheduled = False
+        self._listeners: list[Callable[[], None]] = []
+
+    @property
+    def in_memory(self) -> bool:
+        """If the database is in memory and private to the writer."""
+        return self.filepath == MEMORY_DATABASE
+
+    def _open(self, read_only: bool) -> sqlite3.Connection:
+        # Connections are used by whichever thread holds them, including the
+        # database thread, so they cannot be bound to the opening thread.
+        db = sqlite3.connect(
+            self.filepath,
+            check_same_thread=False,
+            # Every table on the file shares the connection and its prepared
+            # statement cache, so keep more than the default of 128.
+            cached_statements=512,
+        )
+        db.execute(f'PRAGMA cache_size = -{self.settings.cache_size_kib}')
+        db.execute(f'PRAGMA mmap_size = {self.settings.mmap_size_mib << 20}')
+        db.execute(f'PRAGMA synchronous = {self.settings.synchronous}')
+        if read_only:
+            db.execute('PRAGMA query_only = 1')
+        else:
+            # WAL lets the readers keep reading while the writer writes. It
+            # is a no-op for ':memory:'.
+            db.execute('PRAGMA journal_mode = WAL')
+        return db
+
+    @contextlib.contextmanager
+    def writer(self) -> Generator[sqlite3.Connection, None, None]:
+        """Transaction on the writer connection.
+
+        The context holds the writer lock, commits on success, and rolls back
+        if the body raises. Inside a transaction(), the writes join it
+        instead and it commits or rolls back all of them.
+        """
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._open(read_only=False)
+                self._data_version = self._writer.execute(
+                    'PRAGMA data_version',
+                ).fetchone()[0]
+            if self._transaction_depth > 0:
+                yield self._writer
+                return
+            with self._writer as db:
+                yield db
+
+    @contextlib.contextmanager
+    def transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        """Transaction that spans every write made inside it.
+
+        Any writer() used by this thread inside the context, e.g., by the
+        writes of several tables on the file, joins one transaction, so the
+        writes commit atomically and with one fsync. Transactions can be
+        nested, in which case the outermost one commits.
+
+        Reads use the reader connections, so they do not see the writes until
+        the transaction commits.
+        """
+        with self._writer_lock:
+            if self._transaction_depth > 0:
+                assert self._writer is not None
+                self._transaction_depth += 1
+                try:
+                    yield self._writer
+                finally:
+                    self._transaction_depth -= 1
+                return
+
+            try:
+                with self.writer() as db:
+                    # DDL does not implicitly open a transaction in sqlite3.
+                    db.execute('BEGIN')
+                    self._transaction_depth = 1
+                    self._transaction_thread = threading.get_ident()
+                    try:
+                        yield db
+                    finally:
+                        self._transaction_depth = 0
+                        self._transaction_thread = None
+            except BaseException:
+                callbacks = self._on_rollback
+                raise
+            else:
+                callbacks = self._on_commit
+            finally:
+                self._on_commit, self._on_rollback = [], []
+                # Run once the commit or rollback is done but before another
+                # thread can write.
+                for callback in callbacks:
+                    callback()
+
+    def in_transaction(self) -> bool:
+        """If the calling thread is inside a transaction()."""
+        return self._transaction_thread == threading.get_ident()
+
+    def defer(
+        self,
+        *,
+        on_commit: Callable[[], None] | None = None,
+        on_rollback: Callable[[], None] | None = None,
+    ) -> None:
+        """Run callbacks once the calling thread's transaction finishes.
+
+        `on_commit` is called if the transaction() commits and `on_rollback`
+        if it rolls back. Outside of a transaction, the caller's write has
+        already been committed, so `on_commit` is called immediately.
+        """
+        if not self.in_transaction():
+            if on_commit is not None:
+                on_commit()
+            return
+        if on_commit is not None:
+            self._on_commit.append(on_commit)
+        if on_rollback is not None:
+            self._on_rollback.append(on_rollback)
+
+    @contextlib.contextmanager
+    def reader(self) -> Generator[sqlite3.Connection, None, None]:
+        """Borrow a read-only connection.
+
+        Blocks if all of the readers are in use. Falls back to the writer for
+        ':memory:' databases.
+        """
+        if self.in_memory:
+            with self.writer() as db:
+                yield db
+            return
+
+        db = self._borrow()
+        try:
+            yield db
+        finally:
+            # Readers closed by close() while borrowed are not reused.
+            if db in self._readers:
+                self._idle.put(db)
+
+    def _borrow(self) -> sqlite3.Connection:
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                with self._readers_lock:
+                    if len(self._readers) < self.settings.readers:
+                        db = self._open(read_only=True)
+                        self._readers.append(db)
+                        return db
+                    idle = self._idle
+                    self._waiting += 1
+                db = idle.get()
+                with self._readers_lock:
+                    self._waiting -= 1
+            if db is not None:
+                return db
+            # Woken by close(), which closed the readers being waited for,
+            # so try again with new ones.
+
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        """Call listener when another process writes to the file."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[], None]) -> None:
+        """Stop calling a listener added with subscribe()."""
+        with contextlib.suppress(ValueError):
+            self._listeners.remove(listener)
+
+    def check_external_writes(self) -> bool:
+        """Check if another process has written to the file.
+
+        SQLite changes a connection's `PRAGMA data_version` when any other
+        connection commits to the file. Every write in this process goes
+        through the writer, so a change seen by the writer means another
+        process (e.g., a second worker or an admin script) wrote to the file.
+        If so, the subscribed listeners are called so they can drop state
+        derived from the file, such as cached reads.
+
+        The check runs at most once per `coherence_interval_ms` and is
+        skipped if the writer is busy. Listeners may still block, e.g., to
+        reload a mirror, so reads use schedule_check() instead.
+
+        Returns:
+            if a write by another process was detected.
+        """
+        interval = self.settings.coherence_interval_ms
+        if interval is None or self.in_memory:
+            return False
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        # Skip rather than wait for a write in progress. It will be checked
+        # again after the next interval.
+        if not self._writer_lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = now + interval / 1000
+            if self._writer is None:
+                return False
+            version: int = self._writer.execute(
+                'PRAGMA data_version',
+            ).fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+        finally:
+            self._writer_lock.release()
+
+        if changed:
+            logger.debug('detected external write to %s', self.filepath)
+            for listener in list(self._listeners):
+                listener()
+        return changed
+
+    def schedule_check(self) -> None:
+        """Run check_external_writes() on the database thread.
+
+        This returns without waiting, so a cache hit on the event loop
+        never waits for the check or for listeners that reload state (e.g.,
+        a mirror, which waits for the writer lock). Reads may return the
+        old state until the check finishes, as they already may for up to
+        `coherence_interval_ms`.
+        """
+        interval = self.settings.coherence_interval_ms
+        if (
+            interval is None
+            or self.in_memory
+            or self._check_scheduled
+            or time.monotonic() < self._next_check
+        ):
+            return
+        self._check_scheduled = True
+        self._database_thread().submit(self._scheduled_check)
+
+    def _scheduled_check(self) -> None:
+        try:
+            self.check_external_writes()
+        except Exception:
+            # Nothing waits on the result, so log it instead.
+            logger.exception(
+                'failed to check %s for external writes', self.filepath
+            )
+        finally:
+            self._check_scheduled = False
+
+    def _database_thread(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix='threepseat-sqlite',
+            )
+        return self._executor
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """Run func on the database thread without blocking the event loop.
+
+        Every async operation on the file goes through one thread, so a
+        slow query or fsync only delays other database work, not the event
+        loop (e.g., the gateway heartbeat or web requests).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._database_thread(),
+            functools.partial(func, *args, **kwargs),
+        )
+
+    def close(self) -> None:
+        """Close the database thread and all of the connections.
+
+        Pending async operations finish before the connections are closed.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for db in self._readers:
+                db.close()
+            self._readers.clear()
+            # Readers returned after this are not reused (see reader()), so
+            # wake the threads waiting for one to open new readers instead.
+            for _ in range(self._waiting):
+                self._idle.put(None)
+            self._idle = queue.SimpleQueue()
+
+
+class _Registered(NamedTuple):
+    pool: ConnectionPool
+    references: int
+
+
+_pools: dict[str, _Registered] = {}
+_settings: dict[str, PoolSettings] = {}
+_registry_lock = threading.Lock()
+
+
+def _registry_key(filepath: str) -> str:
+    return str(Path(filepath).resolve())
+
+
+def configure(filepath: str, settings: PoolSettings) -> None:
+    """Set the settings used for connections to a database file.
+
+    Only affects pools opened after this is called, so call it before
+    creating any tables on the file.
+    """
+    with _registry_lock:
+        _settings[_registry_key(filepath)] = settings
+
+
+def acquire(filepath: str) -> ConnectionPool:
+    """Get the shared pool for a database file.
+
+    Every caller with the same file shares one pool, so the file has one
+    writer connection and one page cache per connection in the process.
+    Each call must be paired with a call to release().
+
+    A ':memory:' database is private to its connection, so every call for
+    one returns a new, unshared pool.
+    """
+    if filepath == MEMORY_DATABASE:
+        return ConnectionPool(filepath)
+
+    key = _registry_key(filepath)
+    with _registry_lock:
+        if key in _pools:
+            pool, references = _pools[key]
+        else:
+            pool, references = ConnectionPool(filepath, _settings.get(key)), 0
+            logger.debug('opened connection pool for %s', filepath)
+        _pools[key] = _Registered(pool, references + 1)
+        return pool
+
+
+def release(pool: ConnectionPool) -> None:
+    """Release a pool returned by acquire().
+
+    The pool is closed once every user of the file has released it.
+    """
+    if pool.in_memory:
+        pool.close()
+        return
+
+    key = _registry_key(pool.filepath)
+    with _registry_lock:
+        registered = _pools.get(key)
+        if registered is None or registered.pool is not pool:
+            return
+        if registered.references > 1:
+            _pools[key] = _Registered(pool, registered.references - 1)
+            return
+        del _pools[key]
+    pool.close()
+    logger.debug('closed connection pool for %s', pool.filepath)
@@ -5,6 +5,7 @@ import enum
 import logging
 import time
 import zoneinfo
+from collections.abc import Iterable
 
 import discord
 from discord import app_commands
@@ -84,14 +85,30 @@ class BirthdayCommands(CommandGroupExtension):
         @tasks.loop(time=time)
         async def _checker() -> None:
             logger.info('starting daily birthday check...')
+            # One query for every guild rather than one per guild.
+            birthdays: dict[int, list[Birthday]] = {
+                guild.id: [] for guild in client.guilds
+            }
+            for birthday in self.table.all_in(guild_id=list(birthdays)):
+                birthdays[birthday.guild_id].append(birthday)
             for guild in client.guilds:
-                await self.send_birthday_messages(guild)
+                await self.send_birthday_messages(guild, birthdays[guild.id])
             logger.info('finished daily birthday check')
 
         return _checker
 
-    async def send_birthday_messages(self, guild: discord.Guild) -> None:
-        """Checks birthdays in guild and sends messages if they are today."""
+    async def send_birthday_messages(
+        self,
+        guild: discord.Guild,
+        birthdays: Iterable[Birthday] | None = None,
+    ) -> None:
+        """Checks birthdays in guild and sends messages if they are today.
+
+        Args:
+            guild (Guild): guild to check.
+            birthdays (Iterable[Birthday] | None): birthdays in the guild if
+                already fetched. If None, they are read from the table.
+        """
         month = datetime.datetime.now(tz=datetime.UTC).month
         day = datetime.datetime.now(tz=datetime.UTC).day
 
@@ -99,7 +116,9 @@ class BirthdayCommands(CommandGroupExtension):
         if channel is None:
             return
 
-        for birthday in self.table.all(guild.id):
+        if birthdays is None:
+            birthdays = self.table.all(guild.id)
+        for birthday in birthdays:
             if birthday.birth_day == day and birthday.birth_month == month:
                 member = guild.get_member(birthday.user_id)
                 if member is not None:
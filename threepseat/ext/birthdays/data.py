@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import sqlite3
 from typing import NamedTuple
 
+from threepseat import migrations
 from threepseat.table import SQLTableInterface
 
 
@@ -39,6 +41,7 @@ class BirthdayTable(SQLTableInterface[Birthday]):
             'birthdays',
             db_path,
             primary_keys=('guild_id', 'user_id'),
+            without_rowid=True,
         )
 
     def _all(self, guild_id: int) -> tuple[Birthday, ...]:
@@ -56,3 +59,13 @@ class BirthdayTable(SQLTableInterface[Birthday]):
     def remove(self, guild_id: int, user_id: int) -> int:
         """Remove a birthday from the table."""
         return super().remove(guild_id=guild_id, user_id=user_id)
+
+
+@migrations.register(
+    'birthdays',
+    1,
+    'Store birthdays without rowids',
+    tables=('birthdays',),
+)
+def _without_rowid(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'birthdays')
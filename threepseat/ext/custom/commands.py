@@ -44,10 +44,13 @@ class CustomCommands(CommandGroupExtension):
 
     async def post_init(self, bot: discord.ext.commands.Bot) -> None:
         """Register all saved custom commands to the client."""
-        commands = self.table.all()
-        for command in commands:
+        # Streamed rather than all() so the whole table is not left in the
+        # read cache for the life of the process.
+        count = 0
+        for command in self.table.iter_all():
             await self.register(command, bot, sync=False)
-        logger.info('registered %s saved custom command(s)', len(commands))
+            count += 1
+        logger.info('registered %s saved custom command(s)', count)
 
     async def post_shutdown(self) -> None:
         """Close the database."""
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import sqlite3
 from typing import NamedTuple
 
+from threepseat import migrations
 from threepseat.table import SQLTableInterface
 
 
@@ -30,6 +32,7 @@ class CustomCommandTable(SQLTableInterface[CustomCommand]):
             'custom_commands',
             db_path,
             primary_keys=('guild_id', 'name'),
+            without_rowid=True,
         )
 
     def _all(
@@ -52,3 +55,13 @@ class CustomCommandTable(SQLTableInterface[CustomCommand]):
     def remove(self, guild_id: int, name: str) -> int:
         """Remove a custom command from the table."""
         return super().remove(guild_id=guild_id, name=name)
+
+
+@migrations.register(
+    'custom',
+    1,
+    'Store custom commands without rowids',
+    tables=('custom_commands',),
+)
+def _without_rowid(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'custom_commands')
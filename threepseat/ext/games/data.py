@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import sqlite3
 from typing import NamedTuple
 
+from threepseat import migrations
 from threepseat.table import SQLTableInterface
 
 
@@ -35,6 +37,7 @@ class GamesTable(SQLTableInterface[Game]):
             'games',
             db_path,
             primary_keys=('guild_id', 'name'),
+            without_rowid=True,
         )
 
     def _all(self, guild_id: int) -> tuple[Game, ...]:
@@ -48,3 +51,13 @@ class GamesTable(SQLTableInterface[Game]):
     def remove(self, guild_id: int, name: str) -> int:
         """Remove a game from the table."""
         return super().remove(guild_id=guild_id, name=name)
+
+
+@migrations.register(
+    'games',
+    1,
+    'Store games without rowids',
+    tables=('games',),
+)
+def _without_rowid(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'games')
@@ -66,19 +66,16 @@ class ReminderCommands(CommandGroupExtension):
 
     async def post_init(self, bot: discord.ext.commands.Bot) -> None:
         """Spawn all saved repeating reminder tasks."""
-        restored = 0
-        guilds = 0
-        for guild in bot.guilds:
-            reminders = self.table.all(guild.id)
-            if reminders:
-                guilds += 1
-            for reminder in reminders:
-                self.start_reminder(bot, reminder, ReminderType.REPEATING)
-                restored += 1
+        # One query for every guild rather than one per guild.
+        reminders = self.table.all_in(
+            guild_id=[guild.id for guild in bot.guilds],
+        )
+        for reminder in reminders:
+            self.start_reminder(bot, reminder, ReminderType.REPEATING)
         logger.info(
             'restored %s repeating reminder(s) across %s guild(s)',
-            restored,
-            guilds,
+            len(reminders),
+            len({reminder.guild_id for reminder in reminders}),
         )
 
     async def post_shutdown(self) -> None:
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import enum
+import sqlite3
 from typing import NamedTuple
 
+from threepseat import migrations
 from threepseat.table import SQLTableInterface
 
 
@@ -49,6 +51,7 @@ class RemindersTable(SQLTableInterface[Reminder]):
             'reminders',
             db_path,
             primary_keys=('guild_id', 'name'),
+            without_rowid=True,
         )
 
     def _all(self, guild_id: int) -> tuple[Reminder, ...]:
@@ -66,3 +69,13 @@ class RemindersTable(SQLTableInterface[Reminder]):
     def remove(self, guild_id: int, name: str) -> int:
         """Remove a reminder."""
         return super().remove(guild_id=guild_id, name=name)
+
+
+@migrations.register(
+    'reminders',
+    1,
+    'Store reminders without rowids',
+    tables=('reminders',),
+)
+def _without_rowid(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'reminders')
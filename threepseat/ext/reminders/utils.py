@@ -13,7 +13,8 @@ from threepseat.ext.reminders.data import ReminderType
 from threepseat.tts import Accent
 from threepseat.tts import tts_as_mp3
 from threepseat.utils import LoopType
-from threepseat.utils import play_sound
+from threepseat.voice import VoiceBusyError
+from threepseat.voice import play_sound
 
 logger = logging.getLogger(__name__)
 
@@ -133,4 +134,11 @@ async def send_voice_reminder(
     slow = random.random() < SLOW_VOICE_PROBABILITY
 
     async with tts_as_mp3(message, accent=accent, slow=slow) as fp:
-        await play_sound(fp, channel, wait=True)
+        try:
+            await play_sound(fp, channel, policy='enqueue', wait=True)
+        except VoiceBusyError:
+            logger.warning(
+                'skipped voice reminder in busy channel %s in %s',
+                channel.name,
+                channel.guild.name,
+            )
@@ -61,7 +61,7 @@ class RulesCommands(CommandGroupExtension):
         bot.add_listener(self.on_message, 'on_message')
 
         # Scan database for guilds that should be in an event
-        for config in self.database.get_configs():
+        for config in self.database.iter_configs():
             time_since_last_event = time.time() - config.last_event
             event_time_remain = (
                 config.last_event + (config.event_duration * 60)
@@ -102,7 +102,9 @@ class RulesCommands(CommandGroupExtension):
         times.
         """
         assert message.channel.guild is not None
-        config = self.database.get_config(guild_id=message.channel.guild.id)
+        config = await self.database.aget_config(
+            guild_id=message.channel.guild.id,
+        )
         if config is None:
             msg = 'Unreachable.'
             raise AssertionError(msg)
@@ -187,7 +189,7 @@ class RulesCommands(CommandGroupExtension):
         if ignore_message(message):
             return
 
-        config = self.database.get_config(message.channel.guild.id)
+        config = await self.database.aget_config(message.channel.guild.id)
         if config is None:
             logger.error(
                 'rules enabled for guild %s (%s) but the guild has not '
@@ -300,7 +302,7 @@ class RulesCommands(CommandGroupExtension):
         async def _event_starter() -> None:
             logger.info('starting periodic rules event starter routine')
             chances_per_day = (60 * 24) / interval_minutes
-            for config in self.database.get_configs():
+            for config in self.database.iter_configs():
                 if not bool(config.enabled):
                     continue
                 if config.guild_id in self.event_handlers:
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import sqlite3
 import time
+from collections.abc import Iterator
 from typing import NamedTuple
 
+from threepseat import migrations
 from threepseat.ext.rules.exceptions import GuildNotConfiguredError
 from threepseat.ext.rules.exceptions import MaxOffensesExceededError
 from threepseat.table import SQLTableInterface
+from threepseat.table import WriteBehind
 
 
 class GuildConfig(NamedTuple):
@@ -67,10 +71,18 @@ class RulesDatabase:
         """Get configuration for guild."""
         return self.config_table.get(guild_id)
 
+    async def aget_config(self, guild_id: int) -> GuildConfig | None:
+        """Get configuration for guild without blocking the event loop."""
+        return await self.config_table.aget(guild_id)
+
     def get_configs(self) -> tuple[GuildConfig, ...]:
         """Get all guild configs."""
         return self.config_table.all()
 
+    def iter_configs(self) -> Iterator[GuildConfig]:
+        """Stream all guild configs without caching them."""
+        return self.config_table.iter_all()
+
     def update_config(self, config: GuildConfig) -> None:
         """Update config row matching guild id."""
         return self.config_table.update(config)
@@ -99,21 +111,21 @@ class RulesDatabase:
         config = self.get_config(guild_id)
         if config is None:
             raise GuildNotConfiguredError
-        user = self.get_user(guild_id, user_id)
-        if user is None:
-            user = UserOffenses(
+        user = self.offenses_table.increment(
+            guild_id=guild_id,
+            user_id=user_id,
+            current_offenses=count,
+            total_offenses=count,
+            default=UserOffenses(
                 guild_id=guild_id,
                 user_id=user_id,
                 current_offenses=count,
                 total_offenses=count,
                 last_offense=time.time(),
-            )
-        else:
-            user = user._replace(
-                current_offenses=user.current_offenses + count,
-                total_offenses=user.total_offenses + count,
-            )
-        self.update_user(user)
+            ),
+        )
+        # The default is inserted if the user has no offenses yet.
+        assert user is not None
         if user.current_offenses >= config.max_offenses:
             raise MaxOffensesExceededError
         return user.current_offenses
@@ -128,20 +140,21 @@ class RulesDatabase:
         if count < 1:
             msg = 'Count must be greater than zero.'
             raise ValueError(msg)
-        user = self.get_user(guild_id, user_id)
-        if user is not None:
-            user = user._replace(
-                current_offenses=max(0, user.current_offenses - count),
-                total_offenses=max(0, user.total_offenses - count),
-            )
-            self.update_user(user)
+        self.offenses_table.increment(
+            guild_id=guild_id,
+            user_id=user_id,
+            current_offenses=-count,
+            total_offenses=-count,
+            minimum=0,
+        )
 
     def reset_current_offenses(self, guild_id: int, user_id: int) -> None:
         """Reset current offenses for user in guild."""
-        user = self.get_user(guild_id, user_id)
-        if user is not None:
-            user = user._replace(current_offenses=0)
-            self.update_user(user)
+        self.offenses_table.assign(
+            guild_id=guild_id,
+            user_id=user_id,
+            current_offenses=0,
+        )
 
 
 class GuildConfigTable(SQLTableInterface[GuildConfig]):
@@ -158,6 +171,8 @@ class GuildConfigTable(SQLTableInterface[GuildConfig]):
             'guild_configs',
             db_path,
             primary_keys=('guild_id',),
+            # Read on every message, but only one small row per guild.
+            mirror=True,
         )
 
     def _all(self) -> tuple[GuildConfig, ...]:
@@ -187,6 +202,11 @@ class UserOffensesTable(SQLTableInterface[UserOffenses]):
             'user_offenses',
             db_path,
             primary_keys=('guild_id', 'user_id'),
+            without_rowid=True,
+            # Every offending message during an event is a write, so batch
+            # them rather than committing (and fsyncing) once per message.
+            # Losing the last second of offenses in a crash is acceptable.
+            write_behind=WriteBehind(),
         )
 
     def _all(self, guild_id: int) -> tuple[UserOffenses, ...]:
@@ -204,3 +224,13 @@ class UserOffensesTable(SQLTableInterface[UserOffenses]):
     def remove(self, guild_id: int, user_id: int) -> int:
         """Remove a row."""
         raise NotImplementedError
+
+
+@migrations.register(
+    'rules',
+    1,
+    'Store user offenses without rowids',
+    tables=('user_offenses',),
+)
+def _without_rowid(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'user_offenses')
@@ -19,15 +19,16 @@ from threepseat.ext.sounds.data import MemberSound
 from threepseat.ext.sounds.data import MemberSoundTable
 from threepseat.ext.sounds.data import Sound
 from threepseat.ext.sounds.data import SoundsTable
+from threepseat.ext.sounds.data import backfill_opus
 from threepseat.ext.sounds.data import download
-from threepseat.ext.sounds.data import remove_if_exists
+from threepseat.ext.sounds.data import remove_sound_files
 from threepseat.ext.sounds.data import save_upload
 from threepseat.ext.sounds.data import validate_upload_extension
 from threepseat.ext.sounds.data import validate_upload_size
-from threepseat.utils import LoopType
-from threepseat.utils import leave_on_empty
-from threepseat.utils import play_sound
 from threepseat.utils import voice_channel
+from threepseat.voice import DEFAULT_IDLE_SECONDS
+from threepseat.voice import IdleVoiceDisconnector
+from threepseat.voice import VoiceBusyError
 
 logger = logging.getLogger(__name__)
 
@@ -35,16 +36,29 @@ logger = logging.getLogger(__name__)
 class SoundCommands(CommandGroupExtension):
     """App commands for sound board."""
 
-    def __init__(self, db_path: str, data_path: str) -> None:
+    def __init__(
+        self,
+        db_path: str,
+        data_path: str,
+        *,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        mix_voices: int | None = None,
+    ) -> None:
         """Init SoundCommands.
 
         Args:
             db_path (str): path to database to add table to.
             data_path (str): directory where sound files are stored.
+            idle_seconds (float): time in seconds to stay in a voice channel
+                after everyone else leaves.
+            mix_voices (int, optional): mix sounds played at the same time
+                in a channel, up to this many at once (see SoundsTable).
         """
-        self.table = SoundsTable(db_path, data_path)
+        self.table = SoundsTable(db_path, data_path, mix_voices=mix_voices)
         self.join_table = MemberSoundTable(db_path)
-        self._vc_leaver_task: LoopType | None = None
+        self.idle_seconds = idle_seconds
+        self._idle: IdleVoiceDisconnector | None = None
+        self._backfill_task: asyncio.Task[int] | None = None
 
         super().__init__(
             name='sounds',
@@ -53,17 +67,35 @@ class SoundCommands(CommandGroupExtension):
         )
 
     async def post_init(self, bot: discord.ext.commands.Bot) -> None:
-        """Spawn task that leaves channels when they are empty."""
-        self._vc_leaver_task = leave_on_empty(bot, 60)
-        self._vc_leaver_task.start()
+        """Start leaving empty channels and spawn the Opus backfill task."""
+        self._idle = IdleVoiceDisconnector(bot, self.idle_seconds)
+        self._idle.start()
+        self._backfill_task = asyncio.create_task(backfill_opus(self.table))
 
         bot.add_listener(self.on_voice_state_update, 'on_voice_state_update')
+        bot.add_listener(
+            self._idle.on_voice_state_update,
+            'on_voice_state_update',
+        )
 
     async def post_shutdown(self) -> None:
-        """Cancel the voice channel leaver task and close the databases."""
-        if self._vc_leaver_task is not None:
-            self._vc_leaver_task.cancel()
-            self._vc_leaver_task = None
+        """Cancel the background tasks and close the databases."""
+        if self._idle is not None:
+            self._idle.stop()
+            self._idle = None
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            self._backfill_task = None
+        info = self.table.packets.cache_info()
+        logger.info(
+            'sound packet cache hit rate %.0f%% (%s hit(s), %s miss(es)), '
+            'using %s of %s bytes',
+            info.hit_rate * 100,
+            info.hits,
+            info.misses,
+            info.currbytes,
+            info.maxbytes,
+        )
         self.table.close()
         self.join_table.close()
 
@@ -81,14 +113,14 @@ class SoundCommands(CommandGroupExtension):
         ):
             return
 
-        member_sound = self.join_table.get(
+        member_sound = await self.join_table.aget(
             member_id=member.id,
             guild_id=member.guild.id,
         )
         if member_sound is None:
             return
 
-        sound = self.table.get(
+        sound = await self.table.aget(
             name=member_sound.name,
             guild_id=member.guild.id,
         )
@@ -96,9 +128,18 @@ class SoundCommands(CommandGroupExtension):
             return
 
         try:
-            await play_sound(
-                self.table.filepath(sound.filename),
+            # An entrance sound is only useful right as the member joins, so
+            # it is skipped rather than queued behind other sounds.
+            await self.table.play(
+                sound,
                 after.channel,
+                policy='drop',
+            )
+        except VoiceBusyError:
+            logger.debug(
+                'skipped entrance sound of %s in busy guild %s',
+                member.id,
+                member.guild.id,
             )
         except Exception:
             logger.exception(
@@ -260,7 +301,13 @@ class SoundCommands(CommandGroupExtension):
             return
 
         try:
-            await play_sound(self.table.filepath(sound.filename), channel)
+            await self.table.play(
+                sound,
+                channel,
+                policy='enqueue',
+            )
+        except VoiceBusyError as e:
+            await interaction.followup.send(f'{e} Try again later.')
         except Exception:
             await interaction.followup.send(
                 'Failed to play the sound. Sorry.',
@@ -326,7 +373,11 @@ class SoundCommands(CommandGroupExtension):
                 ephemeral=True,
             )
         else:
-            self.table.remove(name, interaction.guild.id)
+            self.table.remove(
+                name,
+                interaction.guild.id,
+                member_sounds=self.join_table,
+            )
             await interaction.response.send_message(
                 f'Removed the *{name}* sound.',
                 ephemeral=True,
@@ -383,11 +434,11 @@ class SoundCommands(CommandGroupExtension):
             await save_upload(content, ext, filepath)
             self.table.add(sound)
         except ValueError as e:
-            remove_if_exists(filepath)
+            remove_sound_files(filepath)
             await interaction.followup.send(f'Error: {e}', ephemeral=True)
         except Exception:
             logger.exception('failed to save uploaded sound')
-            remove_if_exists(filepath)
+            remove_sound_files(filepath)
             await interaction.followup.send(
                 'Error: Could not process the file.',
                 ephemeral=True,
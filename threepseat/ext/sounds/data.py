@@ -5,17 +5,29 @@ import contextlib
 import json
 import logging
 import pathlib
+import sqlite3
+import subprocess
 import tempfile
 import time
 import uuid
+from collections.abc import Generator
 from typing import NamedTuple
 from typing import Self
 
+import discord
 from yt_dlp import YoutubeDL
 
+from threepseat import migrations
+from threepseat.ext.sounds.mixer import SoundMixers
+from threepseat.ext.sounds.packets import DEFAULT_PACKET_CACHE_BYTES
+from threepseat.ext.sounds.packets import OpusPacketCache
 from threepseat.logging import log_timing
 from threepseat.table import SQLTableInterface
+from threepseat.table import transaction
 from threepseat.utils import alphanumeric
+from threepseat.utils import opus_path
+from threepseat.voice import Policy
+from threepseat.voice import play_sound
 
 MAX_SOUND_FILE_SIZE_BYTES = 1 * 1024 * 1024
 MAX_VIDEO_FILE_SIZE_BYTES = 25 * 1024 * 1024
@@ -23,6 +35,7 @@ MAX_SOUND_LENGTH_SECONDS = 30
 MAX_SOUND_NAME_CHARS = 18
 MAX_SOUND_DESCRIPTION_CHARS = 100
 SUPPORTED_VIDEO_EXTENSIONS = frozenset({'.mp4', '.m4v', '.mov'})
+OPUS_BITRATE_KBPS = 96
 
 logger = logging.getLogger(__name__)
 
@@ -99,8 +112,9 @@ async def save_upload(content: bytes, ext: str, filepath: str) -> None:
     """Save an uploaded sound file to filepath as an MP3.
 
     Video uploads have their audio track extracted. In both cases the result
-    must be within the length limit. On failure the caller is responsible for
-    cleaning up filepath (see remove_if_exists()).
+    must be within the length limit. The MP3 is then encoded to Opus (see
+    encode_opus()). On failure the caller is responsible for cleaning up
+    the files (see remove_sound_files()).
 
     Args:
         content (bytes): raw contents of the uploaded file.
@@ -110,8 +124,9 @@ async def save_upload(content: bytes, ext: str, filepath: str) -> None:
 
     Raises:
         ValueError:
-            if the sound is longer than MAX_SOUND_LENGTH_SECONDS or the audio
-            could not be extracted from a video.
+            if the sound is longer than MAX_SOUND_LENGTH_SECONDS, the audio
+            could not be extracted from a video, or the audio could not be
+            encoded to Opus.
     """
     if ext == '.mp3':
         await asyncio.to_thread(pathlib.Path(filepath).write_bytes, content)
@@ -123,6 +138,7 @@ async def save_upload(content: bytes, ext: str, filepath: str) -> None:
             temp_file.flush()
             _check_duration(await mp3_duration_seconds(temp_file.name))
             await extract_audio(temp_file.name, filepath)
+    await encode_opus(filepath)
 
 
 def _check_duration(duration: float) -> None:
@@ -141,6 +157,12 @@ def remove_if_exists(filepath: str) -> None:
         pathlib.Path(filepath).unlink()
 
 
+def remove_sound_files(filepath: str) -> None:
+    """Remove a sound's MP3 and its Opus copy if they exist."""
+    remove_if_exists(filepath)
+    remove_if_exists(opus_path(filepath))
+
+
 class Sound(NamedTuple):
     """Representation of entry in sounds database."""
 
@@ -186,20 +208,40 @@ class Sound(NamedTuple):
 class SoundsTable(SQLTableInterface[Sound]):
     """Sounds table interface."""
 
-    def __init__(self, db_path: str, data_path: str) -> None:
+    def __init__(
+        self,
+        db_path: str,
+        data_path: str,
+        *,
+        packet_cache_bytes: int = DEFAULT_PACKET_CACHE_BYTES,
+        mix_voices: int | None = None,
+    ) -> None:
         """Init SoundsTable.
 
         Args:
             db_path (str): path to sqlite database.
             data_path (str): directory where sound files are stored.
+            packet_cache_bytes (int): maximum memory used to cache the Opus
+                packets of recently played sounds (see audio_source()).
+            mix_voices (int, optional): if set, sounds played in the same
+                channel at the same time are mixed together, up to this many
+                at once (see play()). Requires numpy.
         """
         self.data_path = data_path
+        self.packets = OpusPacketCache(packet_cache_bytes)
+        self.mixers = (
+            SoundMixers(mix_voices) if mix_voices is not None else None
+        )
 
         super().__init__(
             Sound,
             'sounds',
             db_path,
             primary_keys=('name', 'guild_id'),
+            without_rowid=True,
+            # Sounds are listed per guild, which the primary key index cannot
+            # serve because guild_id is not its first column.
+            indexes=(('guild_id',),),
         )
 
     def filepath(self, filename: str) -> str:
@@ -234,6 +276,75 @@ class SoundsTable(SQLTableInterface[Sound]):
         self.update(sound)
         logger.info('added sound to database: %s', sound)
 
+    async def aadd(self, sound: Sound) -> None:
+        """Awaitable add() that runs on the database thread."""
+        await self._run(self.add, sound)
+
+    async def audio_source(self, sound: Sound) -> str | discord.AudioSource:
+        """Get the source to play a sound from with play_sound().
+
+        The packets of the sound's Opus file are cached in memory, so
+        replaying a recent sound needs no file read or ffmpeg process.
+        Sounds without an Opus file are played from their MP3.
+        """
+        filepath = self.filepath(sound.filename)
+        source = await self.packets.asource(opus_path(filepath))
+        return filepath if source is None else source
+
+    async def play(
+        self,
+        sound: Sound,
+        channel: discord.VoiceChannel,
+        *,
+        gain: float = 1.0,
+        policy: Policy = 'interrupt',
+    ) -> None:
+        """Play a sound in a voice channel.
+
+        If mixing is enabled, the sound is mixed with the others playing in
+        the channel. Otherwise, it is played with play_sound(). Sounds played
+        at full gain without mixing stream their Opus copy (see
+        audio_source()), while other gains need the sound decoded to PCM.
+
+        Args:
+            sound (Sound): sound to play.
+            channel (VoiceChannel): voice channel to play the sound in.
+            gain (float): factor to scale the sound's samples by.
+            policy (Policy): what to do if the guild's voice session is busy.
+
+        Raises:
+            ValueError:
+                if the gain is negative.
+            VoiceBusyError:
+                if the sound cannot be played or mixed right now.
+        """
+        if gain < 0:
+            msg = 'Gain must not be negative.'
+            raise ValueError(msg)
+        filepath = self.filepath(sound.filename)
+        if self.mixers is not None:
+            await self.mixers.play(
+                filepath,
+                channel,
+                gain=gain,
+                policy=policy,
+            )
+        elif gain != 1.0:
+            await play_sound(
+                discord.PCMVolumeTransformer(
+                    discord.FFmpegPCMAudio(filepath),
+                    volume=gain,
+                ),
+                channel,
+                policy=policy,
+            )
+        else:
+            await play_sound(
+                await self.audio_source(sound),
+                channel,
+                policy=policy,
+            )
+
     def _all(self, guild_id: int) -> tuple[Sound, ...]:
         """List sounds in database."""
         return super()._all(guild_id=guild_id)
@@ -242,9 +353,23 @@ class SoundsTable(SQLTableInterface[Sound]):
         """Get sound in database."""
         return super()._get(name=name, guild_id=guild_id)
 
-    def remove(self, name: str, guild_id: int) -> int:
+    def remove(
+        self,
+        name: str,
+        guild_id: int,
+        member_sounds: MemberSoundTable | None = None,
+    ) -> int:
         """Remove a sound from the table and delete its file.
 
+        Args:
+            name (str): name of the sound.
+            guild_id (int): guild the sound is in.
+            member_sounds (MemberSoundTable | None): optional table of
+                entrance sounds. Members with the sound as their entrance
+                sound have it cleared in the same transaction as the sound
+                is removed, so no entrance sound is left pointing at a
+                removed sound.
+
         Returns:
             the number of rows removed.
         """
@@ -252,9 +377,20 @@ class SoundsTable(SQLTableInterface[Sound]):
         if sound is None:
             return 0
 
-        removed = super().remove(name=name, guild_id=guild_id)
+        tables = (self,) if member_sounds is None else (self, member_sounds)
+        with transaction(*tables):
+            removed = super().remove(name=name, guild_id=guild_id)
+            if member_sounds is not None:
+                member_sounds.remove_many(
+                    {'member_id': entrance.member_id, 'guild_id': guild_id}
+                    for entrance in member_sounds.all(guild_id)
+                    if entrance.name == name
+                )
+        # The files are only deleted once the removal has committed.
         filepath = self.filepath(sound.filename)
         pathlib.Path(filepath).unlink()
+        remove_if_exists(opus_path(filepath))
+        self.packets.invalidate(opus_path(filepath))
 
         logger.info(
             'removed sound from database: (name=%s, guild_id=%s)',
@@ -287,6 +423,11 @@ class MemberSoundTable(SQLTableInterface[MemberSound]):
             'member_sounds',
             db_path,
             primary_keys=('member_id', 'guild_id'),
+            without_rowid=True,
+            indexes=(('guild_id',),),
+            # Read on every voice state update, but only one small row per
+            # member with a join sound.
+            mirror=True,
         )
 
     def _all(self, guild_id: int) -> tuple[MemberSound, ...]:
@@ -306,9 +447,22 @@ class MemberSoundTable(SQLTableInterface[MemberSound]):
         return super().remove(member_id=member_id, guild_id=guild_id)
 
 
+@migrations.register(
+    'sounds',
+    1,
+    'Store sounds and member sounds without rowids',
+    tables=('sounds', 'member_sounds'),
+)
+def _without_rowid(db: sqlite3.Connection) -> None:
+    migrations.rebuild_without_rowid(db, 'sounds')
+    migrations.rebuild_without_rowid(db, 'member_sounds')
+
+
 def download(link: str, filepath: str) -> None:
     """Download sound from YouTube.
 
+    The downloaded MP3 is also encoded to Opus (see encode_opus()).
+
     Args:
         link (str): youtube link to download.
         filepath (str): filepath for downloaded file.
@@ -318,7 +472,10 @@ def download(link: str, filepath: str) -> None:
             if the clip is longer than MAX_SOUND_LENGTH_SECONDS.
         ValueError:
             if there is an error downloading the clip.
+        ValueError:
+            if the clip could not be encoded to Opus.
     """
+    mp3_path = filepath
     filepath = str(pathlib.Path(filepath).with_suffix('.%(ext)s'))
     ydl_opts = {
         'outtmpl': filepath,
@@ -367,6 +524,14 @@ def download(link: str, filepath: str) -> None:
             msg = 'Error downloading sound.'
             raise ValueError(msg) from e
 
+    # download() already runs in a worker thread, so block on ffmpeg here
+    # rather than in the event loop like encode_opus().
+    with _encoding(mp3_path) as output:
+        cmd = _opus_command(mp3_path, output)
+        with log_timing(logger, 'encoded %s to opus', mp3_path):
+            proc = subprocess.run(cmd, capture_output=True, check=False)  # noqa: S603
+        _check_encoded(proc.returncode, proc.stderr)
+
 
 async def mp3_duration_seconds(filepath: str) -> float:
     """Get the duration of an MP3 file in seconds.
@@ -458,3 +623,142 @@ async def extract_audio(source_path: str, mp3_path: str) -> None:
         )
         msg = 'Could not extract audio from the video.'
         raise ValueError(msg)
+
+
+def _opus_command(mp3_path: str, output: str) -> tuple[str, ...]:
+    """Command that encodes an MP3 to an Ogg/Opus file at output."""
+    # Discord voice is 48 kHz stereo Opus in 20 ms frames, so packets in
+    # this format can be sent without transcoding.
+    return (
+        'ffmpeg',
+        '-y',
+        '-i',
+        mp3_path,
+        '-vn',
+        '-c:a',
+        'libopus',
+        '-b:a',
+        f'{OPUS_BITRATE_KBPS}k',
+        '-ar',
+        '48000',
+        '-ac',
+        '2',
+        '-frame_duration',
+        '20',
+        '-f',
+        'ogg',
+        output,
+    )
+
+
+@contextlib.contextmanager
+def _encoding(mp3_path: str) -> Generator[str, None, None]:
+    """Temporary path to encode the Opus file of a sound to.
+
+    A partial Opus file would be picked up by play_sound(), so ffmpeg writes
+    to a sibling of it that replaces it once the context exits. If the
+    context raises, including when the encode is cancelled, the temporary
+    file is removed instead.
+    """
+    opus = opus_path(mp3_path)
+    output = f'{opus}.{uuid.uuid4().hex}.tmp'
+    try:
+        yield output
+    except BaseException:
+        remove_if_exists(output)
+        raise
+    pathlib.Path(output).replace(opus)
+
+
+def _check_encoded(returncode: int | None, stderr_b: bytes) -> None:
+    """Raise ValueError if encoding failed."""
+    if returncode != 0:
+        logger.error(
+            'encode opus with ffmpeg failed (exit code %s):\nstderr:\n%s',
+            returncode,
+            stderr_b.decode().strip(),
+        )
+        msg = 'Could not encode the sound.'
+        raise ValueError(msg)
+
+
+async def encode_opus(mp3_path: str) -> str:
+    """Encode an MP3 to an Ogg/Opus file next to it.
+
+    play_sound() streams the packets of the Opus file without transcoding,
+    so sounds are encoded once when added instead of on every play.
+
+    Args:
+        mp3_path (str): path to the MP3 of the sound.
+
+    Returns:
+        path of the Opus file (see opus_path()).
+
+    Raises:
+        ValueError:
+            if ffmpeg fails to encode the sound.
+    """
+    with _encoding(mp3_path) as output:
+        cmd = _opus_command(mp3_path, output)
+        with log_timing(logger, 'encoded %s to opus', mp3_path):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                # See mp3_duration_seconds: communicate() avoids a pipe
+                # deadlock.
+                _, stderr_b = await proc.communicate()
+            except asyncio.CancelledError:
+                # Stop ffmpeg so it does not write the file once removed.
+                with contextlib.suppress(ProcessLookupError):
+                    proc.kill()
+                raise
+        _check_encoded(proc.returncode, stderr_b)
+    return opus_path(mp3_path)
+
+
+def _missing_opus(sounds: SoundsTable) -> list[str]:
+    """Filepaths of the sounds in a table without an Opus file."""
+    filepaths = []
+    for sound in sounds.iter_all():
+        filepath = sounds.filepath(sound.filename)
+        if pathlib.Path(opus_path(filepath)).is_file():
+            continue
+        if not pathlib.Path(filepath).is_file():
+            logger.warning('skipping opus backfill of missing %s', filepath)
+            continue
+        filepaths.append(filepath)
+    return filepaths
+
+
+async def backfill_opus(sounds: SoundsTable) -> int:
+    """Encode the Opus files of sounds that do not have one.
+
+    Sounds added before sounds were encoded at ingest are played by
+    transcoding the MP3 until this has encoded them. Sounds are encoded one
+    at a time so a large backfill does not compete with playback for CPU.
+    A sound that fails to encode is logged and skipped. The packets of each
+    encoded sound are evicted from the table's packet cache in case a stale
+    copy was cached.
+
+    Args:
+        sounds (SoundsTable): table of sounds to encode.
+
+    Returns:
+        number of sounds encoded.
+    """
+    filepaths = await asyncio.to_thread(_missing_opus, sounds)
+    encoded = 0
+    for filepath in filepaths:
+        try:
+            await encode_opus(filepath)
+        except ValueError:
+            logger.warning('failed to backfill opus of %s', filepath)
+        else:
+            sounds.packets.invalidate(opus_path(filepath))
+            encoded += 1
+    if encoded > 0:
+        logger.info('encoded %s existing sound(s) to opus', encoded)
+    return encoded
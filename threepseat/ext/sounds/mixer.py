@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import threading
+from typing import NamedTuple
+
+import discord
+from discord.opus import Encoder
+
+from threepseat.voice import Policy
+from threepseat.voice import VoiceBusyError
+from threepseat.voice import submit_sound
+
+_numpy_error: ImportError | None
+try:
+    import numpy as np
+except ImportError as e:  # pragma: no cover
+    _numpy_error = e
+else:
+    _numpy_error = None
+
+DEFAULT_MAX_VOICES = 4
+FRAME_SIZE = Encoder.FRAME_SIZE
+"""Bytes of 20 ms of 48 kHz, 16-bit stereo PCM."""
+
+logger = logging.getLogger(__name__)
+
+
+def _require_numpy() -> None:
+    if _numpy_error is not None:  # pragma: no cover
+        msg = (
+            'Mixing sounds requires numpy. Install it with '
+            "'pip install threepseat[mix]'."
+        )
+        raise ImportError(msg) from _numpy_error
+
+
+class _Voice(NamedTuple):
+    source: discord.AudioSource
+    gain: float
+
+
+class PCMMixer(discord.AudioSource):
+    """Audio source that plays several PCM sources at the same time.
+
+    Each call to read() reads a 20 ms frame from every voice, scales them by
+    their gain, and sums them with saturating addition so loud overlaps clip
+    instead of wrapping around. Voices can be added while the mixer is
+    playing and each is cleaned up as soon as it ends. The mixer ends once
+    its last voice does, after which it cannot be added to.
+
+    The sum is vectorized with numpy into preallocated buffers, so a frame
+    costs a few array operations regardless of its length, and a single
+    voice at full gain is passed through without touching numpy.
+
+    Voices are added from the event loop while read() is called from the
+    voice client's audio player thread, so the mixer is thread safe.
+    """
+
+    def __init__(
+        self,
+        max_voices: int = DEFAULT_MAX_VOICES,
+        name: str = '',
+    ) -> None:
+        """Init PCMMixer.
+
+        Args:
+            max_voices (int): maximum number of sources playing at once.
+            name (str): name of the mixer for logging.
+
+        Raises:
+            ImportError:
+                if numpy is not installed.
+            ValueError:
+                if max_voices is less than one.
+        """
+        # Set first since AudioSource.__del__() calls cleanup() even if
+        # init raises.
+        self._voices: list[_Voice] = []
+        self._closed = False
+        self._lock = threading.Lock()
+        _require_numpy()
+        if max_voices < 1:
+            msg = 'Mixer must allow at least one voice.'
+            raise ValueError(msg)
+        self.max_voices = max_voices
+        self.name = name
+        samples = FRAME_SIZE // 2
+        self._mix = np.zeros(samples, dtype=np.float32)
+        self._scaled = np.zeros(samples, dtype=np.float32)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.name!r})'
+
+    @property
+    def closed(self) -> bool:
+        """If the mixer has ended and no more voices can be added."""
+        return self._closed
+
+    @property
+    def voices(self) -> int:
+        """Number of sources playing."""
+        return len(self._voices)
+
+    def add(self, source: discord.AudioSource, gain: float = 1.0) -> bool:
+        """Start playing a source.
+
+        Args:
+            source (AudioSource): 48 kHz, 16-bit stereo PCM source, such as
+                discord.FFmpegPCMAudio.
+            gain (float): factor to scale the source's samples by.
+
+        Returns:
+            if the source was added, False if the mixer has ended.
+
+        Raises:
+            ValueError:
+                if the source is Opus encoded or the gain is negative.
+            VoiceBusyError:
+                if max_voices sources are already playing.
+        """
+        if source.is_opus():
+            msg = 'Only PCM sources can be mixed.'
+            raise ValueError(msg)
+        if gain < 0:
+            msg = 'Gain must not be negative.'
+            raise ValueError(msg)
+        with self._lock:
+            if self._closed:
+                return False
+            if len(self._voices) >= self.max_voices:
+                msg = 'Too many sounds are playing.'
+                raise VoiceBusyError(msg)
+            self._voices.append(_Voice(source, gain))
+        return True
+
+    def read(self) -> bytes:
+        """Read the next 20 ms frame of the mix or an empty frame when done."""
+        with self._lock:
+            voices = tuple(self._voices)
+        # Sources are read without the lock since reading can block on
+        # ffmpeg and add() should not wait on it.
+        frames = [voice.source.read() for voice in voices]
+
+        playing = [(v, f) for v, f in zip(voices, frames, strict=True) if f]
+        if len(playing) < len(voices):
+            self._remove(
+                [v for v, f in zip(voices, frames, strict=True) if not f]
+            )
+        if not playing:
+            with self._lock:
+                if not self._voices:
+                    self._closed = True
+                    return b''
+            # Voices were added while the last ones ended.
+            return bytes(FRAME_SIZE)
+
+        if len(playing) == 1 and playing[0][0].gain == 1.0:
+            return playing[0][1].ljust(FRAME_SIZE, b'\x00')
+        return self._sum(playing)
+
+    def _remove(self, ended: list[_Voice]) -> None:
+        with self._lock:
+            for voice in ended:
+                # cleanup() may have removed it already.
+                if voice in self._voices:
+                    self._voices.remove(voice)
+        for voice in ended:
+            voice.source.cleanup()
+
+    def _sum(self, playing: list[tuple[_Voice, bytes]]) -> bytes:
+        mix = self._mix
+        mix.fill(0)
+        for voice, frame in playing:
+            # The last frame of a source may be short or an odd length.
+            samples = np.frombuffer(
+                frame, dtype=np.int16, count=len(frame) // 2
+            )
+            size = len(samples)
+            if voice.gain == 1.0:
+                np.add(mix[:size], samples, out=mix[:size])
+            else:
+                np.multiply(
+                    samples,
+                    np.float32(voice.gain),
+                    out=self._scaled[:size],
+                )
+                np.add(mix[:size], self._scaled[:size], out=mix[:size])
+        np.rint(mix, out=mix)
+        np.clip(mix, -32768, 32767, out=mix)
+        return mix.astype(np.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        """The mix is PCM that the voice client encodes."""
+        return False
+
+    def cleanup(self) -> None:
+        """End the mixer and clean up the sources still playing."""
+        with self._lock:
+            self._closed = True
+            voices, self._voices = self._voices, []
+        for voice in voices:
+            voice.source.cleanup()
+
+
+class SoundMixers:
+    """Mixes sounds played in the same voice channel of a guild.
+
+    A sound played while the guild's mixer is playing in the same channel is
+    added to it and heard right away. Otherwise, a new mixer is played with
+    the guild's voice session (see threepseat.voice), so it waits for or
+    interrupts the session's current sound depending on the policy.
+
+    A mixer is cleaned up and forgotten once the session is done with it,
+    including when it is skipped or fails to connect before it plays.
+    """
+
+    def __init__(self, max_voices: int = DEFAULT_MAX_VOICES) -> None:
+        """Init SoundMixers.
+
+        Args:
+            max_voices (int): maximum number of sounds playing at once in
+                each guild.
+
+        Raises:
+            ImportError:
+                if numpy is not installed.
+            ValueError:
+                if max_voices is less than one.
+        """
+        _require_numpy()
+        if max_voices < 1:
+            msg = 'Mixer must allow at least one voice.'
+            raise ValueError(msg)
+        self.max_voices = max_voices
+        self._mixers: dict[int, tuple[PCMMixer, discord.VoiceChannel]] = {}
+
+    def mixer(self, guild_id: int) -> PCMMixer | None:
+        """Get the mixer of a guild if one is playing."""
+        entry = self._mixers.get(guild_id)
+        if entry is None or entry[0].closed:
+            return None
+        return entry[0]
+
+    async def play(
+        self,
+        filepath: str,
+        channel: discord.VoiceChannel,
+        *,
+        gain: float = 1.0,
+        policy: Policy = 'interrupt',
+    ) -> None:
+        """Play a sound in a voice channel, mixing it if others are playing.
+
+        Args:
+            filepath (str): filepath of the sound to play.
+            channel (VoiceChannel): voice channel to play the sound in.
+            gain (float): factor to scale the sound's samples by.
+            policy (Policy): what to do if the guild's session is busy with
+                something other than this channel's mixer.
+
+        Raises:
+            VoiceBusyError:
+                if the mixer is playing max_voices sounds already or the
+                session cannot take a new mixer.
+        """
+        source = discord.FFmpegPCMAudio(filepath)
+        guild_id = channel.guild.id
+        entry = self._mixers.get(guild_id)
+        try:
+            if (
+                entry is not None
+                and entry[1] == channel
+                and entry[0].add(source, gain)
+            ):
+                logger.debug('mixed %s into %r', filepath, entry[0])
+                return
+
+            mixer = PCMMixer(self.max_voices, channel.name)
+            mixer.add(source, gain)
+        except Exception:
+            source.cleanup()
+            raise
+
+        # The session cleans up the mixer if it rejects or skips it.
+        done = submit_sound(mixer, channel, policy=policy)
+        self._mixers[guild_id] = (mixer, channel)
+        done.add_done_callback(functools.partial(self._done, guild_id, mixer))
+
+    def _done(
+        self,
+        guild_id: int,
+        mixer: PCMMixer,
+        done: asyncio.Future[bool],
+    ) -> None:
+        # Close the mixer so no more sounds are added to it.
+        mixer.cleanup()
+        entry = self._mixers.get(guild_id)
+        if entry is not None and entry[0] is mixer:
+            del self._mixers[guild_id]
+        if not done.cancelled() and done.exception() is not None:
+            logger.error('error playing %r', mixer, exc_info=done.exception())
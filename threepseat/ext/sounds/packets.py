@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import pathlib
+import sys
+import threading
+from collections.abc import Sequence
+from typing import NamedTuple
+
+import discord
+from discord.oggparse import OggError
+from discord.oggparse import OggStream
+
+DEFAULT_PACKET_CACHE_BYTES = 32 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+Packets = tuple[bytes, ...]
+
+
+class PacketCacheInfo(NamedTuple):
+    """Counters for an OpusPacketCache."""
+
+    hits: int
+    """Lookups answered from the cache."""
+    misses: int
+    """Lookups that had to read the file."""
+    evictions: int
+    """Entries dropped to stay within maxbytes."""
+    invalidations: int
+    """Entries dropped because their file was removed."""
+    maxbytes: int
+    """Maximum memory used by the entries."""
+    currbytes: int
+    """Current memory used by the entries."""
+    currsize: int
+    """Current number of entries."""
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+def read_packets(filepath: str) -> Packets:
+    """Read the audio packets of an Ogg/Opus file.
+
+    The identification and comment header packets at the start of the
+    stream are skipped, so every packet returned is 20 ms of audio ready to
+    be sent to Discord (see encode_opus()).
+
+    Raises:
+        FileNotFoundError:
+            if the file does not exist.
+        OggError:
+            if the file is not an Ogg/Opus stream.
+    """
+    with pathlib.Path(filepath).open('rb') as f:
+        packets = tuple(OggStream(f).iter_packets())
+    if len(packets) < 2 or not packets[0].startswith(b'OpusHead'):  # noqa: PLR2004
+        msg = f'{filepath} is not an Ogg/Opus file.'
+        raise OggError(msg)
+    return packets[2:]
+
+
+def packets_size(packets: Packets) -> int:
+    """Memory used by a tuple of packets in bytes."""
+    return sys.getsizeof(packets) + sum(sys.getsizeof(p) for p in packets)
+
+
+class OpusPackets(discord.AudioSource):
+    """Audio source that plays Opus packets from memory.
+
+    Unlike discord.FFmpegOpusAudio, no ffmpeg process is started, so the
+    first packet is ready as soon as the source is created.
+    """
+
+    def __init__(self, packets: Sequence[bytes], name: str = '') -> None:
+        """Init OpusPackets.
+
+        Args:
+            packets (Sequence[bytes]): 20 ms Opus packets to play in order.
+            name (str): name of the source for logging.
+        """
+        self.packets = packets
+        self.name = name
+        self._index = 0
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.name!r})'
+
+    def read(self) -> bytes:
+        """Read the next packet or an empty packet when finished."""
+        if self._index >= len(self.packets):
+            return b''
+        packet = self.packets[self._index]
+        self._index += 1
+        return packet
+
+    def is_opus(self) -> bool:
+        """The packets are already Opus encoded."""
+        return True
+
+
+class OpusPacketCache:
+    """Least recently used cache of the packets of Ogg/Opus files.
+
+    Popular sounds, like entrance sounds, are played over and over, so
+    keeping their packets in memory skips reading the file and starting
+    ffmpeg on each play. The cache is bounded by the memory its entries
+    use rather than their number since sounds vary in length. A file larger
+    than the whole cache is read on every play and never cached.
+
+    Entries are keyed by filepath and are not checked against the file, so
+    the owner must call invalidate() when a file is removed or rewritten.
+
+    The cache is safe to use from multiple threads.
+    """
+
+    def __init__(self, maxbytes: int = DEFAULT_PACKET_CACHE_BYTES) -> None:
+        """Init OpusPacketCache.
+
+        Args:
+            maxbytes (int): maximum memory used by the cached packets.
+
+        Raises:
+            ValueError:
+                if maxbytes is negative.
+        """
+        if maxbytes < 0:
+            msg = 'Packet cache size must not be negative.'
+            raise ValueError(msg)
+        self.maxbytes = maxbytes
+        self._entries: collections.OrderedDict[str, tuple[Packets, int]] = (
+            collections.OrderedDict()
+        )
+        self._bytes = 0
+        # Incremented by invalidations so a read that raced with one is not
+        # cached.
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, filepath: str) -> Packets:
+        """Get the packets of an Ogg/Opus file, reading it on a miss.
+
+        Raises:
+            FileNotFoundError:
+                if the file does not exist.
+            OggError:
+                if the file is not an Ogg/Opus stream.
+        """
+        packets, generation = self._lookup(filepath)
+        if packets is None:
+            packets = read_packets(filepath)
+            self._put(filepath, packets, generation)
+        return packets
+
+    async def asource(self, filepath: str) -> OpusPackets | None:
+        """Get an audio source that plays an Ogg/Opus file from memory.
+
+        Hits are returned without leaving the event loop and a miss reads
+        the file in a worker thread.
+
+        Returns:
+            the audio source or None if the file does not exist or could not
+            be read.
+        """
+        packets, generation = self._lookup(filepath)
+        if packets is None:
+            try:
+                packets = await asyncio.to_thread(read_packets, filepath)
+            except FileNotFoundError:
+                return None
+            except OggError:
+                logger.exception('failed to read opus packets of %s', filepath)
+                return None
+            self._put(filepath, packets, generation)
+        return OpusPackets(packets, filepath)
+
+    def invalidate(self, filepath: str) -> bool:
+        """Drop the packets of a file.
+
+        Returns:
+            if the file was cached.
+        """
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.pop(filepath, None)
+            if entry is None:
+                return False
+            self._bytes -= entry[1]
+            self._invalidations += 1
+            return True
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def cache_info(self) -> PacketCacheInfo:
+        """Report cache counters and memory use."""
+        with self._lock:
+            return PacketCacheInfo(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                maxbytes=self.maxbytes,
+                currbytes=self._bytes,
+                currsize=len(self._entries),
+            )
+
+    def _lookup(self, filepath: str) -> tuple[Packets | None, int]:
+        """Get the cached packets of a file and count the hit or miss.
+
+        Returns:
+            the packets, or None on a miss, and the current generation.
+        """
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is None:
+                self._misses += 1
+                return None, self._generation
+            self._entries.move_to_end(filepath)
+            self._hits += 1
+            return entry[0], self._generation
+
+    def _put(self, filepath: str, packets: Packets, generation: int) -> None:
+        """Cache the packets read for a miss and evict to stay in bounds."""
+        size = packets_size(packets)
+        with self._lock:
+            if generation != self._generation or size > self.maxbytes:
+                return
+            old = self._entries.pop(filepath, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[filepath] = (packets, size)
+            self._bytes += size
+            while self._bytes > self.maxbytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._evictions += 1
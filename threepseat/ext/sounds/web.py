@@ -27,12 +27,12 @@ from threepseat.ext.sounds.data import MemberSoundTable
 from threepseat.ext.sounds.data import Sound
 from threepseat.ext.sounds.data import SoundsTable
 from threepseat.ext.sounds.data import download
-from threepseat.ext.sounds.data import remove_if_exists
+from threepseat.ext.sounds.data import remove_sound_files
 from threepseat.ext.sounds.data import save_upload
 from threepseat.ext.sounds.data import validate_upload_extension
 from threepseat.ext.sounds.data import validate_upload_size
-from threepseat.utils import play_sound
 from threepseat.utils import voice_channel
+from threepseat.voice import VoiceBusyError
 
 type Response = str | quart.Response | werkseug_Response
 
@@ -284,7 +284,7 @@ async def guilds() -> Response:
 async def sound_grid(guild_id: int) -> Response:
     """Display grid of available sounds in guild."""
     ctx = context()
-    sound_list = ctx.sounds.all(guild_id)
+    sound_list = await ctx.sounds.aall(guild_id)
     guild = ctx.bot.get_guild(guild_id)
 
     sound_data = [
@@ -318,7 +318,10 @@ async def sound_grid(guild_id: int) -> Response:
     entrance_sound: str | None = None
     try:
         user = await ctx.session.fetch_user()
-        current = ctx.member_sounds.get(member_id=user.id, guild_id=guild_id)
+        current = await ctx.member_sounds.aget(
+            member_id=user.id,
+            guild_id=guild_id,
+        )
         if current is not None:
             entrance_sound = current.name
     except Exception:  # pragma: no cover
@@ -348,7 +351,7 @@ async def sound_play(guild_id: int, sound_name: str) -> Response:
         return error
     assert member is not None
 
-    sound = sounds.get(sound_name, guild_id=guild_id)
+    sound = await sounds.aget(sound_name, guild_id=guild_id)
     if sound is None:
         return quart.Response(
             f'Unable to locate a sound named {sound_name}.',
@@ -359,9 +362,14 @@ async def sound_play(guild_id: int, sound_name: str) -> Response:
     if channel is None:
         return quart.Response('You are not in a voice channel.', 400)
 
-    sound_file = sounds.filepath(sound.filename)
     try:
-        await play_sound(sound_file, channel)
+        await sounds.play(
+            sound,
+            channel,
+            policy='enqueue',
+        )
+    except VoiceBusyError as e:
+        return quart.Response(str(e), 429)
     except Exception as e:
         logger.exception('error playing sound')
         return quart.Response(str(e), 400)
@@ -387,19 +395,22 @@ async def set_entrance(guild_id: int, sound_name: str) -> Response:
         return error
     assert member is not None
 
-    sound = ctx.sounds.get(sound_name, guild_id=guild_id)
+    sound = await ctx.sounds.aget(sound_name, guild_id=guild_id)
     if sound is None:
         return quart.Response(
             f'Unable to locate a sound named {sound_name}.',
             400,
         )
 
-    current = ctx.member_sounds.get(member_id=member.id, guild_id=guild_id)
+    current = await ctx.member_sounds.aget(
+        member_id=member.id,
+        guild_id=guild_id,
+    )
     if current is not None and current.name == sound_name:
-        ctx.member_sounds.remove(member_id=member.id, guild_id=guild_id)
+        await ctx.member_sounds.aremove(member_id=member.id, guild_id=guild_id)
         active = False
     else:
-        ctx.member_sounds.update(
+        await ctx.member_sounds.aupdate(
             MemberSound(
                 member_id=member.id,
                 guild_id=guild_id,
@@ -417,7 +428,7 @@ async def set_entrance(guild_id: int, sound_name: str) -> Response:
 async def sound_file(guild_id: int, sound_name: str) -> Response:
     """Serve a sound's MP3 for in-browser preview."""
     sounds = context().sounds
-    sound = sounds.get(sound_name, guild_id=guild_id)
+    sound = await sounds.aget(sound_name, guild_id=guild_id)
     if sound is None:
         return quart.Response(
             f'Unable to locate a sound named {sound_name}.',
@@ -530,13 +541,13 @@ async def sound_add(guild_id: int) -> Response:
 
         # add() validates the name (alphanumeric, length, uniqueness) and
         # that the file exists on disk.
-        sounds.add(sound)
+        await sounds.aadd(sound)
     except ValueError as e:
-        remove_if_exists(filepath)
+        remove_sound_files(filepath)
         return quart.Response(str(e), 400)
     except Exception:
         logger.exception('error saving uploaded sound')
-        remove_if_exists(filepath)
+        remove_sound_files(filepath)
         return quart.Response('Failed to save the sound.', 400)
 
     return quart.Response('', 200)
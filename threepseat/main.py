@@ -12,7 +12,11 @@ from hypercorn.asyncio import serve
 from hypercorn.config import Config as HypercornConfig
 
 import threepseat
+from threepseat import backup
 from threepseat import config
+from threepseat import connections
+from threepseat import migrations
+from threepseat import voice
 from threepseat.bot import Bot
 from threepseat.ext.birthdays import BirthdayCommands
 from threepseat.ext.custom import CustomCommands
@@ -76,16 +80,44 @@ def quiet_ssl_shutdown_errors(loop: asyncio.AbstractEventLoop) -> None:
     loop.set_exception_handler(handler)
 
 
+def configure_database(cfg: config.Config) -> None:
+    """Configure the connections to the database file.
+
+    Must happen before anything opens the connections to the file, such as
+    the migrations or the extensions creating their tables.
+    """
+    connections.configure(
+        cfg.sqlite_database,
+        connections.PoolSettings(
+            cache_size_kib=cfg.sqlite_cache_kib,
+            mmap_size_mib=cfg.sqlite_mmap_mib,
+            synchronous=cfg.sqlite_synchronous,
+            coherence_interval_ms=cfg.sqlite_coherence_ms,
+            slow_query_ms=cfg.sqlite_slow_query_ms,
+        ),
+    )
+
+
 async def amain(cfg: config.Config, shutdown_event: asyncio.Event) -> None:
     """Run asyncio services."""
     quiet_ssl_shutdown_errors(asyncio.get_running_loop())
 
+    configure_database(cfg)
+    voice.configure(queue_size=cfg.voice_queue_size)
+    # The extensions' data modules are imported by now, so every migration
+    # is registered. Tables must be migrated before they are opened.
+    migrations.migrate(cfg.sqlite_database)
     birthday_commands = BirthdayCommands(cfg.sqlite_database)
     custom_commands = CustomCommands(cfg.sqlite_database)
     games_commands = GamesCommands(cfg.sqlite_database)
     reminder_commands = ReminderCommands(cfg.sqlite_database)
     rules_commands = RulesCommands(cfg.sqlite_database)
-    sound_commands = SoundCommands(cfg.sqlite_database, cfg.sounds_path)
+    sound_commands = SoundCommands(
+        cfg.sqlite_database,
+        cfg.sounds_path,
+        idle_seconds=cfg.voice_idle_seconds,
+        mix_voices=cfg.sounds_mix_voices,
+    )
     sounds = sound_commands.table
     member_sounds = sound_commands.join_table
 
@@ -117,6 +149,21 @@ async def amain(cfg: config.Config, shutdown_event: asyncio.Event) -> None:
         # asyncio.Event.wait() resolves to True, hence this wrapper.
         await shutdown_event.wait()
 
+    snapshots = (
+        None
+        if cfg.backup_path is None
+        else backup.snapshot_loop(
+            cfg.sqlite_database,
+            cfg.backup_path,
+            hours=cfg.backup_interval_hours,
+            keep=cfg.backup_keep,
+            compress=cfg.backup_compress,
+            vacuum=cfg.backup_vacuum,
+        )
+    )
+    if snapshots is not None:
+        snapshots.start()
+
     services = ('bot', 'webapp')
     async with bot:
         results = await asyncio.gather(
@@ -129,6 +176,9 @@ async def amain(cfg: config.Config, shutdown_event: asyncio.Event) -> None:
             return_exceptions=True,
         )
 
+    if snapshots is not None:
+        snapshots.cancel()
+
     # gather(return_exceptions=True) prevents one service crashing from tearing
     # down the other, but it also swallows the exceptions. Surface any real
     # failures (a CancelledError is the expected result of a clean shutdown) so
@@ -145,6 +195,35 @@ async def amain(cfg: config.Config, shutdown_event: asyncio.Event) -> None:
         raise first_error
 
 
+def migrate(config_path: str, *, dry_run: bool) -> int:
+    """Migrate the database in a config without starting the bot."""
+    cfg = config.load(config_path)
+    configure_database(cfg)
+    steps = migrations.migrate(cfg.sqlite_database, dry_run=dry_run)
+    logger.info(
+        '%s %s migration(s)',
+        'found' if dry_run else 'applied',
+        len(steps),
+    )
+    return 0
+
+
+def snapshot(config_path: str) -> int:
+    """Snapshot the database in a config to its backup_path."""
+    cfg = config.load(config_path)
+    if cfg.backup_path is None:
+        logger.error('backup_path is not set in %s', config_path)
+        return 1
+    backup.snapshot(
+        cfg.sqlite_database,
+        cfg.backup_path,
+        keep=cfg.backup_keep,
+        compress=cfg.backup_compress,
+        vacuum=cfg.backup_vacuum,
+    )
+    return 0
+
+
 def main(argv: Sequence[str] | None = None) -> int:
     """Main entrypoint for launching 3pseatBot."""
     argv = argv if argv is not None else sys.argv[1:]
@@ -174,6 +253,21 @@ def main(argv: Sequence[str] | None = None) -> int:
         metavar='PATH',
         help='create template config file',
     )
+    mutex_group.add_argument(
+        '--migrate',
+        metavar='PATH',
+        help='migrate the database in this config and exit',
+    )
+    mutex_group.add_argument(
+        '--backup',
+        metavar='PATH',
+        help='snapshot the database in this config to its backup_path',
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='with --migrate, only log the pending migrations',
+    )
     parser.add_argument(
         '--log-dir',
         metavar='PATH',
@@ -192,12 +286,20 @@ def main(argv: Sequence[str] | None = None) -> int:
 
     args = parser.parse_args(argv)
 
+    if args.dry_run and args.migrate is None:
+        parser.error('--dry-run requires --migrate')
+
     if args.template is not None:
         config.write_template(args.template)
         return 0
 
     configure_logging(logdir=args.log_dir, level=args.log_level)
 
+    if args.migrate is not None:
+        return migrate(args.migrate, dry_run=args.dry_run)
+    if args.backup is not None:
+        return snapshot(args.backup)
+
     cfg = config.load(args.config)
     logger.info(cfg)
 
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from threepseat import connections
+
+SCHEMA_TABLE = 'schema_version'
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    """One ordered change to the schema of a component's tables."""
+
+    component: str
+    """Name of the component (e.g., the extension) that owns the tables."""
+    version: int
+    """Schema version of the component after the migration is applied."""
+    description: str
+    """Short description of the change for logs and dry-runs."""
+    apply: Callable[[sqlite3.Connection], None]
+    """Applies the change using the connection. Tables may not exist yet."""
+    tables: tuple[str, ...] = ()
+    """Tables the migration rewrites, used to estimate its work."""
+
+
+class Step(NamedTuple):
+    """A pending migration and an estimate of its work."""
+
+    migration: Migration
+    rows: int
+    """Number of rows in the tables the migration rewrites."""
+
+
+_registry: dict[tuple[str, int], Migration] = {}
+
+
+def register(
+    component: str,
+    version: int,
+    description: str,
+    *,
+    tables: tuple[str, ...] = (),
+) -> Callable[
+    [Callable[[sqlite3.Connection], None]],
+    Callable[[sqlite3.Connection], None],
+]:
+    """Decorator which registers a function as a migration.
+
+    Each component numbers its migrations from 1 and they are applied in
+    version order. Data modules register the migrations for their tables
+    when imported.
+
+    Example:
+        ```python
+        @migrations.register('sounds', 1, 'Add a duration column')
+        def _add_duration(db: sqlite3.Connection) -> None:
+            ...
+        ```
+
+    Raises:
+        ValueError:
+            if the version is less than 1 or is already registered for the
+            component.
+    """
+
+    def _decorator(
+        func: Callable[[sqlite3.Connection], None],
+    ) -> Callable[[sqlite3.Connection], None]:
+        if version < 1:
+            msg = f'Migration versions start at 1, got {version}.'
+            raise ValueError(msg)
+        if (component, version) in _registry:
+            msg = f'Migration {version} of {component} is already registered.'
+            raise ValueError(msg)
+        _registry[(component, version)] = Migration(
+            component,
+            version,
+            description,
+            func,
+            tables,
+        )
+        return func
+
+    return _decorator
+
+
+def registered() -> tuple[Migration, ...]:
+    """Registered migrations ordered by component and version."""
+    return tuple(_registry[key] for key in sorted(_registry))
+
+
+def table_exists(db: sqlite3.Connection, name: str) -> bool:
+    """Check if a table exists in the database."""
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (name,),
+    ).fetchone()
+    return row is not None
+
+
+def rebuild_without_rowid(db: sqlite3.Connection, name: str) -> bool:
+    """Rebuild a table as a WITHOUT ROWID table.
+
+    The rows are copied into a new table with the same definition plus the
+    WITHOUT ROWID option, which then replaces the old one. Indexes on the
+    old table are dropped with it and are recreated when the table is next
+    opened by SQLTableInterface.
+
+    Tables that do not exist, are already WITHOUT ROWID, or have no primary
+    key are skipped. Legacy tables without a primary key are rebuilt with
+    one when opened instead (see SQLTableInterface).
+
+    Returns:
+        if the table was rebuilt.
+    """
+    row = db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (name,),
+    ).fetchone()
+    if row is None:
+        return False
+    sql: str = row[0]
+    info = db.execute(f'PRAGMA table_info({name})').fetchall()
+    # Column 5 of table_info is non-zero for primary key columns.
+    if sql.upper().endswith('WITHOUT ROWID') or not any(c[5] for c in info):
+        return False
+
+    columns = ', '.join(column[1] for column in info)
+    old = f'{name}_old'
+    db.execute(f'ALTER TABLE {name} RENAME TO {old}')
+    # The original statement still names the table as name.
+    db.execute(f'{sql} WITHOUT ROWID')
+    db.execute(
+        f'INSERT INTO {name} ({columns}) '  # noqa: S608
+        f'SELECT {columns} FROM {old}',
+    )
+    db.execute(f'DROP TABLE {old}')
+    return True
+
+
+def versions(db: sqlite3.Connection) -> dict[str, int]:
+    """Current schema version of each migrated component."""
+    if not table_exists(db, SCHEMA_TABLE):
+        return {}
+    return dict(
+        db.execute(f'SELECT component, version FROM {SCHEMA_TABLE}'),  # noqa: S608
+    )
+
+
+def plan(
+    db: sqlite3.Connection,
+    migrations: Iterable[Migration] | None = None,
+) -> tuple[Step, ...]:
+    """Pending migrations in the order they will be applied.
+
+    Args:
+        db (Connection): connection to the database.
+        migrations (Iterable[Migration]): migrations to consider. Defaults
+            to the registered migrations.
+
+    Returns:
+        tuple of the migrations newer than their component's version, in
+        version order, with the number of rows each would rewrite.
+    """
+    migrations = registered() if migrations is None else migrations
+    current = versions(db)
+    steps = []
+    for migration in sorted(migrations, key=lambda m: m[:2]):
+        if migration.version <= current.get(migration.component, 0):
+            continue
+        rows = sum(
+            db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]  # noqa: S608
+            for table in migration.tables
+            if table_exists(db, table)
+        )
+        steps.append(Step(migration, rows))
+    return tuple(steps)
+
+
+def migrate(
+    filepath: str,
+    *,
+    dry_run: bool = False,
+    migrations: Iterable[Migration] | None = None,
+) -> tuple[Step, ...]:
+    """Apply the pending migrations to a database file.
+
+    Each migration runs in its own transaction along with the update to its
+    component's version, so a failure rolls back that migration and leaves
+    the database at the last migration that succeeded.
+
+    Migrations run before the tables are opened at startup, so on a new
+    database the tables do not exist yet. Migrations skip missing tables,
+    which SQLTableInterface then creates with the latest schema, and the
+    versions are still recorded.
+
+    Args:
+        filepath (str): filepath to the sqlite3 database.
+        dry_run (bool): only log the pending migrations and their estimated
+            work without applying them.
+        migrations (Iterable[Migration]): migrations to apply. Defaults to
+            the registered migrations.
+
+    Returns:
+        tuple of the pending, or applied if not `dry_run`, migrations.
+    """
+    pool = connections.acquire(filepath)
+    try:
+        with pool.writer() as db:
+            steps = plan(db, migrations)
+        for migration, rows in steps:
+            if dry_run:
+                logger.info(
+                    'would migrate %s to version %s (%s), rewriting %s row(s)',
+                    migration.component,
+                    migration.version,
+                    migration.description,
+                    rows,
+                )
+                continue
+            start = time.perf_counter()
+            with pool.writer() as db:
+                # DDL does not implicitly open a transaction in sqlite3.
+                db.execute('BEGIN')
+                db.execute(
+                    f'CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} '
+                    '(component TEXT PRIMARY KEY, version INTEGER, '
+                    'applied_at REAL)',
+                )
+                migration.apply(db)
+                db.execute(
+                    f'INSERT OR REPLACE INTO {SCHEMA_TABLE} '  # noqa: S608
+                    'VALUES (?, ?, ?)',
+                    (migration.component, migration.version, time.time()),
+                )
+            logger.info(
+                'migrated %s to version %s (%s) in %.2fs',
+                migration.component,
+                migration.version,
+                migration.description,
+                time.perf_counter() - start,
+            )
+    finally:
+        connections.release(pool)
+    return steps
@@ -1,19 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import bisect
 import contextlib
 import functools
+import inspect
+import logging
 import sqlite3
+import threading
+import time
 import typing
+from collections import OrderedDict
+from collections.abc import Awaitable
+from collections.abc import Callable
 from collections.abc import Generator
 from collections.abc import Iterable
+from collections.abc import Iterator
 from collections.abc import Sequence
+from concurrent.futures import Future
 from pathlib import Path
 from types import UnionType
 from typing import Any
 from typing import Generic
 from typing import NamedTuple
+from typing import ParamSpec
+from typing import Protocol
 from typing import TypeVar
+from typing import cast
 
+from threepseat import connections
+from threepseat.connections import ConnectionPool
 from threepseat.typing import base_type
 from threepseat.typing import is_optional
 
@@ -33,8 +49,20 @@ BUILTIN_TO_SQLITE = {
 }
 
 RowType = TypeVar('RowType', bound=NamedTuple)
+T = TypeVar('T')
+P = ParamSpec('P')
 
 CACHE_MAXSIZE = 1024
+# Filepath that selects the dict engine, see SQLTableInterface.
+DICT_DATABASE = ':dict:'
+# SQLite's default limit on parameters per statement before 3.32.0. Bulk
+# queries are split into statements that stay under it.
+MAX_VARIABLES = 999
+# Upper bounds of the operation latency histogram buckets, see
+# OperationStats.histogram.
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+logger = logging.getLogger(__name__)
 
 
 class Field(NamedTuple):
@@ -45,6 +73,1744 @@ class Field(NamedTuple):
     sql_type: str
 
 
+class CacheInfo(NamedTuple):
+    """Counters for a TableCache."""
+
+    hits: int
+    """Calls answered from the cache."""
+    misses: int
+    """Calls that had to query the table."""
+    evictions: int
+    """Entries dropped to stay within maxsize."""
+    invalidations: int
+    """Entries dropped because a write could have changed them."""
+    maxsize: int
+    """Maximum number of entries."""
+    currsize: int
+    """Current number of entries."""
+    coalesced: int
+    """Misses that waited for an identical miss already in flight."""
+
+
+CacheKey = tuple[tuple[str, Any], ...]
+# A cache key and if the miss for it is async.
+FlightKey = tuple[CacheKey, bool]
+
+
+class OperationStats(NamedTuple):
+    """Counters for one kind of operation on a table."""
+
+    calls: int
+    """Number of calls, including failed calls."""
+    errors: int
+    """Calls that raised an exception."""
+    rows: int
+    """Rows returned by reads or the count returned by removes."""
+    total_ms: float
+    """Total time spent in the operation."""
+    max_ms: float
+    """Time of the slowest call."""
+    histogram: tuple[int, ...]
+    """Calls per latency bucket. Bucket i counts calls that took at most
+    LATENCY_BUCKETS_MS[i] (and more than the previous bound) and the last
+    bucket counts calls slower than every bound."""
+
+    @property
+    def mean_ms(self) -> float:
+        """Mean time per call."""
+        return self.total_ms / self.calls if self.calls > 0 else 0.0
+
+
+class TableStats(NamedTuple):
+    """Counters for a table, see SQLTableInterface.stats()."""
+
+    name: str
+    """Name of the table."""
+    operations: dict[str, OperationStats]
+    """Counters for each operation keyed by the operation's method name.
+    Cached reads that hit are not operations, see the caches instead."""
+    all: CacheInfo
+    """Counters for the all() cache."""
+    get: CacheInfo
+    """Counters for the get() cache."""
+
+
+class _Counters:
+    """Mutable counters behind an OperationStats."""
+
+    __slots__ = ('calls', 'errors', 'histogram', 'max_ms', 'rows', 'total_ms')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+class ChangeEvent(NamedTuple, Generic[RowType]):  # noqa: UP046
+    """A change to a row of a table, see SQLTableInterface.subscribe()."""
+
+    kind: str
+    """One of 'insert', 'update', 'delete', or 'reset'.
+
+    A 'reset' has no rows and means any row may have changed (e.g., another
+    process wrote to the file), so derived state should be rebuilt.
+    """
+    old: RowType | None
+    """Row before the change or None if it was inserted."""
+    new: RowType | None
+    """Row after the change or None if it was deleted."""
+
+
+class WriteBehind(NamedTuple):
+    """Settings for buffering a table's writes in memory.
+
+    Buffered writes are flushed in a single transaction after interval_ms
+    or once max_rows rows are buffered, whichever comes first.
+    """
+
+    interval_ms: int = 1000
+    """Maximum time a write is buffered before it is flushed."""
+    max_rows: int = 100
+    """Maximum number of buffered rows before they are flushed."""
+
+
+class TableCache(Generic[T]):  # noqa: UP046
+    """Bounded LRU cache for a table read method.
+
+    Unlike functools.lru_cache, entries are keyed by the field filters the
+    call resolves to, so a write can evict only the entries it could have
+    changed (see invalidate_row()) rather than clearing the whole cache.
+    Entries are also indexed by their filter values and by the primary keys
+    of the rows they contain, so finding those entries takes a few lookups
+    rather than a scan of every cached row.
+
+    Concurrent misses for the same entry are coalesced: the first computes
+    the value and the rest wait for and share its result (or exception)
+    rather than each running the same query. Sync calls, from any thread,
+    share sync misses and coroutines share async misses, but the two never
+    wait on each other. An async miss is settled by a callback on the event
+    loop, so a sync call on the loop that waited for it would block the
+    loop forever. A miss that starts after an invalidation does not join a
+    miss that started before it because that result may be stale.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        func: Callable[..., T],
+        rows: Callable[[T], Iterable[NamedTuple]],
+        maxsize: int = CACHE_MAXSIZE,
+        *,
+        check: Callable[[], object] | None = None,
+        primary_keys: Sequence[str] = (),
+        check_interval: float = 0,
+    ) -> None:
+        """Init TableCache.
+
+        Args:
+            func (Callable): read method to cache (e.g.,
+                SQLTableInterface._get). Its arguments are resolved against
+                its signature, so positional and keyword calls for the same
+                filters share an entry.
+            rows (Callable): returns the rows contained in a cached value.
+            maxsize (int): maximum number of entries to keep.
+            check (Callable | None): optional function called before
+                lookups that may invalidate entries (e.g., if the underlying
+                data was changed by another process).
+            primary_keys (Sequence[str]): primary keys of the rows, used to
+                find the entries containing a written row. Without them,
+                invalidate_row() checks the rows of every entry.
+            check_interval (float): minimum time in seconds between calls to
+                check, so most hits do not pay for it.
+        """
+        self._func = func
+        self._check = check
+        self._check_interval = check_interval
+        self._next_check = 0.0
+        self._rows = rows
+        self._maxsize = maxsize
+        self._signature = inspect.signature(func)
+        # Names that positional arguments bind to, so a hit can build its
+        # key without binding the call to the signature, see _hit_key().
+        self._positional = tuple(
+            name
+            for name, parameter in self._signature.parameters.items()
+            if parameter.kind
+            in (
+                inspect.Parameter.POSITIONAL_ONLY,
+                inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            )
+        )
+        self._var_positional = any(
+            parameter.kind is inspect.Parameter.VAR_POSITIONAL
+            for parameter in self._signature.parameters.values()
+        )
+        self._entries: OrderedDict[CacheKey, T] = OrderedDict()
+        self._primary_keys = tuple(primary_keys)
+        # Entries keyed by their filter names and then filter values, except
+        # entries with a None filter, which match any value, see _index().
+        self._filters: dict[
+            tuple[str, ...],
+            dict[tuple[Any, ...], CacheKey],
+        ] = {}
+        self._unfiltered: set[CacheKey] = set()
+        # Entries keyed by the primary key values of each row they contain.
+        self._containing: dict[tuple[Any, ...], set[CacheKey]] = {}
+        # Misses being computed, keyed like the entries plus if the miss is
+        # async, with the generation they started in.
+        self._flights: dict[FlightKey, tuple[Future[T], int]] = {}
+        # Reads may come from several threads, and a write may invalidate
+        # entries while a miss is still querying the table.
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._coalesced = 0
+
+    def __call__(self, *args: Any, **kwargs: Any) -> T:  # noqa: ANN401
+        """Return the cached result for the call or compute it."""
+        if self._check is not None and time.monotonic() >= self._next_check:
+            self._run_check()
+        hit = (
+            self._hit_key(args, kwargs)
+            if args
+            else tuple(sorted(kwargs.items()))
+        )
+        with self._lock:
+            if hit is not None and hit in self._entries:
+                self._entries.move_to_end(hit)
+                self._hits += 1
+                return self._entries[hit]
+        # Calls that could not be resolved without binding them are bound,
+        # which also rejects invalid calls.
+        key = hit if hit is not None else self.key(*args, **kwargs)
+        with self._lock:
+            future, generation = self._join((key, False))
+
+        if generation is None:
+            return future.result()
+        try:
+            value = self._func(*args, **kwargs)
+        except BaseException as e:
+            self._settle((key, False), future, generation, error=e)
+            raise
+        self._settle((key, False), future, generation, value)
+        return value
+
+    async def acall(
+        self,
+        run: Callable[..., Awaitable[T]],
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """Awaitable call that computes a miss with run.
+
+        Hits are returned without leaving the event loop. A miss is
+        computed by awaiting `run(func, *args, **kwargs)` (e.g.,
+        ConnectionPool.run()) unless an identical miss is already in
+        flight. Cancelling the caller does not cancel the computation, so
+        other callers waiting on it still get the result.
+        """
+        if self._check is not None and time.monotonic() >= self._next_check:
+            self._run_check()
+        hit = (
+            self._hit_key(args, kwargs)
+            if args
+            else tuple(sorted(kwargs.items()))
+        )
+        with self._lock:
+            if hit is not None and hit in self._entries:
+                self._entries.move_to_end(hit)
+                self._hits += 1
+                return self._entries[hit]
+        # Calls that could not be resolved without binding them are bound,
+        # which also rejects invalid calls.
+        key = hit if hit is not None else self.key(*args, **kwargs)
+        with self._lock:
+            future, generation = self._join((key, True))
+
+        if generation is not None:
+            task = asyncio.ensure_future(run(self._func, *args, **kwargs))
+            task.add_done_callback(
+                functools.partial(
+                    self._settle_task,
+                    (key, True),
+                    future,
+                    generation,
+                ),
+            )
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _join(self, flight: FlightKey) -> tuple[Future[T], int | None]:
+        """Join the miss in flight for a key and kind of call or start one.
+
+        Must be called with the lock held.
+
+        Returns:
+            the future of the miss and, if the caller started the miss and
+            so must compute it, the generation it started in.
+        """
+        current = self._flights.get(flight)
+        if current is not None and current[1] == self._generation:
+            self._coalesced += 1
+            return current[0], None
+        self._misses += 1
+        future: Future[T] = Future()
+        self._flights[flight] = (future, self._generation)
+        return future, self._generation
+
+    def _settle(
+        self,
+        flight: FlightKey,
+        future: Future[T],
+        generation: int,
+        value: T | None = None,
+        *,
+        error: BaseException | None = None,
+    ) -> None:
+        """Store the result of a miss and pass it to the waiting callers."""
+        key = flight[0]
+        with self._lock:
+            if self._flights.get(flight, (None,))[0] is future:
+                del self._flights[flight]
+            # A write that landed while we were querying may have made the
+            # value stale, so only keep it if nothing has been invalidated.
+            if error is None and generation == self._generation:
+                if key in self._entries:
+                    self._unindex(key, self._entries[key])
+                self._entries[key] = cast('T', value)
+                self._index(key, cast('T', value))
+                if len(self._entries) > self._maxsize:
+                    self._unindex(*self._entries.popitem(last=False))
+                    self._evictions += 1
+        if error is None:
+            future.set_result(cast('T', value))
+        else:
+            future.set_exception(error)
+
+    def _settle_task(
+        self,
+        flight: FlightKey,
+        future: Future[T],
+        generation: int,
+        task: asyncio.Future[T],
+    ) -> None:
+        if task.cancelled():
+            self._settle(
+                flight, future, generation, error=asyncio.CancelledError()
+            )
+        elif task.exception() is not None:
+            self._settle(flight, future, generation, error=task.exception())
+        else:
+            self._settle(flight, future, generation, task.result())
+
+    def lookup(self, *args: Any, **kwargs: Any) -> T:  # noqa: ANN401
+        """Return the cached result for the call without computing it.
+
+        A hit is counted, but a miss is not because the caller is expected to
+        follow it with a normal call, which counts the miss.
+
+        Raises:
+            KeyError:
+                if the result of the call is not cached.
+        """
+        key = self.key(*args, **kwargs)
+        if self._check is not None and time.monotonic() >= self._next_check:
+            self._run_check()
+        with self._lock:
+            value = self._entries[key]
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def _run_check(self) -> None:
+        self._next_check = time.monotonic() + self._check_interval
+        cast('Callable[[], object]', self._check)()
+
+    def _hit_key(
+        self,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> CacheKey | None:
+        """Key of a call if it is valid, without binding it to the signature.
+
+        Binding is most of the cost of a hit, so calls are resolved with
+        the names of the positional parameters instead. Any call this
+        cannot resolve returns None and is bound with key(), which rejects
+        it if it is invalid. Other invalid calls, e.g., with an unknown
+        keyword, are rejected by the read method itself, so they are never
+        cached and never match an entry.
+        """
+        if len(args) > len(self._positional) and not self._var_positional:
+            return None
+        arguments = dict(zip(self._positional, args, strict=False))
+        if not kwargs.keys().isdisjoint(arguments):
+            return None
+        arguments.update(kwargs)
+        return tuple(sorted(arguments.items()))
+
+    def key(self, *args: Any, **kwargs: Any) -> CacheKey:  # noqa: ANN401
+        """Resolve call arguments to a sorted tuple of (name, value) pairs."""
+        bound = self._signature.bind(*args, **kwargs)
+        arguments: dict[str, Any] = {}
+        for name, value in bound.arguments.items():
+            kind = self._signature.parameters[name].kind
+            if kind is inspect.Parameter.VAR_KEYWORD:
+                arguments.update(value)
+            elif kind is not inspect.Parameter.VAR_POSITIONAL:
+                arguments[name] = value
+        return tuple(sorted(arguments.items()))
+
+    def _index(self, key: CacheKey, value: T) -> None:
+        """Add an entry to the indexes.
+
+        Must be called with the lock held.
+        """
+        if any(value is None for _, value in key):
+            self._unfiltered.add(key)
+        else:
+            names = tuple(name for name, _ in key)
+            values = tuple(value for _, value in key)
+            self._filters.setdefault(names, {})[values] = key
+        for row_key in self._row_keys(value):
+            self._containing.setdefault(row_key, set()).add(key)
+
+    def _unindex(self, key: CacheKey, value: T) -> None:
+        """Remove an entry from the indexes.
+
+        Must be called with the lock held.
+        """
+        if key in self._unfiltered:
+            self._unfiltered.discard(key)
+        else:
+            names = tuple(name for name, _ in key)
+            entries = self._filters[names]
+            del entries[tuple(value for _, value in key)]
+            if not entries:
+                del self._filters[names]
+        for row_key in self._row_keys(value):
+            containing = self._containing[row_key]
+            containing.discard(key)
+            if not containing:
+                del self._containing[row_key]
+
+    def _row_keys(self, value: T) -> set[tuple[Any, ...]]:
+        if not self._primary_keys:
+            return set()
+        return {
+            tuple(getattr(row, name) for name in self._primary_keys)
+            for row in self._rows(value)
+        }
+
+    def _evict(self, stale: Iterable[CacheKey]) -> int:
+        """Evict entries and count them as invalidations.
+
+        Must be called with the lock held.
+        """
+        count = 0
+        for key in stale:
+            self._unindex(key, self._entries.pop(key))
+            count += 1
+        self._invalidations += count
+        return count
+
+    def invalidate(
+        self,
+        predicate: Callable[[CacheKey, Iterable[NamedTuple]], bool],
+    ) -> int:
+        """Evict entries for which predicate(key, rows) is true.
+
+        This checks every entry, so prefer invalidate_row() after a write
+        to one row.
+
+        Returns:
+            the number of entries evicted.
+        """
+        with self._lock:
+            self._generation += 1
+            return self._evict(
+                [
+                    key
+                    for key, value in self._entries.items()
+                    if predicate(key, self._rows(value))
+                ],
+            )
+
+    def invalidate_row(
+        self,
+        key: dict[str, Any],
+        row: NamedTuple | None = None,
+    ) -> int:
+        """Evict entries that a write to one row could have changed.
+
+        An entry is affected if it contains the row's old version (found by
+        the row's primary key values in key) or if its filters match the
+        row's new version (see row_matches()), in which case the row would
+        now be part of the result.
+
+        Args:
+            key (dict[str, Any]): primary key values of the written row.
+            row (NamedTuple | None): new version of the row or None if the
+                row was removed.
+
+        Returns:
+            the number of entries evicted.
+        """
+        with self._lock:
+            self._generation += 1
+            stale: set[CacheKey] = set()
+            if row is not None:
+                for names, entries in self._filters.items():
+                    if all(name in row._fields for name in names):
+                        values = tuple(getattr(row, name) for name in names)
+                        if values in entries:
+                            stale.add(entries[values])
+                    else:
+                        # Filters that are not fields match any row.
+                        stale.update(
+                            filters
+                            for filters in entries.values()
+                            if row_matches(row, filters)
+                        )
+                stale.update(
+                    filters
+                    for filters in self._unfiltered
+                    if row_matches(row, filters)
+                )
+
+            if self._primary_keys and all(
+                key.get(name) is not None for name in self._primary_keys
+            ):
+                row_key = tuple(key[name] for name in self._primary_keys)
+                stale.update(self._containing.get(row_key, ()))
+            else:
+                key_items = tuple(key.items())
+                stale.update(
+                    filters
+                    for filters, value in self._entries.items()
+                    if any(
+                        row_matches(cached, key_items)
+                        for cached in self._rows(value)
+                    )
+                )
+            return self._evict(stale)
+
+    def cache_clear(self) -> None:
+        """Clear the cache and its counters."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._filters.clear()
+            self._unfiltered.clear()
+            self._containing.clear()
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+            self._invalidations = 0
+            self._coalesced = 0
+
+    def cache_info(self) -> CacheInfo:
+        """Report cache counters."""
+        with self._lock:
+            return CacheInfo(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                maxsize=self._maxsize,
+                currsize=len(self._entries),
+                coalesced=self._coalesced,
+            )
+
+
+class _Mirror(Generic[RowType]):  # noqa: UP046
+    """In-memory copy of a table's rows.
+
+    Rows are keyed by their primary key values and also grouped by the
+    value of each indexed field, so filtering on a primary key or an indexed
+    field does not scan every row.
+    """
+
+    def __init__(
+        self,
+        primary_keys: tuple[str, ...],
+        indexes: tuple[tuple[str, ...], ...],
+    ) -> None:
+        self.primary_keys = primary_keys
+        # Writers update the mirror while readers select from it.
+        self.lock = threading.RLock()
+        self.rows: dict[tuple[Any, ...], RowType] = {}
+        # Only the first field of an index is indexed.
+        self.index: dict[str, dict[Any, dict[tuple[Any, ...], RowType]]] = {
+            index[0]: {} for index in indexes if index
+        }
+
+    def key(self, row: RowType) -> tuple[Any, ...]:
+        return tuple(getattr(row, key) for key in self.primary_keys)
+
+    def load(self, rows: Iterable[RowType]) -> None:
+        with self.lock:
+            self.rows.clear()
+            for index in self.index.values():
+                index.clear()
+            for row in rows:
+                self.put(row)
+
+    def put(self, row: RowType) -> None:
+        with self.lock:
+            key = self.key(row)
+            old = self.rows.get(key)
+            if old is not None:
+                self._unindex(key, old)
+            # Replacing the value keeps the row's position, so rows stay in
+            # insertion order like a rowid table's.
+            self.rows[key] = row
+            for field, index in self.index.items():
+                index.setdefault(getattr(row, field), {})[key] = row
+
+    def pop(self, key: tuple[Any, ...]) -> bool:
+        """Remove the row with the key and return if it existed."""
+        with self.lock:
+            row = self.rows.pop(key, None)
+            if row is None:
+                return False
+            self._unindex(key, row)
+            return True
+
+    def _unindex(self, key: tuple[Any, ...], row: RowType) -> None:
+        for field, index in self.index.items():
+            group = index[getattr(row, field)]
+            del group[key]
+            if len(group) == 0:
+                del index[getattr(row, field)]
+
+    def get(self, key: tuple[Any, ...]) -> RowType | None:
+        with self.lock:
+            return self.rows.get(key)
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        """Rows matching the filters, like a SELECT ... WHERE query."""
+        with self.lock:
+            candidates: Iterable[RowType]
+            if len(self.primary_keys) > 0 and all(
+                key in filters for key in self.primary_keys
+            ):
+                row = self.rows.get(
+                    tuple(filters[key] for key in self.primary_keys),
+                )
+                candidates = () if row is None else (row,)
+            else:
+                indexed = [f for f in filters if f in self.index]
+                candidates = (
+                    self.index[indexed[0]]
+                    .get(filters[indexed[0]], {})
+                    .values()
+                    if len(indexed) > 0
+                    else self.rows.values()
+                )
+            # Follows SQL where "field = NULL" never matches.
+            return tuple(
+                row
+                for row in candidates
+                if all(
+                    value is not None and getattr(row, name) == value
+                    for name, value in filters.items()
+                )
+            )
+
+    def iter_batches(
+        self,
+        filters: dict[str, Any],
+        *,
+        batch_size: int,
+        order_by: Sequence[str] | None,
+        limit: int | None,
+        offset: int,
+    ) -> Iterator[list[RowType]]:
+        """Rows matching the filters, sorted when iteration starts.
+
+        Rows written during iteration are not seen.
+        """
+        order = tuple(order_by or self.primary_keys)
+        rows = sorted(
+            self.select(filters),
+            # Follows SQL where NULL sorts before any other value.
+            key=lambda row: tuple(
+                (getattr(row, f) is not None, getattr(row, f)) for f in order
+            ),
+        )
+        end = None if limit is None else offset + limit
+        rows = rows[offset:end]
+        for index in range(0, len(rows), batch_size):
+            yield rows[index : index + batch_size]
+
+
+class StorageWriter(Protocol[RowType]):
+    """Writes to a table's rows, see StorageBackend.write()."""
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        """Rows matching the filters, including the writes made so far."""
+        ...
+
+    def upsert(self, rows: Sequence[RowType]) -> None:
+        """Update rows or insert them if they do not exist."""
+        ...
+
+    def delete(self, keys: Sequence[dict[str, Any]]) -> int:
+        """Remove rows by their primary keys and return how many existed."""
+        ...
+
+    def increment(
+        self,
+        keys: dict[str, Any],
+        deltas: dict[str, Any],
+        *,
+        default: RowType | None,
+        minimum: float | None,
+    ) -> RowType | None:
+        """Add deltas to fields of a row, see SQLTableInterface.increment()."""
+        ...
+
+    def assign(
+        self,
+        keys: dict[str, Any],
+        values: dict[str, Any],
+    ) -> RowType | None:
+        """Set fields of a row, see SQLTableInterface.assign()."""
+        ...
+
+
+class StorageBackend(Protocol[RowType]):
+    """Where a table's rows are stored, see SQLTableInterface.
+
+    The table validates arguments, caches reads, buffers writes (see
+    WriteBehind), and sends change events, so a backend only stores rows.
+    Reads of the backend are never cached by it.
+    """
+
+    @property
+    def engine(self) -> str:
+        """Name of the storage engine (e.g., 'sqlite')."""
+        ...
+
+    @property
+    def isolated(self) -> bool:
+        """If reads inside a transaction() do not see its writes."""
+        ...
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """Connections to the database file.
+
+        Raises:
+            ValueError:
+                if the backend has no database connections.
+        """
+        ...
+
+    @property
+    def connected(self) -> bool:
+        """If the backend holds database connections."""
+        ...
+
+    @property
+    def slow_query_ms(self) -> float | None:
+        """Duration of operations logged as slow or None to not log them."""
+        ...
+
+    @property
+    def coherence_interval_ms(self) -> float | None:
+        """Time between checks for writes by other processes.
+
+        None if other processes cannot write to the storage.
+        """
+        ...
+
+    def create(self) -> None:
+        """Create, or migrate, the storage for the rows."""
+        ...
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        """Rows matching the filters, like a SELECT ... WHERE query."""
+        ...
+
+    def select_keys(
+        self,
+        keys: Sequence[tuple[Any, ...]],
+    ) -> dict[tuple[Any, ...], RowType]:
+        """Rows with any of the primary key values, keyed by them."""
+        ...
+
+    def select_in(self, field: str, values: Sequence[Any]) -> list[RowType]:
+        """Rows where a field is any of the values."""
+        ...
+
+    def iter_batches(
+        self,
+        filters: dict[str, Any],
+        *,
+        batch_size: int,
+        order_by: Sequence[str] | None,
+        limit: int | None,
+        offset: int,
+    ) -> Iterator[list[RowType]]:
+        """Rows matching the filters in batches, see iter_all()."""
+        ...
+
+    def write(
+        self,
+    ) -> contextlib.AbstractContextManager[StorageWriter[RowType]]:
+        """Context for a write that commits when it exits.
+
+        The writer sees a consistent state for as long as the context is
+        open, so the previous versions of the rows it writes can be read
+        with it first.
+        """
+        ...
+
+    def transaction(
+        self,
+        others: Sequence[StorageBackend[Any]],
+    ) -> contextlib.AbstractContextManager[None]:
+        """Make the writes to this and other backends one transaction.
+
+        Raises:
+            ValueError:
+                if the backends cannot share a transaction.
+        """
+        ...
+
+    def in_transaction(self) -> bool:
+        """If the calling thread is inside a transaction()."""
+        ...
+
+    def defer(
+        self,
+        *,
+        on_commit: Callable[[], None] | None = None,
+        on_rollback: Callable[[], None] | None = None,
+    ) -> None:
+        """Run callbacks once the calling thread's transaction finishes.
+
+        Outside of a transaction, `on_commit` is called immediately.
+        """
+        ...
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """Run func without blocking the event loop on the database."""
+        ...
+
+    def check_external_writes(self) -> None:
+        """Start a check for writes to the database by other processes.
+
+        Must not block, because it is called before cache hits.
+        """
+        ...
+
+    def close(self) -> None:
+        """Release the database connections."""
+        ...
+
+
+class SQLiteBackend(Generic[RowType]):  # noqa: UP046
+    """Stores a table's rows in a SQLite database file.
+
+    Connections come from the file's ConnectionPool, which is shared by
+    every table in the file. With a mirror, a copy of every row is also
+    kept in memory and reads are answered from it without any SQL (see the
+    `mirror` option of SQLTableInterface).
+    """
+
+    engine = 'sqlite'
+    isolated = True
+
+    def __init__(  # noqa: PLR0913
+        self,
+        row_type: type[RowType],
+        name: str,
+        filepath: str,
+        *,
+        primary_keys: tuple[str, ...],
+        indexes: tuple[tuple[str, ...], ...],
+        mirror: bool,
+        without_rowid: bool,
+        on_external_write: Callable[[], None],
+    ) -> None:
+        """Init SQLiteBackend.
+
+        Args:
+            row_type (type[RowType]): type of the rows in the table.
+            name (str): name of the table in the database.
+            filepath (str): filepath of the database.
+            primary_keys (tuple[str]): primary keys of the table.
+            indexes (tuple[tuple[str]]): secondary indexes of the table.
+            mirror (bool): keep a copy of every row in memory.
+            without_rowid (bool): create the table as a WITHOUT ROWID table.
+            on_external_write (Callable): called after another process
+                wrote to the file (see ConnectionPool.subscribe()).
+        """
+        self.name = name
+        self.primary_keys = primary_keys
+        self.make = row_type._make
+        self._fields = field_types(row_type)
+        self._field_names = field_names(row_type)
+        self._indexes = indexes
+        self._without_rowid = without_rowid
+        self._filepath = filepath
+        self._on_external_write = on_external_write
+        self._pool: ConnectionPool | None = None
+        # Statement text keyed by (operation, fields), see statement().
+        self._statements: dict[tuple[str, tuple[str, ...]], str] = {}
+        self.mirror: _Mirror[RowType] | None = (
+            _Mirror(primary_keys, indexes) if mirror else None
+        )
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """Connections to the database file.
+
+        The pool is shared by every table in the same file, so the process
+        holds one writer connection per file rather than one connection per
+        table. It is acquired on first use and released by close().
+        """
+        if self._pool is None:
+            self._pool = connections.acquire(self._filepath)
+            self._pool.subscribe(self._external_write)
+        return self._pool
+
+    @property
+    def connected(self) -> bool:
+        """If the pool is acquired."""
+        return self._pool is not None
+
+    @property
+    def slow_query_ms(self) -> float | None:
+        """Slow query threshold of the file's PoolSettings."""
+        return self.pool.settings.slow_query_ms
+
+    @property
+    def coherence_interval_ms(self) -> float | None:
+        """Coherence interval of the file's PoolSettings.
+
+        None for ':memory:' files, which are private to the process.
+        """
+        if self.pool.in_memory:
+            return None
+        return self.pool.settings.coherence_interval_ms
+
+    def create(self) -> None:
+        """Create, or migrate, the table and its indexes.
+
+        The statements used by the common operations are precompiled and
+        the mirror, if any, is loaded.
+        """
+        parent = Path(self._filepath).parent
+        if str(parent) not in ('', '.'):
+            parent.mkdir(parents=True, exist_ok=True)
+
+        with self.pool.writer() as db:
+            # Table/column names come from the RowType definition, not user
+            # input, so this is not susceptible to SQL injection.
+            db.execute(self._create_sql(if_not_exists=True))
+            self._migrate_primary_keys(db)
+            # Indexes are created after the migration because rebuilding a
+            # legacy table drops any indexes on it.
+            for index in self._indexes:
+                name_ = index_name(self.name, index)
+                db.execute(
+                    f'CREATE INDEX IF NOT EXISTS {name_} '
+                    f'ON {self.name} ({", ".join(index)})',
+                )
+
+        self.statement('select')
+        self.statement('select', self.primary_keys)
+        self.statement('upsert')
+        if len(self.primary_keys) > 0:
+            self.statement('delete', self.primary_keys)
+
+        if self.mirror is not None:
+            self.load_mirror()
+
+    def _columns_str(self) -> str:
+        """Column definitions, and the primary key, for CREATE TABLE."""
+        columns = [
+            f'{name} {field.sql_type}' for name, field in self._fields.items()
+        ]
+        if len(self.primary_keys) > 0:
+            columns.append(f'PRIMARY KEY ({", ".join(self.primary_keys)})')
+        return ', '.join(columns)
+
+    def _create_sql(self, *, if_not_exists: bool = False) -> str:
+        """CREATE TABLE statement for the table."""
+        exists = 'IF NOT EXISTS ' if if_not_exists else ''
+        options = ' WITHOUT ROWID' if self._without_rowid else ''
+        return (
+            f'CREATE TABLE {exists}{self.name} '
+            f'({self._columns_str()}){options}'
+        )
+
+    def _migrate_primary_keys(self, db: sqlite3.Connection) -> None:
+        """Rebuild a legacy table so it declares the primary keys.
+
+        Tables used to be created without a PRIMARY KEY, so they have no
+        index on the keys and cannot be upserted into. SQLite cannot add a
+        primary key to an existing table, so the rows are copied into a new
+        table with the correct schema which then replaces the old one. If
+        the legacy table contains several rows with the same keys, the most
+        recently inserted one is kept. This is a no-op once the table has
+        the primary keys.
+        """
+        info = db.execute(f'PRAGMA table_info({self.name})').fetchall()
+        # Column 5 of table_info is the column's 1-indexed position in the
+        # primary key, or 0 if the column is not part of it.
+        existing = tuple(
+            column[1]
+            for column in sorted(info, key=lambda c: c[5])
+            if column[5]
+        )
+        if existing == self.primary_keys:
+            return
+
+        columns = ', '.join(self._field_names)
+        legacy = f'{self.name}_legacy'
+        before = db.execute(
+            f'SELECT COUNT(*) FROM {self.name}',  # noqa: S608
+        ).fetchone()[0]
+        # Run the rebuild in one transaction so a failure part way through
+        # leaves the legacy table untouched.
+        db.execute('BEGIN')
+        db.execute(f'ALTER TABLE {self.name} RENAME TO {legacy}')
+        db.execute(self._create_sql())
+        # Ordering by rowid means later duplicates replace earlier ones.
+        db.execute(
+            f'INSERT OR REPLACE INTO {self.name} ({columns}) '  # noqa: S608
+            f'SELECT {columns} FROM {legacy} ORDER BY rowid',
+        )
+        db.execute(f'DROP TABLE {legacy}')
+        after = db.execute(
+            f'SELECT COUNT(*) FROM {self.name}',  # noqa: S608
+        ).fetchone()[0]
+        logger.info(
+            'migrated table %s to primary keys (%s)',
+            self.name,
+            ', '.join(self.primary_keys),
+        )
+        if after < before:
+            logger.warning(
+                'dropped %s row(s) with duplicate primary keys from table %s',
+                before - after,
+                self.name,
+            )
+
+    def statement(
+        self,
+        operation: str,
+        fields: tuple[str, ...] = (),
+    ) -> str:
+        """Get the statement text for an operation on fields.
+
+        Statements are built once per (operation, fields) and reused, so
+        repeated calls do not rebuild the same SQL string. The number of
+        distinct keys is bounded by the combinations of field names.
+
+        Args:
+            operation (str): one of 'select' (rows matching fields), 'delete'
+                (rows matching fields), or 'upsert' (fields are ignored).
+            fields (tuple[str]): fields in the WHERE clause, in the order of
+                the kwargs they come from.
+        """
+        key = (operation, fields)
+        sql = self._statements.get(key)
+        if sql is None:
+            # Table/column names come from the RowType definition, not user
+            # input, so this is not susceptible to SQL injection.
+            where = f' WHERE {fields_to_search_str(fields)}' if fields else ''
+            if operation == 'select':
+                sql = f'SELECT * FROM {self.name}{where}'  # noqa: S608
+            elif operation == 'delete':
+                sql = f'DELETE FROM {self.name}{where}'  # noqa: S608
+            elif operation == 'upsert':
+                sql = self._upsert_sql()
+            else:
+                msg = f'Unknown operation {operation}.'
+                raise ValueError(msg)
+            self._statements[key] = sql
+        return sql
+
+    def _upsert_sql(self) -> str:
+        """INSERT statement that updates the row if its keys exist."""
+        # Table/column names come from the RowType definition, not user
+        # input, so this is not susceptible to SQL injection.
+        sql = (
+            f'INSERT INTO {self.name} ({", ".join(self._field_names)}) '  # noqa: S608
+            f'VALUES ({fields_to_insert_str(self._field_names)})'
+        )
+        if len(self.primary_keys) == 0:
+            return sql
+        values = [f for f in self._field_names if f not in self.primary_keys]
+        action = (
+            f'UPDATE SET {fields_to_excluded_str(values)}'
+            if len(values) > 0
+            else 'NOTHING'
+        )
+        return (
+            f'{sql} ON CONFLICT ({", ".join(self.primary_keys)}) DO {action}'
+        )
+
+    def increment_sql(
+        self,
+        keys: tuple[str, ...],
+        deltas: tuple[str, ...],
+        *,
+        insert: bool,
+        clamp: bool,
+    ) -> str:
+        """UPDATE (or INSERT with an UPDATE on conflict) for increment()."""
+        sets = ', '.join(
+            f'{f} = max({f} + :delta_{f}, :minimum)'
+            if clamp
+            else f'{f} = {f} + :delta_{f}'
+            for f in deltas
+        )
+        if insert:
+            # Table/column names come from the RowType definition, not user
+            # input, so this is not susceptible to SQL injection.
+            return (
+                f'INSERT INTO {self.name} ({", ".join(self._field_names)}) '  # noqa: S608
+                f'VALUES ({fields_to_insert_str(self._field_names)}) '
+                f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {sets} '
+                'RETURNING *'
+            )
+        return (
+            f'UPDATE {self.name} SET {sets} '  # noqa: S608
+            f'WHERE {fields_to_search_str(keys)} RETURNING *'
+        )
+
+    def assign_sql(
+        self, keys: tuple[str, ...], fields: tuple[str, ...]
+    ) -> str:
+        """UPDATE for assign()."""
+        sets = ', '.join(f'{f} = :value_{f}' for f in fields)
+        # Table/column names come from the RowType definition, not user
+        # input, so this is not susceptible to SQL injection.
+        return (
+            f'UPDATE {self.name} SET {sets} '  # noqa: S608
+            f'WHERE {fields_to_search_str(keys)} RETURNING *'
+        )
+
+    def load_mirror(self) -> None:
+        """Replace the in-memory copy with the rows in the database.
+
+        Writes hold the writer lock while they update the mirror, so the
+        rows are read with the writer and its lock is taken before the
+        mirror's. Taking them in the opposite order could deadlock with a
+        write, and reading the committed rows with a reader could overwrite
+        the mirror's copy of a write that commits during the reload.
+        """
+        assert self.mirror is not None
+        with self.pool.writer() as db, self.mirror.lock:
+            self.mirror.load(
+                map(self.make, db.execute(self.statement('select')))
+            )
+
+    def _external_write(self) -> None:
+        if self.mirror is not None:
+            self.load_mirror()
+        self._on_external_write()
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        """Rows matching the filters, read from the mirror if there is one."""
+        if self.mirror is not None:
+            return self.mirror.select(filters)
+        with self.pool.reader() as db:
+            rows = db.execute(
+                self.statement('select', tuple(filters)),
+                filters,
+            ).fetchall()
+        return tuple(map(self.make, rows))
+
+    def select_keys(
+        self,
+        keys: Sequence[tuple[Any, ...]],
+    ) -> dict[tuple[Any, ...], RowType]:
+        """Rows with any of the primary key values in few queries."""
+        if self.mirror is not None:
+            return {
+                key: row
+                for key, row in zip(
+                    keys, map(self.mirror.get, keys), strict=True
+                )
+                if row is not None
+            }
+        pks = ', '.join(self.primary_keys)
+        row_value = f'({", ".join("?" * len(self.primary_keys))})'
+        found: dict[tuple[Any, ...], RowType] = {}
+        with self.pool.reader() as db:
+            for chunk in _chunks(
+                list(keys),
+                MAX_VARIABLES // len(self.primary_keys),
+            ):
+                # Table/column names come from the RowType definition, not
+                # user input, so this is not susceptible to SQL injection.
+                rows = db.execute(
+                    f'SELECT * FROM {self.name} WHERE ({pks}) IN '  # noqa: S608
+                    f'(VALUES {", ".join([row_value] * len(chunk))})',
+                    [v for key in chunk for v in key],
+                ).fetchall()
+                for row in map(self.make, rows):
+                    found[
+                        tuple(getattr(row, key) for key in self.primary_keys)
+                    ] = row
+        return found
+
+    def select_in(self, field: str, values: Sequence[Any]) -> list[RowType]:
+        """Rows where a field is any of the values in few queries."""
+        if self.mirror is not None:
+            return [
+                row
+                for value in dict.fromkeys(values)
+                for row in self.mirror.select({field: value})
+            ]
+        rows: list[RowType] = []
+        with self.pool.reader() as db:
+            for chunk in _chunks(list(values), MAX_VARIABLES):
+                # Table/column names come from the RowType definition, not
+                # user input, so this is not susceptible to SQL injection.
+                rows.extend(
+                    map(
+                        self.make,
+                        db.execute(
+                            f'SELECT * FROM {self.name} WHERE {field} IN '  # noqa: S608
+                            f'({", ".join("?" * len(chunk))})',
+                            chunk,
+                        ),
+                    ),
+                )
+        return rows
+
+    def iter_batches(
+        self,
+        filters: dict[str, Any],
+        *,
+        batch_size: int,
+        order_by: Sequence[str] | None,
+        limit: int | None,
+        offset: int,
+    ) -> Iterator[list[RowType]]:
+        """Rows matching the filters, one query per batch.
+
+        Batches are paged by primary key (keyset pagination) unless order_by
+        is given or the table has no primary keys, in which case they are
+        paged with LIMIT/OFFSET. The final batch may be empty. With a
+        mirror, the batches are read from it instead, without queries.
+        """
+        if self.mirror is not None:
+            yield from self.mirror.iter_batches(
+                filters,
+                batch_size=batch_size,
+                order_by=order_by,
+                limit=limit,
+                offset=offset,
+            )
+            return
+        keyset = order_by is None and len(self.primary_keys) > 0
+        order = self.primary_keys if keyset else (order_by or ('rowid',))
+        pks = ', '.join(self.primary_keys)
+        last: RowType | None = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = (
+                batch_size if remaining is None else min(batch_size, remaining)
+            )
+            where = [fields_to_search_str(filters.keys())] if filters else []
+            params: dict[str, Any] = {**filters, 'limit': size}
+            if keyset and last is not None:
+                where.append(
+                    f'({pks}) > '
+                    f'({", ".join(f":last_{k}" for k in self.primary_keys)})',
+                )
+                params.update(
+                    {f'last_{k}': getattr(last, k) for k in self.primary_keys},
+                )
+                params['offset'] = 0
+            else:
+                params['offset'] = offset
+            clause = f'WHERE {" AND ".join(where)}' if where else ''
+            with self.pool.reader() as db:
+                # Table/column names come from the RowType definition, not
+                # user input, so this is not susceptible to SQL injection.
+                rows = list(
+                    map(
+                        self.make,
+                        db.execute(
+                            f'SELECT * FROM {self.name} {clause} '  # noqa: S608
+                            f'ORDER BY {", ".join(order)} '
+                            'LIMIT :limit OFFSET :offset',
+                            params,
+                        ),
+                    ),
+                )
+            yield rows
+            if len(rows) < size:
+                return
+            last = rows[-1]
+            offset += len(rows)
+            if remaining is not None:
+                remaining -= len(rows)
+
+    @contextlib.contextmanager
+    def write(self) -> Generator[_SQLiteWriter[RowType], None, None]:
+        """Transaction for a write that also updates the mirror.
+
+        The mirror is updated inside the transaction, while the writer lock
+        serializes it with other writes. If the transaction fails, the mirror
+        may be ahead of the database, so it is reloaded. Inside a
+        transaction(), that includes when a later write in it fails.
+        """
+        try:
+            with self.pool.writer() as db:
+                yield _SQLiteWriter(self, db)
+        except BaseException:
+            if self.mirror is not None:
+                self.load_mirror()
+            raise
+        if self.mirror is not None:
+            self.pool.defer(on_rollback=self.load_mirror)
+
+    @contextlib.contextmanager
+    def transaction(
+        self,
+        others: Sequence[StorageBackend[Any]],
+    ) -> Generator[None, None, None]:
+        """Share a transaction of the file's writer connection.
+
+        Every ':memory:' table has its own private database, so backends
+        that are all in memory instead open a transaction on each pool.
+        They roll back together if the context raises, but commit one
+        after another, so a failed commit does not undo the earlier ones.
+
+        Raises:
+            ValueError:
+                if the other backends are not in the same file or all in
+                memory.
+        """
+        pools = {
+            id(backend.pool): backend.pool
+            for backend in (self, *others)
+            if isinstance(backend, SQLiteBackend)
+        }
+        if len(others) + 1 != sum(
+            isinstance(backend, SQLiteBackend) for backend in (self, *others)
+        ) or (
+            len(pools) != 1
+            and not all(pool.in_memory for pool in pools.values())
+        ):
+            msg = 'Tables in a transaction must share one database file.'
+            raise ValueError(msg)
+        with contextlib.ExitStack() as stack:
+            # Locked in a fixed order so concurrent transactions cannot
+            # deadlock.
+            for _, pool in sorted(pools.items()):
+                stack.enter_context(pool.transaction())
+            yield
+
+    def in_transaction(self) -> bool:
+        """If the calling thread is inside a transaction of the pool."""
+        return self._pool is not None and self._pool.in_transaction()
+
+    def defer(
+        self,
+        *,
+        on_commit: Callable[[], None] | None = None,
+        on_rollback: Callable[[], None] | None = None,
+    ) -> None:
+        """See ConnectionPool.defer()."""
+        self.pool.defer(on_commit=on_commit, on_rollback=on_rollback)
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """Run func on the file's database thread, see ConnectionPool.run()."""
+        return await self.pool.run(func, *args, **kwargs)
+
+    def check_external_writes(self) -> None:
+        """See ConnectionPool.schedule_check()."""
+        # Checking should not reopen a closed pool, and a closed table has
+        # no cached reads from the current pool to check.
+        if self._pool is not None:
+            self._pool.schedule_check()
+
+    def close(self) -> None:
+        """Release the pool, which is reopened on demand."""
+        if self._pool is not None:
+            self._pool.unsubscribe(self._external_write)
+            connections.release(self._pool)
+            self._pool = None
+
+
+class _SQLiteWriter(Generic[RowType]):  # noqa: UP046
+    """Writes made with the writer connection of a SQLiteBackend."""
+
+    def __init__(
+        self,
+        backend: SQLiteBackend[RowType],
+        db: sqlite3.Connection,
+    ) -> None:
+        self.backend = backend
+        self.db = db
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        mirror = self.backend.mirror
+        if mirror is not None:
+            return mirror.select(filters)
+        return tuple(
+            map(
+                self.backend.make,
+                self.db.execute(
+                    self.backend.statement('select', tuple(filters)),
+                    filters,
+                ),
+            ),
+        )
+
+    def upsert(self, rows: Sequence[RowType]) -> None:
+        sql = self.backend.statement('upsert')
+        if len(rows) == 1:
+            self.db.execute(sql, rows[0]._asdict())
+        else:
+            self.db.executemany(sql, [row._asdict() for row in rows])
+        if self.backend.mirror is not None:
+            for row in rows:
+                self.backend.mirror.put(row)
+
+    def delete(self, keys: Sequence[dict[str, Any]]) -> int:
+        primary_keys = self.backend.primary_keys
+        changed = self.db.executemany(
+            self.backend.statement('delete', primary_keys),
+            keys,
+        ).rowcount
+        if self.backend.mirror is not None:
+            for key in keys:
+                self.backend.mirror.pop(tuple(key[k] for k in primary_keys))
+        return changed
+
+    def increment(
+        self,
+        keys: dict[str, Any],
+        deltas: dict[str, Any],
+        *,
+        default: RowType | None,
+        minimum: float | None,
+    ) -> RowType | None:
+        params = {f'delta_{k}': v for k, v in deltas.items()}
+        params['minimum'] = minimum
+        # Table/column names come from the RowType definition, not user
+        # input, so this is not susceptible to SQL injection.
+        result = self.db.execute(
+            self.backend.increment_sql(
+                tuple(keys),
+                tuple(deltas),
+                insert=default is not None,
+                clamp=minimum is not None,
+            ),
+            {**keys, **params}
+            if default is None
+            else {**default._asdict(), **params},
+        ).fetchone()
+        row = None if result is None else self.backend.make(result)
+        if self.backend.mirror is not None and row is not None:
+            self.backend.mirror.put(row)
+        return row
+
+    def assign(
+        self,
+        keys: dict[str, Any],
+        values: dict[str, Any],
+    ) -> RowType | None:
+        params = {f'value_{k}': v for k, v in values.items()}
+        result = self.db.execute(
+            self.backend.assign_sql(tuple(keys), tuple(values)),
+            {**keys, **params},
+        ).fetchone()
+        row = None if result is None else self.backend.make(result)
+        if self.backend.mirror is not None and row is not None:
+            self.backend.mirror.put(row)
+        return row
+
+
+class DictBackend(Generic[RowType]):  # noqa: UP046
+    """Stores a table's rows only in memory, see DICT_DATABASE.
+
+    Rows are indexed like a mirror and never touch SQLite, with the same
+    semantics as SQLiteBackend otherwise. Writes are visible to reads as
+    soon as they are made, even inside a transaction(), whose rows are
+    locked until it finishes and restored if it raises.
+    """
+
+    engine = 'dict'
+    isolated = False
+    connected = False
+    slow_query_ms = None
+    coherence_interval_ms = None
+
+    def __init__(
+        self,
+        primary_keys: tuple[str, ...],
+        indexes: tuple[tuple[str, ...], ...],
+    ) -> None:
+        """Init DictBackend.
+
+        Args:
+            primary_keys (tuple[str]): primary keys of the table.
+            indexes (tuple[tuple[str]]): secondary indexes of the table.
+        """
+        self.store: _Mirror[RowType] = _Mirror(primary_keys, indexes)
+        self._transaction_thread: int | None = None
+        self._on_commit: list[Callable[[], None]] = []
+        self._on_rollback: list[Callable[[], None]] = []
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """The dict engine has no pool.
+
+        Raises:
+            ValueError:
+                always.
+        """
+        msg = 'Tables using the dict engine have no database connections.'
+        raise ValueError(msg)
+
+    def create(self) -> None:
+        """Nothing to create, the rows are only in memory."""
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        """Rows matching the filters."""
+        return self.store.select(filters)
+
+    def select_keys(
+        self,
+        keys: Sequence[tuple[Any, ...]],
+    ) -> dict[tuple[Any, ...], RowType]:
+        """Rows with any of the primary key values."""
+        return {
+            key: row
+            for key, row in zip(keys, map(self.store.get, keys), strict=True)
+            if row is not None
+        }
+
+    def select_in(self, field: str, values: Sequence[Any]) -> list[RowType]:
+        """Rows where a field is any of the values."""
+        return [
+            row
+            for value in dict.fromkeys(values)
+            for row in self.store.select({field: value})
+        ]
+
+    def iter_batches(
+        self,
+        filters: dict[str, Any],
+        *,
+        batch_size: int,
+        order_by: Sequence[str] | None,
+        limit: int | None,
+        offset: int,
+    ) -> Iterator[list[RowType]]:
+        """Rows matching the filters, sorted when iteration starts.
+
+        Rows written during iteration are not seen.
+        """
+        return self.store.iter_batches(
+            filters,
+            batch_size=batch_size,
+            order_by=order_by,
+            limit=limit,
+            offset=offset,
+        )
+
+    @contextlib.contextmanager
+    def write(self) -> Generator[_DictWriter[RowType], None, None]:
+        """Lock the rows for a write."""
+        with self.store.lock:
+            yield _DictWriter(self.store)
+
+    @contextlib.contextmanager
+    def transaction(
+        self,
+        others: Sequence[StorageBackend[Any]],
+    ) -> Generator[None, None, None]:
+        """Lock the rows of this and other backends for a transaction.
+
+        Raises:
+            ValueError:
+                if the other backends do not use the dict engine.
+        """
+        if not all(isinstance(other, DictBackend) for other in others):
+            msg = 'Tables in a transaction must share one database file.'
+            raise ValueError(msg)
+        backends = {
+            id(backend): cast('DictBackend[Any]', backend)
+            for backend in (self, *others)
+        }
+        with contextlib.ExitStack() as stack:
+            # Locked in a fixed order so concurrent transactions cannot
+            # deadlock.
+            for _, backend in sorted(backends.items()):
+                stack.enter_context(backend.hold())
+            yield
+
+    @contextlib.contextmanager
+    def hold(self) -> Generator[None, None, None]:
+        """Lock the rows for a transaction and restore them if it raises.
+
+        Joins the transaction if the calling thread is already in one.
+        """
+        if self.in_transaction():
+            yield
+            return
+        with self.store.lock:
+            saved = tuple(self.store.rows.values())
+            self._transaction_thread = threading.get_ident()
+            try:
+                yield
+            except BaseException:
+                self.store.load(saved)
+                callbacks = self._on_rollback
+                raise
+            else:
+                callbacks = self._on_commit
+            finally:
+                self._transaction_thread = None
+                self._on_commit, self._on_rollback = [], []
+                for callback in callbacks:
+                    callback()
+
+    def in_transaction(self) -> bool:
+        """If the calling thread is inside a transaction()."""
+        return self._transaction_thread == threading.get_ident()
+
+    def defer(
+        self,
+        *,
+        on_commit: Callable[[], None] | None = None,
+        on_rollback: Callable[[], None] | None = None,
+    ) -> None:
+        """Run callbacks once the calling thread's transaction finishes.
+
+        Outside of a transaction, `on_commit` is called immediately.
+        """
+        if not self.in_transaction():
+            if on_commit is not None:
+                on_commit()
+            return
+        if on_commit is not None:
+            self._on_commit.append(on_commit)
+        if on_rollback is not None:
+            self._on_rollback.append(on_rollback)
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """Run func directly since it does not wait on a database."""
+        return func(*args, **kwargs)
+
+    def check_external_writes(self) -> None:
+        """No other process can write to the rows."""
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+class _DictWriter(Generic[RowType]):  # noqa: UP046
+    """Writes to the rows of a DictBackend, made with its lock held."""
+
+    def __init__(self, store: _Mirror[RowType]) -> None:
+        self.store = store
+
+    def select(self, filters: dict[str, Any]) -> tuple[RowType, ...]:
+        return self.store.select(filters)
+
+    def upsert(self, rows: Sequence[RowType]) -> None:
+        for row in rows:
+            self.store.put(row)
+
+    def delete(self, keys: Sequence[dict[str, Any]]) -> int:
+        primary_keys = self.store.primary_keys
+        return sum(
+            self.store.pop(tuple(key[k] for k in primary_keys)) for key in keys
+        )
+
+    def increment(
+        self,
+        keys: dict[str, Any],
+        deltas: dict[str, Any],
+        *,
+        default: RowType | None,
+        minimum: float | None,
+    ) -> RowType | None:
+        row = self.store.get(tuple(keys[k] for k in self.store.primary_keys))
+        if row is None:
+            row = default
+        else:
+            row = row._replace(
+                **{
+                    field: _clamp(getattr(row, field) + delta, minimum)
+                    for field, delta in deltas.items()
+                },
+            )
+        if row is not None:
+            self.store.put(row)
+        return row
+
+    def assign(
+        self,
+        keys: dict[str, Any],
+        values: dict[str, Any],
+    ) -> RowType | None:
+        row = self.store.get(tuple(keys[k] for k in self.store.primary_keys))
+        if row is not None:
+            row = row._replace(**values)
+            self.store.put(row)
+        return row
+
+
+def _instrumented(
+    operation: str,
+) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """Decorator which records the calls of a table method in its stats."""
+
+    def _decorator(func: Callable[P, T]) -> Callable[P, T]:
+        @functools.wraps(func)
+        def _wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            table = cast('SQLTableInterface[Any]', args[0])
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                table._record(operation, start, None, error=True)  # noqa: SLF001
+                raise
+            table._record(operation, start, result)  # noqa: SLF001
+            return result
+
+        return _wrapper
+
+    return _decorator
+
+
 class SQLTableInterface(Generic[RowType]):  # noqa: UP046
     """Abstract interface to a SQLite3 table.
 
@@ -55,13 +1821,17 @@ class SQLTableInterface(Generic[RowType]):  # noqa: UP046
         use at your own risk.
     """
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         row_type: type[RowType],
         name: str,
         filepath: str,
         *,
         primary_keys: tuple[str, ...] | None = None,
+        indexes: tuple[tuple[str, ...], ...] = (),
+        write_behind: WriteBehind | None = None,
+        mirror: bool = False,
+        without_rowid: bool = False,
     ) -> None:
         """Init SQLTableInterface.
 
@@ -69,102 +1839,491 @@ class SQLTableInterface(Generic[RowType]):  # noqa: UP046
             row_type (type[RowType]): user defined RowType that represents
                 what a row in the table will look like.
             name (str): name of the table to add the the sqlite3 database.
-            filepath (str): filepath to the sqlite3 database to use.
+            filepath (str): filepath to the sqlite3 database to use or
+                DICT_DATABASE to use the dict engine. The dict engine keeps
+                the rows only in memory, indexed like a mirror (see
+                `mirror`), and never touches SQLite. It has the same
+                semantics as the SQLite engine, so it can stand in for it to
+                measure how much of an operation's time is spent in the
+                database. It requires primary keys and ignores
+                `write_behind`, `mirror`, and `without_rowid`.
             primary_keys (tuple[str]): optional tuple of field names that serve
-                as the primary keys for the table. Some operations will
-                validate the user provided the primary keys to ensure the
-                operation only affects one row. Note: primary keys are not
-                officially set in the table because of legacy issues with
-                how the tables were previously formatted.
+                as the primary keys for the table. These are declared as the
+                table's PRIMARY KEY, and legacy tables created without one
+                are rebuilt with it on first use (see
+                _migrate_primary_keys()). Some operations will validate the
+                user provided the primary keys to ensure the operation only
+                affects one row.
+            indexes (tuple[tuple[str]]): optional secondary indexes to create
+                on the table, each given as a tuple of field names (e.g.,
+                `(('guild_id',), ('birth_month', 'birth_day'))`). Queries
+                that filter on a prefix of an index's fields can then avoid
+                a full table scan. The primary keys are already indexed.
+            write_behind (WriteBehind | None): buffer update() and remove()
+                in memory and flush them to the database in batches (see
+                flush()). Buffered writes are immediately visible to reads
+                from this instance but are lost if the process dies before
+                they are flushed, so only use this for high-frequency writes
+                that can tolerate that. Requires primary keys.
+            mirror (bool): keep a copy of every row in memory, loaded when
+                the table is created, and answer reads from it without any
+                SQL. Writes still go to the database and then update the
+                copy. Filters on the primary keys or on the first field of
+                an index are dict lookups. Only use this for small tables
+                that are read often. Requires primary keys and cannot be
+                combined with write-behind.
+            without_rowid (bool): create the table as a WITHOUT ROWID table
+                so rows are stored in primary key order and lookups by the
+                primary keys skip the separate primary key index. Rows are
+                returned in primary key, rather than insertion, order. Only
+                affects new tables, existing tables are rebuilt by a
+                migration (see threepseat.migrations). Requires primary keys.
 
         Raises:
             ValueError:
-                if any key in `primary_keys` is not a field of the `row_type`.
+                if any key in `primary_keys` or `indexes` is not a field of
+                the `row_type`, if `write_behind`, `mirror`, or
+                `without_rowid` is set or the dict engine is used without
+                `primary_keys`, or if both `write_behind` and `mirror` are
+                set.
         """
         self._row_type = row_type
         self._row_name = row_type.__name__
         self._primary_keys = () if primary_keys is None else primary_keys
+        self._indexes = indexes
+        self._without_rowid = without_rowid
         self._name = name
         self._filepath = filepath
 
-        self._field_names = field_names(self._row_type)
-        self._fields = field_types(self._row_type)
-        self._db: sqlite3.Connection | None = None
+        self._field_names = field_names(self._row_type)
+        self._fields = field_types(self._row_type)
+        # Per-call work is kept out of the hot paths: rows are decoded with
+        # the C-level map(_make) and kwargs are validated by a set lookup of
+        # their exact type (see _validator()).
+        self._make = row_type._make
+        self._validators = {
+            name: _validator(field.python_type)
+            for name, field in self._fields.items()
+        }
+        dict_engine = filepath == DICT_DATABASE
+        # Writes are already in memory with the dict engine.
+        self._write_behind = None if dict_engine else write_behind
+        # Buffered writes keyed by primary key values. A value of None is a
+        # buffered removal.
+        self._dirty: dict[tuple[Any, ...], RowType | None] = {}
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer: threading.Timer | None = None
+        # Serializes buffered writes with write-behind so the
+        # read-modify-writes of increment() and assign() are not lost.
+        self._write_behind_lock = threading.Lock()
+        # Operation counters keyed by operation, see stats().
+        self._stats: dict[str, _Counters] = {}
+        self._stats_lock = threading.Lock()
+        self._slow_query_ms: float | None = None
+        # Change subscribers keyed by the callback or queue passed to
+        # subscribe() or returned by subscribe_queue().
+        self._subscribers: dict[
+            object,
+            Callable[[ChangeEvent[RowType]], None],
+        ] = {}
+
+        self._validate_options(
+            write_behind=self._write_behind,
+            mirror=mirror or dict_engine,
+            without_rowid=without_rowid,
+            dict_engine=dict_engine,
+        )
+        # The only place the engine is chosen, everything else goes through
+        # the StorageBackend.
+        self._backend: StorageBackend[RowType] = (
+            DictBackend(self._primary_keys, indexes)
+            if dict_engine
+            else SQLiteBackend(
+                row_type,
+                name,
+                filepath,
+                primary_keys=self._primary_keys,
+                indexes=indexes,
+                mirror=mirror,
+                without_rowid=without_rowid,
+                on_external_write=self._external_write,
+            )
+        )
+
+        # Bounded because the cache key is the full kwargs combination, so an
+        # unbounded cache would retain an entry for every distinct query ever
+        # made (misses included). Created before the backend is created
+        # because it may call _external_write() as soon as it is.
+        interval = self._backend.coherence_interval_ms
+        check = None if interval is None else self._check_external_writes
+        self.all: TableCache[tuple[RowType, ...]] = TableCache(
+            self._all,
+            lambda rows: rows,
+            check=check,
+            primary_keys=self._primary_keys,
+            check_interval=(interval or 0) / 1000,
+        )
+        self.get: TableCache[RowType | None] = TableCache(
+            self._get,
+            lambda row: () if row is None else (row,),
+            check=check,
+            primary_keys=self._primary_keys,
+            check_interval=(interval or 0) / 1000,
+        )
+        self._backend.create()
+        self._slow_query_ms = self._backend.slow_query_ms
+
+    def _validate_options(
+        self,
+        *,
+        write_behind: WriteBehind | None,
+        mirror: bool,
+        without_rowid: bool,
+        dict_engine: bool,
+    ) -> None:
+        """Check the init options, see __init__() for the errors raised."""
+        for key in self._primary_keys:
+            if key not in self.field_names:
+                msg = f'Primary key {key} is not a field in {self._row_name}.'
+                raise ValueError(msg)
+        for index in self._indexes:
+            for key in index:
+                if key not in self.field_names:
+                    msg = (
+                        f'Index key {key} is not a field in {self._row_name}.'
+                    )
+                    raise ValueError(msg)
+        requires_keys = {
+            'The dict engine': dict_engine,
+            'Write-behind': write_behind is not None,
+            'Mirror': mirror,
+            'Without rowid': without_rowid,
+        }
+        for option, enabled in requires_keys.items():
+            if enabled and len(self._primary_keys) == 0:
+                msg = f'{option} requires primary keys.'
+                raise ValueError(msg)
+        if mirror and write_behind is not None:
+            msg = 'Mirror and write-behind cannot be combined.'
+            raise ValueError(msg)
+
+    @property
+    def field_names(self) -> tuple[str, ...]:
+        """Returns a tuple of the field/column names in the table."""
+        return self._field_names
+
+    @property
+    def fields(self) -> dict[str, Field]:
+        """Returns dict with information about the types of each field."""
+        return self._fields
+
+    @property
+    def indexes(self) -> tuple[tuple[str, ...], ...]:
+        """Tuple of the secondary indexes."""
+        return self._indexes
+
+    @property
+    def name(self) -> str:
+        """Name of the table in the SQLite3 database."""
+        return self._name
+
+    @property
+    def engine(self) -> str:
+        """Storage engine of the table, either 'sqlite' or 'dict'."""
+        return self._backend.engine
+
+    @property
+    def primary_keys(self) -> tuple[str, ...]:
+        """Tuple of the primary keys."""
+        return self._primary_keys
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """Connections to the database file.
+
+        The pool is shared by every table in the same file, so the process
+        holds one writer connection per file rather than one connection per
+        table. It is acquired on first use and released by close().
+
+        Raises:
+            ValueError:
+                if the table uses the dict engine.
+        """
+        return self._backend.pool
+
+    @contextlib.contextmanager
+    def connect(self) -> Generator[sqlite3.Connection, None, None]:
+        """Database transaction context manager.
+
+        Yields the file's writer connection. The context manager scopes a
+        transaction, committing on success and rolling back if the body
+        raises, and holds the writer lock so writes from other tables and
+        threads are serialized.
+        """
+        with self.pool.writer() as db:
+            yield db
+
+    def close(self) -> None:
+        """Flush buffered writes and release the database connections.
+
+        The connections are closed once every table in the file has been
+        closed. They are reopened on demand, so this releases the handles
+        rather than permanently disabling the table. Pending async
+        operations finish before the connections are closed.
+        """
+        with self._dirty_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self.flush()
+        self._backend.close()
+
+    async def _run(
+        self,
+        func: Callable[..., T],
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """Run func on the database thread without blocking the event loop.
+
+        The thread is shared by every table in the file (see
+        ConnectionPool.run()). With the dict engine, func is run directly.
+        """
+        return await self._backend.run(func, *args, **kwargs)
+
+    def _check_external_writes(self) -> None:
+        self._backend.check_external_writes()
+
+    def _external_write(self) -> None:
+        """Drop all cached reads after another process wrote to the file.
+
+        Which rows changed is unknown, so every entry is invalidated and
+        subscribers are sent a 'reset'.
+        """
+        self._invalidate_all()
+        self._deliver([ChangeEvent('reset', None, None)])
+
+    def subscribe(
+        self,
+        callback: Callable[[ChangeEvent[RowType]], None],
+    ) -> None:
+        """Call callback with a ChangeEvent for every row that changes.
+
+        Events are sent once the write commits (or is buffered, with
+        write-behind), so derived state such as an autocomplete list can be
+        updated incrementally rather than rebuilt. Writes that do not change
+        a row (e.g., removing a missing row) send no event.
+
+        The callback is called on the thread that made the write, which may
+        be the database thread, so it should be quick and must not block.
+        Exceptions it raises are logged. Use subscribe_queue() to consume
+        events on the event loop instead.
+
+        Finding a row's old version costs a read per write, so it is only
+        done while there are subscribers.
+        """
+        self._subscribers[callback] = callback
+
+    def subscribe_queue(
+        self,
+        maxsize: int = 0,
+    ) -> asyncio.Queue[ChangeEvent[RowType]]:
+        """Subscribe to changes with a queue consumed on the event loop.
+
+        Must be called from the event loop that consumes the queue. Events
+        are put on the queue by the event loop, whichever thread made the
+        write. If the queue is full, events are dropped with a warning.
+
+        Returns:
+            the queue, which is passed to unsubscribe() to stop events.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[ChangeEvent[RowType]] = asyncio.Queue(maxsize)
 
-        for key in self._primary_keys:
-            if key not in self.field_names:
-                msg = f'Primary key {key} is not a field in {self._row_name}.'
-                raise ValueError(msg)
+        def _put(event: ChangeEvent[RowType]) -> None:
+            loop.call_soon_threadsafe(self._enqueue, queue, event)
 
-        parent = Path(self._filepath).parent
-        if str(parent) not in ('', '.'):
-            parent.mkdir(parents=True, exist_ok=True)
+        self._subscribers[queue] = _put
+        return queue
 
-        # Create table
-        columns = [
-            f'{name} {field.sql_type}' for name, field in self.fields.items()
-        ]
-        columns_str = ', '.join(columns)
-        with self.connect() as db:
-            # Table/column names come from the RowType definition, not user
-            # input, so this is not susceptible to SQL injection.
-            db.execute(
-                f'CREATE TABLE IF NOT EXISTS {self.name} ({columns_str})',
+    def unsubscribe(
+        self,
+        subscriber: Callable[[ChangeEvent[RowType]], None]
+        | asyncio.Queue[ChangeEvent[RowType]],
+    ) -> None:
+        """Stop sending events to a callback or queue."""
+        self._subscribers.pop(subscriber, None)
+
+    def _enqueue(
+        self,
+        queue: asyncio.Queue[ChangeEvent[RowType]],
+        event: ChangeEvent[RowType],
+    ) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(
+                'dropped %s change to %s, queue is full',
+                event.kind,
+                self.name,
             )
 
-        # Bounded because the cache key is the full kwargs combination, so an
-        # unbounded cache would retain an entry for every distinct query ever
-        # made (misses included).
-        self.all = functools.lru_cache(maxsize=CACHE_MAXSIZE)(self._all)
-        self.get = functools.lru_cache(maxsize=CACHE_MAXSIZE)(self._get)
+    def _previous(
+        self,
+        writer: StorageWriter[RowType] | None,
+        key: dict[str, Any],
+    ) -> tuple[RowType, ...]:
+        """Rows matching key before a write, read with writer if given."""
+        if writer is None:
+            # Includes buffered writes.
+            return self._select(key)
+        return writer.select(key)
 
-    @property
-    def field_names(self) -> tuple[str, ...]:
-        """Returns a tuple of the field/column names in the table."""
-        return self._field_names
+    def _changes(
+        self,
+        writer: StorageWriter[RowType] | None,
+        writes: Iterable[tuple[dict[str, Any], RowType | None]],
+    ) -> list[tuple[RowType | None, RowType | None]]:
+        """Pair writes with the rows they replace, for change events.
 
-    @property
-    def fields(self) -> dict[str, Field]:
-        """Returns dict with information about the types of each field."""
-        return self._fields
+        Must be called before the writes are applied and, to see a
+        consistent state, under the same lock or transaction.
 
-    @property
-    def name(self) -> str:
-        """Name of the table in the SQLite3 database."""
-        return self._name
+        Args:
+            writer (StorageWriter | None): writer the writes are made with
+                or None if they are buffered.
+            writes (Iterable): primary key values and new version, or None
+                if removed, of each row written, in order.
 
-    @property
-    def primary_keys(self) -> tuple[str, ...]:
-        """Tuple of the primary keys."""
-        return self._primary_keys
+        Returns:
+            (old, new) pairs for the rows written or an empty list if there
+            are no subscribers.
+        """
+        if len(self._subscribers) == 0:
+            return []
+        changes: list[tuple[RowType | None, RowType | None]] = []
+        seen: dict[tuple[Any, ...], RowType | None] = {}
+        for key, new in writes:
+            pk = tuple(key[k] for k in self.primary_keys)
+            olds: tuple[RowType | None, ...]
+            if len(self.primary_keys) == 0 and new is not None:
+                # Rows without primary keys are always inserted.
+                olds = (None,)
+            elif pk in seen:
+                # Written earlier in the same batch.
+                olds = (seen[pk],)
+            else:
+                olds = self._previous(writer, key) or (None,)
+            changes.extend((old, new) for old in olds)
+            seen[pk] = new
+        return changes
 
-    @contextlib.contextmanager
-    def connect(self) -> Generator[sqlite3.Connection, None, None]:
-        """Database transaction context manager.
+    def _publish(
+        self,
+        changes: Iterable[tuple[RowType | None, RowType | None]],
+    ) -> None:
+        """Send events for the changes once the write commits."""
+        events = [
+            ChangeEvent(
+                'insert'
+                if old is None
+                else 'delete'
+                if new is None
+                else 'update',
+                old,
+                new,
+            )
+            for old, new in changes
+            if old != new
+        ]
+        if len(events) == 0:
+            return
+        self._backend.defer(on_commit=lambda: self._deliver(events))
 
-        The underlying connection is opened on first use and reused for the
-        lifetime of this instance (or until close() is called), so a
-        ':memory:' database persists across operations. The context manager
-        scopes a transaction, committing on success and rolling back if the
-        body raises.
-        """
-        if self._db is None:
-            self._db = sqlite3.connect(self._filepath)
-            # Other table instances share this file, so WAL lets them keep
-            # reading while this one writes. It is a no-op for ':memory:'.
-            self._db.execute('PRAGMA journal_mode=WAL')
-        with self._db as db:
-            yield db
+    def _deliver(self, events: list[ChangeEvent[RowType]]) -> None:
+        for subscriber in list(self._subscribers.values()):
+            for event in events:
+                try:
+                    subscriber(event)
+                except Exception:
+                    logger.exception(
+                        'change subscriber of %s failed', self.name
+                    )
 
-    def close(self) -> None:
-        """Close the database connection.
+    def _record(
+        self,
+        operation: str,
+        start: float,
+        result: object,
+        *,
+        error: bool = False,
+    ) -> None:
+        """Record a call that started at start (from time.perf_counter())."""
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if result is None:
+            rows = 0
+        elif isinstance(result, int):
+            rows = result
+        elif isinstance(result, self._row_type):
+            rows = 1
+        else:
+            rows = sum(
+                row is not None for row in cast('Iterable[Any]', result)
+            )
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+
+        with self._stats_lock:
+            counters = self._stats.get(operation)
+            if counters is None:
+                counters = self._stats[operation] = _Counters()
+            counters.calls += 1
+            counters.errors += error
+            counters.rows += rows
+            counters.total_ms += elapsed_ms
+            counters.max_ms = max(counters.max_ms, elapsed_ms)
+            counters.histogram[bucket] += 1
 
-        Connections are reopened on demand, so this releases the handle
-        rather than permanently disabling the table.
+        if (
+            self._slow_query_ms is not None
+            and elapsed_ms >= self._slow_query_ms
+        ):
+            logger.warning(
+                'slow %s on table %s took %.1fms (%s row(s))',
+                operation,
+                self.name,
+                elapsed_ms,
+                rows,
+            )
+
+    def stats(self) -> TableStats:
+        """Report counters for the operations on the table and its caches.
+
+        Every operation records its call count, errors, rows returned, and a
+        latency histogram, so the tables (and so the extensions) that spend
+        the most time in the database can be found under load. Awaitable
+        operations are recorded under the name of the operation they run.
+        Operations slower than the `slow_query_ms` of the database's
+        PoolSettings are also logged as warnings.
         """
-        if self._db is not None:
-            self._db.close()
-            self._db = None
+        with self._stats_lock:
+            operations = {
+                operation: OperationStats(
+                    calls=counters.calls,
+                    errors=counters.errors,
+                    rows=counters.rows,
+                    total_ms=counters.total_ms,
+                    max_ms=counters.max_ms,
+                    histogram=tuple(counters.histogram),
+                )
+                for operation, counters in self._stats.items()
+            }
+        return TableStats(
+            name=self.name,
+            operations=operations,
+            all=self.all.cache_info(),
+            get=self.get.cache_info(),
+        )
 
     def validate_kwargs(self, kwargs: dict[str, Any]) -> None:
         """Validate that every key/value in kwargs.
@@ -173,19 +2332,25 @@ class SQLTableInterface(Generic[RowType]):  # noqa: UP046
         and that the type of each value matches the type expected by the
         table.
         """
+        validators = self._validators
         for field, value in kwargs.items():
-            if field not in self._fields:
+            validator = validators.get(field)
+            if validator is None:
                 msg = f'Field {field} is not a member of {self._row_name}.'
                 raise ValueError(msg)
-            if not isinstance(value, self.fields[field].python_type):
+            if type(value) not in validator.exact and not isinstance(
+                value,
+                validator.expected,
+            ):
                 msg = (
                     f'Type of {field} is {type(value)} but expected '
-                    f'{self.fields[field].python_type}.'
+                    f'{validator.expected}.'
                 )
                 # ValueError (not TypeError) is this class's convention for
                 # any invalid kwarg, including wrong-typed values.
-                raise ValueError(msg)  # noqa: TRY004
+                raise ValueError(msg)
 
+    @_instrumented('all')
     def _all(self, *_: Any, **kwargs: Any) -> tuple[RowType, ...]:  # noqa: ANN401
         """Get all rows in the table match kwargs.
 
@@ -199,22 +2364,9 @@ class SQLTableInterface(Generic[RowType]):  # noqa: UP046
             compatible with any override. Only keyword arguments are used.
         """
         self.validate_kwargs(kwargs)
+        return self._select(kwargs)
 
-        where = (
-            f'WHERE {fields_to_search_str(kwargs.keys())}'
-            if len(kwargs) > 0
-            else ''
-        )
-
-        with self.connect() as db:
-            # Table/column names come from the RowType definition, not user
-            # input, so this is not susceptible to SQL injection.
-            rows = db.execute(
-                f'SELECT * FROM {self.name} {where}',  # noqa: S608
-                kwargs,
-            ).fetchall()
-            return tuple(self._row_type(*row) for row in rows)
-
+    @_instrumented('get')
     def _get(self, *_: Any, **kwargs: Any) -> RowType | None:  # noqa: ANN401
         """Get the row in the table matching kwargs.
 
@@ -229,46 +2381,62 @@ class SQLTableInterface(Generic[RowType]):  # noqa: UP046
             msg = 'At least one argument must be provided.'
             raise ValueError(msg)
         self.validate_kwargs(kwargs)
+        return self._select_one(kwargs)
 
-        with self.connect() as db:
-            # Table/column names come from the RowType definition, not user
-            # input, so this is not susceptible to SQL injection.
-            rows = db.execute(
-                f'SELECT * FROM {self.name} WHERE '  # noqa: S608
-                f'{fields_to_search_str(kwargs.keys())}',
-                kwargs,
-            ).fetchall()
-            if len(rows) == 0:
-                return None
-            if len(rows) >= 2:  # noqa: PLR2004 (checking for "more than one")
-                msg = 'Found multiple matching rows.'
-                raise ValueError(msg)
-            return self._row_type(*rows[0])
+    # The _select*() methods read the current rows, including buffered
+    # writes, for the public reads and for the reads that writes make
+    # internally. They are not instrumented, so the internal reads are not
+    # counted in stats() or logged as slow queries, and they do not go
+    # through subclass overrides of _all() and _get(). Arguments must
+    # already be validated.
+
+    def _select(self, kwargs: dict[str, Any]) -> tuple[RowType, ...]:
+        # Snapshot the buffer before querying so a flush that commits in
+        # between is seen by at least one of the two.
+        dirty = self._dirty_snapshot()
+        return self._overlay(self._backend.select(kwargs), dirty, kwargs)
+
+    def _select_one(self, kwargs: dict[str, Any]) -> RowType | None:
+        matches = self._select(kwargs)
+        if len(matches) == 0:
+            return None
+        if len(matches) >= 2:  # noqa: PLR2004 (checking for "more than one")
+            msg = 'Found multiple matching rows.'
+            raise ValueError(msg)
+        return matches[0]
+
+    def _select_keys(
+        self,
+        values: Sequence[tuple[Any, ...]],
+    ) -> tuple[RowType | None, ...]:
+        dirty = self._dirty_snapshot()
+        found: dict[tuple[Any, ...], RowType | None] = {}
+        found.update(self._backend.select_keys(values))
+        found.update(dirty)
+        return tuple(found.get(value) for value in values)
 
+    @_instrumented('update')
     def update(self, row: RowType) -> None:
-        """Update a row in the table or insert it if it does not exist."""
-        with self.connect() as db:
-            # Table/column names come from the RowType definition, not user
-            # input, so this is not susceptible to SQL injection.
-            res = db.execute(
-                f'UPDATE {self.name} '  # noqa: S608
-                f'SET {fields_to_update_str(self.field_names)} '
-                f'WHERE {fields_to_search_str(self.primary_keys)}',
-                row._asdict(),
-            )
-            if res.rowcount > 1:
-                msg = 'Updated more than one row!'
-                raise ValueError(msg)
-            if res.rowcount == 0:
-                res = db.execute(
-                    f'INSERT INTO {self.name} VALUES '  # noqa: S608
-                    f'({fields_to_insert_str(self.field_names)})',
-                    row._asdict(),
-                )
+        """Update a row in the table or insert it if it does not exist.
 
-        self.all.cache_clear()
-        self.get.cache_clear()
+        This is a single upsert statement keyed on the primary keys. Tables
+        without primary keys have no notion of an existing row, so the row
+        is always inserted. With write-behind, the row is buffered instead.
+        """
+        key = {k: getattr(row, k) for k in self.primary_keys}
+        if self._write_behind is not None:
+            with self._write_behind_lock:
+                changes = self._changes(None, [(key, row)])
+                self._buffer(self._key(row), row)
+        else:
+            with self._backend.write() as writer:
+                changes = self._changes(writer, [(key, row)])
+                writer.upsert((row,))
 
+        self._invalidate(key, row)
+        self._publish(changes)
+
+    @_instrumented('remove')
     def remove(self, *_: Any, **kwargs: Any) -> int:  # noqa: ANN401
         """Remove a row from the table.
 
@@ -283,20 +2451,597 @@ class SQLTableInterface(Generic[RowType]):  # noqa: UP046
             raise ValueError(msg)
         self.validate_kwargs(kwargs)
 
-        with self.connect() as db:
-            # Table/column names come from the RowType definition, not user
-            # input, so this is not susceptible to SQL injection.
-            res = db.execute(
-                f'DELETE FROM {self.name} WHERE '  # noqa: S608
-                f'{fields_to_search_str(kwargs.keys())}',
-                kwargs,
-            )
-            changed = res.rowcount
+        if self._write_behind is not None:
+            with self._write_behind_lock:
+                changes = self._changes(None, [(kwargs, None)])
+                # Bypass the cache to check the buffered state of exactly
+                # this row.
+                changed = int(self._select_one(kwargs) is not None)
+                if changed > 0:
+                    key = tuple(kwargs[k] for k in self.primary_keys)
+                    self._buffer(key, None)
+        else:
+            with self._backend.write() as writer:
+                changes = self._changes(writer, [(kwargs, None)])
+                changed = writer.delete((kwargs,))
+
+        if changed > 0:
+            self._invalidate(kwargs)
+        self._publish(changes)
+        return changed
+
+    @_instrumented('increment')
+    def increment(
+        self,
+        *,
+        default: RowType | None = None,
+        minimum: float | None = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> RowType | None:
+        """Add to numeric fields of a row in a single statement.
+
+        Example:
+            `table.increment(guild_id=1, user_id=2, offenses=1)` adds one to
+            the offenses of the row with primary keys (1, 2).
+
+        The addition happens in SQL (`SET x = x + :delta ... RETURNING *`),
+        so concurrent increments are not lost and the new row is returned
+        without a separate read. With write-behind or the dict engine, the
+        addition is instead applied to the buffered or stored row under a
+        lock.
+
+        Args:
+            default (RowType | None): row to insert, as is, if no row with the
+                primary keys exists. If None, nothing is inserted.
+            minimum (float | None): optional lower bound for the incremented
+                fields (e.g., 0 to keep counters from going negative).
+            kwargs: values for all of the primary keys and the deltas to add
+                to any other fields.
+
+        Returns:
+            the row after the increment or None if the row does not exist and
+            no default was given.
+
+        Raises:
+            ValueError:
+                if not all of the primary keys are supplied as kwargs, no
+                deltas are given, the default's primary keys do not match, or
+                the kwargs are not valid fields/types.
+        """
+        if not set(self.primary_keys).issubset(kwargs.keys()):
+            msg = 'Increment parameters must include the primary keys'
+            raise ValueError(msg)
+        self.validate_kwargs(kwargs)
+        keys = {k: kwargs[k] for k in self.primary_keys}
+        deltas = {k: v for k, v in kwargs.items() if k not in keys}
+        if len(deltas) == 0:
+            msg = 'At least one field to increment must be provided.'
+            raise ValueError(msg)
+        if default is not None and self._key(default) != tuple(keys.values()):
+            msg = 'Default row primary keys do not match the parameters.'
+            raise ValueError(msg)
+
+        row: RowType | None
+        if self._write_behind is not None:
+            with self._write_behind_lock:
+                changes = self._changes(None, [(keys, None)])
+                row = self._select_one(keys)
+                if row is not None:
+                    row = row._replace(
+                        **{
+                            field: _clamp(getattr(row, field) + delta, minimum)
+                            for field, delta in deltas.items()
+                        },
+                    )
+                else:
+                    row = default
+                if row is not None:
+                    self._buffer(self._key(row), row)
+        else:
+            with self._backend.write() as writer:
+                changes = self._changes(writer, [(keys, None)])
+                row = writer.increment(
+                    keys,
+                    deltas,
+                    default=default,
+                    minimum=minimum,
+                )
+
+        if row is not None:
+            self._invalidate(keys, row)
+        self._publish((old, row) for old, _ in changes)
+        return row
+
+    @_instrumented('assign')
+    def assign(self, **kwargs: Any) -> RowType | None:  # noqa: ANN401
+        """Set fields of an existing row in a single statement.
+
+        Example:
+            `table.assign(guild_id=1, user_id=2, offenses=0)` sets the
+            offenses of the row with primary keys (1, 2) to zero.
+
+        Unlike reading the row, calling _replace(), and passing it to
+        update(), this is one `UPDATE ... RETURNING *`, so it cannot undo a
+        concurrent write to the row's other fields, and a missing row is
+        not inserted. With write-behind, the buffered row is changed under
+        the same lock as increment().
+
+        Args:
+            kwargs: values for all of the primary keys and the new values of
+                any other fields.
+
+        Returns:
+            the row after the change or None if the row does not exist.
+
+        Raises:
+            ValueError:
+                if not all of the primary keys are supplied as kwargs, no
+                other fields are given, or the kwargs are not valid
+                fields/types.
+        """
+        if not set(self.primary_keys).issubset(kwargs.keys()):
+            msg = 'Assign parameters must include the primary keys'
+            raise ValueError(msg)
+        self.validate_kwargs(kwargs)
+        keys = {k: kwargs[k] for k in self.primary_keys}
+        values = {k: v for k, v in kwargs.items() if k not in keys}
+        if len(values) == 0:
+            msg = 'At least one field to assign must be provided.'
+            raise ValueError(msg)
+
+        row: RowType | None
+        if self._write_behind is not None:
+            with self._write_behind_lock:
+                changes = self._changes(None, [(keys, None)])
+                row = self._select_one(keys)
+                if row is not None:
+                    row = row._replace(**values)
+                    self._buffer(self._key(row), row)
+        else:
+            with self._backend.write() as writer:
+                changes = self._changes(writer, [(keys, None)])
+                row = writer.assign(keys, values)
 
-        self.all.cache_clear()
-        self.get.cache_clear()
+        if row is not None:
+            self._invalidate(keys, row)
+        self._publish((old, row) for old, _ in changes)
+        return row
+
+    def iter_all(
+        self,
+        *,
+        batch_size: int = 100,
+        order_by: Sequence[str] | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> Iterator[RowType]:
+        """Stream the rows matching kwargs without caching them.
+
+        Unlike all(), which keeps the full result in memory and in the
+        cache, this reads batch_size rows at a time so large tables can be
+        processed in constant memory.
+
+        Each batch is a separate query and no cursor is held open between
+        batches, so the reader connection is returned to the pool while the
+        caller processes rows (an open read would also stop WAL checkpoints
+        for as long as the caller takes). By default, batches are paged by
+        primary key (keyset pagination), which is stable if rows are written
+        during iteration. If order_by is given or the table has no primary
+        keys, batches are paged with LIMIT/OFFSET instead.
+
+        Buffered writes (see WriteBehind) are flushed first. With a mirror
+        or the dict engine, no queries are made: the matching rows are
+        sorted when iteration starts, so rows written during iteration are
+        not seen.
+
+        Args:
+            batch_size (int): rows to read per query.
+            order_by (Sequence[str] | None): optional fields to order by.
+                Defaults to the primary keys.
+            limit (int | None): optional maximum number of rows to yield.
+            offset (int): number of matching rows to skip.
+            kwargs: field values to filter by, as in all().
+
+        Raises:
+            ValueError:
+                if batch_size is not positive or a field in kwargs or
+                order_by is not in the table.
+        """
+        if batch_size < 1:
+            msg = 'Batch size must be greater than zero.'
+            raise ValueError(msg)
+        self.validate_kwargs(kwargs)
+        for field in order_by or ():
+            if field not in self.fields:
+                msg = f'Field {field} is not a member of {self._row_name}.'
+                raise ValueError(msg)
+        self.flush()
+        batches = self._backend.iter_batches(
+            kwargs,
+            batch_size=batch_size,
+            order_by=order_by,
+            limit=limit,
+            offset=offset,
+        )
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                return
+            # Each batch is recorded as its own call, the time spent by the
+            # caller between batches is not the table's.
+            self._record('iter_all', start, batch)
+            yield from batch
+
+    @_instrumented('get_many')
+    def get_many(
+        self,
+        keys: Iterable[dict[str, Any]],
+    ) -> tuple[RowType | None, ...]:
+        """Get the rows matching many primary keys in few queries.
+
+        Example:
+            `table.get_many([{'guild_id': 1, 'user_id': 2}, ...])`
+
+        Results are not cached, so this is intended for bulk lookups (e.g., at
+        startup) rather than repeated point reads.
+
+        Returns:
+            the row, or None if it does not exist, for each key in order.
+
+        Raises:
+            ValueError:
+                if the table has no primary keys or a key is not exactly the
+                primary keys.
+        """
+        if len(self.primary_keys) == 0:
+            msg = 'Get many requires primary keys.'
+            raise ValueError(msg)
+        keys = list(keys)
+        for key in keys:
+            if set(key.keys()) != set(self.primary_keys):
+                msg = 'Get parameters must be the primary keys'
+                raise ValueError(msg)
+            self.validate_kwargs(key)
+
+        return self._select_keys(
+            [tuple(key[k] for k in self.primary_keys) for key in keys],
+        )
+
+    @_instrumented('all_in')
+    def all_in(self, **kwargs: Iterable[Any]) -> tuple[RowType, ...]:
+        """Get all rows where a field is any of the values.
+
+        Example:
+            `table.all_in(guild_id=[1, 2, 3])` gets the rows of three guilds
+            in one query rather than calling `all()` once per guild.
+
+        Results are not cached, see get_many().
+
+        Raises:
+            ValueError:
+                if not exactly one field is given.
+        """
+        if len(kwargs) != 1:
+            msg = 'Exactly one field must be provided.'
+            raise ValueError(msg)
+        ((field, values_),) = kwargs.items()
+        values = list(values_)
+        for value in values:
+            self.validate_kwargs({field: value})
+
+        dirty = self._dirty_snapshot()
+        rows = self._backend.select_in(field, values)
+        if len(dirty) == 0:
+            return tuple(rows)
+        return tuple(
+            row for row in rows if self._key(row) not in dirty
+        ) + tuple(
+            row
+            for row in dirty.values()
+            if row is not None and getattr(row, field) in values
+        )
+
+    @_instrumented('update_many')
+    def update_many(self, rows: Iterable[RowType]) -> None:
+        """Update or insert many rows in one transaction.
+
+        Equivalent to calling update() for each row, but the upserts are
+        sent with a single executemany() and committed together.
+        """
+        rows = list(rows)
+        writes = [
+            ({k: getattr(row, k) for k in self.primary_keys}, row)
+            for row in rows
+        ]
+        if self._write_behind is not None:
+            with self._write_behind_lock:
+                changes = self._changes(None, writes)
+                for row in rows:
+                    self._buffer(self._key(row), row)
+        else:
+            with self._backend.write() as writer:
+                changes = self._changes(writer, writes)
+                writer.upsert(rows)
+
+        for key, row in writes:
+            self._invalidate(key, row)
+        self._publish(changes)
+
+    @_instrumented('remove_many')
+    def remove_many(self, keys: Iterable[dict[str, Any]]) -> int:
+        """Remove many rows by their primary keys in one transaction.
+
+        Returns:
+            the number of rows removed.
+
+        Raises:
+            ValueError:
+                if a key is not exactly the primary keys.
+        """
+        keys = list(keys)
+        for key in keys:
+            if set(key.keys()) != set(self.primary_keys):
+                msg = 'Remove parameters must be the primary keys'
+                raise ValueError(msg)
+            self.validate_kwargs(key)
+
+        writes = [(key, None) for key in keys]
+        if self._write_behind is not None:
+            with self._write_behind_lock:
+                changes = self._changes(None, writes)
+                existing = self._select_keys(
+                    [tuple(key[k] for k in self.primary_keys) for key in keys],
+                )
+                changed = 0
+                for row in existing:
+                    if row is not None:
+                        self._buffer(self._key(row), None)
+                        changed += 1
+        else:
+            with self._backend.write() as writer:
+                changes = self._changes(writer, writes)
+                changed = writer.delete(keys)
+
+        for key in keys:
+            self._invalidate(key)
+        self._publish(changes)
         return changed
 
+    @_instrumented('flush')
+    def flush(self) -> int:
+        """Write buffered rows to the database in one transaction.
+
+        This is a no-op for tables without write-behind.
+
+        Returns:
+            the number of buffered writes flushed.
+        """
+        with self._flush_lock:
+            dirty = self._dirty_snapshot()
+            if len(dirty) == 0:
+                return 0
+            rows = [row for row in dirty.values() if row is not None]
+            removed = [
+                dict(zip(self.primary_keys, key, strict=True))
+                for key, row in dirty.items()
+                if row is None
+            ]
+            with self._backend.write() as writer:
+                writer.upsert(rows)
+                writer.delete(removed)
+            with self._dirty_lock:
+                # Keep anything written again while the flush was running.
+                for key, row in dirty.items():
+                    if self._dirty.get(key, row) is row:
+                        self._dirty.pop(key, None)
+            logger.debug('flushed %s row(s) to %s', len(dirty), self.name)
+            return len(dirty)
+
+    def _key(self, row: RowType) -> tuple[Any, ...]:
+        return tuple(getattr(row, key) for key in self.primary_keys)
+
+    def _buffer(self, key: tuple[Any, ...], row: RowType | None) -> None:
+        """Buffer a write and schedule or trigger a flush."""
+        assert self._write_behind is not None
+        with self._dirty_lock:
+            self._dirty[key] = row
+            full = len(self._dirty) >= self._write_behind.max_rows
+            if not full and self._flush_timer is None:
+                self._flush_timer = threading.Timer(
+                    self._write_behind.interval_ms / 1000,
+                    self._flush_on_timer,
+                )
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if full:
+            self.flush()
+
+    def _flush_on_timer(self) -> None:
+        with self._dirty_lock:
+            self._flush_timer = None
+        try:
+            self.flush()
+        except Exception:
+            # The rows stay buffered and are retried on the next flush.
+            logger.exception(
+                'failed to flush buffered writes to %s', self.name
+            )
+
+    def _dirty_snapshot(self) -> dict[tuple[Any, ...], RowType | None]:
+        if self._write_behind is None:
+            # Nothing is ever buffered, so skip the lock on the read path.
+            return {}
+        with self._dirty_lock:
+            return dict(self._dirty)
+
+    def _overlay(
+        self,
+        rows: tuple[RowType, ...],
+        dirty: dict[tuple[Any, ...], RowType | None],
+        filters: dict[str, Any],
+    ) -> tuple[RowType, ...]:
+        """Apply buffered writes to the rows a query returned."""
+        if len(dirty) == 0:
+            return rows
+
+        def _matches(row: RowType) -> bool:
+            # Follows SQL where "field = NULL" never matches.
+            return all(
+                value is not None and getattr(row, name) == value
+                for name, value in filters.items()
+            )
+
+        return tuple(
+            row for row in rows if self._key(row) not in dirty
+        ) + tuple(
+            row for row in dirty.values() if row is not None and _matches(row)
+        )
+
+    async def aall(
+        self,
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> tuple[RowType, ...]:
+        """Awaitable all() that queries on the database thread.
+
+        Cached results are returned immediately without leaving the event
+        loop, and concurrent identical misses share one query (see
+        TableCache.acall()). Accepts the same arguments as all().
+        """
+        return await self.all.acall(self._run, *args, **kwargs)
+
+    async def aget(
+        self,
+        *args: Any,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> RowType | None:
+        """Awaitable get() that queries on the database thread.
+
+        Cached results are returned immediately without leaving the event
+        loop, and concurrent identical misses share one query (see
+        TableCache.acall()). Accepts the same arguments as get().
+        """
+        return await self.get.acall(self._run, *args, **kwargs)
+
+    async def aupdate(self, row: RowType) -> None:
+        """Awaitable update() that writes on the database thread."""
+        await self._run(self.update, row)
+
+    async def aremove(self, *args: Any, **kwargs: Any) -> int:  # noqa: ANN401
+        """Awaitable remove() that writes on the database thread.
+
+        Accepts the same arguments as remove().
+        """
+        return await self._run(self.remove, *args, **kwargs)
+
+    def _invalidate(
+        self,
+        key: dict[str, Any],
+        row: RowType | None = None,
+    ) -> None:
+        """Evict cached reads that a write to one row could have changed.
+
+        See TableCache.invalidate_row(). Everything else is still valid and
+        stays cached.
+
+        Inside a transaction(), if reads do not see its writes (see
+        StorageBackend.isolated), the eviction waits until it commits so
+        that another thread cannot cache a read of the state before the
+        commit. If the transaction rolls back, reads cached during it may
+        have seen the rolled back writes, so every entry is evicted.
+
+        Args:
+            key (dict[str, Any]): primary key values of the written row.
+            row (RowType | None): new version of the row or None if the row
+                was removed.
+        """
+        if self._backend.in_transaction():
+            self._backend.defer(on_rollback=self._invalidate_all)
+            if self._backend.isolated:
+                self._backend.defer(
+                    on_commit=lambda: self._invalidate(key, row),
+                )
+                return
+
+        self.all.invalidate_row(key, row)
+        self.get.invalidate_row(key, row)
+
+    def _invalidate_all(self) -> None:
+        self.all.invalidate(lambda *_: True)
+        self.get.invalidate(lambda *_: True)
+
+
+@contextlib.contextmanager
+def transaction(
+    *tables: SQLTableInterface[Any],
+) -> Generator[None, None, None]:
+    """Make the writes to several tables one atomic transaction.
+
+    The writes to the tables inside the context commit together, with one
+    fsync, or roll back together if the context raises. Cached reads are
+    invalidated once the transaction commits. The tables must be in the
+    same database file because they share its writer connection.
+    ':memory:' tables, which each have a private database, are the
+    exception. Their writes roll back together but are committed one
+    table at a time.
+
+    Writes to tables with write-behind are still buffered, so they are not
+    part of the transaction. Reads do not see the writes until the
+    transaction commits, except for reads of mirrored tables.
+
+    Tables using the dict engine can only share a transaction with each
+    other. Their rows are locked for the transaction and restored if it
+    raises.
+
+    Usage:
+        >>> with transaction(sounds, member_sounds):
+        >>>     sounds.remove(name=name, guild_id=guild_id)
+        >>>     member_sounds.remove_many(keys)
+
+    Raises:
+        ValueError:
+            if the tables are not in the same database file.
+    """
+    if len(tables) == 0:
+        msg = 'Tables in a transaction must share one database file.'
+        raise ValueError(msg)
+    first, *others = (table._backend for table in tables)  # noqa: SLF001
+    with first.transaction(others):
+        yield
+
+
+def _chunks(values: list[T], size: int) -> Iterator[list[T]]:  # noqa: UP047
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _clamp(value: Any, minimum: float | None) -> Any:  # noqa: ANN401
+    return value if minimum is None else max(value, minimum)
+
+
+def index_name(table: str, fields: Iterable[str]) -> str:
+    """Name of the index on fields of table.
+
+    Example:
+        ('sounds', ('guild_id',)) -> "sounds_guild_id_idx"
+    """
+    return '_'.join([table, *fields, 'idx'])
+
+
+def row_matches(row: NamedTuple, filters: Iterable[tuple[str, Any]]) -> bool:
+    """Check if a row could be returned by a query with the filters.
+
+    This errs towards matching: a filter that is None or not a field of the
+    row (e.g., an argument of a subclass's read method) matches any value,
+    because subclasses may treat those as "no filter".
+    """
+    return all(
+        value is None or name not in row._fields or getattr(row, name) == value
+        for name, value in filters
+    )
+
 
 def fields_to_update_str(fields: Iterable[str]) -> str:
     """Format field names as a SQL update string.
@@ -307,6 +3052,15 @@ def fields_to_update_str(fields: Iterable[str]) -> str:
     return ', '.join([f'{f} = :{f}' for f in fields])
 
 
+def fields_to_excluded_str(fields: Iterable[str]) -> str:
+    """Format field names as a SQL upsert update string.
+
+    Example:
+        ('name', 'date') -> "name = excluded.name, date = excluded.date"
+    """
+    return ', '.join([f'{f} = excluded.{f}' for f in fields])
+
+
 def fields_to_insert_str(fields: Sequence[str]) -> str:
     """Format field names as a SQL insert string.
 
@@ -333,6 +3087,25 @@ def field_names(nt: NamedTuple | type[NamedTuple]) -> tuple[str, ...]:
     return tuple(typing.get_type_hints(nt))
 
 
+class _Validator(NamedTuple):
+    exact: frozenset[type]
+    """Types whose values are valid, checked with a set lookup."""
+    expected: type | UnionType
+    """Type of the field, checked with isinstance() for subclasses."""
+
+
+def _validator(expected: type | UnionType) -> _Validator:
+    """Precompute the check of a field's values.
+
+    Values are almost always exactly one of the field's types, so that is
+    checked by a set lookup rather than isinstance() against the union of
+    the types. Only other values, which may be instances of subclasses,
+    fall back to isinstance().
+    """
+    exact = typing.get_args(expected) or (expected,)
+    return _Validator(frozenset(exact), expected)
+
+
 def field_types(nt: NamedTuple | type[NamedTuple]) -> dict[str, Field]:
     """Extracts dictionary of field data from NamedTuple."""
     if not isinstance(nt, type) and hasattr(nt, '__class__'):
@@ -1,21 +1,17 @@
 from __future__ import annotations
 
-import asyncio
 import datetime
 import logging
+import pathlib
 import re
-import warnings
 from collections.abc import Callable
 from collections.abc import Coroutine
 from collections.abc import Sequence
 from typing import Any
-from typing import cast
 
 import discord
 from discord.ext import tasks
 
-from threepseat.logging import log_timing
-
 logger = logging.getLogger(__name__)
 
 LF = Callable[..., Coroutine[Any, Any, Any]]
@@ -149,88 +145,6 @@ def voice_channel(member: discord.Member) -> discord.VoiceChannel | None:
     return None
 
 
-async def play_sound(
-    sound: str,
-    channel: discord.VoiceChannel,
-    wait: bool = False,
-) -> None:
-    """Play a sound in the voice channel.
-
-    Args:
-        sound (filepath): filepath to MP3 file to play.
-        channel (discord.VoiceChannel): voice channel to play sound in.
-        wait (bool): wait for sound to finish playing before exiting. Otherwise
-            the coroutine may return before the sound has finished.
-    """
-    voice_client: discord.VoiceClient
-    if channel.guild.voice_client is not None:
-        voice_client = cast('discord.VoiceClient', channel.guild.voice_client)
-        await voice_client.move_to(channel)
-    else:
-        # Voice handshakes can be slow or hang, so time the connect.
-        with log_timing(
-            logger,
-            'connected to voice channel %s in %s',
-            channel.name,
-            channel.guild.name,
-        ):
-            voice_client = await channel.connect()
-
-    logger.info(
-        'playing %s in voice channel %s in %s',
-        sound,
-        channel.name,
-        channel.guild.name,
-    )
-    source = discord.FFmpegOpusAudio(sound)
-
-    if voice_client.is_playing():
-        voice_client.stop()
-
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        voice_client.play(source, after=None)
-
-    if wait:
-        # discord.py's VoiceClient owns the playback state, so we have no
-        # event to wait on and must poll is_playing() instead.
-        while voice_client.is_playing():  # noqa: ASYNC110
-            await asyncio.sleep(0.1)
-
-
-def leave_on_empty(
-    client: discord.Client,
-    interval: float = 30,
-) -> LoopType:
-    """Returns a task that when started will leave empty voice channels.
-
-    This will periodically check if the client is in an empty voice
-    channel and have the client leave.
-
-    Usage:
-        >>> checker = leave_on_empty(bot, 30)
-        >>> checker.start()
-
-    Args:
-        client (Client): client to check for active voice channels.
-        interval (float): time in seconds between checking.
-
-    Returns:
-        discord.ext.tasks.Loop
-    """
-
-    @tasks.loop(seconds=interval)
-    async def _leaver() -> None:
-        for voice_client in client.voice_clients:
-            if (
-                isinstance(voice_client, discord.VoiceClient)
-                and len(voice_client.channel.members) <= 1
-            ):
-                logger.info(
-                    'leaving voice channel %s in %s due to inactivity',
-                    voice_client.channel.name,
-                    voice_client.channel.guild.name,
-                )
-                await voice_client.disconnect()
-
-    return _leaver
+def opus_path(filepath: str) -> str:
+    """Path of the pre-encoded Ogg/Opus copy of a sound file."""
+    return str(pathlib.Path(filepath).with_suffix('.ogg'))
@@ -0,0 +1,507 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import logging
+import pathlib
+import warnings
+from typing import Literal
+from typing import NamedTuple
+from typing import cast
+
+import discord
+
+from threepseat.logging import log_timing
+from threepseat.utils import opus_path
+
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_IDLE_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+Policy = Literal['interrupt', 'enqueue', 'drop']
+"""What to do with a new sound while a guild's session is playing one.
+
+- interrupt: stop the current sound, skip any queued sounds, and play it.
+- enqueue: play it after the queued sounds.
+- drop: do not play it.
+"""
+
+
+class VoiceBusyError(Exception):
+    """Raised when a guild's voice session cannot take another sound."""
+
+
+class _Request(NamedTuple):
+    sound: str | discord.AudioSource
+    channel: discord.VoiceChannel
+    done: asyncio.Future[bool]
+
+
+def _cleanup(sound: str | discord.AudioSource) -> None:
+    """Clean up the audio source of a sound that will not be played.
+
+    Sources that are played are cleaned up by the voice client when they
+    finish, but others would leave their ffmpeg process running.
+    """
+    if isinstance(sound, discord.AudioSource):
+        sound.cleanup()
+
+
+def _audio_source(sound: str) -> discord.FFmpegOpusAudio:
+    """Audio source of a sound that prefers its Opus copy if it exists."""
+    opus = opus_path(sound)
+    if pathlib.Path(opus).is_file():
+        return discord.FFmpegOpusAudio(opus, codec='copy')
+    return discord.FFmpegOpusAudio(sound)
+
+
+class VoiceSession:
+    """Plays the sounds requested in one guild one at a time.
+
+    Sounds are queued and played in order by a worker task, which exits
+    when the queue is empty. Each sound is awaited via the `after` callback
+    of VoiceClient.play(), so the next sound starts as soon as the last one
+    finishes and the voice client is only moved when the channel changes.
+
+    The session owns the audio sources submitted to it: any that is
+    rejected, skipped, or fails before it starts playing is cleaned up.
+    """
+
+    def __init__(
+        self, guild_id: int, maxsize: int = DEFAULT_QUEUE_SIZE
+    ) -> None:
+        """Init VoiceSession.
+
+        Args:
+            guild_id (int): guild the session plays sounds in.
+            maxsize (int): maximum number of sounds waiting to be played.
+
+        Raises:
+            ValueError:
+                if maxsize is less than one.
+        """
+        if maxsize < 1:
+            msg = 'Voice session queue size must be at least one.'
+            raise ValueError(msg)
+        self.guild_id = guild_id
+        self.maxsize = maxsize
+        self._queue: collections.deque[_Request] = collections.deque()
+        self._current: _Request | None = None
+        self._interrupted = False
+        self._voice_client: discord.VoiceClient | None = None
+        self._worker: asyncio.Task[None] | None = None
+
+    @property
+    def busy(self) -> bool:
+        """If a sound is playing or waiting to be played."""
+        return self._current is not None or len(self._queue) > 0
+
+    @property
+    def queued(self) -> int:
+        """Number of sounds waiting to be played."""
+        return len(self._queue)
+
+    def submit(
+        self,
+        sound: str | discord.AudioSource,
+        channel: discord.VoiceChannel,
+        policy: Policy = 'interrupt',
+    ) -> asyncio.Future[bool]:
+        """Request a sound be played.
+
+        Args:
+            sound (str | AudioSource): filepath of the sound or an audio
+                source to play.
+            channel (VoiceChannel): voice channel to play the sound in.
+            policy (Policy): what to do if the session is busy.
+
+        Returns:
+            future that is set to True once the sound has finished, False if
+            it was stopped or skipped by an interrupt, or the exception raised
+            when playing it.
+
+        Raises:
+            VoiceBusyError:
+                if the policy is drop and the session is busy, or the policy
+                is enqueue and the queue is full.
+        """
+        if policy == 'drop' and self.busy:
+            _cleanup(sound)
+            msg = 'A sound is already playing.'
+            raise VoiceBusyError(msg)
+        if policy == 'interrupt':
+            self._skip_queued()
+            self._stop_current()
+        elif len(self._queue) >= self.maxsize:
+            _cleanup(sound)
+            msg = 'Too many sounds are waiting to be played.'
+            raise VoiceBusyError(msg)
+
+        done: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        self._queue.append(_Request(sound, channel, done))
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        return done
+
+    def _skip_queued(self) -> None:
+        while self._queue:
+            request = self._queue.popleft()
+            _cleanup(request.sound)
+            # The caller may have stopped waiting and cancelled it already.
+            with contextlib.suppress(asyncio.InvalidStateError):
+                request.done.set_result(False)
+
+    def _stop_current(self) -> None:
+        if self._current is not None and self._voice_client is not None:
+            self._interrupted = True
+            # Calls the after callback, which finishes the current sound.
+            self._voice_client.stop()
+
+    async def _run(self) -> None:
+        try:
+            while self._queue:
+                request = self._queue.popleft()
+                # Callers who stopped waiting no longer want the sound.
+                if request.done.done():
+                    _cleanup(request.sound)
+                    continue
+                self._current = request
+                self._interrupted = False
+                try:
+                    played = await self._play(request)
+                except Exception as e:  # noqa: BLE001
+                    with contextlib.suppress(asyncio.InvalidStateError):
+                        request.done.set_exception(e)
+                else:
+                    with contextlib.suppress(asyncio.InvalidStateError):
+                        request.done.set_result(played)
+                finally:
+                    self._current = None
+        finally:
+            self._worker = None
+
+    async def _connect(
+        self,
+        channel: discord.VoiceChannel,
+    ) -> discord.VoiceClient:
+        if channel.guild.voice_client is not None:
+            voice_client = cast(
+                'discord.VoiceClient', channel.guild.voice_client
+            )
+            if voice_client.channel != channel:
+                await voice_client.move_to(channel)
+            return voice_client
+        # Voice handshakes can be slow or hang, so time the connect.
+        with log_timing(
+            logger,
+            'connected to voice channel %s in %s',
+            channel.name,
+            channel.guild.name,
+        ):
+            return await channel.connect()
+
+    async def _play(self, request: _Request) -> bool:
+        channel = request.channel
+        try:
+            voice_client = await self._connect(channel)
+        except BaseException:
+            _cleanup(request.sound)
+            raise
+        self._voice_client = voice_client
+        # Interrupted while connecting.
+        if self._interrupted:
+            _cleanup(request.sound)
+            return False
+
+        logger.info(
+            'playing %s in voice channel %s in %s',
+            request.sound,
+            channel.name,
+            channel.guild.name,
+        )
+        source = (
+            _audio_source(request.sound)
+            if isinstance(request.sound, str)
+            else request.sound
+        )
+
+        loop = asyncio.get_running_loop()
+        finished: asyncio.Future[None] = loop.create_future()
+
+        def _after(error: Exception | None) -> None:
+            # Called from the audio player thread when the sound ends.
+            loop.call_soon_threadsafe(_finish, finished, error)
+
+        # Audio played without the session is stopped first.
+        if voice_client.is_playing():
+            voice_client.stop()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                voice_client.play(source, after=_after)
+            except BaseException:
+                _cleanup(source)
+                raise
+
+        await finished
+        return not self._interrupted
+
+
+def _finish(finished: asyncio.Future[None], error: Exception | None) -> None:
+    if error is None:
+        finished.set_result(None)
+    else:
+        finished.set_exception(error)
+
+
+class VoiceSessionManager:
+    """Owns the voice session of each guild.
+
+    Every feature that plays audio should go through the same manager so
+    sounds requested at the same time in a guild are queued instead of
+    cutting each other off.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE) -> None:
+        """Init VoiceSessionManager.
+
+        Args:
+            maxsize (int): maximum number of sounds waiting to be played in
+                each guild.
+        """
+        self.maxsize = maxsize
+        self._sessions: dict[int, VoiceSession] = {}
+
+    def session(self, guild_id: int) -> VoiceSession:
+        """Get the session of a guild, creating it if needed."""
+        if guild_id not in self._sessions:
+            self._sessions[guild_id] = VoiceSession(guild_id, self.maxsize)
+        return self._sessions[guild_id]
+
+    def submit(
+        self,
+        sound: str | discord.AudioSource,
+        channel: discord.VoiceChannel,
+        *,
+        policy: Policy = 'interrupt',
+    ) -> asyncio.Future[bool]:
+        """Request a sound be played in a voice channel.
+
+        Unlike play(), the caller is responsible for the future, including
+        any error playing the sound.
+
+        Returns:
+            the future of the sound (see VoiceSession.submit()).
+
+        Raises:
+            VoiceBusyError:
+                if the session cannot take the sound.
+        """
+        session = self.session(channel.guild.id)
+        return session.submit(sound, channel, policy)
+
+    async def play(
+        self,
+        sound: str | discord.AudioSource,
+        channel: discord.VoiceChannel,
+        *,
+        policy: Policy = 'interrupt',
+        wait: bool = False,
+    ) -> bool:
+        """Play a sound in a voice channel.
+
+        Args:
+            sound (str | AudioSource): filepath of the sound or an audio
+                source to play.
+            channel (VoiceChannel): voice channel to play the sound in.
+            policy (Policy): what to do if the guild's session is busy.
+            wait (bool): wait for the sound to finish playing. Otherwise
+                return once it is queued and log any error playing it.
+
+        Returns:
+            if waiting, whether the sound played to the end rather than being
+            stopped or skipped by an interrupt. Otherwise, True.
+
+        Raises:
+            VoiceBusyError:
+                if the session cannot take the sound (see
+                VoiceSession.submit()).
+            Exception:
+                if waiting, any error connecting to the channel or playing.
+        """
+        done = self.submit(sound, channel, policy=policy)
+        if wait:
+            return await done
+        done.add_done_callback(_log_error)
+        return True
+
+
+def _log_error(done: asyncio.Future[bool]) -> None:
+    if not done.cancelled() and done.exception() is not None:
+        logger.error('error playing sound', exc_info=done.exception())
+
+
+class IdleVoiceDisconnector:
+    """Leaves voice channels the bot has been alone in for a grace period.
+
+    Rather than periodically checking every voice client, the guild of each
+    voice state change is checked. When the bot is left alone in a channel,
+    a timer is scheduled for the end of the grace period, and it is
+    cancelled if anyone joins first. The event loop keeps the timers ordered
+    by deadline, so the cost is proportional to voice state changes rather
+    than the number of connected guilds.
+
+    Usage:
+        >>> idle = IdleVoiceDisconnector(bot, grace_seconds=60)
+        >>> idle.start()
+        >>> bot.add_listener(
+        ...     idle.on_voice_state_update,
+        ...     'on_voice_state_update',
+        ... )
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        grace_seconds: float = DEFAULT_IDLE_SECONDS,
+    ) -> None:
+        """Init IdleVoiceDisconnector.
+
+        Args:
+            client (Client): client whose voice channels to leave.
+            grace_seconds (float): time in seconds the bot must be alone in
+                a channel before leaving it.
+
+        Raises:
+            ValueError:
+                if grace_seconds is negative.
+        """
+        if grace_seconds < 0:
+            msg = 'Idle grace period must not be negative.'
+            raise ValueError(msg)
+        self.client = client
+        self.grace_seconds = grace_seconds
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._leaving: set[asyncio.Task[None]] = set()
+
+    @property
+    def idle(self) -> frozenset[int]:
+        """IDs of guilds where the bot is alone and waiting to leave."""
+        return frozenset(self._timers)
+
+    def start(self) -> None:
+        """Check the channels the bot is already in."""
+        for voice_client in self.client.voice_clients:
+            if isinstance(voice_client, discord.VoiceClient):
+                self.check(voice_client.channel.guild)
+
+    def stop(self) -> None:
+        """Cancel the pending disconnects."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+    def check(self, guild: discord.Guild) -> None:
+        """Schedule or cancel leaving the voice channel of a guild."""
+        timer = self._timers.get(guild.id)
+        if not _alone(guild):
+            if timer is not None:
+                timer.cancel()
+                del self._timers[guild.id]
+        elif timer is None:
+            self._timers[guild.id] = asyncio.get_running_loop().call_later(
+                self.grace_seconds,
+                self._expire,
+                guild,
+            )
+
+    async def on_voice_state_update(
+        self,
+        member: discord.Member,
+        before: discord.VoiceState,  # noqa: ARG002
+        after: discord.VoiceState,  # noqa: ARG002
+    ) -> None:
+        """Listener for voice state changes in any guild."""
+        self.check(member.guild)
+
+    def _expire(self, guild: discord.Guild) -> None:
+        del self._timers[guild.id]
+        task = asyncio.create_task(self._leave(guild))
+        # Keep a reference so the task is not garbage collected.
+        self._leaving.add(task)
+        task.add_done_callback(self._leaving.discard)
+
+    async def _leave(self, guild: discord.Guild) -> None:
+        # Check again in case a voice state change was missed.
+        if not _alone(guild):
+            return
+        voice_client = cast('discord.VoiceClient', guild.voice_client)
+        logger.info(
+            'leaving voice channel %s in %s due to inactivity',
+            voice_client.channel.name,
+            guild.name,
+        )
+        await voice_client.disconnect()
+
+
+def _alone(guild: discord.Guild) -> bool:
+    """Check if the bot is the only member of its voice channel in a guild."""
+    voice_client = guild.voice_client
+    return (
+        isinstance(voice_client, discord.VoiceClient)
+        and len(voice_client.channel.members) <= 1
+    )
+
+
+sessions = VoiceSessionManager()
+"""Voice sessions shared by the bot's commands, reminders, and web app."""
+
+
+def configure(*, queue_size: int = DEFAULT_QUEUE_SIZE) -> None:
+    """Configure the shared voice sessions.
+
+    Must be called before any sound is played, since sessions that already
+    exist keep their settings.
+
+    Args:
+        queue_size (int): maximum number of sounds waiting to be played in
+            each guild.
+
+    Raises:
+        ValueError:
+            if queue_size is less than one.
+    """
+    if queue_size < 1:
+        msg = 'Voice session queue size must be at least one.'
+        raise ValueError(msg)
+    sessions.maxsize = queue_size
+
+
+async def play_sound(
+    sound: str | discord.AudioSource,
+    channel: discord.VoiceChannel,
+    *,
+    policy: Policy = 'interrupt',
+    wait: bool = False,
+) -> bool:
+    """Play a sound in a voice channel with the shared sessions.
+
+    See VoiceSessionManager.play().
+    """
+    return await sessions.play(sound, channel, policy=policy, wait=wait)
+
+
+def submit_sound(
+    sound: str | discord.AudioSource,
+    channel: discord.VoiceChannel,
+    *,
+    policy: Policy = 'interrupt',
+) -> asyncio.Future[bool]:
+    """Request a sound be played with the shared sessions.
+
+    See VoiceSessionManager.submit().
+    """
+    return sessions.submit(sound, channel, policy=policy)